@@ -4,23 +4,47 @@ Redis统一管理器 - 整合所有Redis相关功能
 """
 import json
 import logging
+import os
 import pickle
+import socket
 import threading
 import time
 import zlib
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from functools import wraps
-from typing import Any, Dict, List, Optional, Set, Union
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
 
 import redis
-from flask import session
 
-from .config import RedisConfig, SESSION_KEYS
+from . import session_codec
+from .config import RedisConfig
 
 logger = logging.getLogger(__name__)
 
 
+# 记录一次答题：KEYS 依次为 question_indices / question_statuses / wrong_indices / answer_history，
+# ARGV 为 题目序号、1字节状态、答题记录、错题成员（空串表示答对）、有效期秒数。
+# 题目列表键不存在（状态未写入或已过期）时不写入任何键并返回0
+_APPLY_PRACTICE_ANSWER_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+local index = tonumber(ARGV[1])
+if index < redis.call('STRLEN', KEYS[2]) then
+    redis.call('SETRANGE', KEYS[2], index, ARGV[2])
+end
+redis.call('HSET', KEYS[4], ARGV[1], ARGV[3])
+if ARGV[4] ~= '' then
+    redis.call('SADD', KEYS[3], ARGV[4])
+end
+for i = 1, #KEYS do
+    redis.call('EXPIRE', KEYS[i], ARGV[5])
+end
+return 1
+"""
+
+
 class CacheMetrics:
     """缓存性能指标"""
     
@@ -86,6 +110,87 @@ class CacheMetrics:
             }
 
 
+class CircuitBreaker:
+    """
+    Redis可用性熔断器
+    根据命令执行结果判断可用性，代替每次调用前的PING：
+    短时间内连续失败达到阈值后熔断，熔断期间直接判定不可用；
+    超过恢复时间后仅做一次PING探测，成功则恢复
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._last_failure_time = 0.0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def allow(self, probe) -> bool:
+        """判断当前是否允许访问Redis，熔断超时后调用probe探测一次"""
+        if self._state == self.CLOSED:
+            return True
+
+        if time.time() - self._opened_at < self.reset_timeout:
+            return False
+
+        with self._lock:
+            # 双重检查：其他线程可能已完成探测
+            if self._state == self.CLOSED:
+                return True
+            if time.time() - self._opened_at < self.reset_timeout:
+                return False
+            try:
+                probe()
+            except Exception as e:
+                self._opened_at = time.time()
+                logger.warning(f"Redis恢复探测失败，继续熔断: {e}")
+                return False
+
+            self._state = self.CLOSED
+            self._failures = 0
+            logger.info("Redis恢复探测成功，熔断器关闭")
+            return True
+
+    def record_failure(self, error: Optional[Exception] = None):
+        """记录一次Redis命令失败"""
+        with self._lock:
+            now = time.time()
+            # 距上次失败超过恢复时间的视为新的一轮，避免零散错误累积触发熔断
+            if now - self._last_failure_time > self.reset_timeout:
+                self._failures = 0
+            self._failures += 1
+            self._last_failure_time = now
+
+            if self._state == self.CLOSED and self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = now
+                logger.warning(f"Redis连续失败 {self._failures} 次，熔断 {self.reset_timeout}s: {error}")
+
+    def trip(self):
+        """直接进入熔断状态（如初始化连接失败）"""
+        with self._lock:
+            self._state = self.OPEN
+            self._opened_at = time.time()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取熔断器状态"""
+        return {
+            'state': self._state,
+            'recent_failures': self._failures,
+            'failure_threshold': self.failure_threshold,
+            'reset_timeout': self.reset_timeout
+        }
+
+
 def performance_monitor(func):
     """性能监控装饰器"""
     
@@ -129,6 +234,7 @@ class RedisManager:
     def __init__(self):
         self._redis_client = None
         self._connection_pool = None
+        self._breaker = CircuitBreaker(**RedisConfig.CIRCUIT_BREAKER_CONFIG)
         self._init_redis()
         
         # 缓存配置
@@ -147,6 +253,13 @@ class RedisManager:
         # 批量操作配置
         self._batch_size = 100
         self._pipeline_threshold = 5  # 超过5个操作使用pipeline
+        self._scan_count = 500  # SCAN每次遍历的建议数量
+        
+        # 跨进程缓存失效通知：各进程注册的处理函数和订阅线程
+        self._invalidation_handlers: List[Callable[[str, Optional[int]], None]] = []
+        self._invalidation_lock = threading.Lock()
+        self._invalidation_pid = None
+        self._invalidation_stats = {'published': 0, 'received': 0, 'handler_errors': 0, 'reconnects': 0}
     
     def _init_redis(self):
         """初始化Redis连接"""
@@ -169,20 +282,26 @@ class RedisManager:
             logger.info("Redis连接成功")
             
         except Exception as e:
+            # 保留客户端并进入熔断，Redis恢复后由熔断器探测自动恢复
             logger.error(f"Redis连接失败: {e}")
-            self._redis_client = None
+            self._breaker.trip()
     
     @property
     def is_available(self) -> bool:
-        """检查Redis是否可用"""
+        """检查Redis是否可用 - 由熔断器判断，不额外发送PING"""
         if not self._redis_client:
             return False
-        try:
-            self._redis_client.ping()
-            return True
-        except Exception as e:
-            logger.warning(f"Redis不可用: {e}")
-            return False
+        return self._breaker.allow(self._redis_client.ping)
+    
+    def record_failure(self, error: Optional[Exception] = None):
+        """记录Redis命令失败，供直接使用客户端的调用方上报错误（只统计连接类错误）"""
+        if error is None or isinstance(error, (redis.ConnectionError, redis.TimeoutError)):
+            self._breaker.record_failure(error)
+    
+    @property
+    def client(self) -> Optional[redis.Redis]:
+        """获取底层Redis客户端"""
+        return self._redis_client
     
     def get_connection_info(self) -> Dict[str, Any]:
         """获取连接信息"""
@@ -207,7 +326,10 @@ class RedisManager:
     # =========================
     
     def _serialize_data(self, data: Any) -> bytes:
-        """序列化数据"""
+        """
+        序列化数据（通用路径，保留原类型）
+        紧凑编码只用于明确指定的session/练习状态字段（PACKED_SESSION_KEYS、store_practice_state），不在此处自动套用
+        """
         try:
             # 使用pickle序列化
             serialized = pickle.dumps(data)
@@ -228,6 +350,10 @@ class RedisManager:
     def _deserialize_data(self, data: bytes) -> Any:
         """反序列化数据"""
         try:
+            # 兼容之前按紧凑编码写入的值
+            if session_codec.is_packed(data):
+                return session_codec.unpack(data)
+            
             # 检查是否有压缩标记
             if data.startswith(b'compressed:'):
                 # 移除压缩标记并解压缩
@@ -279,6 +405,7 @@ class RedisManager:
             return True
             
         except Exception as e:
+            self.record_failure(e)
             logger.error(f"存储Redis session数据失败: {e}")
             return False
     
@@ -302,6 +429,7 @@ class RedisManager:
             return self._deserialize_data(serialized_value)
             
         except Exception as e:
+            self.record_failure(e)
             logger.error(f"获取Redis session数据失败: {e}")
             return default
     
@@ -324,6 +452,7 @@ class RedisManager:
             return True
             
         except Exception as e:
+            self.record_failure(e)
             logger.error(f"删除Redis session数据失败: {e}")
             return False
     
@@ -356,6 +485,7 @@ class RedisManager:
             return result
             
         except Exception as e:
+            self.record_failure(e)
             logger.error(f"获取Redis所有session数据失败: {e}")
             return {}
     
@@ -374,6 +504,7 @@ class RedisManager:
             return True
             
         except Exception as e:
+            self.record_failure(e)
             logger.error(f"延长Redis session过期时间失败: {e}")
             return False
     
@@ -384,20 +515,173 @@ class RedisManager:
             
         try:
             pattern = f"{self._session_prefix}*"
-            keys = self._redis_client.keys(pattern)
-            
             expired_count = 0
-            for key in keys:
-                ttl = self._redis_client.ttl(key)
-                if ttl == -2:  # key不存在（已过期）
-                    expired_count += 1
+            for ttls in self._batched_ttls(self.scan_keys(pattern)):
+                expired_count += sum(1 for ttl in ttls.values() if ttl == -2)  # key不存在（已过期）
             
             return expired_count
             
         except Exception as e:
+            self.record_failure(e)
             logger.error(f"清理过期sessions失败: {e}")
             return 0
     
+    # =========================
+    # 练习状态存储（按练习会话ID）
+    # =========================
+    
+    # 练习状态各部分，每部分一个Redis键：
+    # question_indices 紧凑编码的题目ID列表(string)，question_statuses 每题1字节的状态(string，SETRANGE单题更新)，
+    # wrong_indices 错题集合(set)，answer_history 题目序号 -> 答题记录(hash)
+    PRACTICE_STATE_PARTS = ('question_indices', 'question_statuses', 'wrong_indices', 'answer_history')
+    
+    def _get_practice_state_keys(self, practice_session_id: int) -> Dict[str, str]:
+        """生成练习状态各部分的Redis键"""
+        base = f"{RedisConfig.PRACTICE_STATE_CONFIG['key_prefix']}{practice_session_id}"
+        return {part: f'{base}:{part}' for part in self.PRACTICE_STATE_PARTS}
+    
+    @performance_monitor
+    def store_practice_state(self, practice_session_id: int, state: Dict[str, Any]) -> bool:
+        """整体替换练习状态中给出的部分（开始练习、新一轮、从数据库恢复时使用），并续期全部键"""
+        if not self.is_available:
+            return False
+        
+        try:
+            keys = self._get_practice_state_keys(practice_session_id)
+            # MULTI中执行，读取方不会看到写了一半的状态
+            with self._redis_client.pipeline() as pipe:
+                for part, value in state.items():
+                    key = keys[part]
+                    value = session_codec.unpack(value)
+                    pipe.delete(key)
+                    if part == 'question_indices':
+                        pipe.set(key, session_codec.pack_ids(list(value or [])))
+                    elif part == 'question_statuses':
+                        pipe.set(key, bytes(value or []))
+                    elif part == 'wrong_indices' and value:
+                        pipe.sadd(key, *{self._serialize_json(qid) for qid in value})
+                    elif part == 'answer_history' and value:
+                        pipe.hset(key, mapping={str(index): self._serialize_json(entry)
+                                                for index, entry in value.items()})
+                self._expire_practice_state(pipe, keys)
+                pipe.execute()
+            return True
+            
+        except Exception as e:
+            self.record_failure(e)
+            logger.error(f"存储练习会话 {practice_session_id} 的状态失败: {e}")
+            return False
+    
+    @performance_monitor
+    def get_practice_state(self, practice_session_id: int, parts: Iterable[str]) -> Optional[Dict[str, Any]]:
+        """
+        读取练习状态中的指定部分（一次pipeline往返）
+        Redis不可用、状态尚未写入或已过期时返回None，由调用方从数据库恢复
+        """
+        if not self.is_available:
+            return None
+        
+        try:
+            parts = list(parts)
+            keys = self._get_practice_state_keys(practice_session_id)
+            with self._redis_client.pipeline(transaction=False) as pipe:
+                # 题目列表键作为状态是否存在的标记（空练习也会写入编码后的空列表）
+                pipe.exists(keys['question_indices'])
+                for part in parts:
+                    if part in ('question_indices', 'question_statuses'):
+                        pipe.get(keys[part])
+                    elif part == 'wrong_indices':
+                        pipe.smembers(keys[part])
+                    else:
+                        pipe.hgetall(keys[part])
+                exists, *values = pipe.execute()
+            
+            if not exists:
+                return None
+            
+            state = {}
+            for part, raw in zip(parts, values):
+                if part == 'question_indices':
+                    state[part] = session_codec.unpack(raw)
+                elif part == 'question_statuses':
+                    state[part] = list(raw or b'')
+                elif part == 'wrong_indices':
+                    state[part] = [self._deserialize_json(member) for member in raw]
+                else:
+                    state[part] = {field.decode('utf-8') if isinstance(field, bytes) else field:
+                                   self._deserialize_json(entry) for field, entry in raw.items()}
+            return state
+            
+        except Exception as e:
+            self.record_failure(e)
+            logger.error(f"读取练习会话 {practice_session_id} 的状态失败: {e}")
+            return None
+    
+    def get_practice_question_count(self, practice_session_id: int) -> Optional[int]:
+        """练习题目数量（状态串长度），不读取题目列表；状态不在Redis中时返回None"""
+        if not self.is_available:
+            return None
+        
+        try:
+            keys = self._get_practice_state_keys(practice_session_id)
+            with self._redis_client.pipeline(transaction=False) as pipe:
+                pipe.exists(keys['question_indices'])
+                pipe.strlen(keys['question_statuses'])
+                exists, count = pipe.execute()
+            return count if exists else None
+            
+        except Exception as e:
+            self.record_failure(e)
+            logger.error(f"读取练习会话 {practice_session_id} 的题目数量失败: {e}")
+            return None
+    
+    def apply_practice_answer(self, practice_session_id: int, question_index: int, status: int,
+                              history_entry: Dict[str, Any], wrong_question_id: Any = None) -> bool:
+        """
+        按字段记录一次答题：SETRANGE更新该题1字节状态、HSET写入该题答题历史、答错时SADD错题，
+        不读写其余题目的数据；状态不在Redis中时返回False
+        存在检查和写入在同一个Lua脚本中原子执行，状态在检查后过期或被删除时不会写出只有部分字段的状态
+        """
+        if not self.is_available:
+            return False
+        
+        try:
+            keys = self._get_practice_state_keys(practice_session_id)
+            wrong_member = self._serialize_json(wrong_question_id) if wrong_question_id is not None else ''
+            applied = self._redis_client.eval(
+                _APPLY_PRACTICE_ANSWER_SCRIPT, len(self.PRACTICE_STATE_PARTS),
+                *(keys[part] for part in self.PRACTICE_STATE_PARTS),
+                question_index, bytes((status,)), self._serialize_json(history_entry), wrong_member,
+                RedisConfig.PRACTICE_STATE_CONFIG['ttl']
+            )
+            return bool(applied)
+            
+        except Exception as e:
+            self.record_failure(e)
+            logger.error(f"记录练习会话 {practice_session_id} 的答题失败: {e}")
+            return False
+    
+    @performance_monitor
+    def delete_practice_state(self, practice_session_id: int) -> bool:
+        """删除练习状态（练习完成或放弃时）"""
+        if not self.is_available:
+            return False
+        
+        try:
+            self._redis_client.unlink(*self._get_practice_state_keys(practice_session_id).values())
+            return True
+            
+        except Exception as e:
+            self.record_failure(e)
+            logger.error(f"删除练习会话 {practice_session_id} 的状态失败: {e}")
+            return False
+    
+    @staticmethod
+    def _expire_practice_state(pipe, keys: Dict[str, str]) -> None:
+        ttl = RedisConfig.PRACTICE_STATE_CONFIG['ttl']
+        for key in keys.values():
+            pipe.expire(key, ttl)
+    
     # =========================
     # 缓存管理功能
     # =========================
@@ -419,6 +703,7 @@ class RedisManager:
                 return default
             return self._deserialize_json(data)
         except Exception as e:
+            self.record_failure(e)
             logger.error(f"从Redis缓存获取数据失败 {key}: {e}")
             return default
     
@@ -436,6 +721,7 @@ class RedisManager:
             self._redis_client.setex(redis_key, ttl, data)
             return True
         except Exception as e:
+            self.record_failure(e)
             logger.error(f"设置Redis缓存失败 {key}: {e}")
             return False
     
@@ -450,6 +736,7 @@ class RedisManager:
             self._redis_client.delete(redis_key)
             return True
         except Exception as e:
+            self.record_failure(e)
             logger.error(f"删除Redis缓存失败 {key}: {e}")
             return False
     
@@ -462,6 +749,7 @@ class RedisManager:
             redis_key = self._get_cache_key(key)
             return bool(self._redis_client.exists(redis_key))
         except Exception as e:
+            self.record_failure(e)
             logger.error(f"检查Redis缓存存在性失败 {key}: {e}")
             return False
     
@@ -474,6 +762,7 @@ class RedisManager:
             redis_key = self._get_cache_key(key)
             return self._redis_client.ttl(redis_key)
         except Exception as e:
+            self.record_failure(e)
             logger.error(f"获取Redis缓存TTL失败 {key}: {e}")
             return -1
     
@@ -482,17 +771,21 @@ class RedisManager:
     # =========================
     
     @performance_monitor
-    def cache_mget(self, keys: List[str]) -> Dict[str, Any]:
-        """批量获取缓存数据"""
-        if not self.is_available or not keys:
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """批量获取缓存数据 - 按批次MGET，全部在一个pipeline中一次往返完成"""
+        if not keys or not self.is_available:
             return {}
         
         try:
-            redis_keys = [self._get_cache_key(key) for key in keys]
-            values = self._redis_client.mget(redis_keys)
+            with self._redis_client.pipeline(transaction=False) as pipe:
+                for i in range(0, len(keys), self._batch_size):
+                    batch = keys[i:i + self._batch_size]
+                    pipe.mget([self._get_cache_key(key) for key in batch])
+                batches = pipe.execute()
             
             result = {}
-            for i, (key, value) in enumerate(zip(keys, values)):
+            values = [value for batch in batches for value in batch]
+            for key, value in zip(keys, values):
                 if value is not None:
                     try:
                         result[key] = self._deserialize_json(value)
@@ -502,51 +795,109 @@ class RedisManager:
             return result
             
         except Exception as e:
+            self.record_failure(e)
             logger.error(f"批量获取Redis缓存失败: {e}")
             return {}
     
     @performance_monitor
-    def cache_mset(self, data: Dict[str, Any], ttl: Optional[int] = None) -> bool:
-        """批量设置缓存数据"""
-        if not self.is_available or not data:
+    def set_many(self, data: Dict[str, Any], ttl: Optional[int] = None) -> bool:
+        """批量设置缓存数据 - 使用pipeline一次往返写入"""
+        if not data or not self.is_available:
             return False
         
         try:
             if ttl is None:
                 ttl = self._default_cache_ttl
             
-            # 使用pipeline提高性能
-            with self._redis_client.pipeline() as pipe:
+            with self._redis_client.pipeline(transaction=False) as pipe:
                 for key, value in data.items():
-                    redis_key = self._get_cache_key(key)
-                    serialized_value = self._serialize_json(value)
-                    pipe.setex(redis_key, ttl, serialized_value)
-                
+                    pipe.setex(self._get_cache_key(key), ttl, self._serialize_json(value))
                 pipe.execute()
             
             return True
             
         except Exception as e:
+            self.record_failure(e)
             logger.error(f"批量设置Redis缓存失败: {e}")
             return False
     
+    @performance_monitor
+    def delete_many(self, keys: List[str]) -> int:
+        """批量删除缓存数据"""
+        if not keys or not self.is_available:
+            return 0
+        
+        try:
+            return self._redis_client.delete(*[self._get_cache_key(key) for key in keys])
+        except Exception as e:
+            self.record_failure(e)
+            logger.error(f"批量删除Redis缓存失败: {e}")
+            return 0
+    
+    def cache_mget(self, keys: List[str]) -> Dict[str, Any]:
+        """批量获取缓存数据（兼容旧接口）"""
+        return self.get_many(keys)
+    
+    def cache_mset(self, data: Dict[str, Any], ttl: Optional[int] = None) -> bool:
+        """批量设置缓存数据（兼容旧接口）"""
+        return self.set_many(data, ttl)
+    
     @performance_monitor
     def cache_delete_pattern(self, pattern: str) -> int:
-        """按模式删除缓存"""
+        """按模式删除缓存（SCAN增量遍历 + 分批UNLINK）"""
         if not self.is_available:
             return 0
         
         try:
-            redis_pattern = self._get_cache_key(pattern)
-            keys = self._redis_client.keys(redis_pattern)
-            if keys:
-                self._redis_client.delete(*keys)
-                return len(keys)
-            return 0
+            return self.unlink_keys(self.scan_keys(self._get_cache_key(pattern)))
         except Exception as e:
+            self.record_failure(e)
             logger.error(f"按模式删除Redis缓存失败 {pattern}: {e}")
             return 0
     
+    # =========================
+    # 键遍历（SCAN代替KEYS，避免阻塞与session共用的Redis）
+    # =========================
+    
+    def scan_keys(self, pattern: str, count: Optional[int] = None) -> Iterator[str]:
+        """用SCAN增量遍历匹配的完整Redis键，每次只占用Redis很短时间"""
+        for key in self._redis_client.scan_iter(match=pattern, count=count or self._scan_count):
+            yield key.decode('utf-8') if isinstance(key, bytes) else key
+    
+    def count_keys(self, pattern: str) -> int:
+        """统计匹配的Redis键数量（SCAN遍历）"""
+        return sum(1 for _ in self.scan_keys(pattern))
+    
+    def unlink_keys(self, keys: Iterable[str]) -> int:
+        """分批UNLINK完整Redis键，内存由Redis后台线程释放"""
+        deleted = 0
+        batch = []
+        for key in keys:
+            batch.append(key)
+            if len(batch) >= self._batch_size:
+                deleted += self._redis_client.unlink(*batch)
+                batch = []
+        if batch:
+            deleted += self._redis_client.unlink(*batch)
+        return deleted
+    
+    def _batched_ttls(self, keys: Iterable[str]) -> Iterator[Dict[str, int]]:
+        """分批用pipeline获取键的TTL，每批返回 {键: TTL}"""
+        batch = []
+        for key in keys:
+            batch.append(key)
+            if len(batch) >= self._batch_size:
+                yield self._pipeline_ttls(batch)
+                batch = []
+        if batch:
+            yield self._pipeline_ttls(batch)
+    
+    def _pipeline_ttls(self, keys: List[str]) -> Dict[str, int]:
+        with self._redis_client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.ttl(key)
+            return dict(zip(keys, pipe.execute()))
+    
     # =========================
     # 特定业务缓存接口
     # =========================
@@ -575,9 +926,387 @@ class RedisManager:
         """设置题库题目缓存"""
         return self.cache_set(f'question_bank_{tiku_id}', data, self._question_bank_ttl)
     
+    # 题库hash中保存题目ID顺序的字段名（题目字段为题目ID字符串）
+    _BANK_IDS_FIELD = '_ids'
+    # 题库hash中保存按题型划分的题目ID的字段名
+    _BANK_TYPES_FIELD = '_types'
+    
+    def _get_bank_hash_key(self, tiku_id: int) -> str:
+        """生成题库hash的Redis键"""
+        return self._get_cache_key(f'question_bank_hash:{tiku_id}')
+    
+    # 索引集合：已缓存的题库ID集合，以及每个题库已缓存的单题键集合
+    # 失效和统计只需处理索引中登记的键，不用遍历整个键空间
+    _BANK_INDEX_KEY = 'index:banks'
+    
+    def _get_bank_questions_index_key(self, tiku_id: int) -> str:
+        """生成题库单题键索引集合的Redis键"""
+        return self._get_cache_key(f'index:bank_questions:{tiku_id}')
+    
+    @performance_monitor
+    def store_bank_questions(self, tiku_id: int, questions: List[Dict[str, Any]],
+                             ttl: Optional[int] = None) -> bool:
+        """写入单题缓存（question_{id}），并把这些键登记到所在题库的索引集合"""
+        if not questions or not self.is_available:
+            return False
+        
+        try:
+            if ttl is None:
+                ttl = self._question_bank_ttl
+            
+            question_keys = [self._get_cache_key(f'question_{q["id"]}') for q in questions]
+            index_key = self._get_bank_questions_index_key(tiku_id)
+            with self._redis_client.pipeline(transaction=False) as pipe:
+                for redis_key, question in zip(question_keys, questions):
+                    pipe.setex(redis_key, ttl, self._serialize_json(question))
+                pipe.sadd(index_key, *question_keys)
+                pipe.expire(index_key, ttl)
+                pipe.sadd(self._get_cache_key(self._BANK_INDEX_KEY), tiku_id)
+                pipe.execute()
+            return True
+            
+        except Exception as e:
+            self.record_failure(e)
+            logger.error(f"存储题库 {tiku_id} 的单题缓存失败: {e}")
+            return False
+    
+    def delete_bank_questions(self, tiku_id: int, keep_ids: Optional[Iterable[Any]] = None) -> int:
+        """删除题库索引集合中登记的单题缓存，keep_ids中的题目保留（用于清理已删除题目的残留键）"""
+        if not self.is_available:
+            return 0
+        
+        try:
+            index_key = self._get_bank_questions_index_key(tiku_id)
+            registered = {key.decode('utf-8') if isinstance(key, bytes) else key
+                          for key in self._redis_client.smembers(index_key)}
+            keep_keys = {self._get_cache_key(f'question_{qid}') for qid in (keep_ids or [])}
+            stale_keys = registered - keep_keys
+            if not stale_keys:
+                return 0
+            
+            deleted = self.unlink_keys(stale_keys)
+            if keep_keys:
+                self._redis_client.srem(index_key, *stale_keys)
+            else:
+                self._redis_client.unlink(index_key)
+            return deleted
+            
+        except Exception as e:
+            self.record_failure(e)
+            logger.error(f"删除题库 {tiku_id} 的单题缓存失败: {e}")
+            return 0
+    
+    def get_cached_bank_ids(self) -> List[int]:
+        """获取索引中登记的已缓存题库ID"""
+        if not self.is_available:
+            return []
+        
+        try:
+            members = self._redis_client.smembers(self._get_cache_key(self._BANK_INDEX_KEY))
+            return sorted(int(member) for member in members)
+        except Exception as e:
+            self.record_failure(e)
+            logger.error(f"获取已缓存题库索引失败: {e}")
+            return []
+    
+    @performance_monitor
+    def store_question_bank(self, tiku_id: int, questions: List[Dict[str, Any]],
+                            ttl: Optional[int] = None,
+                            type_partitions: Optional[Dict[str, List[Any]]] = None) -> bool:
+        """将整套题库写入一个hash：每道题一个字段，另存题目ID顺序和按题型划分的题目ID"""
+        if not self.is_available:
+            return False
+        
+        try:
+            if ttl is None:
+                ttl = self._question_bank_ttl
+            
+            mapping = {str(q['id']): self._serialize_json(q) for q in questions}
+            mapping[self._BANK_IDS_FIELD] = self._serialize_json([q['id'] for q in questions])
+            if type_partitions is not None:
+                mapping[self._BANK_TYPES_FIELD] = self._serialize_json(type_partitions)
+            
+            redis_key = self._get_bank_hash_key(tiku_id)
+            with self._redis_client.pipeline() as pipe:
+                pipe.delete(redis_key)
+                pipe.hset(redis_key, mapping=mapping)
+                pipe.expire(redis_key, ttl)
+                pipe.sadd(self._get_cache_key(self._BANK_INDEX_KEY), tiku_id)
+                pipe.execute()
+            return True
+            
+        except Exception as e:
+            self.record_failure(e)
+            logger.error(f"存储题库 {tiku_id} 到Redis hash失败: {e}")
+            return False
+    
+    @performance_monitor
+    def get_question_bank(self, tiku_id: int) -> Optional[List[Dict[str, Any]]]:
+        """一次HGETALL取回整套题库，按原始顺序返回，未缓存返回None"""
+        if not self.is_available:
+            return None
+        
+        try:
+            raw = self._redis_client.hgetall(self._get_bank_hash_key(tiku_id))
+            if not raw:
+                return None
+            
+            raw = {(k.decode('utf-8') if isinstance(k, bytes) else k): v for k, v in raw.items()}
+            ids_data = raw.pop(self._BANK_IDS_FIELD, None)
+            if ids_data is None:
+                return None
+            
+            questions = []
+            for qid in self._deserialize_json(ids_data):
+                data = raw.get(str(qid))
+                if data is None:
+                    # 数据不完整，视为未命中由调用方重新加载
+                    return None
+                questions.append(self._deserialize_json(data))
+            return questions
+            
+        except Exception as e:
+            self.record_failure(e)
+            logger.error(f"从Redis hash获取题库 {tiku_id} 失败: {e}")
+            return None
+    
+    @performance_monitor
+    def get_bank_type_partitions(self, tiku_id: int) -> Optional[Dict[str, List[Any]]]:
+        """一次HGET取回题库按题型划分的题目ID（不含题目内容），未缓存返回None"""
+        if not self.is_available:
+            return None
+        
+        try:
+            data = self._redis_client.hget(self._get_bank_hash_key(tiku_id), self._BANK_TYPES_FIELD)
+            return self._deserialize_json(data) if data is not None else None
+        except Exception as e:
+            self.record_failure(e)
+            logger.error(f"从Redis hash获取题库 {tiku_id} 题型划分失败: {e}")
+            return None
+    
+    @performance_monitor
+    def get_bank_questions(self, tiku_id: int, question_ids: List[Any]) -> Dict[Any, Dict[str, Any]]:
+        """一次HMGET取回题库中的任意题目子集，返回 {题目ID: 题目}"""
+        if not question_ids or not self.is_available:
+            return {}
+        
+        try:
+            values = self._redis_client.hmget(self._get_bank_hash_key(tiku_id),
+                                              [str(qid) for qid in question_ids])
+            return {qid: self._deserialize_json(value)
+                    for qid, value in zip(question_ids, values) if value is not None}
+            
+        except Exception as e:
+            self.record_failure(e)
+            logger.error(f"从Redis hash获取题库 {tiku_id} 的题目失败: {e}")
+            return {}
+    
+    def get_bank_question_ids(self, tiku_id: int) -> Optional[List[Any]]:
+        """获取题库的题目ID列表（单字段HGET），未缓存返回None"""
+        if not self.is_available:
+            return None
+        
+        try:
+            data = self._redis_client.hget(self._get_bank_hash_key(tiku_id), self._BANK_IDS_FIELD)
+            return self._deserialize_json(data) if data is not None else None
+        except Exception as e:
+            self.record_failure(e)
+            logger.error(f"从Redis hash获取题库 {tiku_id} 的题目ID失败: {e}")
+            return None
+    
+    def delete_question_bank(self, tiku_id: int) -> bool:
+        """删除题库hash"""
+        return self.cache_delete(f'question_bank_hash:{tiku_id}')
+    
     def clear_all_question_bank_cache(self) -> int:
-        """清除所有题库题目缓存"""
-        return self.cache_delete_pattern('question_bank_*')
+        """清除所有题库题目缓存：按索引集合删除题库hash、单题缓存和索引本身"""
+        if not self.is_available:
+            return 0
+        
+        cleared_count = 0
+        for tiku_id in self.get_cached_bank_ids():
+            cleared_count += self.delete_bank_questions(tiku_id)
+            try:
+                cleared_count += self._redis_client.unlink(
+                    self._get_bank_hash_key(tiku_id),
+                    self._get_cache_key(f'question_bank_{tiku_id}')
+                )
+            except Exception as e:
+                self.record_failure(e)
+                logger.error(f"删除题库 {tiku_id} 缓存失败: {e}")
+        
+        try:
+            self._redis_client.unlink(self._get_cache_key(self._BANK_INDEX_KEY))
+        except Exception as e:
+            self.record_failure(e)
+        
+        # 旧格式（未登记索引）的题库列表缓存
+        cleared_count += self.cache_delete_pattern('question_bank_*')
+        return cleared_count
+    
+    # 题库元数据索引：tiku_id -> 题库信息，一个hash保存，另有版本号供进程内副本校验
+    _TIKU_INDEX_KEY = 'tiku_index'
+    _TIKU_INDEX_VERSION_KEY = 'tiku_index_version'
+    
+    def store_tiku_index(self, tikus: List[Dict[str, Any]], ttl: Optional[int] = None) -> Optional[int]:
+        """整体覆盖题库元数据索引并递增版本号，返回新版本号"""
+        if not self.is_available:
+            return None
+        
+        try:
+            if ttl is None:
+                ttl = self._tiku_list_ttl
+            
+            redis_key = self._get_cache_key(self._TIKU_INDEX_KEY)
+            with self._redis_client.pipeline() as pipe:
+                pipe.delete(redis_key)
+                if tikus:
+                    pipe.hset(redis_key, mapping={str(t['tiku_id']): self._serialize_json(t) for t in tikus})
+                    pipe.expire(redis_key, ttl)
+                pipe.incr(self._get_cache_key(self._TIKU_INDEX_VERSION_KEY))
+                return int(pipe.execute()[-1])
+            
+        except Exception as e:
+            self.record_failure(e)
+            logger.error(f"存储题库元数据索引失败: {e}")
+            return None
+    
+    @performance_monitor
+    def get_tiku_index(self) -> Optional[Dict[int, Dict[str, Any]]]:
+        """一次HGETALL取回全部题库元数据 {tiku_id: 题库信息}，未缓存返回None"""
+        if not self.is_available:
+            return None
+        
+        try:
+            raw = self._redis_client.hgetall(self._get_cache_key(self._TIKU_INDEX_KEY))
+            if not raw:
+                return None
+            return {int(tiku_id): self._deserialize_json(data) for tiku_id, data in raw.items()}
+            
+        except Exception as e:
+            self.record_failure(e)
+            logger.error(f"获取题库元数据索引失败: {e}")
+            return None
+    
+    def get_tiku_index_version(self) -> Optional[int]:
+        """获取题库元数据索引版本号，Redis不可用时返回None"""
+        if not self.is_available:
+            return None
+        
+        try:
+            return int(self._redis_client.get(self._get_cache_key(self._TIKU_INDEX_VERSION_KEY)) or 0)
+        except Exception as e:
+            self.record_failure(e)
+            logger.error(f"获取题库元数据索引版本号失败: {e}")
+            return None
+    
+    # =========================
+    # 跨进程缓存失效通知（pub/sub）
+    # =========================
+    
+    @staticmethod
+    def _get_origin() -> str:
+        """当前进程的标识（fork后pid变化，每次重新计算）"""
+        return f"{socket.gethostname()}:{os.getpid()}"
+    
+    def register_invalidation_handler(self, handler: Callable[[str, Optional[int]], None]) -> None:
+        """
+        注册进程内缓存的失效处理函数 handler(scope, target_id)
+        scope: 'tiku' | 'question' | 'catalog' | 'all'
+        """
+        with self._invalidation_lock:
+            self._invalidation_handlers.append(handler)
+    
+    def publish_invalidation(self, scope: str, target_id: Optional[int] = None) -> bool:
+        """广播失效通知，其他worker进程的订阅线程收到后清理各自的进程内缓存"""
+        if not self.is_available:
+            return False
+        
+        try:
+            message = json.dumps({'scope': scope, 'id': target_id, 'origin': self._get_origin()})
+            self._redis_client.publish(RedisConfig.INVALIDATION_CHANNEL, message)
+            with self._invalidation_lock:
+                self._invalidation_stats['published'] += 1
+            return True
+        except Exception as e:
+            self.record_failure(e)
+            logger.error(f"发布缓存失效通知失败 {scope}:{target_id}: {e}")
+            return False
+    
+    def ensure_invalidation_listener(self) -> None:
+        """按进程懒启动订阅线程（Gunicorn preload_app 下fork后需在worker进程内重新启动）"""
+        pid = os.getpid()
+        if self._invalidation_pid == pid or not self._redis_client:
+            return
+        
+        with self._invalidation_lock:
+            if self._invalidation_pid == pid:
+                return
+            self._invalidation_pid = pid
+            threading.Thread(target=self._invalidation_loop, name="cache_invalidation", daemon=True).start()
+            logger.info(f"缓存失效通知订阅线程已启动 (pid={pid})")
+    
+    def _dispatch_invalidation(self, scope: str, target_id: Optional[int]) -> None:
+        """调用所有已注册的失效处理函数"""
+        with self._invalidation_lock:
+            handlers = list(self._invalidation_handlers)
+        
+        for handler in handlers:
+            try:
+                handler(scope, target_id)
+            except Exception as e:
+                with self._invalidation_lock:
+                    self._invalidation_stats['handler_errors'] += 1
+                logger.error(f"处理缓存失效通知失败 {scope}:{target_id}: {e}")
+    
+    def _invalidation_loop(self) -> None:
+        """订阅线程：接收失效通知并分发，连接断开后重连"""
+        connected_before = False
+        while True:
+            pubsub = None
+            try:
+                pubsub = self._redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(RedisConfig.INVALIDATION_CHANNEL)
+                
+                if connected_before:
+                    # 断线期间的通知已丢失，清空全部进程内缓存
+                    with self._invalidation_lock:
+                        self._invalidation_stats['reconnects'] += 1
+                    logger.info("缓存失效通知订阅已重连，清空进程内缓存")
+                    self._dispatch_invalidation('all', None)
+                connected_before = True
+                
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if not message or message.get('type') != 'message':
+                        continue
+                    
+                    data = json.loads(message['data'])
+                    if data.get('origin') == self._get_origin():
+                        continue  # 本进程发出的通知已在本地处理
+                    
+                    with self._invalidation_lock:
+                        self._invalidation_stats['received'] += 1
+                    self._dispatch_invalidation(data.get('scope'), data.get('id'))
+                    
+            except Exception as e:
+                self.record_failure(e)
+                logger.warning(f"缓存失效通知订阅中断，{RedisConfig.INVALIDATION_RECONNECT_DELAY}秒后重连: {e}")
+                time.sleep(RedisConfig.INVALIDATION_RECONNECT_DELAY)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+    
+    def get_invalidation_stats(self) -> Dict[str, Any]:
+        """获取失效通知统计信息"""
+        with self._invalidation_lock:
+            stats = dict(self._invalidation_stats)
+            stats['handlers'] = len(self._invalidation_handlers)
+        stats['listening'] = self._invalidation_pid == os.getpid()
+        return stats
     
     # =========================
     # 缓存管理和监控
@@ -616,6 +1345,7 @@ class RedisManager:
             }
             
         except Exception as e:
+            self.record_failure(e)
             logger.error(f"刷新Redis缓存失败: {e}")
             return {
                 'success': False,
@@ -637,24 +1367,33 @@ class RedisManager:
                     'redis_memory_rss': info.get('used_memory_rss_human')
                 })
                 
-                # 获取缓存键统计
-                cache_pattern = self._get_cache_key('*')
-                session_pattern = self._get_session_key('*')
+                # 获取缓存键统计（SCAN增量遍历，不阻塞Redis）
+                cache_keys = self.count_keys(self._get_cache_key('*'))
+                session_keys = self.count_keys(self._get_session_key('*'))
                 
-                cache_keys = len(self._redis_client.keys(cache_pattern))
-                session_keys = len(self._redis_client.keys(session_pattern))
+                # 题目缓存按索引集合统计
+                bank_ids = self.get_cached_bank_ids()
+                with self._redis_client.pipeline(transaction=False) as pipe:
+                    for tiku_id in bank_ids:
+                        pipe.scard(self._get_bank_questions_index_key(tiku_id))
+                    indexed_question_keys = sum(pipe.execute()) if bank_ids else 0
                 
                 stats.update({
                     'cache_keys_count': cache_keys,
                     'session_keys_count': session_keys,
-                    'total_keys': cache_keys + session_keys
+                    'total_keys': cache_keys + session_keys,
+                    'cached_banks_count': len(bank_ids),
+                    'indexed_question_keys': indexed_question_keys
                 })
                 
             except Exception as e:
+                self.record_failure(e)
                 logger.error(f"获取Redis统计信息失败: {e}")
                 stats['redis_error'] = str(e)
         
         stats['redis_available'] = self.is_available
+        stats['circuit_breaker'] = self._breaker.get_stats()
+        stats['invalidation_bus'] = self.get_invalidation_stats()
         return stats
     
     # =========================
@@ -682,83 +1421,3 @@ class RedisManager:
 
 # 全局Redis管理器实例
 redis_manager = RedisManager()
-
-# 需要存储在Redis中的session keys - 大数据量的keys
-REDIS_STORED_KEYS: Set[str] = {
-    SESSION_KEYS['QUESTION_INDICES'],
-    SESSION_KEYS['WRONG_INDICES'],
-    SESSION_KEYS['QUESTION_STATUSES'],
-    SESSION_KEYS['ANSWER_HISTORY']
-}
-
-
-# =========================
-# 高级接口函数
-# =========================
-
-def get_hybrid_session_value(key: str, default: Any = None) -> Any:
-    """
-    混合session值获取 - 大数据从Redis获取，小数据从cookie获取
-    如果Redis不可用，回退到数据库存储
-    """
-    # 如果是大数据key，优先从Redis获取
-    if key in REDIS_STORED_KEYS:
-        session_id = session.get('session_id')
-        logger.debug(f"混合获取key {key}: session_id={'有' if session_id else '无'}, redis_available={redis_manager.is_available}")
-        
-        if session_id and redis_manager.is_available:
-            redis_value = redis_manager.get_session_data(session_id, key)
-            logger.debug(f"Redis获取key {key}: {'有值' if redis_value is not None else '无值'}")
-            if redis_value is not None:
-                return redis_value
-        
-        # Redis不可用时回退到数据库
-        try:
-            from .session_manager import get_database_session_value
-            db_value = get_database_session_value(key, default)
-            logger.debug(f"数据库回退获取key {key}: {'有值' if db_value != default else '无值/默认值'}")
-            return db_value
-        except ImportError:
-            logger.warning("无法导入数据库session函数，返回默认值")
-            return default
-    
-    # 小数据从cookie获取
-    cookie_value = session.get(key, default)
-    logger.debug(f"Cookie获取key {key}: {'有值' if cookie_value != default else '无值/默认值'}")
-    return cookie_value
-
-
-def set_hybrid_session_value(key: str, value: Any) -> None:
-    """
-    混合session值设置 - 大数据存储在Redis，小数据存储在cookie
-    """
-    # 如果是大数据key，存储到Redis
-    if key in REDIS_STORED_KEYS:
-        session_id = session.get('session_id')
-        if not session_id:
-            # 生成新的session ID
-            session['session_id'] = session_id
-            session.modified = True
-            logger.debug(f"生成新的session_id: {session_id}")
-        
-        logger.debug(f"混合设置key {key}: session_id={session_id}, redis_available={redis_manager.is_available}")
-        
-        if redis_manager.is_available:
-            success = redis_manager.store_session_data(session_id, key, value)
-            logger.debug(f"Redis存储key {key}: {'成功' if success else '失败'}")
-            if success:
-                return
-        
-        # Redis存储失败时回退到数据库
-        try:
-            from .session_manager import set_database_session_value
-            logger.debug(f"回退到数据库存储key {key}")
-            set_database_session_value(key, value)
-            return
-        except ImportError:
-            logger.warning("无法导入数据库session函数，数据可能丢失")
-    
-    # 小数据存储在cookie
-    logger.debug(f"设置小数据key {key} 到cookie")
-    session[key] = value
-    session.modified = True
@@ -0,0 +1,56 @@
+"""
+题库缓存快照 - 启动预热时把进程内题库存储序列化到本地文件，
+下次启动先读快照，只有指纹与数据库不一致的题库才重新查询MySQL
+"""
+import logging
+import os
+import pickle
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 1
+
+
+def load_snapshot(path: str) -> Dict[int, Dict[str, Any]]:
+    """
+    读取快照，返回 {tiku_id: {'fingerprint', 'questions', 'type_partitions'}}
+    文件不存在、损坏或格式版本不符时返回空字典
+    """
+    if not os.path.exists(path):
+        logger.info(f"题库缓存快照不存在: {path}")
+        return {}
+
+    try:
+        with open(path, 'rb') as f:
+            snapshot = pickle.load(f)
+    except Exception as e:
+        logger.warning(f"读取题库缓存快照失败，忽略快照: {e}")
+        return {}
+
+    if not isinstance(snapshot, dict) or snapshot.get('format') != SNAPSHOT_FORMAT:
+        logger.warning("题库缓存快照格式不符，忽略快照")
+        return {}
+    return snapshot['banks']
+
+
+def save_snapshot(path: str, banks: Dict[int, Dict[str, Any]]) -> Optional[int]:
+    """写入快照（先写临时文件再原子替换），返回文件大小，失败返回None"""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(temp_path, 'wb') as f:
+            pickle.dump({'format': SNAPSHOT_FORMAT, 'created_at': time.time(), 'banks': banks},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+        return os.path.getsize(path)
+    except Exception as e:
+        logger.error(f"写入题库缓存快照失败: {e}")
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        return None
@@ -9,7 +9,7 @@ class DatabaseConfig:
     # MySQL 连接池配置
     MYSQL_POOL_CONFIG = {
         'pool_name': "mypool",
-        'pool_size': 10,  # 连接池大小，可根据并发需求调整
+        # 连接池大小不在此固定，由 db_manager 按 ServerConfig 的worker/线程配置计算（见 CONNECTION_MANAGER_CONFIG）
         'pool_reset_session': True,  # 确保每次获取的连接状态是干净的
         'host': "14.103.133.62",
         'user': "shuati",
@@ -25,6 +25,15 @@ class DatabaseConfig:
         'sql_mode': 'STRICT_TRANS_TABLES,NO_ZERO_DATE,NO_ZERO_IN_DATE,ERROR_FOR_DIVISION_BY_ZERO'
     }
 
+    # 连接管理配置 - 每个进程的连接数 = 处理请求的线程数 + 后台线程数（写回队列、导入任务）+ extra_connections，
+    # 并受 max_total_connections / worker数 和 mysql.connector 的上限(32)约束
+    CONNECTION_MANAGER_CONFIG = {
+        'extra_connections': 2,  # 缓存预热、定时任务等其他后台线程
+        'max_total_connections': 150,  # 所有worker进程合计不超过该值（需小于MySQL max_connections）
+        'checkout_timeout': 5.0,  # 连接池耗尽时排队等待的最长时间(秒)，超时抛出ConnectionError
+        'validate_on_checkout': False  # 取出连接时先ping（断线自动重连），网络不稳定时开启
+    }
+
     # 连接重试配置
     CONNECTION_RETRY_CONFIG = {
         'max_retries': 3,
@@ -32,6 +41,35 @@ class DatabaseConfig:
         'backoff_factor': 2
     }
 
+    # 练习会话写回队列配置 - 答题状态先入队合并，由固定数量的后台线程批量写库
+    PRACTICE_WRITE_BEHIND_CONFIG = {
+        'workers': 2,  # 后台写库线程数，远小于连接池大小
+        'max_pending': 2000,  # 最多排队的练习会话数（同一会话的多次更新只占一个位置）
+        'batch_size': 50,  # 每批最多写入的会话数
+        'flush_interval': 0.5,  # 攒批等待时间(秒)
+        'enqueue_timeout': 0.2,  # 队列已满时入队最长等待时间(秒)，超时则在请求线程同步写入
+        'max_attempts': 3  # 单个会话写入失败（非数据库不可用）的最多次数，超过后记录日志并丢弃
+    }
+
+    # 练习会话快照间隔 - 每次答题只追加一条答题事件，每答这么多题才写一次完整状态快照
+    PRACTICE_SNAPSHOT_INTERVAL = 50
+
+    # 批量读取题目时每次 fetchmany 的行数（非缓冲游标流式读取）
+    STREAM_FETCH_SIZE = 1000
+
+    # 题目批量导入配置 - 多行VALUES插入，按块提交避免长事务
+    BULK_INSERT_CONFIG = {
+        'batch_size': 500,  # 每条INSERT语句包含的行数（受max_allowed_packet限制）
+        'chunk_rows': 5000,  # 每个事务提交的行数
+        'delete_chunk_rows': 5000  # 按题库删除题目时每次DELETE的行数
+    }
+
+    # 题库后台导入任务配置
+    IMPORT_JOB_CONFIG = {
+        'workers': 2,  # 每个进程同时执行的导入任务数
+        'job_ttl': 86400  # 任务状态保留时间(秒)
+    }
+
 
 # --- Redis 配置 ---
 class RedisConfig:
@@ -53,10 +91,82 @@ class RedisConfig:
         'health_check_interval': 30
     }
 
+    # 熔断器配置 - 以命令执行结果判断可用性，避免每次调用前PING
+    CIRCUIT_BREAKER_CONFIG = {
+        'failure_threshold': 3,  # 连续失败次数达到阈值后熔断
+        'reset_timeout': 10  # 熔断后等待多少秒进入半开状态尝试恢复
+    }
+
+    # 跨进程缓存失效通知配置 - 各worker订阅该频道，收到后清理进程内缓存
+    INVALIDATION_CHANNEL = 'cache:invalidation'
+    INVALIDATION_RECONNECT_DELAY = 2  # 订阅连接断开后重连等待秒数
+
+    # 启动预热快照配置 - 启动时读取本地题库快照，只重新查询指纹变化的题库
+    WARM_START_CONFIG = {
+        'enabled': True,
+        'snapshot_path': 'cache/question_snapshot.pkl'
+    }
+
     # Session 存储配置
     REDIS_SESSION_PREFIX = 'session:'
     REDIS_SESSION_TTL = 7200  # 2小时，与Flask session保持一致
 
+    # 题库使用次数计数 - 各worker通过HINCRBY累加到共享hash，由抢到锁的worker定期批量写入MySQL
+    USAGE_COUNTER_CONFIG = {
+        'key_prefix': 'usage:tiku:',
+        'flush_interval': 30,  # 写库间隔(秒)，每个间隔最多一个worker写库
+        'lock_ttl': 300  # 写库锁有效期(秒)，应远大于最慢的一次写库；写库前续期，完成后释放
+    }
+
+    # 使用统计 - 按小时/按天分桶的使用次数有序集合 + 总排行有序集合，
+    # 汇总文档由后台监控线程定期重建，接口只读汇总文档
+    USAGE_ANALYTICS_CONFIG = {
+        'key_prefix': 'usage:',
+        'hour_retention': 48,  # 小时桶保留小时数，也是按小时查询的最大窗口
+        'day_retention': 90,  # 天桶保留天数，也是按天查询的最大窗口
+        'summary_ttl': 300,  # 汇总文档有效期(秒)，过期后由请求重新生成
+        'window_cache_ttl': 60,  # 时间窗口合并结果缓存(秒)
+        'top_subjects': 50,  # 汇总文档保留的科目排行数量
+        'top_tikus': 100  # 汇总文档保留的题库排行数量
+    }
+
+    # 管理后台统计面板缓存 - 超过 fresh_ttl 的统计先返回旧数据，同时由一个worker在后台重新统计
+    DASHBOARD_STATS_CONFIG = {
+        'fresh_ttl': 60,  # 统计数据新鲜期(秒)，超过后在后台刷新
+        'stale_ttl': 600,  # 统计数据在Redis中的最长保留时间(秒)，超过后请求同步重新统计
+        'refresh_lock_ttl': 30  # 后台刷新锁有效期(秒)，同一时间只有一个worker执行统计查询
+    }
+
+    # 管理后台列表总数缓存 - 题目/用户分页的总数缓存在Redis，管理操作增删题目/注册用户时失效，
+    # 其余情况（如直接修改数据库）在有效期后自然刷新，总数为近似值
+    LISTING_COUNT_CONFIG = {
+        'key_prefix': 'listing_count:',
+        'ttl': 600  # 总数缓存有效期(秒)
+    }
+
+    # 用户练习统计读模型 - 每个用户一个汇总hash，开始/完成练习时增量更新，缺失时从数据库重建
+    USER_STATS_CONFIG = {
+        'key_prefix': 'user_stats:',
+        'ttl': 7 * 86400,  # 汇总hash有效期(秒)，过期后从数据库重建，同时限制增量累加偏差的存续时间
+        'recent_limit': 10  # 最近练习记录条数
+    }
+
+    # 练习状态存储 - 题目列表/答题状态/错题/答题历史按练习会话存于独立的Redis结构，
+    # Flask session只保留少量标量，答题时按字段更新
+    PRACTICE_STATE_CONFIG = {
+        'enabled': True,
+        'key_prefix': 'practice_state:',
+        'ttl': 7200  # 与Flask session保持一致，每次写入时续期；过期后从数据库恢复
+    }
+
+    # Session 生命周期配置 - 重启不清空session，按结构版本懒迁移，后台压缩过大的session
+    SESSION_LIFECYCLE_CONFIG = {
+        'schema_version': 3,  # 当前session结构版本，结构变化时递增并在 session_lifecycle 中添加迁移
+        'compact_interval': 600,  # 后台压缩间隔(秒)，多个worker通过Redis锁保证同一时间只有一个在执行
+        'compact_threshold_bytes': 8192,  # 超过该大小的session才尝试压缩
+        'scan_count': 500  # 每次SCAN返回的键数量提示
+    }
+
     # Flask-Session 配置
     FLASK_SESSION_PREFIX = 'flask_session:'
     FLASK_SESSION_TTL = 7200  # 2小时
@@ -123,6 +233,9 @@ QUESTION_STATUS = {
     'WRONG': 2  # 答错/查看答案
 }
 
+# 提交答案的最大长度（与 practice_answer_events.user_answer 列长度一致，超长会导致批量写入事务失败）
+ANSWER_MAX_LENGTH = 64
+
 # 状态映射（用于调试和日志）
 QUESTION_STATUS_NAMES = {
     0: 'unanswered',
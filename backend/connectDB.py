@@ -1,25 +1,25 @@
 import hashlib
 import json
 import logging
+from collections import defaultdict
 from datetime import datetime, timedelta
 from functools import wraps
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Iterable, Iterator, Callable, Tuple
 
 from mysql.connector import Error
-from mysql.connector import pooling
 
-from backend.config import DatabaseConfig
+from backend import session_codec
+from backend.config import DatabaseConfig, QUESTION_STATUS
+from backend.db_manager import connection_manager, release_db_resources
 
 logger = logging.getLogger(__name__)
-db_pool = None
 
 
 def init_connection_pool():
-    global db_pool
+    """创建连接池并验证数据库可用（各worker进程在第一次取连接时会重新创建自己的连接池）"""
     try:
-        # 使用config.py中的配置参数
-        db_pool = pooling.MySQLConnectionPool(**DatabaseConfig.MYSQL_POOL_CONFIG)
-        print("数据库连接池创建成功")
+        connection_manager.init()
+        print(f"数据库连接池创建成功: 每个进程 {connection_manager.pool_size} 个连接")
     except Error as e:
         print(f"创建数据库连接池失败: {e}")
         exit(1)
@@ -27,62 +27,29 @@ def init_connection_pool():
 
 
 def get_db_connection():
-    """从连接池获取数据库连接"""
-    global db_pool
-    if db_pool is None:
-        # 实际应用中，这里应该有更健壮的错误处理或重试逻辑
-        # 或者确保 init_connection_pool() 已经被成功调用
-        print("错误：连接池未初始化")
-        # Consider raising an exception here or ensuring init_connection_pool is always called
-        raise ConnectionError("Database connection pool not initialized.")
-    try:
-        # 从池中获取连接
-        connection = db_pool.get_connection()
-        return connection
-    except Error as e:
-        print(f"从连接池获取连接失败: {e}")
-        # Consider raising an exception here
-        raise ConnectionError(f"Failed to get connection from pool: {e}")
+    """从连接池获取数据库连接（连接池耗尽时排队等待，超时抛出ConnectionError），用完必须close()归还"""
+    return connection_manager.get_connection()
 
 
 # New decorator for handling DB connection and cursor
 def with_db_connection(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
-        conn = None
-        cursor = None
-        try:
-            conn = get_db_connection()
-            # Assuming operations might want to manage transactions or need the connection
-            # Pass cursor to the wrapped function. Adjust if connection also needed.
-            # Using dictionary=True for cursor to get results as dicts, common for APIs.
+        with connection_manager.connection() as conn:
             cursor = conn.cursor(dictionary=True)
-            result = func(cursor, *args, **kwargs)
-            # If the function itself doesn't commit (e.g. for transactions spanning multiple calls),
-            # this commit might be too broad. For now, assuming functions are atomic or manage their own commits.
-            # If autocommit is True (as per DatabaseConfig.MYSQL_POOL_CONFIG default), this explicit commit is not strictly needed for SELECTs
-            # but good for INSERT/UPDATE/DELETE if autocommit was False or transaction started.
-            if conn.autocommit is False:
-                conn.commit()
-            return result
-        except Error as e:
-            print(f"Database operation error in {func.__name__}: {e}")
-            if conn and conn.autocommit is False:
-                conn.rollback()
-            # Propagate the error or return a standardized error structure
-            # For now, re-raising to be handled by @handle_api_error or similar in routes
-            raise  # Or return {"success": False, "error": str(e)} if that's the standard
-        finally:
-            if cursor:
+            try:
+                return func(cursor, *args, **kwargs)
+            except Error as e:
+                print(f"Database operation error in {func.__name__}: {e}")
+                # 各函数自行管理事务（默认自动提交），这里只负责回滚未提交的事务
                 try:
-                    cursor.close()
-                except Error as e:
-                    print(f"Error closing cursor: {e}")
-            if conn and conn.is_connected():
-                try:
-                    conn.close()  # Returns connection to the pool
-                except Error as e:
-                    print(f"Error closing connection: {e}")
+                    conn.rollback()
+                except Error:
+                    pass
+                # 交由 @handle_api_error 等上层处理
+                raise
+            finally:
+                release_db_resources(cursor)
 
     return wrapper
 
@@ -177,14 +144,7 @@ def create_user(username: str, password: str, invitation_code_id: int) -> Dict[s
             print(f"Error during rollback: {ex_rollback}")
         return {"success": False, "error": f"创建用户失败: {str(e)}"}
     finally:
-        try:
-            if cursor:
-                cursor.close()
-            if connection and connection.is_connected():
-                connection.autocommit = True  # 恢复默认设置
-                connection.close()
-        except Error as ex_finally:  # Catch specific error for finally block
-            print(f"Error in finally block of create_user: {ex_finally}")
+        release_db_resources(cursor, connection)
 
 
 @with_db_connection
@@ -312,8 +272,7 @@ def create_invitation_code(code: str, expires_days: Optional[int] = None) -> Dic
     except Error as e:
         return {"success": False, "error": f"创建邀请码失败: {str(e)}"}
     finally:
-        if connection.is_connected():
-            connection.close()
+        release_db_resources(connection=connection)
 
 
 def cleanup_expired_practice_sessions() -> int:
@@ -322,6 +281,7 @@ def cleanup_expired_practice_sessions() -> int:
     if not connection:
         return 0
 
+    cursor = None
     try:
         cursor = connection.cursor()
         query = """
@@ -338,10 +298,7 @@ def cleanup_expired_practice_sessions() -> int:
     except Error:
         return 0
     finally:
-        if cursor:
-            cursor.close()
-        if connection.is_connected():
-            connection.close()
+        release_db_resources(cursor, connection)
 
 
 # 测试连接函数（仅在直接运行时使用）
@@ -359,10 +316,7 @@ def test_connection():
             print(f"Database query error: {e}")
             return False
         finally:
-            if cursor:
-                cursor.close()
-            if connection.is_connected():
-                connection.close()
+            release_db_resources(cursor, connection)
     else:
         print("Failed to connect to database")
         return False
@@ -375,6 +329,7 @@ def get_all_subjects() -> list:
     if not connection:
         return []
 
+    cursor = None
     try:
         cursor = connection.cursor()
         query = """
@@ -398,10 +353,7 @@ def get_all_subjects() -> list:
         print(f"Error getting subjects: {e}")
         return []
     finally:
-        if cursor:
-            cursor.close()
-        if connection.is_connected():
-            connection.close()
+        release_db_resources(cursor, connection)
 
 
 def create_subject(subject_name: str, exam_time: str = None) -> Dict[str, Any]:
@@ -410,6 +362,7 @@ def create_subject(subject_name: str, exam_time: str = None) -> Dict[str, Any]:
     if not connection:
         return {"success": False, "error": "数据库连接失败"}
 
+    cursor = None
     try:
         cursor = connection.cursor()
 
@@ -438,10 +391,7 @@ def create_subject(subject_name: str, exam_time: str = None) -> Dict[str, Any]:
     except Error as e:
         return {"success": False, "error": f"创建科目失败: {str(e)}"}
     finally:
-        if cursor:
-            cursor.close()
-        if connection.is_connected():
-            connection.close()
+        release_db_resources(cursor, connection)
 
 
 def update_subject(subject_id: int, subject_name: str, exam_time: str = None) -> Dict[str, Any]:
@@ -450,6 +400,7 @@ def update_subject(subject_id: int, subject_name: str, exam_time: str = None) ->
     if not connection:
         return {"success": False, "error": "数据库连接失败"}
 
+    cursor = None
     try:
         cursor = connection.cursor()
 
@@ -479,10 +430,7 @@ def update_subject(subject_id: int, subject_name: str, exam_time: str = None) ->
     except Error as e:
         return {"success": False, "error": f"更新科目失败: {str(e)}"}
     finally:
-        if cursor:
-            cursor.close()
-        if connection.is_connected():
-            connection.close()
+        release_db_resources(cursor, connection)
 
 
 def delete_subject(subject_id: int) -> Dict[str, Any]:
@@ -491,6 +439,7 @@ def delete_subject(subject_id: int) -> Dict[str, Any]:
     if not connection:
         return {"success": False, "error": "数据库连接失败"}
 
+    cursor = None
     try:
         cursor = connection.cursor()
 
@@ -524,10 +473,7 @@ def delete_subject(subject_id: int) -> Dict[str, Any]:
         connection.rollback()
         return {"success": False, "error": f"删除科目失败: {str(e)}"}
     finally:
-        if cursor:
-            cursor.close()
-        if connection.is_connected():
-            connection.close()
+        release_db_resources(cursor, connection)
 
 
 def get_tiku_by_subject(subject_id: int = None) -> list:
@@ -536,6 +482,7 @@ def get_tiku_by_subject(subject_id: int = None) -> list:
     if not connection:
         return []
 
+    cursor = None
     try:
         cursor = connection.cursor()
 
@@ -598,10 +545,7 @@ def get_tiku_by_subject(subject_id: int = None) -> list:
         print(f"Error getting tiku: {e}")
         return []
     finally:
-        if cursor:
-            cursor.close()
-        if connection.is_connected():
-            connection.close()
+        release_db_resources(cursor, connection)
 
 
 def create_or_update_tiku(subject_id: int, tiku_name: str, tiku_position: str,
@@ -611,6 +555,8 @@ def create_or_update_tiku(subject_id: int, tiku_name: str, tiku_position: str,
     if not connection:
         return {"success": False, "error": "数据库连接失败"}
 
+    cursor = None
+    action = "保存"
     try:
         cursor = connection.cursor()
 
@@ -653,16 +599,33 @@ def create_or_update_tiku(subject_id: int, tiku_name: str, tiku_position: str,
         return {
             "success": True,
             "tiku_id": tiku_id,
+            "created": not existing_tiku,
             "message": f"题库{action}成功"
         }
 
     except Error as e:
         return {"success": False, "error": f"{action}题库失败: {str(e)}"}
     finally:
-        if cursor:
-            cursor.close()
-        if connection.is_connected():
-            connection.close()
+        release_db_resources(cursor, connection)
+
+
+def update_tiku_question_count(tiku_id: int, tiku_nums: int) -> Dict[str, Any]:
+    """更新题库的题目数量（批量导入完成后以实际插入的数量为准）"""
+    connection = get_db_connection()
+    if not connection:
+        return {"success": False, "error": "数据库连接失败"}
+
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute("UPDATE tiku SET tiku_nums = %s, updated_at = CURRENT_TIMESTAMP WHERE tiku_id = %s",
+                       (tiku_nums, tiku_id))
+        return {"success": True, "message": "题目数量已更新"}
+
+    except Error as e:
+        return {"success": False, "error": f"更新题库题目数量失败: {str(e)}"}
+    finally:
+        release_db_resources(cursor, connection)
 
 
 def delete_tiku(tiku_id: int) -> Dict[str, Any]:
@@ -671,6 +634,7 @@ def delete_tiku(tiku_id: int) -> Dict[str, Any]:
     if not connection:
         return {"success": False, "error": "数据库连接失败"}
 
+    cursor = None
     try:
         cursor = connection.cursor()
 
@@ -695,10 +659,7 @@ def delete_tiku(tiku_id: int) -> Dict[str, Any]:
     except Error as e:
         return {"success": False, "error": f"删除题库失败: {str(e)}"}
     finally:
-        if cursor:
-            cursor.close()
-        if connection.is_connected():
-            connection.close()
+        release_db_resources(cursor, connection)
 
 
 def toggle_tiku_status(tiku_id: int) -> Dict[str, Any]:
@@ -707,6 +668,7 @@ def toggle_tiku_status(tiku_id: int) -> Dict[str, Any]:
     if not connection:
         return {"success": False, "error": "数据库连接失败"}
 
+    cursor = None
     try:
         cursor = connection.cursor()
 
@@ -732,20 +694,24 @@ def toggle_tiku_status(tiku_id: int) -> Dict[str, Any]:
     except Error as e:
         return {"success": False, "error": f"更新题库状态失败: {str(e)}"}
     finally:
-        if cursor:
-            cursor.close()
-        if connection.is_connected():
-            connection.close()
+        release_db_resources(cursor, connection)
 
 
 def batch_update_tiku_usage(usage_stats: dict) -> dict[str, bool | str] | dict[str, bool | int | str | Any] | None:
-    """批量更新题库使用次数"""
+    """
+    批量更新题库使用次数
+    一条CASE语句累加所有题库的使用次数，再用一条分组汇总语句重算涉及科目的使用次数
+    """
+    usage_stats = {int(tiku_id): int(count) for tiku_id, count in usage_stats.items() if count}
+    if not usage_stats:
+        return {"success": True, "updated_tiku_count": 0, "updated_subject_count": 0, "message": "没有需要更新的使用次数"}
+
     connection = get_db_connection()
     if not connection:
         return {"success": False, "error": "数据库连接失败"}
 
     cursor = None
-    all_counts = 0
+    all_counts = sum(usage_stats.values())
     try:
         # 确保事务管理正确
         connection.autocommit = False
@@ -754,47 +720,36 @@ def batch_update_tiku_usage(usage_stats: dict) -> dict[str, bool | str] | dict[s
         # 开始事务
         connection.start_transaction()
 
-        updated_count = 0
-        updated_subjects = set()
-
-        for tiku_id, usage_count in usage_stats.items():
-            # 更新题库使用次数
-            update_tiku_query = """
-                                UPDATE tiku
-                                SET used_count = used_count + %s
-                                WHERE tiku_id = %s
-                                """
-            cursor.execute(update_tiku_query, (usage_count, tiku_id))
-            all_counts += usage_count
-
-            if cursor.rowcount > 0:
-                updated_count += 1
-
-                # 获取对应的科目ID并更新科目使用次数
-                cursor.execute("SELECT subject_id FROM tiku WHERE tiku_id = %s", (tiku_id,))
-                result = cursor.fetchone()
-                if result:
-                    subject_id = result[0]
-                    updated_subjects.add(subject_id)
-
-        # 更新科目使用次数
-        for subject_id in updated_subjects:
-            update_subject_query = """
-                                   UPDATE subject
-                                   SET used_count = (SELECT COALESCE(SUM(used_count), 0)
-                                                     FROM tiku
-                                                     WHERE subject_id = %s)
-                                   WHERE subject_id = %s
-                                   """
-            cursor.execute(update_subject_query, (subject_id, subject_id))
+        tiku_ids = list(usage_stats)
+        id_placeholders = ', '.join(['%s'] * len(tiku_ids))
+        case_params = [value for item in usage_stats.items() for value in item]
+
+        # 更新题库使用次数
+        cursor.execute(f"""
+                       UPDATE tiku
+                       SET used_count = used_count + CASE tiku_id {' '.join(['WHEN %s THEN %s'] * len(tiku_ids))} END
+                       WHERE tiku_id IN ({id_placeholders})
+                       """, case_params + tiku_ids)
+        updated_count = cursor.rowcount
+
+        # 按科目分组汇总，更新涉及科目的使用次数
+        cursor.execute(f"""
+                       UPDATE subject s
+                           JOIN (SELECT subject_id, COALESCE(SUM(used_count), 0) AS total
+                                 FROM tiku
+                                 WHERE subject_id IN (SELECT subject_id FROM tiku WHERE tiku_id IN ({id_placeholders}))
+                                 GROUP BY subject_id) t ON s.subject_id = t.subject_id
+                       SET s.used_count = t.total
+                       """, tiku_ids)
+        updated_subject_count = cursor.rowcount
 
         connection.commit()
 
         return {
             "success": True,
             "updated_tiku_count": updated_count,
-            "updated_subject_count": len(updated_subjects),
-            "message": f"成功更新{updated_count}个题库和{len(updated_subjects)}个科目的使用次数{all_counts}次"
+            "updated_subject_count": updated_subject_count,
+            "message": f"成功更新{updated_count}个题库和{updated_subject_count}个科目的使用次数{all_counts}次"
         }
 
     except Error as e:
@@ -805,14 +760,7 @@ def batch_update_tiku_usage(usage_stats: dict) -> dict[str, bool | str] | dict[s
             pass
         return {"success": False, "error": f"批量更新使用次数失败: {str(e)}"}
     finally:
-        try:
-            if cursor:
-                cursor.close()
-            if connection and connection.is_connected():
-                connection.autocommit = True  # 恢复默认设置
-                connection.close()
-        except:
-            pass  # 忽略清理时的错误
+        release_db_resources(cursor, connection)
 
 
 def get_usage_statistics() -> dict[str, bool | str] | dict[str, bool | list[dict[str, Any]] | list[Any]] | None:
@@ -860,305 +808,584 @@ def get_usage_statistics() -> dict[str, bool | str] | dict[str, bool | list[dict
     except Error as e:
         return {"success": False, "error": f"获取使用统计失败: {str(e)}"}
     finally:
-        try:
-            if cursor:
-                cursor.close()
-            if connection and connection.is_connected():
-                connection.close()
-        except:
-            return None
+        release_db_resources(cursor, connection)
 
 
-# 题目管理相关函数
-def insert_questions_batch(questions_data: list) -> Dict[str, Any]:
-    """批量插入题目到数据库"""
+def get_usage_totals() -> Dict[str, Any]:
+    """获取全部题库和科目的累计使用次数及名称（用于重建使用统计排行）"""
     connection = get_db_connection()
     if not connection:
         return {"success": False, "error": "数据库连接失败"}
 
     cursor = None
     try:
-        connection.autocommit = False
         cursor = connection.cursor()
 
-        # 开始事务
-        connection.start_transaction()
+        cursor.execute("""
+                       SELECT subject_id, subject_name, used_count
+                       FROM subject
+                       """)
+        subjects = [{"subject_id": row[0], "subject_name": row[1], "used_count": row[2] or 0}
+                    for row in cursor.fetchall()]
 
-        insert_query = """
-                       INSERT INTO questions (subject_id, tiku_id, question_type, stem, option_a, option_b, option_c,
-                                              option_d, answer, explanation, difficulty, status)
-                       VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) \
-                       """
+        cursor.execute("""
+                       SELECT t.tiku_id, t.tiku_name, t.tiku_position, t.subject_id, s.subject_name, t.used_count
+                       FROM tiku t
+                                JOIN subject s ON t.subject_id = s.subject_id
+                       """)
+        tikus = [{"tiku_id": row[0], "tiku_name": row[1], "tiku_position": row[2], "subject_id": row[3],
+                  "subject_name": row[4], "used_count": row[5] or 0}
+                 for row in cursor.fetchall()]
 
-        inserted_count = 0
-        for question in questions_data:
-            cursor.execute(insert_query, (
-                question['subject_id'],
-                question['tiku_id'],
-                question['question_type'],
-                question['stem'],
-                question.get('option_a'),
-                question.get('option_b'),
-                question.get('option_c'),
-                question.get('option_d'),
-                question['answer'],
-                question.get('explanation'),
-                question.get('difficulty', 1),
-                question.get('status', 'active')
-            ))
-            inserted_count += 1
+        return {"success": True, "subjects": subjects, "tikus": tikus}
+
+    except Error as e:
+        return {"success": False, "error": f"获取使用次数失败: {str(e)}"}
+    finally:
+        release_db_resources(cursor, connection)
+
+
+# 题目管理相关函数
+QUESTION_INSERT_COLUMNS = ('subject_id', 'tiku_id', 'question_type', 'stem', 'option_a', 'option_b', 'option_c',
+                           'option_d', 'answer', 'explanation', 'difficulty', 'status')
+
+
+def _question_insert_row(question: Dict[str, Any]) -> tuple:
+    """题目字典转为INSERT参数"""
+    return (
+        question['subject_id'],
+        question['tiku_id'],
+        question['question_type'],
+        question['stem'],
+        question.get('option_a'),
+        question.get('option_b'),
+        question.get('option_c'),
+        question.get('option_d'),
+        question['answer'],
+        question.get('explanation'),
+        question.get('difficulty', 1),
+        question.get('status', 'active')
+    )
+
+
+def bulk_insert_questions(questions_data: Iterable[Dict[str, Any]], batch_size: int = None,
+                          chunk_rows: int = None,
+                          progress_callback: Optional[Callable[[int], None]] = None) -> Dict[str, Any]:
+    """
+    批量导入题目：每条INSERT语句插入 batch_size 行（多行VALUES），
+    每 chunk_rows 行提交一次事务，避免大题库长时间占用一个事务
+    :param questions_data: 题目字典的可迭代对象（可以是生成器，边解析边写入）
+    :param progress_callback: 每次提交后以已插入的行数调用
+    失败时已提交的块不会回滚，返回值中的 inserted_count 为已提交的行数
+    返回值中的 inserted_id_ranges 为本次插入的题目ID区间 [(first_id, last_id)]（每条多行INSERT一个区间，
+    多行VALUES的INSERT一次分配连续的自增ID），用于只启用/删除本次写入的题目
+    """
+    batch_size = batch_size or DatabaseConfig.BULK_INSERT_CONFIG['batch_size']
+    chunk_rows = max(chunk_rows or DatabaseConfig.BULK_INSERT_CONFIG['chunk_rows'], batch_size)
+
+    connection = get_db_connection()
+    if not connection:
+        return {"success": False, "error": "数据库连接失败", "inserted_count": 0}
+
+    columns = ', '.join(QUESTION_INSERT_COLUMNS)
+    row_placeholder = '(' + ', '.join(['%s'] * len(QUESTION_INSERT_COLUMNS)) + ')'
+
+    cursor = None
+    inserted_count = 0
+    inserted_id_ranges: List[Tuple[int, int]] = []
+    try:
+        cursor = connection.cursor()
+
+        def flush(rows: List[tuple]):
+            cursor.execute(
+                f"INSERT INTO questions ({columns}) VALUES " + ', '.join([row_placeholder] * len(rows)),
+                [value for row in rows for value in row]
+            )
+            inserted_id_ranges.append((cursor.lastrowid, cursor.lastrowid + len(rows) - 1))
 
+        batch: List[tuple] = []
+        uncommitted = 0
+        connection.start_transaction()
+        for question in questions_data:
+            batch.append(_question_insert_row(question))
+            if len(batch) < batch_size:
+                continue
+
+            flush(batch)
+            uncommitted += len(batch)
+            batch = []
+
+            if uncommitted >= chunk_rows:
+                connection.commit()
+                inserted_count += uncommitted
+                uncommitted = 0
+                logger.info(f"批量导入题目进度: 已提交 {inserted_count} 道")
+                if progress_callback:
+                    progress_callback(inserted_count)
+                connection.start_transaction()
+
+        if batch:
+            flush(batch)
+            uncommitted += len(batch)
         connection.commit()
+        inserted_count += uncommitted
+        if progress_callback and uncommitted:
+            progress_callback(inserted_count)
 
         return {
             "success": True,
             "inserted_count": inserted_count,
+            "inserted_id_ranges": inserted_id_ranges,
             "message": f"成功插入{inserted_count}道题目"
         }
 
     except Error as e:
         try:
-            if connection:
-                connection.rollback()
-        except:
+            connection.rollback()
+        except Error:
             pass
-        return {"success": False, "error": f"批量插入题目失败: {str(e)}"}
+        # 已回滚的区间也一并返回：自增ID不会重用，清理时按区间删除不会误删其他题目
+        return {"success": False, "error": f"批量插入题目失败: {str(e)}", "inserted_count": inserted_count,
+                "inserted_id_ranges": inserted_id_ranges}
     finally:
+        release_db_resources(cursor, connection)
+
+
+def insert_questions_batch(questions_data: list) -> Dict[str, Any]:
+    """批量插入题目到数据库（多行INSERT，按块提交）"""
+    return bulk_insert_questions(questions_data)
+
+
+def get_question_id_watermark() -> Optional[int]:
+    """获取当前最大的题目ID，此后插入的题目ID都大于该值（用于区分暂存的新题目）"""
+    connection = get_db_connection()
+    if not connection:
+        return None
+
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM questions")
+        return cursor.fetchone()[0]
+    except Error as e:
+        logger.error(f"获取题目ID水位失败: {e}")
+        return None
+    finally:
+        release_db_resources(cursor, connection)
+
+
+def swap_staged_questions(tiku_id: int, watermark: int, staged_id_ranges: List[Tuple[int, int]]) -> Dict[str, Any]:
+    """
+    在一个事务内用暂存的新题目替换题库的旧题目：
+    删除导入开始前已存在的旧题目（ID不大于水位），只启用本次导入写入的题目（staged_id_ranges），
+    导入期间其他任务或管理员写入的题目不受影响；最后更新题库题目数量
+    """
+    connection = get_db_connection()
+    if not connection:
+        return {"success": False, "error": "数据库连接失败"}
+
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        connection.start_transaction()
+
+        cursor.execute("DELETE FROM questions WHERE tiku_id = %s AND id <= %s", (tiku_id, watermark))
+        deleted_count = cursor.rowcount
+
+        cursor.executemany("""
+                           UPDATE questions
+                           SET status = 'active'
+                           WHERE tiku_id = %s
+                             AND id BETWEEN %s AND %s
+                           """, [(tiku_id, first_id, last_id) for first_id, last_id in staged_id_ranges])
+        cursor.execute("SELECT COUNT(*) FROM questions WHERE tiku_id = %s", (tiku_id,))
+        question_count = cursor.fetchone()[0]
+
+        cursor.execute("UPDATE tiku SET tiku_nums = %s, updated_at = CURRENT_TIMESTAMP WHERE tiku_id = %s",
+                       (question_count, tiku_id))
+        connection.commit()
+
+        return {
+            "success": True,
+            "deleted_count": deleted_count,
+            "question_count": question_count,
+            "message": f"题库题目已替换，共{question_count}道题目"
+        }
+
+    except Error as e:
         try:
-            if cursor:
-                cursor.close()
-            if connection and connection.is_connected():
-                connection.autocommit = True
-                connection.close()
-        except:
+            connection.rollback()
+        except Error:
             pass
+        return {"success": False, "error": f"替换题库题目失败: {str(e)}"}
+    finally:
+        release_db_resources(cursor, connection)
+
 
+def delete_staged_questions(tiku_id: int, staged_id_ranges: List[Tuple[int, int]],
+                            chunk_rows: int = None) -> Dict[str, Any]:
+    """删除导入失败时残留的暂存题目（只删除本次导入写入的ID区间内、尚未启用的题目），分块删除"""
+    chunk_rows = chunk_rows or DatabaseConfig.BULK_INSERT_CONFIG['delete_chunk_rows']
 
-def get_questions_by_tiku(tiku_id: int = None) -> list:
-    """根据题库ID获取题目列表，如果不指定则获取所有题目"""
     connection = get_db_connection()
     if not connection:
-        return []
+        return {"success": False, "error": "数据库连接失败"}
 
     cursor = None
     try:
         cursor = connection.cursor()
+        count = 0
+        for first_id, last_id in staged_id_ranges:
+            while True:
+                cursor.execute("""
+                               DELETE FROM questions
+                               WHERE tiku_id = %s
+                                 AND id BETWEEN %s AND %s
+                                 AND status = 'inactive'
+                               LIMIT %s
+                               """, (tiku_id, first_id, last_id, chunk_rows))
+                count += cursor.rowcount
+                if cursor.rowcount < chunk_rows:
+                    break
+        return {"success": True, "deleted_count": count}
 
-        if tiku_id:
-            query = """
-                    SELECT q.id,
-                           q.subject_id,
-                           q.tiku_id,
-                           q.question_type,
-                           q.stem,
-                           q.option_a,
-                           q.option_b,
-                           q.option_c,
-                           q.option_d,
-                           q.answer,
-                           q.explanation,
-                           q.difficulty,
-                           q.status,
-                           s.subject_name,
-                           t.tiku_name
-                    FROM questions q
-                             LEFT JOIN subject s ON q.subject_id = s.subject_id
-                             LEFT JOIN tiku t ON q.tiku_id = t.tiku_id
-                    WHERE q.tiku_id = %s
-                      AND q.status = 'active'
-                    ORDER BY q.id \
-                    """
-            cursor.execute(query, (tiku_id,))
-        else:
-            query = """
-                    SELECT q.id,
-                           q.subject_id,
-                           q.tiku_id,
-                           q.question_type,
-                           q.stem,
-                           q.option_a,
-                           q.option_b,
-                           q.option_c,
-                           q.option_d,
-                           q.answer,
-                           q.explanation,
-                           q.difficulty,
-                           q.status,
-                           s.subject_name,
-                           t.tiku_name
-                    FROM questions q
-                             LEFT JOIN subject s ON q.subject_id = s.subject_id
-                             LEFT JOIN tiku t ON q.tiku_id = t.tiku_id
-                    WHERE q.status = 'active'
-                    ORDER BY q.tiku_id, q.id \
-                    """
-            cursor.execute(query)
+    except Error as e:
+        return {"success": False, "error": f"删除暂存题目失败: {str(e)}"}
+    finally:
+        release_db_resources(cursor, connection)
+
+
+QUESTION_CONTENT_COLUMNS = ('question_type', 'stem', 'option_a', 'option_b', 'option_c', 'option_d',
+                            'answer', 'explanation')
 
-        questions = []
-        for row in cursor.fetchall():
-            question_id, subject_id, tiku_id, question_type, stem, option_a, option_b, option_c, option_d, answer, explanation, difficulty, status, subject_name, tiku_name = row
-
-            # 构造选项字典
-            options_for_practice = {}
-            if option_a:
-                options_for_practice['A'] = option_a
-            if option_b:
-                options_for_practice['B'] = option_b
-            if option_c:
-                options_for_practice['C'] = option_c
-            if option_d:
-                options_for_practice['D'] = option_d
-
-            # 处理题目类型
-            if question_type == 0:
-                type_name = '单选题'
-                is_multiple_choice = False
-            elif question_type == 5:
-                type_name = '多选题'
-                is_multiple_choice = True
-            elif question_type == 10:
-                type_name = '判断题'
-                is_multiple_choice = False
-                options_for_practice = None  # 判断题不需要选项
-            else:
-                type_name = '未知题型'
-                is_multiple_choice = False
-
-            questions.append({
-                'id': question_id,
-                'subject_id': subject_id,
-                'tiku_id': tiku_id,
-                'type': type_name,
-                'question': stem,
-                'options_for_practice': options_for_practice,
-                'answer': answer,
-                'is_multiple_choice': is_multiple_choice,
-                'explanation': explanation,
-                'difficulty': difficulty,
-                'subject_name': subject_name,
-                'tiku_name': tiku_name
-            })
 
-        return questions
+def question_content_hash(question: Dict[str, Any]) -> str:
+    """题目内容哈希：规范化题型、题干、选项、答案、解析后计算，用于增量导入时比对题目"""
+    parts = []
+    for column in QUESTION_CONTENT_COLUMNS:
+        value = question.get(column)
+        parts.append('' if value is None else str(value).strip())
+    return hashlib.sha1('\x1f'.join(parts).encode('utf-8')).hexdigest()
 
+
+def get_tiku_by_name(subject_id: int, tiku_name: str) -> Optional[Dict[str, Any]]:
+    """按科目和题库名称查找题库（重新上传同名题库时使用）"""
+    connection = get_db_connection()
+    if not connection:
+        return None
+
+    cursor = None
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("""
+                       SELECT tiku_id, tiku_position, file_hash
+                       FROM tiku
+                       WHERE subject_id = %s AND tiku_name = %s
+                       ORDER BY tiku_id LIMIT 1
+                       """, (subject_id, tiku_name))
+        return cursor.fetchone()
     except Error as e:
-        print(f"Error getting questions: {e}")
-        return []
+        logger.error(f"查找题库失败: {e}")
+        return None
     finally:
-        try:
-            if cursor:
-                cursor.close()
-            if connection and connection.is_connected():
-                connection.close()
-        except:
-            pass
+        release_db_resources(cursor, connection)
 
 
-def get_all_questions_by_tiku_dict() -> dict:
-    """获取所有题目，按题库ID分组返回字典"""
+def update_tiku_file(tiku_id: int, tiku_position: str, file_size: int, file_hash: str) -> Dict[str, Any]:
+    """增量导入完成后更新题库的文件路径、大小和哈希（导入成功后才写入哈希，失败时下次上传会重新比对）"""
     connection = get_db_connection()
     if not connection:
-        return {}
+        return {"success": False, "error": "数据库连接失败"}
 
     cursor = None
     try:
         cursor = connection.cursor()
+        cursor.execute("""
+                       UPDATE tiku
+                       SET tiku_position = %s,
+                           file_size     = %s,
+                           file_hash     = %s,
+                           updated_at    = CURRENT_TIMESTAMP
+                       WHERE tiku_id = %s
+                       """, (tiku_position, file_size, file_hash, tiku_id))
+        return {"success": True, "message": "题库文件信息已更新"}
 
-        query = """
-                SELECT q.id,
-                       q.subject_id,
-                       q.tiku_id,
-                       q.question_type,
-                       q.stem,
-                       q.option_a,
-                       q.option_b,
-                       q.option_c,
-                       q.option_d,
-                       q.answer,
-                       q.explanation,
-                       q.difficulty,
-                       q.status,
-                       s.subject_name,
-                       t.tiku_name,
-                       t.tiku_position
-                FROM questions q
-                         LEFT JOIN subject s ON q.subject_id = s.subject_id
-                         LEFT JOIN tiku t ON q.tiku_id = t.tiku_id
-                WHERE q.status = 'active'
-                  AND t.is_active = 1
-                ORDER BY q.tiku_id, q.id \
-                """
-        cursor.execute(query)
+    except Error as e:
+        return {"success": False, "error": f"更新题库文件信息失败: {str(e)}"}
+    finally:
+        release_db_resources(cursor, connection)
 
-        questions_dict = {}
-        for row in cursor.fetchall():
-            question_id, subject_id, tiku_id, question_type, stem, option_a, option_b, option_c, option_d, answer, explanation, difficulty, status, subject_name, tiku_name, tiku_position = row
-
-            # 构造选项字典
-            options_for_practice = {}
-            if option_a:
-                options_for_practice['A'] = option_a
-            if option_b:
-                options_for_practice['B'] = option_b
-            if option_c:
-                options_for_practice['C'] = option_c
-            if option_d:
-                options_for_practice['D'] = option_d
-
-            # 处理题目类型
-            if question_type == 0:
-                type_name = '单选题'
-                is_multiple_choice = False
-            elif question_type == 5:
-                type_name = '多选题'
-                is_multiple_choice = True
-            elif question_type == 10:
-                type_name = '判断题'
-                is_multiple_choice = False
-                options_for_practice = None  # 判断题不需要选项
-            else:
-                type_name = '未知题型'
-                is_multiple_choice = False
-
-            question_data = {
-                'id': f"db_{question_id}",
-                'db_id': question_id,
-                'subject_id': subject_id,
-                'tiku_id': tiku_id,
-                'type': type_name,
-                'question': stem,
-                'options_for_practice': options_for_practice,
-                'answer': answer,
-                'is_multiple_choice': is_multiple_choice,
-                'explanation': explanation,
-                'difficulty': difficulty,
-                'subject_name': subject_name,
-                'tiku_name': tiku_name
-            }
 
-            # 使用tiku_position作为key以保持与现有代码的兼容性
-            tiku_key = tiku_id
-            if tiku_key not in questions_dict:
-                questions_dict[tiku_key] = []
-            questions_dict[tiku_key].append(question_data)
+def get_tiku_question_digests(tiku_id: int) -> Optional[List[Dict[str, Any]]]:
+    """获取题库所有题目（含禁用）的ID、状态和内容哈希，失败时返回None"""
+    connection = get_db_connection()
+    if not connection:
+        return None
+
+    cursor = None
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(f"SELECT id, status, {', '.join(QUESTION_CONTENT_COLUMNS)} "
+                       f"FROM questions WHERE tiku_id = %s ORDER BY id", (tiku_id,))
+        return [{
+            'id': row['id'],
+            'status': row['status'],
+            'question_type': row['question_type'],
+            'stem': (row['stem'] or '').strip(),
+            'content_hash': question_content_hash(row)
+        } for row in cursor.fetchall()]
+    except Error as e:
+        logger.error(f"获取题库 {tiku_id} 的题目哈希失败: {e}")
+        return None
+    finally:
+        release_db_resources(cursor, connection)
 
-        return questions_dict
 
+def get_tiku_fingerprints() -> Optional[Dict[int, Dict[str, Any]]]:
+    """
+    一次查询所有题库的内容指纹：启用题目数、题目最后修改时间、题目ID异或值和题库修改时间
+    题目增删改、启用/禁用或题库信息变化都会改变指纹，用于校验本地题库快照，失败时返回None
+    """
+    connection = get_db_connection()
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute("""
+                       SELECT t.tiku_id,
+                              t.is_active,
+                              t.updated_at,
+                              COUNT(q.id),
+                              MAX(q.updated_at),
+                              BIT_XOR(q.id)
+                       FROM tiku t
+                                LEFT JOIN questions q ON q.tiku_id = t.tiku_id AND q.status = 'active'
+                       GROUP BY t.tiku_id, t.is_active, t.updated_at
+                       """)
+        return {
+            tiku_id: {
+                'is_active': bool(is_active),
+                'question_count': question_count,
+                'fingerprint': f"{question_count}:{max_updated_at}:{id_xor}:{tiku_updated_at}"
+            }
+            for tiku_id, is_active, tiku_updated_at, question_count, max_updated_at, id_xor in cursor.fetchall()
+        }
     except Error as e:
-        print(f"Error getting all questions: {e}")
-        return {}
+        logger.error(f"获取题库指纹失败: {e}")
+        return None
     finally:
+        release_db_resources(cursor, connection)
+
+
+def apply_question_diff(tiku_id: int, inserts: List[Dict[str, Any]], updates: Dict[int, Dict[str, Any]],
+                        activate_ids: List[int], deactivate_ids: List[int],
+                        batch_size: int = None) -> Dict[str, Any]:
+    """
+    在一个事务内应用增量导入的差异，未变化的题目不改动（ID和缓存保持不变）
+    :param inserts: 新增的题目
+    :param updates: 题目ID -> 新内容（原地更新，保留ID）
+    :param activate_ids: 内容未变但此前被禁用、重新出现在文件中的题目
+    :param deactivate_ids: 文件中已不存在的题目，软删除（禁用）以保留答题记录引用
+    """
+    batch_size = batch_size or DatabaseConfig.BULK_INSERT_CONFIG['batch_size']
+
+    connection = get_db_connection()
+    if not connection:
+        return {"success": False, "error": "数据库连接失败"}
+
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        connection.start_transaction()
+
+        if updates:
+            cursor.executemany(
+                f"UPDATE questions SET {', '.join(f'{c} = %s' for c in QUESTION_CONTENT_COLUMNS)}, "
+                f"status = 'active', updated_at = CURRENT_TIMESTAMP WHERE id = %s AND tiku_id = %s",
+                [tuple(question.get(c) for c in QUESTION_CONTENT_COLUMNS) + (question_id, tiku_id)
+                 for question_id, question in updates.items()]
+            )
+
+        for status, ids in (('active', activate_ids), ('inactive', deactivate_ids)):
+            for start in range(0, len(ids), batch_size):
+                chunk = ids[start:start + batch_size]
+                cursor.execute(
+                    f"UPDATE questions SET status = %s, updated_at = CURRENT_TIMESTAMP "
+                    f"WHERE tiku_id = %s AND id IN ({', '.join(['%s'] * len(chunk))})",
+                    [status, tiku_id] + chunk
+                )
+
+        columns = ', '.join(QUESTION_INSERT_COLUMNS)
+        row_placeholder = '(' + ', '.join(['%s'] * len(QUESTION_INSERT_COLUMNS)) + ')'
+        for start in range(0, len(inserts), batch_size):
+            rows = [_question_insert_row(question) for question in inserts[start:start + batch_size]]
+            cursor.execute(
+                f"INSERT INTO questions ({columns}) VALUES " + ', '.join([row_placeholder] * len(rows)),
+                [value for row in rows for value in row]
+            )
+
+        cursor.execute("SELECT COUNT(*) FROM questions WHERE tiku_id = %s AND status = 'active'", (tiku_id,))
+        question_count = cursor.fetchone()[0]
+        cursor.execute("UPDATE tiku SET tiku_nums = %s, updated_at = CURRENT_TIMESTAMP WHERE tiku_id = %s",
+                       (question_count, tiku_id))
+        connection.commit()
+
+        return {
+            "success": True,
+            "question_count": question_count,
+            "message": f"增量导入完成：新增{len(inserts)}道，更新{len(updates) + len(activate_ids)}道，"
+                       f"删除{len(deactivate_ids)}道"
+        }
+
+    except Error as e:
         try:
-            if cursor:
-                cursor.close()
-            if connection and connection.is_connected():
-                connection.close()
-        except:
+            connection.rollback()
+        except Error:
             pass
+        return {"success": False, "error": f"增量导入题目失败: {str(e)}"}
+    finally:
+        release_db_resources(cursor, connection)
+
+
+QUESTION_TYPE_NAMES = {0: '单选题', 5: '多选题', 10: '判断题'}
+
+_QUESTION_SELECT = """
+                   SELECT q.id,
+                          q.subject_id,
+                          q.tiku_id,
+                          q.question_type,
+                          q.stem,
+                          q.option_a,
+                          q.option_b,
+                          q.option_c,
+                          q.option_d,
+                          q.answer,
+                          q.explanation,
+                          q.difficulty,
+                          s.subject_name,
+                          t.tiku_name
+                   FROM questions q
+                            LEFT JOIN subject s ON q.subject_id = s.subject_id
+                            LEFT JOIN tiku t ON q.tiku_id = t.tiku_id
+                   """
+
+
+# _QUESTION_SELECT 的列顺序（字典游标的行按此顺序转为元组）
+_QUESTION_COLUMNS = ('id', 'subject_id', 'tiku_id', 'question_type', 'stem', 'option_a', 'option_b', 'option_c',
+                     'option_d', 'answer', 'explanation', 'difficulty', 'subject_name', 'tiku_name')
+
+
+def _format_question_row(row, prefixed_id: bool = False) -> Dict[str, Any]:
+    """把 _QUESTION_SELECT 查询的一行（元组或字典游标的行）转换为练习使用的题目字典"""
+    if isinstance(row, dict):
+        row = tuple(row[column] for column in _QUESTION_COLUMNS)
+    (question_id, subject_id, tiku_id, question_type, stem, option_a, option_b, option_c, option_d,
+     answer, explanation, difficulty, subject_name, tiku_name) = row
+
+    # 判断题不需要选项
+    if question_type == 10:
+        options_for_practice = None
+    else:
+        options_for_practice = {}
+        if option_a:
+            options_for_practice['A'] = option_a
+        if option_b:
+            options_for_practice['B'] = option_b
+        if option_c:
+            options_for_practice['C'] = option_c
+        if option_d:
+            options_for_practice['D'] = option_d
+
+    question = {
+        'id': f"db_{question_id}" if prefixed_id else question_id,
+        'subject_id': subject_id,
+        'tiku_id': tiku_id,
+        'type': QUESTION_TYPE_NAMES.get(question_type, '未知题型'),
+        'question': stem,
+        'options_for_practice': options_for_practice,
+        'answer': answer,
+        'is_multiple_choice': question_type == 5,
+        'explanation': explanation,
+        'difficulty': difficulty,
+        'subject_name': subject_name,
+        'tiku_name': tiku_name
+    }
+    if prefixed_id:
+        question['db_id'] = question_id
+    return question
+
+
+def iter_questions(tiku_id: int = None, active_tiku_only: bool = False, prefixed_id: bool = False,
+                   fetch_size: int = None) -> Iterator[Dict[str, Any]]:
+    """
+    流式读取启用的题目（按 tiku_id, id 排序）：使用非缓冲游标，每次 fetchmany 一批行并逐行转换，
+    内存中只保留一批原始行，不会同时持有全部行和全部题目字典
+    生成器未迭代完之前会一直占用一个数据库连接，调用方应尽快消费
+    出错时记录日志后重新抛出异常，调用方不会把中途中断的结果当作完整题库
+    """
+    fetch_size = fetch_size or DatabaseConfig.STREAM_FETCH_SIZE
+
+    conditions = ["q.status = 'active'"]
+    params = []
+    if tiku_id:
+        conditions.append("q.tiku_id = %s")
+        params.append(tiku_id)
+    if active_tiku_only:
+        conditions.append("t.is_active = 1")
+    query = _QUESTION_SELECT + f" WHERE {' AND '.join(conditions)} ORDER BY q.tiku_id, q.id"
+
+    connection = get_db_connection()
+    cursor = None
+    try:
+        cursor = connection.cursor(buffered=False)
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield _format_question_row(row, prefixed_id)
+
+    except Error as e:
+        logger.error(f"流式读取题目失败: {e}")
+        raise
+    finally:
+        if cursor:
+            try:
+                # 未读完的结果集需先丢弃，连接才能归还连接池
+                cursor.fetchall()
+            except Error:
+                pass
+        release_db_resources(cursor, connection)
+
+
+def get_questions_by_tiku(tiku_id: int = None) -> Optional[List[Dict[str, Any]]]:
+    """
+    根据题库ID获取题目列表，如果不指定则获取所有题目
+    读取失败（包括读到一半中断）时返回None，与空题库（[]）区分，调用方不应缓存失败的结果
+    """
+    try:
+        return list(iter_questions(tiku_id))
+    except (Error, ConnectionError) as e:
+        logger.error(f"获取题库 {tiku_id} 的题目失败: {e}")
+        return None
+
+
+def get_all_questions_by_tiku_dict() -> dict:
+    """获取所有题目，按题库ID分组返回字典（读取失败时返回空字典）"""
+    questions_dict = {}
+    try:
+        for question in iter_questions(active_tiku_only=True, prefixed_id=True):
+            questions_dict.setdefault(question['tiku_id'], []).append(question)
+    except (Error, ConnectionError) as e:
+        logger.error(f"获取全部题目失败: {e}")
+        return {}
+    return questions_dict
 
 
-def delete_questions_by_tiku(tiku_id: int) -> Dict[str, Any]:
-    """删除指定题库的所有题目"""
+def delete_questions_by_tiku(tiku_id: int, chunk_rows: int = None) -> Dict[str, Any]:
+    """删除指定题库的所有题目，分块DELETE并逐块提交，避免大题库长时间锁表"""
+    chunk_rows = chunk_rows or DatabaseConfig.BULK_INSERT_CONFIG['delete_chunk_rows']
+
     connection = get_db_connection()
     if not connection:
         return {"success": False, "error": "数据库连接失败"}
@@ -1167,13 +1394,13 @@ def delete_questions_by_tiku(tiku_id: int) -> Dict[str, Any]:
     try:
         cursor = connection.cursor()
 
-        # 先获取要删除的题目数量
-        cursor.execute("SELECT COUNT(*) FROM questions WHERE tiku_id = %s", (tiku_id,))
-        count = cursor.fetchone()[0]
-
-        # 删除题目
-        cursor.execute("DELETE FROM questions WHERE tiku_id = %s", (tiku_id,))
-        connection.commit()
+        # 连接为自动提交模式，每条DELETE独立提交
+        count = 0
+        while True:
+            cursor.execute("DELETE FROM questions WHERE tiku_id = %s LIMIT %s", (tiku_id, chunk_rows))
+            count += cursor.rowcount
+            if cursor.rowcount < chunk_rows:
+                break
 
         return {
             "success": True,
@@ -1184,13 +1411,7 @@ def delete_questions_by_tiku(tiku_id: int) -> Dict[str, Any]:
     except Error as e:
         return {"success": False, "error": f"删除题目失败: {str(e)}"}
     finally:
-        try:
-            if cursor:
-                cursor.close()
-            if connection and connection.is_connected():
-                connection.close()
-        except:
-            pass
+        release_db_resources(cursor, connection)
 
 
 def parse_excel_to_questions(subject_id: int, tiku_id: int, questions_data: list) -> list:
@@ -1268,13 +1489,7 @@ def toggle_user_status(user_id: int) -> Dict[str, Any]:
     except Error as e:
         return {"success": False, "error": f"切换用户状态失败: {str(e)}"}
     finally:
-        try:
-            if cursor:
-                cursor.close()
-            if connection and connection.is_connected():
-                connection.close()
-        except:
-            pass
+        release_db_resources(cursor, connection)
 
 
 def update_user_model(user_id: int, model: int) -> Dict[str, Any]:
@@ -1312,13 +1527,7 @@ def update_user_model(user_id: int, model: int) -> Dict[str, Any]:
     except Error as e:
         return {"success": False, "error": f"更新用户权限失败: {str(e)}"}
     finally:
-        try:
-            if cursor:
-                cursor.close()
-            if connection and connection.is_connected():
-                connection.close()
-        except:
-            pass
+        release_db_resources(cursor, connection)
 
 
 def delete_invitation_code(invitation_id: int) -> Dict[str, Any]:
@@ -1364,13 +1573,7 @@ def delete_invitation_code(invitation_id: int) -> Dict[str, Any]:
     except Error as e:
         return {"success": False, "error": f"删除邀请码失败: {str(e)}"}
     finally:
-        try:
-            if cursor:
-                cursor.close()
-            if connection and connection.is_connected():
-                connection.close()
-        except:
-            pass
+        release_db_resources(cursor, connection)
 
 
 def create_practice_session(user_id: int, tiku_id: int, session_type: str = 'normal',
@@ -1381,12 +1584,13 @@ def create_practice_session(user_id: int, tiku_id: int, session_type: str = 'nor
     if not connection:
         return {"success": False, "error": "数据库连接失败"}
 
+    cursor = None
     try:
         cursor = connection.cursor()
 
         # 将列表转换为JSON字符串
         selected_types_json = json.dumps(selected_types, ensure_ascii=False) if selected_types else None
-        question_indices_json = json.dumps(question_indices, ensure_ascii=False) if question_indices else None
+        question_indices_json = dump_practice_session_column('question_indices', question_indices) if question_indices else None
 
         query = """
                 INSERT INTO practice_sessions
@@ -1412,10 +1616,35 @@ def create_practice_session(user_id: int, tiku_id: int, session_type: str = 'nor
     except Error as e:
         return {"success": False, "error": f"创建练习会话失败: {str(e)}"}
     finally:
-        if cursor:
-            cursor.close()
-        if connection.is_connected():
-            connection.close()
+        release_db_resources(cursor, connection)
+
+
+# 练习会话可更新的字段
+PRACTICE_SESSION_SCALAR_FIELDS = ('current_question_index', 'correct_first_try', 'round_number', 'status')
+PRACTICE_SESSION_JSON_FIELDS = ('question_indices', 'wrong_indices', 'question_statuses', 'answer_history')
+# 答题事件日志的字段（practice_answer_events表，每次答题追加一行）
+PRACTICE_EVENT_COLUMNS = ('question_index', 'question_id', 'is_correct', 'peeked', 'user_answer')
+# 以紧凑二进制编码存储的练习会话列（base64文本包在JSON字符串中）
+PRACTICE_SESSION_PACKED_COLUMNS = {
+    'question_indices': session_codec.pack_ids,
+    'wrong_indices': session_codec.pack_id_set,
+    'question_statuses': session_codec.pack_statuses
+}
+
+
+def dump_practice_session_column(field: str, value: Any) -> Optional[str]:
+    """练习会话JSON列的写入编码"""
+    if value is None:
+        return None
+    packer = PRACTICE_SESSION_PACKED_COLUMNS.get(field)
+    if packer is not None and isinstance(value, list):
+        value = session_codec.to_text(packer(value))
+    return json.dumps(value, ensure_ascii=False)
+
+
+def load_practice_session_column(raw: Optional[str]) -> Any:
+    """练习会话JSON列的读取解码，兼容未编码的旧数据"""
+    return session_codec.unpack(json.loads(raw)) if raw else None
 
 
 def update_practice_session(session_id: int, **kwargs) -> Dict[str, Any]:
@@ -1424,6 +1653,7 @@ def update_practice_session(session_id: int, **kwargs) -> Dict[str, Any]:
     if not connection:
         return {"success": False, "error": "数据库连接失败"}
 
+    cursor = None
     try:
         cursor = connection.cursor()
 
@@ -1432,12 +1662,12 @@ def update_practice_session(session_id: int, **kwargs) -> Dict[str, Any]:
         values = []
 
         for field, value in kwargs.items():
-            if field in ['current_question_index', 'correct_first_try', 'round_number', 'status']:
+            if field in PRACTICE_SESSION_SCALAR_FIELDS:
                 update_fields.append(f"{field} = %s")
                 values.append(value)
-            elif field in ['question_indices', 'wrong_indices', 'question_statuses', 'answer_history']:
+            elif field in PRACTICE_SESSION_JSON_FIELDS:
                 update_fields.append(f"{field} = %s")
-                values.append(json.dumps(value, ensure_ascii=False) if value is not None else None)
+                values.append(dump_practice_session_column(field, value))
 
         if not update_fields:
             return {"success": False, "error": "没有有效的更新字段"}
@@ -1457,10 +1687,139 @@ def update_practice_session(session_id: int, **kwargs) -> Dict[str, Any]:
     except Error as e:
         return {"success": False, "error": f"更新练习会话失败: {str(e)}"}
     finally:
-        if cursor:
-            cursor.close()
-        if connection.is_connected():
-            connection.close()
+        release_db_resources(cursor, connection)
+
+
+def batch_update_practice_sessions(updates: Dict[int, Dict[str, Any]],
+                                   events: Optional[Dict[int, List[Dict[str, Any]]]] = None,
+                                   compact_session_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+    """
+    批量写入多个练习会话 - 在一个事务内完成：
+    1. 字段相同的会话更新合并为一次executemany
+    2. 写入了完整快照的会话删除已被快照覆盖的答题事件
+    3. 追加新的答题事件
+    """
+    events = events or {}
+    compact_session_ids = compact_session_ids or []
+
+    # 按更新字段分组，同组共用一条UPDATE语句
+    groups = defaultdict(list)
+    for session_id, fields in updates.items():
+        columns = tuple(field for field in fields
+                        if field in PRACTICE_SESSION_SCALAR_FIELDS or field in PRACTICE_SESSION_JSON_FIELDS)
+        if not columns:
+            continue
+        row = [dump_practice_session_column(c, fields[c]) if c in PRACTICE_SESSION_JSON_FIELDS
+               else fields[c] for c in columns]
+        row.append(session_id)
+        groups[columns].append(row)
+
+    event_rows = [(session_id,) + tuple(event[c] for c in PRACTICE_EVENT_COLUMNS)
+                  for session_id, session_events in events.items() for event in session_events]
+
+    if not groups and not event_rows and not compact_session_ids:
+        return {"success": True, "updated_rows": 0}
+
+    connection = get_db_connection()
+    if not connection:
+        return {"success": False, "error": "数据库连接失败"}
+
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        connection.start_transaction()
+        updated_rows = 0
+
+        for columns, rows in groups.items():
+            set_clause = ', '.join(f"{column} = %s" for column in columns)
+            query = f"UPDATE practice_sessions SET {set_clause}, updated_at = NOW() WHERE id = %s"
+            cursor.executemany(query, rows)
+            updated_rows += cursor.rowcount
+
+        if compact_session_ids:
+            placeholders = ', '.join(['%s'] * len(compact_session_ids))
+            cursor.execute(f"DELETE FROM practice_answer_events WHERE session_id IN ({placeholders})",
+                           tuple(compact_session_ids))
+
+        if event_rows:
+            query = f"""
+                    INSERT INTO practice_answer_events (session_id, {', '.join(PRACTICE_EVENT_COLUMNS)})
+                    VALUES (%s, {', '.join(['%s'] * len(PRACTICE_EVENT_COLUMNS))})
+                    """
+            cursor.executemany(query, event_rows)
+
+        connection.commit()
+
+        return {
+            "success": True,
+            "updated_rows": updated_rows,
+            "events_written": len(event_rows),
+            "message": f"批量更新 {len(set(updates) | set(events))} 个练习会话成功"
+        }
+
+    except Error as e:
+        connection.rollback()
+        return {"success": False, "error": f"批量更新练习会话失败: {str(e)}"}
+    finally:
+        release_db_resources(cursor, connection)
+
+
+def answer_event_result(event: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+    """答题事件对应的题目状态和答题历史记录"""
+    answered_wrong = not event['is_correct'] or event['peeked']
+    status = QUESTION_STATUS['WRONG'] if answered_wrong else QUESTION_STATUS['CORRECT']
+    history_entry = {
+        'user_answer': event['user_answer'],
+        'is_correct': bool(event['is_correct']),
+        'question_id': event['question_id']
+    }
+    return status, history_entry
+
+
+def apply_answer_event(question_statuses: list, answer_history: dict, wrong_indices: list,
+                       event: Dict[str, Any]) -> None:
+    """将一次答题事件应用到练习状态（提交答案与从事件日志恢复共用同一逻辑）"""
+    question_index = event['question_index']
+    question_id = event['question_id']
+    status, history_entry = answer_event_result(event)
+
+    if question_index < len(question_statuses):
+        question_statuses[question_index] = status
+
+    answer_history[str(question_index)] = history_entry
+
+    if status == QUESTION_STATUS['WRONG'] and question_id not in wrong_indices:
+        wrong_indices.append(question_id)
+
+
+def _replay_answer_events(cursor, session_data: Dict[str, Any]) -> Dict[str, Any]:
+    """在会话快照上重放快照之后的答题事件，得到最新练习状态"""
+    cursor.execute(f"""
+                   SELECT {', '.join(PRACTICE_EVENT_COLUMNS)}
+                   FROM practice_answer_events
+                   WHERE session_id = %s
+                   ORDER BY id
+                   """, (session_data['id'],))
+    rows = cursor.fetchall()
+    if not rows:
+        return session_data
+
+    # 会话创建后尚未写过快照时，按题目列表初始化为未作答
+    question_statuses = (session_data.get('question_statuses')
+                         or [QUESTION_STATUS['UNANSWERED']] * len(session_data.get('question_indices') or []))
+    answer_history = session_data.get('answer_history') or {}
+    wrong_indices = session_data.get('wrong_indices') or []
+
+    for row in rows:
+        event = row if isinstance(row, dict) else dict(zip(PRACTICE_EVENT_COLUMNS, row))
+        apply_answer_event(question_statuses, answer_history, wrong_indices, event)
+
+    session_data.update({
+        'question_statuses': question_statuses,
+        'answer_history': answer_history,
+        'wrong_indices': wrong_indices
+    })
+    return session_data
 
 
 def complete_practice_session(session_id: int, final_stats: dict = None) -> Dict[str, Any]:
@@ -1469,6 +1828,7 @@ def complete_practice_session(session_id: int, final_stats: dict = None) -> Dict
     if not connection:
         return {"success": False, "error": "数据库连接失败"}
 
+    cursor = None
     try:
         cursor = connection.cursor()
 
@@ -1502,10 +1862,7 @@ def complete_practice_session(session_id: int, final_stats: dict = None) -> Dict
     except Error as e:
         return {"success": False, "error": f"完成练习会话失败: {str(e)}"}
     finally:
-        if cursor:
-            cursor.close()
-        if connection.is_connected():
-            connection.close()
+        release_db_resources(cursor, connection)
 
 
 def get_practice_session(session_id: int) -> Optional[Dict[str, Any]]:
@@ -1514,6 +1871,7 @@ def get_practice_session(session_id: int) -> Optional[Dict[str, Any]]:
     if not connection:
         return None
 
+    cursor = None
     try:
         cursor = connection.cursor()
 
@@ -1545,7 +1903,7 @@ def get_practice_session(session_id: int) -> Optional[Dict[str, Any]]:
 
         if result:
             # 解析JSON字段
-            return {
+            session_data = {
                 'id': result[0],
                 'user_id': result[1],
                 'tiku_id': result[2],
@@ -1557,14 +1915,16 @@ def get_practice_session(session_id: int) -> Optional[Dict[str, Any]]:
                 'correct_first_try': result[8],
                 'round_number': result[9],
                 'status': result[10],
-                'question_indices': json.loads(result[11]) if result[11] else None,
-                'wrong_indices': json.loads(result[12]) if result[12] else None,
-                'question_statuses': json.loads(result[13]) if result[13] else None,
-                'answer_history': json.loads(result[14]) if result[14] else None,
+                'question_indices': load_practice_session_column(result[11]),
+                'wrong_indices': load_practice_session_column(result[12]),
+                'question_statuses': load_practice_session_column(result[13]),
+                'answer_history': load_practice_session_column(result[14]),
                 'created_at': result[15],
                 'updated_at': result[16],
                 'completed_at': result[17]
             }
+            # 快照之后的答题记录保存在事件日志中，重放得到最新状态
+            return _replay_answer_events(cursor, session_data)
 
         return None
 
@@ -1572,10 +1932,7 @@ def get_practice_session(session_id: int) -> Optional[Dict[str, Any]]:
         print(f"获取练习会话失败: {e}")
         return None
     finally:
-        if cursor:
-            cursor.close()
-        if connection.is_connected():
-            connection.close()
+        release_db_resources(cursor, connection)
 
 
 @with_db_connection
@@ -1659,17 +2016,18 @@ def get_user_active_practice_session(cursor, user_id: int, tiku_id: int = None)
                 'correct_first_try': result['correct_first_try'],
                 'round_number': result['round_number'],
                 'status': result['status'],
-                'question_indices': json.loads(result['question_indices']) if result['question_indices'] else None,
-                'wrong_indices': json.loads(result['wrong_indices']) if result['wrong_indices'] else None,
-                'question_statuses': json.loads(result['question_statuses']) if result['question_statuses'] else None,
-                'answer_history': json.loads(result['answer_history']) if result['answer_history'] else None,
+                'question_indices': load_practice_session_column(result['question_indices']),
+                'wrong_indices': load_practice_session_column(result['wrong_indices']),
+                'question_statuses': load_practice_session_column(result['question_statuses']),
+                'answer_history': load_practice_session_column(result['answer_history']),
                 'created_at': result['created_at'],
                 'updated_at': result['updated_at'],
                 'completed_at': result['completed_at']
             }
 
             logger.debug(f"找到活跃会话: session_id={session_data['id']}, tiku_id={session_data['tiku_id']}")
-            return session_data
+            # 快照之后的答题记录保存在事件日志中，重放得到最新状态
+            return _replay_answer_events(cursor, session_data)
         else:
             logger.debug(f"用户 {user_id} 没有活跃的练习会话")
 
@@ -1688,6 +2046,7 @@ def update_practice_statistics(session_id: int, stats: dict) -> bool:
     if not connection:
         return False
 
+    cursor = None
     try:
         cursor = connection.cursor()
 
@@ -1726,10 +2085,57 @@ def update_practice_statistics(session_id: int, stats: dict) -> bool:
         print(f"更新练习统计失败: {e}")
         return False
     finally:
-        if cursor:
-            cursor.close()
-        if connection.is_connected():
-            connection.close()
+        release_db_resources(cursor, connection)
+
+
+def get_user_statistics_summary(user_id: int) -> Optional[Dict[str, Any]]:
+    """
+    汇总用户全部练习统计：会话数来自练习会话表，题目数/答对数按科目汇总自练习统计表
+    （练习统计表在练习完成时累加，按 user_id 索引查询）
+    """
+    connection = get_db_connection()
+    if not connection:
+        return None
+
+    cursor = None
+    try:
+        cursor = connection.cursor()
+
+        cursor.execute("""
+                       SELECT COUNT(*), COALESCE(SUM(status = 'completed'), 0)
+                       FROM practice_sessions
+                       WHERE user_id = %s
+                       """, (user_id,))
+        total_sessions, completed_sessions = cursor.fetchone()
+
+        cursor.execute("""
+                       SELECT COALESCE(s.subject_name, 'Unknown'),
+                              SUM(p.sessions_count),
+                              SUM(p.total_questions),
+                              SUM(p.correct_answers)
+                       FROM practice_statistics p
+                                LEFT JOIN tiku t ON p.tiku_id = t.tiku_id
+                                LEFT JOIN subject s ON t.subject_id = s.subject_id
+                       WHERE p.user_id = %s
+                       GROUP BY COALESCE(s.subject_name, 'Unknown')
+                       """, (user_id,))
+        by_subject = {
+            row[0]: {'sessions': int(row[1] or 0), 'total_questions': int(row[2] or 0),
+                     'correct_answers': int(row[3] or 0)}
+            for row in cursor.fetchall()
+        }
+
+        return {
+            'total_sessions': int(total_sessions or 0),
+            'completed_sessions': int(completed_sessions or 0),
+            'by_subject': by_subject
+        }
+
+    except Error as e:
+        logger.error(f"获取用户练习统计失败: {e}")
+        return None
+    finally:
+        release_db_resources(cursor, connection)
 
 
 def get_user_practice_history(user_id: int, limit: int = 10) -> List[Dict[str, Any]]:
@@ -1738,6 +2144,7 @@ def get_user_practice_history(user_id: int, limit: int = 10) -> List[Dict[str, A
     if not connection:
         return []
 
+    cursor = None
     try:
         cursor = connection.cursor()
 
@@ -1786,48 +2193,41 @@ def get_user_practice_history(user_id: int, limit: int = 10) -> List[Dict[str, A
         print(f"获取用户练习历史失败: {e}")
         return []
     finally:
-        if cursor:
-            cursor.close()
-        if connection.is_connected():
-            connection.close()
+        release_db_resources(cursor, connection)
 
 
 @with_db_connection
 def get_system_stats(cursor) -> Dict[str, Any]:
-    """获取系统统计信息，供管理员使用"""
-    stats = {}
-
-    # 用户统计
-    cursor.execute("SELECT COUNT(*) as total FROM user_accounts")
-    stats['total_users'] = cursor.fetchone()['total']
-
-    cursor.execute("SELECT COUNT(*) as active FROM user_accounts WHERE is_enabled = TRUE")
-    stats['active_users'] = cursor.fetchone()['active']
-
-    cursor.execute("SELECT COUNT(*) as admins FROM user_accounts WHERE model = 10")
-    stats['admin_users'] = cursor.fetchone()['admins']
-
-    cursor.execute("SELECT COUNT(*) as vips FROM user_accounts WHERE model = 5")
-    stats['vip_users'] = cursor.fetchone()['vips']
-
-    # 邀请码统计
-    cursor.execute("SELECT COUNT(*) as total FROM invitation_codes")
-    stats['total_invitations'] = cursor.fetchone()['total']
-
-    cursor.execute(
-        "SELECT COUNT(*) as unused FROM invitation_codes WHERE is_used = FALSE AND (expires_at IS NULL OR expires_at > NOW())")
-    stats['unused_invitations'] = cursor.fetchone()['unused']
-
-    cursor.execute("SELECT COUNT(*) as used FROM invitation_codes WHERE is_used = TRUE")
-    stats['used_invitations'] = cursor.fetchone()['used']
-
-    # 题库统计 (Adjusted to match original admin panel fields more closely)
-    cursor.execute(
-        "SELECT COUNT(*) as total_questions FROM questions WHERE status = 'active'")  # Assuming 'active' status for questions
-    stats['total_questions'] = cursor.fetchone()['total_questions']
-
-    cursor.execute("SELECT COUNT(*) as total_files FROM tiku WHERE is_active = 1")
-    stats['total_files'] = cursor.fetchone()['total_files']
+    """获取系统统计信息，供管理员使用（各表一次条件聚合，合并为一次查询）"""
+    cursor.execute("""
+                   SELECT u.total_users,
+                          u.active_users,
+                          u.admin_users,
+                          u.vip_users,
+                          i.total_invitations,
+                          i.unused_invitations,
+                          i.used_invitations,
+                          q.total_questions,
+                          t.total_files
+                   FROM (SELECT COUNT(*)                                AS total_users,
+                                COALESCE(SUM(is_enabled = TRUE), 0)     AS active_users,
+                                COALESCE(SUM(model = 10), 0)            AS admin_users,
+                                COALESCE(SUM(model = 5), 0)             AS vip_users
+                         FROM user_accounts) u
+                            CROSS JOIN
+                        (SELECT COUNT(*)                                AS total_invitations,
+                                COALESCE(SUM(CASE
+                                                 WHEN is_used = FALSE AND (expires_at IS NULL OR expires_at > NOW())
+                                                     THEN 1
+                                                 ELSE 0 END), 0)        AS unused_invitations,
+                                COALESCE(SUM(is_used = TRUE), 0)        AS used_invitations
+                         FROM invitation_codes) i
+                            CROSS JOIN
+                        (SELECT COUNT(*) AS total_questions FROM questions WHERE status = 'active') q
+                            CROSS JOIN
+                        (SELECT COUNT(*) AS total_files FROM tiku WHERE is_active = 1) t
+                   """)
+    stats = {name: int(value or 0) for name, value in cursor.fetchone().items()}
 
     # Formatting to match the original structure expected by api_admin_get_stats
     formatted_stats = {
@@ -1850,9 +2250,48 @@ def get_system_stats(cursor) -> Dict[str, Any]:
     return formatted_stats
 
 
+def _build_pagination(page: int, per_page: int, total_count: int, has_next: bool,
+                      after_id: Optional[int], next_after_id: Optional[int]) -> Dict[str, Any]:
+    """分页信息：has_next 由多取一行判断，不依赖（可能是近似值的）总数"""
+    return {
+        'page': page,
+        'per_page': per_page,
+        'total': total_count,
+        'total_pages': (total_count + per_page - 1) // per_page,
+        'has_prev': after_id is not None or page > 1,
+        'has_next': has_next,
+        'after_id': after_id,
+        'next_after_id': next_after_id
+    }
+
+
+def _user_filter(search: str) -> Tuple[List[str], list]:
+    if search:
+        return ["u.username LIKE %s"], [f"%{search}%"]
+    return [], []
+
+
+def _count_users(cursor, search: str) -> int:
+    conditions, params = _user_filter(search)
+    where_clause = "WHERE " + " AND ".join(conditions) if conditions else ""
+    cursor.execute(f"SELECT COUNT(*) as total FROM user_accounts u {where_clause}", params)
+    return cursor.fetchone()['total']
+
+
 @with_db_connection
-def get_users_paginated(cursor, search: str, order_by: str, order_dir: str, page: int, per_page: int) -> Dict[str, Any]:
-    """获取用户列表（分页和搜索）"""
+def count_users(cursor, search: str = '') -> int:
+    """统计用户数（可按用户名搜索）"""
+    return _count_users(cursor, search)
+
+
+@with_db_connection
+def get_users_paginated(cursor, search: str, order_by: str, order_dir: str, page: int, per_page: int,
+                        after_id: Optional[int] = None, total_count: Optional[int] = None) -> Dict[str, Any]:
+    """
+    获取用户列表（分页和搜索）
+    按id排序且传入 after_id 时使用游标分页（WHERE u.id </> after_id），翻页深度不影响查询代价；
+    其他排序使用 LIMIT/OFFSET。total_count 由调用方传入（缓存的总数）时不再执行 COUNT
+    """
     # 验证排序字段
     valid_order_fields = ['id', 'username', 'created_at', 'last_time_login', 'model']
     if order_by not in valid_order_fields:
@@ -1862,28 +2301,23 @@ def get_users_paginated(cursor, search: str, order_by: str, order_dir: str, page
     if order_dir.lower() not in ['asc', 'desc']:
         order_dir = 'desc'
 
+    if order_by != 'id':
+        after_id = None
+
     # 构建查询条件
-    where_conditions = []
-    query_params = []
+    where_conditions, query_params = _user_filter(search)
 
-    if search:
-        where_conditions.append("u.username LIKE %s")
-        query_params.append(f"%{search}%")
+    if after_id is not None:
+        where_conditions.append("u.id < %s" if order_dir.lower() == 'desc' else "u.id > %s")
+        query_params.append(after_id)
 
     where_clause = "WHERE " + " AND ".join(where_conditions) if where_conditions else ""
 
-    # 计算总数
-    count_query = f"""
-    SELECT COUNT(*) as total
-    FROM user_accounts u
-    {where_clause}
-    """
-    cursor.execute(count_query, query_params)
-    total_count = cursor.fetchone()['total']
+    if total_count is None:
+        total_count = _count_users(cursor, search)
 
-    # 计算分页信息
-    total_pages = (total_count + per_page - 1) // per_page
-    offset = (page - 1) * per_page
+    # 游标分页不需要OFFSET；多取一行判断是否还有下一页
+    offset = 0 if after_id is not None else (page - 1) * per_page
 
     # 获取用户列表
     query = f"""
@@ -1896,8 +2330,10 @@ def get_users_paginated(cursor, search: str, order_by: str, order_dir: str, page
     ORDER BY u.{order_by} {order_dir.upper()}
     LIMIT %s OFFSET %s
     """
-    cursor.execute(query, query_params + [per_page, offset])
+    cursor.execute(query, query_params + [per_page + 1, offset])
     users_data = cursor.fetchall()
+    has_next = len(users_data) > per_page
+    users_data = users_data[:per_page]
 
     users = []
     for user_row in users_data:  # Changed variable name from user_data to user_row to avoid conflict
@@ -1911,17 +2347,10 @@ def get_users_paginated(cursor, search: str, order_by: str, order_dir: str, page
             'invitation_code': user_row['invitation_code']
         })
 
-    pagination = {
-        'page': page,
-        'per_page': per_page,
-        'total': total_count,
-        'total_pages': total_pages,
-        'has_prev': page > 1,
-        'has_next': page < total_pages
-    }
+    next_after_id = users[-1]['id'] if has_next and order_by == 'id' else None
     return {
         'users': users,
-        'pagination': pagination
+        'pagination': _build_pagination(page, per_page, total_count, has_next, after_id, next_after_id)
     }
 
 
@@ -1959,71 +2388,57 @@ def get_all_invitations_detailed(cursor) -> List[Dict[str, Any]]:
 
 @with_db_connection
 def get_detailed_question_stats(cursor) -> Dict[str, Any]:
-    """获取详细的题目统计信息"""
-    stats = {}
-
-    # 题目总数统计
-    cursor.execute("SELECT COUNT(*) as total_questions FROM questions WHERE status = 'active'")
-    stats['total_questions'] = cursor.fetchone()['total_questions']
-
-    # 按题型统计
+    """
+    获取详细的题目统计信息
+    启用题目只按 (subject_id, tiku_id, question_type) 分组扫描一次，总数/题型/科目/题库统计在内存中汇总；
+    第二次查询只读取科目和启用题库的名称（没有题目的科目和题库计为0）
+    """
     cursor.execute("""
-                   SELECT question_type, COUNT(*) as count
+                   SELECT subject_id, tiku_id, question_type, COUNT(*) as count
                    FROM questions
                    WHERE status = 'active'
-                   GROUP BY question_type
+                   GROUP BY subject_id, tiku_id, question_type
                    """)
-    type_stats_raw = cursor.fetchall()
-    type_stats = []
-    type_names = {0: '单选题', 5: '多选题', 10: '判断题'}
-    for row in type_stats_raw:
-        type_stats.append({
-            'type': type_names.get(row['question_type'], f'类型{row["question_type"]}'),
-            'type_code': row['question_type'],
-            'count': row['count']
-        })
-    stats['type_stats'] = type_stats
+    type_counts = defaultdict(int)
+    subject_counts = defaultdict(int)
+    tiku_counts = defaultdict(int)
+    for row in cursor.fetchall():
+        type_counts[row['question_type']] += row['count']
+        subject_counts[row['subject_id']] += row['count']
+        tiku_counts[row['tiku_id']] += row['count']
 
-    # 按科目统计
     cursor.execute("""
-                   SELECT s.subject_name, COUNT(q.id) as count
+                   SELECT s.subject_id, s.subject_name, t.tiku_id, t.tiku_name
                    FROM subject s
-                            LEFT JOIN questions q
-                                      ON s.subject_id = q.subject_id AND q.status = 'active'
-                   GROUP BY s.subject_id, s.subject_name
-                   ORDER BY count DESC
+                            LEFT JOIN tiku t ON t.subject_id = s.subject_id AND t.is_active = 1
                    """)
-    subject_stats_raw = cursor.fetchall()
-    subject_stats = []
-    for row in subject_stats_raw:
-        subject_stats.append({
-            'subject_name': row['subject_name'],
-            'count': row['count']
-        })
-    stats['subject_stats'] = subject_stats
-
-    # 按题库统计
-    cursor.execute("""
-                   SELECT t.tiku_name, s.subject_name, COUNT(q.id) as count
-                   FROM tiku t
-                            LEFT JOIN questions q
-                                      ON t.tiku_id = q.tiku_id AND q.status = 'active'
-                            LEFT JOIN subject s ON t.subject_id = s.subject_id
-                   WHERE t.is_active = 1
-                   GROUP BY t.tiku_id, t.tiku_name, s.subject_name
-                   ORDER BY count DESC
-                   """)
-    tiku_stats_raw = cursor.fetchall()
+    subject_names = {}
     tiku_stats = []
-    for row in tiku_stats_raw:
-        tiku_stats.append({
-            'tiku_name': row['tiku_name'],
-            'subject_name': row['subject_name'],
-            'count': row['count']
-        })
-    stats['tiku_stats'] = tiku_stats
+    for row in cursor.fetchall():
+        subject_names[row['subject_id']] = row['subject_name']
+        if row['tiku_id'] is not None:
+            tiku_stats.append({
+                'tiku_name': row['tiku_name'],
+                'subject_name': row['subject_name'],
+                'count': tiku_counts.get(row['tiku_id'], 0)
+            })
+
+    type_names = {0: '单选题', 5: '多选题', 10: '判断题'}
+    type_stats = [{
+        'type': type_names.get(question_type, f'类型{question_type}'),
+        'type_code': question_type,
+        'count': count
+    } for question_type, count in type_counts.items()]
 
-    return stats
+    subject_stats = [{'subject_name': subject_name, 'count': subject_counts.get(subject_id, 0)}
+                     for subject_id, subject_name in subject_names.items()]
+
+    return {
+        'total_questions': sum(type_counts.values()),
+        'type_stats': type_stats,
+        'subject_stats': sorted(subject_stats, key=lambda item: item['count'], reverse=True),
+        'tiku_stats': sorted(tiku_stats, key=lambda item: item['count'], reverse=True)
+    }
 
 
 @with_db_connection
@@ -2148,11 +2563,7 @@ def create_question_and_update_tiku_count(question_data: Dict[str, Any]) -> Dict
         logger.error(f"创建题目并更新题库数量失败: {e}")  # Use existing logger if available, or define one
         return {"success": False, "error": f"创建题目失败: {str(e)}"}
     finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.autocommit = True  # Reset autocommit
-            conn.close()
+        release_db_resources(cursor, conn)
 
 
 @with_db_connection
@@ -2271,11 +2682,7 @@ def delete_question_and_update_tiku_count(question_id: int) -> Dict[str, Any]:
         logger.error(f"删除题目并更新题库数量失败: {e}")
         return {"success": False, "error": f"删除题目操作失败: {str(e)}"}
     finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.autocommit = True  # Reset autocommit
-            conn.close()
+        release_db_resources(cursor, conn)
 
 
 def toggle_question_status_and_update_tiku_count(question_id: int) -> Dict[str, Any]:
@@ -2325,143 +2732,89 @@ def toggle_question_status_and_update_tiku_count(question_id: int) -> Dict[str,
         logger.error(f"切换题目状态并更新题库数量失败: {e}")
         return {"success": False, "error": f"切换题目状态操作失败: {str(e)}"}
     finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.autocommit = True  # Reset autocommit
-            conn.close()
+        release_db_resources(cursor, conn)
+
+
+def _question_filter(tiku_id: Optional[int]) -> Tuple[List[str], list]:
+    conditions = ["q.status = 'active'"]
+    params = []
+    if tiku_id is not None:
+        conditions.append("q.tiku_id = %s")
+        params.append(tiku_id)
+    return conditions, params
+
+
+def _count_active_questions(cursor, tiku_id: Optional[int]) -> int:
+    conditions, params = _question_filter(tiku_id)
+    cursor.execute(f"SELECT COUNT(*) as total FROM questions q WHERE {' AND '.join(conditions)}", params)
+    return cursor.fetchone()['total']
 
 
 @with_db_connection
-def get_questions_paginated(cursor, tiku_id: Optional[int], page: int, per_page: int) -> Dict[str, Any]:
-    """获取题目列表（分页），可选按题库ID过滤"""
-    base_query = """
-                 FROM questions q
-                 LEFT JOIN subject s ON q.subject_id = s.subject_id
-                 LEFT JOIN tiku t ON q.tiku_id = t.tiku_id
-                 """
-    count_query_base = "SELECT COUNT(q.id) as total " + base_query
-    select_query_base = """SELECT q.id, q.subject_id, q.tiku_id, q.question_type, 
-                                  q.stem, q.option_a, q.option_b, q.option_c, q.option_d, 
-                                  q.answer, q.explanation, q.difficulty, q.status, 
-                                  s.subject_name, t.tiku_name """ + base_query
-
-    where_clauses = ["q.status = 'active'"]
-    query_params = []
+def count_active_questions(cursor, tiku_id: Optional[int] = None) -> int:
+    """统计启用的题目数（可按题库过滤）"""
+    return _count_active_questions(cursor, tiku_id)
 
-    if tiku_id is not None:
-        where_clauses.append("q.tiku_id = %s")
-        query_params.append(tiku_id)
 
-    where_statement = " WHERE " + " AND ".join(where_clauses) if where_clauses else ""
+@with_db_connection
+def get_questions_paginated(cursor, tiku_id: Optional[int], page: int, per_page: int,
+                            after_id: Optional[int] = None, total_count: Optional[int] = None) -> Dict[str, Any]:
+    """
+    获取题目列表（分页，按 tiku_id, id 排序），可选按题库ID过滤，题目格式与练习使用的题目一致
+    传入 after_id（上一页最后一道题的ID）时使用游标分页，翻页深度不影响查询代价；
+    total_count 由调用方传入（缓存的总数）时不再执行 COUNT
+    """
+    conditions, query_params = _question_filter(tiku_id)
 
-    # Get total count
-    cursor.execute(count_query_base + where_statement, query_params)
-    total_count = cursor.fetchone()['total']
+    if total_count is None:
+        total_count = _count_active_questions(cursor, tiku_id)
 
-    # Paginate
     offset = (page - 1) * per_page
-    order_clause = " ORDER BY q.tiku_id, q.id LIMIT %s OFFSET %s"
-
-    final_query_params = query_params + [per_page, offset]
-    cursor.execute(select_query_base + where_statement + order_clause, final_query_params)
+    if after_id is not None:
+        offset = 0
+        if tiku_id is not None:
+            conditions.append("q.id > %s")
+            query_params.append(after_id)
+        else:
+            # 不按题库过滤时游标为 (tiku_id, id)，先按主键取出游标题目所在的题库
+            cursor.execute("SELECT tiku_id FROM questions WHERE id = %s", (after_id,))
+            cursor_row = cursor.fetchone()
+            if cursor_row:
+                conditions.append("(q.tiku_id > %s OR (q.tiku_id = %s AND q.id > %s))")
+                query_params.extend([cursor_row['tiku_id'], cursor_row['tiku_id'], after_id])
+            else:
+                conditions.append("q.id > %s")
+                query_params.append(after_id)
 
+    # 多取一行判断是否还有下一页
+    cursor.execute(_QUESTION_SELECT + f" WHERE {' AND '.join(conditions)} ORDER BY q.tiku_id, q.id LIMIT %s OFFSET %s",
+                   query_params + [per_page + 1, offset])
     rows = cursor.fetchall()
+    has_next = len(rows) > per_page
+
     questions = []
-    for row_dict in rows:
-        # The format_question_for_display logic from get_questions_by_tiku can be reused or adapted here.
-        # For now, returning the raw row_dict which is already a dictionary.
-        # Datetime conversion to isoformat will be handled by the route if necessary.
-        questions.append(row_dict)
-
-    total_pages = (total_count + per_page - 1) // per_page
-    pagination_info = {
-        'page': page,
-        'per_page': per_page,
-        'total': total_count,
-        'total_pages': total_pages,
-        'has_prev': page > 1,
-        'has_next': page < total_pages
-    }
+    for row in rows[:per_page]:
+        question = _format_question_row(row, prefixed_id=True)
+        question['status'] = 'active'
+        questions.append(question)
 
+    next_after_id = questions[-1]['db_id'] if has_next else None
     return {
         'questions': questions,
-        'pagination': pagination_info
+        'pagination': _build_pagination(page, per_page, total_count, has_next, after_id, next_after_id)
     }
 
 
 @with_db_connection
 def get_question_by_db_id(cursor, question_db_id: int) -> Optional[Dict[str, Any]]:
     """根据数据库ID获取单个题目，并格式化以供练习使用"""
-    query = """
-            SELECT q.id,
-                   q.subject_id,
-                   q.tiku_id,
-                   q.question_type,
-                   q.stem,
-                   q.option_a,
-                   q.option_b,
-                   q.option_c,
-                   q.option_d,
-                   q.answer,
-                   q.explanation,
-                   q.difficulty,
-                   q.status,
-                   s.subject_name,
-                   t.tiku_name
-            FROM questions q
-                     LEFT JOIN subject s ON q.subject_id = s.subject_id
-                     LEFT JOIN tiku t ON q.tiku_id = t.tiku_id
-            WHERE q.id = %s
-              AND q.status = 'active'
-            """
-    cursor.execute(query, (question_db_id,))
+    cursor.execute(_QUESTION_SELECT + " WHERE q.id = %s AND q.status = 'active'", (question_db_id,))
     row = cursor.fetchone()
 
     if not row:
         return None
 
-    # Formatting logic adapted from the original get_questions_by_tiku
-    question_id, subject_id, tiku_id, question_type_code, stem, option_a, option_b, option_c, option_d, answer, explanation, difficulty, status, subject_name, tiku_name = (
-        row['id'], row['subject_id'], row['tiku_id'], row['question_type'], row['stem'],
-        row['option_a'], row['option_b'], row['option_c'], row['option_d'],
-        row['answer'], row['explanation'], row['difficulty'], row['status'],
-        row['subject_name'], row['tiku_name']
-    )
-
-    options_for_practice = {}
-    if option_a: options_for_practice['A'] = option_a
-    if option_b: options_for_practice['B'] = option_b
-    if option_c: options_for_practice['C'] = option_c
-    if option_d: options_for_practice['D'] = option_d
-
-    type_name = '未知题型'
-    is_multiple_choice = False
-    if question_type_code == 0:  # 单选题
-        type_name = '单选题'
-    elif question_type_code == 5:  # 多选题
-        type_name = '多选题'
-        is_multiple_choice = True
-    elif question_type_code == 10:  # 判断题
-        type_name = '判断题'
-        options_for_practice = None  # Judgment questions don't need options
-
-    return {
-        'id': f"db_{question_id}",  # Matches practice route id format
-        'db_id': question_id,
-        'subject_id': subject_id,
-        'tiku_id': tiku_id,
-        'type': type_name,
-        'question': stem,
-        'options_for_practice': options_for_practice,
-        'answer': answer,
-        'is_multiple_choice': is_multiple_choice,
-        'explanation': explanation,
-        'difficulty': difficulty,
-        # 'status': status, # Status might not be needed directly in practice question object
-        'subject_name': subject_name,
-        'tiku_name': tiku_name
-    }
+    return _format_question_row(row, prefixed_id=True)
 
 
 @with_db_connection
@@ -0,0 +1,112 @@
+"""
+管理后台统计面板数据
+系统统计和题目统计合并为一份统计文档缓存在Redis，所有worker共用；
+超过新鲜期的文档先照常返回，同时由抢到刷新锁的一个worker在后台线程重新统计，
+高峰期打开管理面板不会同步触发统计查询
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from .RedisManager import redis_manager
+from .config import RedisConfig
+from .connectDB import get_detailed_question_stats, get_system_stats
+
+logger = logging.getLogger(__name__)
+
+
+class DashboardStats:
+    """统计面板数据提供者"""
+
+    _CACHE_KEY = 'dashboard_stats'
+    _LOCK_KEY = 'dashboard_stats:refresh_lock'
+
+    def __init__(self, fresh_ttl: int = 60, stale_ttl: int = 600, refresh_lock_ttl: int = 30):
+        self._fresh_ttl = fresh_ttl
+        self._stale_ttl = stale_ttl
+        self._refresh_lock_ttl = refresh_lock_ttl
+
+        # Redis不可用时使用本进程副本
+        self._local_doc: Optional[Dict[str, Any]] = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'stale_hits': 0, 'refreshes': 0, 'background_refreshes': 0, 'errors': 0,
+                       'last_refresh_ms': 0.0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self) -> Dict[str, Any]:
+        """读取统计文档 {'system', 'questions', 'generated_at'}，没有可用文档时同步统计"""
+        doc = redis_manager.cache_get(self._CACHE_KEY)
+        if doc is None:
+            with self._lock:
+                doc = self._local_doc
+            if doc is not None and time.time() - doc['generated_at'] >= self._stale_ttl:
+                doc = None
+        if doc is None:
+            return self.refresh()
+
+        if time.time() - doc['generated_at'] < self._fresh_ttl:
+            self._count('hits')
+        else:
+            self._count('stale_hits')
+            self._refresh_in_background()
+        return doc
+
+    def refresh(self) -> Dict[str, Any]:
+        """重新统计并写入缓存（查询失败时抛出异常，由调用方处理）"""
+        start_time = time.perf_counter()
+        doc = {
+            'system': get_system_stats(),
+            'questions': get_detailed_question_stats(),
+            'generated_at': time.time()
+        }
+        redis_manager.cache_set(self._CACHE_KEY, doc, self._stale_ttl)
+
+        with self._lock:
+            self._local_doc = doc
+            self._stats['refreshes'] += 1
+            self._stats['last_refresh_ms'] = (time.perf_counter() - start_time) * 1000
+        return doc
+
+    def _refresh_in_background(self) -> None:
+        """抢到刷新锁（Redis不可用时为本进程标记）后启动后台线程重新统计"""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        try:
+            if redis_manager.is_available and not redis_manager.client.set(
+                    redis_manager._get_cache_key(self._LOCK_KEY), os.getpid(), nx=True, ex=self._refresh_lock_ttl):
+                self._refreshing = False
+                return
+        except Exception as e:
+            redis_manager.record_failure(e)
+
+        threading.Thread(target=self._background_refresh, name="dashboard_stats_refresh", daemon=True).start()
+
+    def _background_refresh(self) -> None:
+        try:
+            self.refresh()
+            self._count('background_refreshes')
+        except Exception as e:
+            self._count('errors')
+            logger.error(f"后台刷新统计面板数据失败: {e}")
+        finally:
+            self._refreshing = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计面板缓存的统计信息"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({'fresh_ttl': self._fresh_ttl, 'stale_ttl': self._stale_ttl})
+        return stats
+
+
+# 全局统计面板数据提供者
+dashboard_stats = DashboardStats(**RedisConfig.DASHBOARD_STATS_CONFIG)
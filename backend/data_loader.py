@@ -2,31 +2,39 @@
 数据加载器模块 - 专门处理数据库题目数据的加载
 """
 import logging
-from typing import Dict, Any
+from itertools import groupby
+from operator import itemgetter
+from typing import Dict, Any, Iterator, List, Tuple
 
-from .connectDB import get_all_questions_by_tiku_dict
+from .connectDB import iter_questions
 
 logger = logging.getLogger(__name__)
 
 
-def load_all_banks_from_database():
-    """从数据库加载所有题目数据（主要加载方法）"""
+def load_all_banks_from_database() -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+    """
+    从数据库流式加载所有题目数据（主要加载方法）
+    按题库依次生成 (tiku_id, 题目列表)，同一时刻只在内存中保留一个题库的题目，
+    调用方可边加载边写入缓存
+    """
     logger.info("从数据库加载所有题目数据...")
 
+    bank_count = 0
+    total_questions = 0
     try:
-        # 直接从数据库获取所有题目，按题库分组
-        questions_dict = get_all_questions_by_tiku_dict()
-        
-        if not questions_dict:
-            logger.warning("数据库中没有题目数据")
-            return {}
-
-        # 统计信息
-        total_questions = sum(len(questions) for questions in questions_dict.values())
-        logger.info(f"从数据库成功加载 {len(questions_dict)} 个题库，共 {total_questions} 道题目")
-        
-        return questions_dict
+        # 题目按 tiku_id 排序读出，相邻的同一题库题目组成一个题库
+        for tiku_id, questions in groupby(iter_questions(active_tiku_only=True, prefixed_id=True),
+                                          key=itemgetter('tiku_id')):
+            questions = list(questions)
+            bank_count += 1
+            total_questions += len(questions)
+            yield tiku_id, questions
 
     except Exception as e:
         logger.error(f"从数据库加载题目失败: {e}")
-        return {} 
\ No newline at end of file
+        return
+
+    if not bank_count:
+        logger.warning("数据库中没有题目数据")
+    else:
+        logger.info(f"从数据库成功加载 {bank_count} 个题库，共 {total_questions} 道题目")
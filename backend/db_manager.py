@@ -0,0 +1,248 @@
+"""
+数据库连接管理 - 所有数据库访问都经由这里取得和归还连接
+- 连接池大小按 ServerConfig 的worker/线程配置计算，而不是固定值
+- 连接池耗尽时排队等待（有超时），而不是像 mysql.connector 那样立即抛出异常
+- 统计排队等待时间、连接占用时间和连接池耗尽次数
+- 连接池按进程懒创建（Gunicorn preload_app 下fork后不能共用父进程的连接）
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from mysql.connector import Error
+from mysql.connector import pooling
+
+from .config import DatabaseConfig, ServerConfig
+
+logger = logging.getLogger(__name__)
+
+# mysql.connector 单个连接池的上限
+MYSQL_POOL_SIZE_LIMIT = pooling.CNX_POOL_MAXSIZE
+
+
+class ManagedConnection:
+    """连接池连接的包装：close() 总是把连接归还连接池并记录占用时间，重复调用无副作用"""
+
+    _OWN_ATTRIBUTES = ('_cnx', '_manager', '_semaphore', '_checked_out_at', '_released', '_autocommit_changed')
+
+    def __init__(self, cnx, manager: 'ConnectionManager', semaphore: threading.BoundedSemaphore):
+        object.__setattr__(self, '_cnx', cnx)
+        object.__setattr__(self, '_manager', manager)
+        object.__setattr__(self, '_semaphore', semaphore)
+        object.__setattr__(self, '_checked_out_at', time.perf_counter())
+        object.__setattr__(self, '_released', False)
+        object.__setattr__(self, '_autocommit_changed', False)
+
+    def __getattr__(self, name):
+        return getattr(self._cnx, name)
+
+    def __setattr__(self, name, value):
+        if name in self._OWN_ATTRIBUTES:
+            object.__setattr__(self, name, value)
+            return
+        if name == 'autocommit':
+            object.__setattr__(self, '_autocommit_changed', True)
+        setattr(self._cnx, name, value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self) -> None:
+        if self._released:
+            return
+        object.__setattr__(self, '_released', True)
+        try:
+            # 恢复默认的自动提交，避免下一个使用者拿到关闭了自动提交的连接
+            if self._autocommit_changed and self._cnx.is_connected():
+                self._cnx.autocommit = True
+            self._cnx.close()
+        except Error as e:
+            logger.warning(f"归还数据库连接时出错: {e}")
+        finally:
+            self._manager._release(self._semaphore, time.perf_counter() - self._checked_out_at)
+
+
+class ConnectionManager:
+    """进程内的数据库连接管理器"""
+
+    def __init__(self, pool_config: Dict[str, Any], extra_connections: int = 2,
+                 max_total_connections: int = 150, checkout_timeout: float = 5.0,
+                 validate_on_checkout: bool = False):
+        self._pool_config = dict(pool_config)
+        self._extra_connections = extra_connections
+        self._max_total_connections = max_total_connections
+        self._checkout_timeout = checkout_timeout
+        self._validate_on_checkout = validate_on_checkout
+
+        self._request_threads = ServerConfig.GUNICORN_OPTIONS.get('threads', 1)
+        self._workers = ServerConfig.GUNICORN_OPTIONS.get('workers', 1)
+
+        self._pool = None
+        self._semaphore = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self) -> None:
+        # 统计信息（每个进程各自统计）
+        self._stats = {
+            'checkouts': 0,
+            'exhausted': 0,  # 取连接时连接池已耗尽、需要排队的次数
+            'timeouts': 0,  # 排队超时的次数
+            'errors': 0,
+            'validation_failures': 0,
+            'in_use': 0,
+            'peak_in_use': 0,
+            'wait_ms': 0.0,
+            'max_wait_ms': 0.0,
+            'checkout_ms': 0.0,
+            'max_checkout_ms': 0.0,
+            'released': 0
+        }
+
+    def configure(self, request_threads: Optional[int] = None, workers: Optional[int] = None) -> None:
+        """按实际使用的服务器设置处理请求的线程数和进程数，本进程已创建的连接池在下次取连接时按新大小重建"""
+        with self._lock:
+            if request_threads is not None:
+                self._request_threads = request_threads
+            if workers is not None:
+                self._workers = workers
+            self._pid = None
+
+    @property
+    def pool_size(self) -> int:
+        """每个进程的连接数：请求线程 + 持有连接的后台线程 + 预留，受总连接数和连接池上限约束"""
+        background_threads = (DatabaseConfig.PRACTICE_WRITE_BEHIND_CONFIG['workers']
+                              + DatabaseConfig.IMPORT_JOB_CONFIG['workers']
+                              + self._extra_connections)
+        wanted = self._request_threads + background_threads
+        per_process_limit = max(1, self._max_total_connections // max(1, self._workers))
+        return max(1, min(wanted, per_process_limit, MYSQL_POOL_SIZE_LIMIT))
+
+    def _ensure_pool(self) -> None:
+        """按进程懒创建连接池"""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+
+        with self._lock:
+            if self._pid == pid:
+                return
+            pool_size = self.pool_size
+            self._pool = pooling.MySQLConnectionPool(pool_size=pool_size, **self._pool_config)
+            self._semaphore = threading.BoundedSemaphore(pool_size)
+            with self._stats_lock:
+                self._reset_stats()
+            self._pid = pid
+            logger.info(f"数据库连接池已创建: {pool_size} 个连接 (pid={pid})")
+
+    def init(self) -> None:
+        """创建本进程的连接池（连接失败时抛出 mysql.connector.Error）"""
+        self._ensure_pool()
+
+    def get_connection(self) -> ManagedConnection:
+        """
+        取出一个连接，连接池耗尽时最多排队等待 checkout_timeout 秒
+        调用方必须调用 close() 归还（或使用 connection() 上下文管理器）
+        """
+        try:
+            self._ensure_pool()
+        except Error as e:
+            raise ConnectionError(f"Failed to create connection pool: {e}")
+
+        semaphore = self._semaphore
+        start_time = time.perf_counter()
+        if not semaphore.acquire(blocking=False):
+            with self._stats_lock:
+                self._stats['exhausted'] += 1
+            if not semaphore.acquire(timeout=self._checkout_timeout):
+                with self._stats_lock:
+                    self._stats['timeouts'] += 1
+                logger.error(f"等待数据库连接超时({self._checkout_timeout}s)，连接池已耗尽")
+                raise ConnectionError("Timed out waiting for a database connection.")
+        wait_ms = (time.perf_counter() - start_time) * 1000
+
+        try:
+            cnx = self._pool.get_connection()
+            if self._validate_on_checkout:
+                try:
+                    cnx.ping(reconnect=True, attempts=2, delay=0)
+                except Error:
+                    with self._stats_lock:
+                        self._stats['validation_failures'] += 1
+                    cnx.close()
+                    raise
+        except Error as e:
+            semaphore.release()
+            with self._stats_lock:
+                self._stats['errors'] += 1
+            raise ConnectionError(f"Failed to get connection from pool: {e}")
+
+        with self._stats_lock:
+            stats = self._stats
+            stats['checkouts'] += 1
+            stats['wait_ms'] += wait_ms
+            stats['max_wait_ms'] = max(stats['max_wait_ms'], wait_ms)
+            stats['in_use'] += 1
+            stats['peak_in_use'] = max(stats['peak_in_use'], stats['in_use'])
+        return ManagedConnection(cnx, self, semaphore)
+
+    def _release(self, semaphore: threading.BoundedSemaphore, checkout_seconds: float) -> None:
+        """归还连接：释放排队名额并记录占用时间"""
+        checkout_ms = checkout_seconds * 1000
+        if semaphore is self._semaphore:
+            with self._stats_lock:
+                stats = self._stats
+                stats['released'] += 1
+                stats['in_use'] -= 1
+                stats['checkout_ms'] += checkout_ms
+                stats['max_checkout_ms'] = max(stats['max_checkout_ms'], checkout_ms)
+        semaphore.release()
+
+    @contextmanager
+    def connection(self):
+        """取出连接，退出时总是归还"""
+        connection = self.get_connection()
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取本进程的连接池统计信息"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats.update({
+            'pool_size': self.pool_size,
+            'request_threads': self._request_threads,
+            'workers': self._workers,
+            'checkout_timeout': self._checkout_timeout,
+            'validate_on_checkout': self._validate_on_checkout,
+            'pid': os.getpid()
+        })
+        stats['avg_wait_ms'] = stats['wait_ms'] / stats['checkouts'] if stats['checkouts'] else 0.0
+        stats['avg_checkout_ms'] = stats['checkout_ms'] / stats['released'] if stats['released'] else 0.0
+        return stats
+
+
+def release_db_resources(cursor=None, connection=None) -> None:
+    """关闭游标并归还连接；关闭游标出错也会归还连接"""
+    try:
+        if cursor:
+            cursor.close()
+    except Error as e:
+        logger.warning(f"关闭游标时出错: {e}")
+    finally:
+        if connection:
+            connection.close()
+
+
+# 全局连接管理器
+connection_manager = ConnectionManager(DatabaseConfig.MYSQL_POOL_CONFIG, **DatabaseConfig.CONNECTION_MANAGER_CONFIG)
@@ -0,0 +1,193 @@
+"""
+题库Excel导入引擎
+- 以 openpyxl 只读模式逐行流式读取，不把整个工作簿加载为DataFrame
+- 判断题答案通过预先构建的查找表一次字典查询完成标准化
+- 逐行解析，无效行记录行号和原因，供上传接口返回给管理员
+"""
+import logging
+import os
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from .config import (
+    QUESTION_COLUMN, ANSWER_COLUMN, OPTION_A_COLUMN, OPTION_B_COLUMN, OPTION_C_COLUMN, OPTION_D_COLUMN
+)
+from .utils import TF_ANSWER_MAP
+
+logger = logging.getLogger(__name__)
+
+OPTION_COLUMNS = (
+    ('A', OPTION_A_COLUMN),
+    ('B', OPTION_B_COLUMN),
+    ('C', OPTION_C_COLUMN),
+    ('D', OPTION_D_COLUMN)
+)
+
+# 文件头：.xlsx 是zip包，旧版 .xls 是OLE2复合文档（不能只看扩展名，上传的文件可能被重命名）
+ZIP_MAGIC = b'PK\x03\x04'
+OLE2_MAGIC = b'\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1'
+
+# 逐行错误最多保留的条数，避免整个文件格式错误时返回过大的结果
+MAX_REPORTED_ERRORS = 200
+
+
+def _cell_text(value: Any) -> str:
+    """单元格值转为去除首尾空白的文本，空单元格和 'nan' 视为空"""
+    if value is None:
+        return ''
+    text = str(value).strip()
+    return '' if text.lower() == 'nan' else text
+
+
+def _is_legacy_xls(filepath: str) -> bool:
+    """按文件头判断是否为旧版 .xls（OLE2复合文档），.xlsx 是zip包；无法识别时按扩展名判断"""
+    with open(filepath, 'rb') as f:
+        header = f.read(len(OLE2_MAGIC))
+    if header.startswith(OLE2_MAGIC):
+        return True
+    if header.startswith(ZIP_MAGIC):
+        return False
+    return filepath.lower().endswith('.xls')
+
+
+def _iter_sheet_rows(filepath: str, sheetname: Union[str, int]) -> Iterator[tuple]:
+    """逐行读取工作表（第一行为表头），.xlsx 使用 openpyxl 只读模式流式读取"""
+    if _is_legacy_xls(filepath):
+        # openpyxl 不支持旧版 .xls，回退到 pandas 读取
+        import pandas as pd
+        df = pd.read_excel(filepath, sheet_name=sheetname, dtype=str)
+        yield tuple(df.columns)
+        yield from df.itertuples(index=False, name=None)
+        return
+
+    from openpyxl import load_workbook
+    workbook = load_workbook(filepath, read_only=True, data_only=True)
+    try:
+        worksheet = workbook.worksheets[sheetname] if isinstance(sheetname, int) else workbook[sheetname]
+        yield from worksheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def parse_question_row(values: Dict[str, str]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    解析一行题目数据
+    :param values: {列名: 单元格文本}
+    :return: (题目, None) 或 (None, 错误原因)；整行为空时返回 (None, None)
+    """
+    question_text = values.get(QUESTION_COLUMN, '')
+    raw_answer_text = values.get(ANSWER_COLUMN, '')
+
+    if not question_text and not raw_answer_text:
+        return None, None
+    if not question_text:
+        return None, '题干为空'
+    if not raw_answer_text:
+        return None, '答案为空'
+
+    tf_answer = TF_ANSWER_MAP.get(raw_answer_text.upper())
+    options_for_practice = None
+
+    if tf_answer is not None:
+        # 判断题
+        processed_answer = tf_answer
+        question_type = '判断题'
+    else:
+        # 选择题
+        options_for_practice = {}
+        for option_key, column in OPTION_COLUMNS:
+            option_text = values.get(column, '')
+            if option_text:
+                options_for_practice[option_key] = option_text
+
+        if not options_for_practice:
+            return None, f'无法识别的判断题答案且没有选项: {raw_answer_text}'
+
+        processed_answer = raw_answer_text.upper()
+        if processed_answer.endswith(".0"):
+            processed_answer = processed_answer[:-2]
+
+        # 验证答案
+        invalid_letters = [char for char in processed_answer if char not in options_for_practice]
+        if invalid_letters:
+            return None, f"答案 {processed_answer} 包含不存在的选项: {''.join(invalid_letters)}"
+
+        question_type = '多选题' if len(processed_answer) > 1 else '单选题'
+
+    return {
+        'type': question_type,
+        'question': question_text,
+        'options_for_practice': options_for_practice,
+        'answer': processed_answer,
+        'is_multiple_choice': question_type == '多选题'
+    }, None
+
+
+def iter_questions_from_excel(filepath: str, sheetname: Union[str, int]
+                              ) -> Iterator[Tuple[int, Optional[Dict[str, Any]], Optional[str]]]:
+    """
+    流式解析Excel题库，逐行产出 (数据行序号, 题目, 错误原因)
+    数据行序号从0开始（不含表头）；缺少必需列时抛出 ValueError
+    """
+    rows = _iter_sheet_rows(filepath, sheetname)
+    header = next(rows, None)
+    if header is None:
+        return
+
+    columns = [_cell_text(col) for col in header]
+    missing_cols = [col for col in (QUESTION_COLUMN, ANSWER_COLUMN) if col not in columns]
+    if missing_cols:
+        raise ValueError(f"缺少必需的列: {', '.join(missing_cols)}")
+
+    # 只读取用到的列：{列名: 列位置}
+    wanted = {QUESTION_COLUMN, ANSWER_COLUMN, *(column for _, column in OPTION_COLUMNS)}
+    positions = [(name, pos) for pos, name in enumerate(columns) if name in wanted]
+
+    for index, row in enumerate(rows):
+        values = {name: _cell_text(row[pos]) if pos < len(row) else '' for name, pos in positions}
+        try:
+            question, error = parse_question_row(values)
+        except Exception as e:
+            question, error = None, f'解析失败: {e}'
+        yield index, question, error
+
+
+def ingest_excel(filepath: str, sheetname: Union[str, int]) -> Dict[str, Any]:
+    """
+    解析整个Excel题库
+    :return: {'success', 'questions', 'errors': [{'row': Excel行号, 'error': 原因}],
+              'error_count', 'total_rows', 'error'}
+    """
+    if not os.path.exists(filepath):
+        return {'success': False, 'error': f"文件不存在: {filepath}"}
+
+    questions: List[Dict[str, Any]] = []
+    errors: List[Dict[str, Any]] = []
+    error_count = 0
+    total_rows = 0
+
+    try:
+        for index, question, error in iter_questions_from_excel(filepath, sheetname):
+            total_rows += 1
+            if question is not None:
+                question['id'] = f"{filepath}_{index}"
+                questions.append(question)
+            elif error is not None:
+                error_count += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    # Excel中的行号：表头占第1行
+                    errors.append({'row': index + 2, 'error': error})
+    except Exception as e:
+        logger.error(f"解析Excel题库失败 '{filepath}': {e}")
+        return {'success': False, 'error': str(e)}
+
+    if error_count:
+        logger.warning(f"Excel题库 '{filepath}' 中有 {error_count} 行无效数据已跳过")
+    logger.info(f"从文件加载 {len(questions)} 道题目: '{filepath}' (共 {total_rows} 行)")
+
+    return {
+        'success': True,
+        'questions': questions,
+        'errors': errors,
+        'error_count': error_count,
+        'total_rows': total_rows
+    }
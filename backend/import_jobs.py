@@ -0,0 +1,329 @@
+"""
+题库后台导入任务 - 上传接口只保存文件并登记任务，立即返回任务ID
+由进程内的线程池依次执行 解析 -> 校验 -> 暂存 -> 替换：
+新题目先以 inactive 状态暂存，全部写入后在一个事务内替换旧题目，
+失败时删除暂存数据，题库始终保持导入前或导入后的完整状态
+重新上传同名题库时：文件哈希未变则直接跳过；否则按题目内容哈希比对，
+只新增/更新/软删除有变化的题目，未变化的题目保留原ID，进行中的答题记录不受影响
+任务状态保存在Redis中，任意worker都可以查询进度
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .RedisManager import redis_manager
+from .config import DatabaseConfig, SHEET_NAME
+from .connectDB import (
+    create_or_update_tiku, delete_tiku, parse_excel_to_questions, bulk_insert_questions,
+    get_question_id_watermark, swap_staged_questions, delete_staged_questions,
+    get_tiku_by_name, update_tiku_file, get_tiku_question_digests, apply_question_diff,
+    question_content_hash
+)
+from .excel_ingest import ingest_excel
+from .utils import get_file_hash, remove_file_safely
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = 'queued'
+JOB_PARSING = 'parsing'
+JOB_STAGING = 'staging'
+JOB_SWAPPING = 'swapping'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+JOB_SKIPPED = 'skipped'
+
+
+def plan_question_diff(existing: List[Dict[str, Any]], questions: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    比对题库现有题目和新文件中的题目（数据库格式）
+    1. 内容哈希相同的视为未变化（此前被禁用的重新启用）
+    2. 其余按 题型+题干 匹配的视为修改，原地更新
+    3. 仍未匹配的新题目插入，未匹配的现有启用题目软删除
+    """
+    by_hash = defaultdict(list)
+    by_stem = defaultdict(list)
+    # 启用的题目优先匹配
+    for row in sorted(existing, key=lambda r: (r['status'] != 'active', r['id'])):
+        by_hash[row['content_hash']].append(row)
+    matched_ids = set()
+
+    unchanged_count = 0
+    activate_ids = []
+    remaining = []
+    for question in questions:
+        candidates = by_hash.get(question_content_hash(question))
+        if candidates:
+            row = candidates.pop(0)
+            matched_ids.add(row['id'])
+            if row['status'] == 'active':
+                unchanged_count += 1
+            else:
+                activate_ids.append(row['id'])
+        else:
+            remaining.append(question)
+
+    for row in existing:
+        if row['id'] not in matched_ids:
+            by_stem[(row['question_type'], row['stem'])].append(row)
+
+    updates = {}
+    inserts = []
+    for question in remaining:
+        candidates = by_stem.get((question['question_type'], (question['stem'] or '').strip()))
+        if candidates:
+            row = candidates.pop(0)
+            matched_ids.add(row['id'])
+            updates[row['id']] = question
+        else:
+            inserts.append(question)
+
+    deactivate_ids = [row['id'] for row in existing if row['id'] not in matched_ids and row['status'] == 'active']
+
+    return {
+        'inserts': inserts,
+        'updates': updates,
+        'activate_ids': activate_ids,
+        'deactivate_ids': deactivate_ids,
+        'unchanged_count': unchanged_count
+    }
+
+
+class ImportJobManager:
+    """题库导入任务管理器"""
+
+    def __init__(self, workers: int = 2, job_ttl: int = 86400):
+        self.redis_manager = redis_manager
+        self._workers = workers
+        self._job_ttl = job_ttl
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        # 本进程执行的任务状态（Redis不可用时仍可在本进程查询）
+        self._local_jobs: Dict[str, Dict[str, Any]] = {}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """按进程懒创建线程池（Gunicorn preload_app 下fork后需在worker进程内重新创建）"""
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._executor = ThreadPoolExecutor(max_workers=self._workers,
+                                                        thread_name_prefix="tiku_import_")
+                    self._pid = pid
+        return self._executor
+
+    @staticmethod
+    def _job_key(job_id: str) -> str:
+        return f'import_job:{job_id}'
+
+    def _save(self, job: Dict[str, Any]) -> None:
+        job['updated_at'] = time.time()
+        with self._lock:
+            self._local_jobs[job['job_id']] = dict(job)
+        self.redis_manager.cache_set(self._job_key(job['job_id']), job, self._job_ttl)
+
+    def _update(self, job: Dict[str, Any], **fields) -> None:
+        job.update(fields)
+        self._save(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """查询任务状态"""
+        job = self.redis_manager.cache_get(self._job_key(job_id))
+        if job is not None:
+            return job
+        with self._lock:
+            job = self._local_jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def submit(self, subject_id: int, tiku_name: str, filepath: str, created_by: Any = None,
+               file_size: Optional[int] = None, file_hash: Optional[str] = None,
+               on_complete: Optional[Callable[[int, Optional[List[int]]], None]] = None) -> Dict[str, Any]:
+        """
+        登记导入任务并放入线程池，立即返回任务状态
+        :param filepath: 已保存的题库文件路径
+        :param file_size: 保存文件时同时得到的文件大小和哈希，未提供时由任务读取文件计算
+        :param on_complete: 导入成功后以 (题库ID, 变化的题目ID列表) 调用（用于使相关缓存失效），
+                            新建题库时题目ID列表为None；文件未变化跳过导入时不调用
+        """
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'status': JOB_QUEUED,
+            'progress': 0,
+            'subject_id': subject_id,
+            'tiku_name': tiku_name,
+            'file_path': filepath,
+            'file_size': file_size if file_size is not None else os.path.getsize(filepath),
+            'file_hash': file_hash or get_file_hash(filepath),
+            'created_by': created_by,
+            'tiku_id': None,
+            'total_rows': 0,
+            'parsed_count': 0,
+            'inserted_count': 0,
+            'question_count': 0,
+            'skipped_count': 0,
+            'row_errors': [],
+            'diff': None,
+            'error': None,
+            'created_at': time.time()
+        }
+        self._save(job)
+        self._get_executor().submit(self._run, job, on_complete)
+        logger.info(f"题库导入任务已提交: {job['job_id']} ({tiku_name})")
+        return dict(job)
+
+    def _run(self, job: Dict[str, Any], on_complete: Optional[Callable[[int, Optional[List[int]]], None]]) -> None:
+        """执行导入任务：解析 -> 校验 -> 暂存 -> 替换（同名题库已存在时改为增量导入）"""
+        filepath = job['file_path']
+        tiku_id = None
+        tiku_created = False
+        watermark = None
+        staged_id_ranges: List[Tuple[int, int]] = []
+        keep_file = False
+        changed_ids = None
+        start_time = time.time()
+
+        try:
+            # 同名题库文件内容未变化，跳过整个导入
+            file_hash = job['file_hash']
+            existing_tiku = get_tiku_by_name(job['subject_id'], job['tiku_name'])
+            if existing_tiku and file_hash and existing_tiku['file_hash'] == file_hash:
+                if existing_tiku['tiku_position'] != filepath:
+                    remove_file_safely(filepath)
+                self._update(job, status=JOB_SKIPPED, progress=100, tiku_id=existing_tiku['tiku_id'],
+                             file_path=existing_tiku['tiku_position'])
+                logger.info(f"题库导入任务 {job['job_id']}: 题库 {existing_tiku['tiku_id']} 文件未变化，已跳过")
+                return
+
+            # 解析
+            self._update(job, status=JOB_PARSING, progress=5)
+            ingest_result = ingest_excel(filepath, SHEET_NAME)
+            if not ingest_result['success']:
+                raise ValueError(f"文件格式错误或无法解析: {ingest_result['error']}")
+
+            # 校验
+            questions = ingest_result['questions']
+            self._update(job, progress=30, total_rows=ingest_result['total_rows'],
+                         parsed_count=len(questions), skipped_count=ingest_result['error_count'],
+                         row_errors=ingest_result['errors'])
+            if not questions:
+                raise ValueError('文件中没有有效的题目数据')
+
+            if existing_tiku:
+                tiku_id = existing_tiku['tiku_id']
+                changed_ids = self._run_diff(job, existing_tiku, questions, file_hash)
+            else:
+                tiku_result = create_or_update_tiku(
+                    subject_id=job['subject_id'],
+                    tiku_name=job['tiku_name'],
+                    tiku_position=filepath,
+                    tiku_nums=len(questions),
+                    file_size=job['file_size'],
+                    file_hash=file_hash
+                )
+                if not tiku_result['success']:
+                    raise ValueError(tiku_result['error'])
+                tiku_id = tiku_result['tiku_id']
+                tiku_created = tiku_result.get('created', False)
+                keep_file = not tiku_created
+
+                # 暂存：新题目以 inactive 状态写入，练习时不可见；水位之前的是要替换掉的旧题目
+                watermark = get_question_id_watermark()
+                if watermark is None:
+                    raise ValueError('获取题目ID水位失败')
+
+                db_questions = parse_excel_to_questions(job['subject_id'], tiku_id, questions)
+                for question in db_questions:
+                    question['status'] = 'inactive'
+
+                total = len(db_questions)
+                self._update(job, status=JOB_STAGING, progress=35, tiku_id=tiku_id)
+                insert_result = bulk_insert_questions(
+                    db_questions,
+                    progress_callback=lambda inserted: self._update(
+                        job, inserted_count=inserted, progress=35 + int(55 * inserted / total))
+                )
+                staged_id_ranges = insert_result.get('inserted_id_ranges', [])
+                if not insert_result['success']:
+                    raise ValueError(f"插入题目失败: {insert_result['error']}")
+
+                # 替换：一个事务内删除旧题目并启用新题目
+                self._update(job, status=JOB_SWAPPING, progress=90, inserted_count=insert_result['inserted_count'])
+                swap_result = swap_staged_questions(tiku_id, watermark, staged_id_ranges)
+                if not swap_result['success']:
+                    raise ValueError(swap_result['error'])
+                self._update(job, question_count=swap_result['question_count'])
+
+            self._update(job, status=JOB_COMPLETED, progress=100)
+            logger.info(f"题库导入任务完成: {job['job_id']} 题库 {tiku_id}，共 {job['question_count']} 道题目，"
+                        f"耗时 {time.time() - start_time:.1f}s")
+
+        except Exception as e:
+            logger.error(f"题库导入任务失败 {job['job_id']}: {e}")
+            self._cleanup(tiku_id, tiku_created, staged_id_ranges, filepath, keep_file)
+            self._update(job, status=JOB_FAILED, error=str(e))
+            return
+
+        if on_complete:
+            try:
+                on_complete(tiku_id, changed_ids)
+            except Exception as e:
+                logger.error(f"题库导入任务 {job['job_id']} 完成回调失败: {e}")
+
+    def _run_diff(self, job: Dict[str, Any], existing_tiku: Dict[str, Any], questions: List[Dict[str, Any]],
+                  file_hash: Optional[str]) -> List[int]:
+        """增量导入到已存在的题库，返回内容或状态发生变化的题目ID（新增的题目没有旧缓存，不包含在内）"""
+        tiku_id = existing_tiku['tiku_id']
+        filepath = job['file_path']
+
+        existing = get_tiku_question_digests(tiku_id)
+        if existing is None:
+            raise ValueError('获取题库现有题目失败')
+
+        diff = plan_question_diff(existing, parse_excel_to_questions(job['subject_id'], tiku_id, questions))
+        self._update(job, status=JOB_SWAPPING, progress=60, tiku_id=tiku_id, diff={
+            'inserted': len(diff['inserts']),
+            'updated': len(diff['updates']) + len(diff['activate_ids']),
+            'deleted': len(diff['deactivate_ids']),
+            'unchanged': diff['unchanged_count']
+        })
+
+        diff_result = apply_question_diff(tiku_id, diff['inserts'], diff['updates'],
+                                          diff['activate_ids'], diff['deactivate_ids'])
+        if not diff_result['success']:
+            raise ValueError(diff_result['error'])
+        self._update(job, progress=90, inserted_count=len(diff['inserts']),
+                     question_count=diff_result['question_count'])
+
+        # 题目已替换成功后才记录新文件哈希，失败时下次上传会重新比对
+        old_filepath = existing_tiku['tiku_position']
+        file_result = update_tiku_file(tiku_id, filepath, job['file_size'], file_hash)
+        if not file_result['success']:
+            logger.warning(f"题库 {tiku_id} 题目已更新，但{file_result['error']}")
+            remove_file_safely(filepath)
+        elif old_filepath and old_filepath != filepath:
+            remove_file_safely(old_filepath)
+
+        return list(diff['updates']) + diff['activate_ids'] + diff['deactivate_ids']
+
+    @staticmethod
+    def _cleanup(tiku_id: Optional[int], tiku_created: bool, staged_id_ranges: List[Tuple[int, int]],
+                 filepath: str, keep_file: bool = False) -> None:
+        """导入失败：删除本次暂存的题目；题库是本次新建的则一并删除题库记录；未被题库引用的上传文件删除"""
+        try:
+            if tiku_id and staged_id_ranges:
+                delete_staged_questions(tiku_id, staged_id_ranges)
+            if tiku_id and tiku_created:
+                delete_tiku(tiku_id)
+            if not keep_file:
+                remove_file_safely(filepath)
+        except Exception as e:
+            logger.error(f"清理失败的导入任务数据出错: {e}")
+
+
+# 全局导入任务管理器
+import_job_manager = ImportJobManager(**DatabaseConfig.IMPORT_JOB_CONFIG)
@@ -0,0 +1,80 @@
+"""
+管理后台列表总数缓存
+题目/用户分页列表的总数缓存在Redis，翻页时不再每页执行一次全表 COUNT；
+管理操作增删题目、注册用户时删除对应的缓存，其他变化在有效期后自然刷新（总数为近似值）
+"""
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from .RedisManager import redis_manager
+from .config import RedisConfig
+
+logger = logging.getLogger(__name__)
+
+
+class ListingCounts:
+    """列表总数缓存"""
+
+    def __init__(self, key_prefix: str = 'listing_count:', ttl: int = 600):
+        self._key_prefix = key_prefix
+        self._ttl = ttl
+
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, name: str, counter: Callable[[], int]) -> int:
+        """读取缓存的总数，未缓存时调用 counter() 统计并缓存"""
+        key = f'{self._key_prefix}{name}'
+        total = redis_manager.cache_get(key)
+        if total is not None:
+            self._count('hits')
+            return total
+
+        self._count('misses')
+        total = counter()
+        redis_manager.cache_set(key, total, self._ttl)
+        return total
+
+    # =========================
+    # 总数键
+    # =========================
+
+    @staticmethod
+    def questions_key(tiku_id: Optional[int] = None) -> str:
+        return f'questions:tiku:{tiku_id}' if tiku_id is not None else 'questions:all'
+
+    @staticmethod
+    def users_key(search: str = '') -> str:
+        return f'users:{search}'
+
+    # =========================
+    # 失效
+    # =========================
+
+    def invalidate_questions(self, tiku_id: Optional[int] = None) -> None:
+        """题目增删或启用/禁用后调用；不知道所在题库（或题目换了题库）时删除全部题库的总数"""
+        self._count('invalidations')
+        redis_manager.cache_delete(f'{self._key_prefix}{self.questions_key()}')
+        if tiku_id is not None:
+            redis_manager.cache_delete(f'{self._key_prefix}{self.questions_key(int(tiku_id))}')
+        else:
+            redis_manager.cache_delete_pattern(f'{self._key_prefix}questions:tiku:*')
+
+    def invalidate_users(self) -> None:
+        """新用户注册后调用（包括带搜索条件的总数）"""
+        self._count('invalidations')
+        redis_manager.cache_delete_pattern(f'{self._key_prefix}users:*')
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取总数缓存统计信息"""
+        with self._lock:
+            return dict(self._stats)
+
+
+# 全局列表总数缓存
+listing_counts = ListingCounts(**RedisConfig.LISTING_COUNT_CONFIG)
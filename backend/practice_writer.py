@@ -0,0 +1,320 @@
+"""
+练习会话写回队列 - 答题时只在内存中登记会话的最新状态和答题事件，
+由少量固定的后台线程合并、攒批后批量写入数据库，
+代替每次提交答案都新建线程并单独占用一个数据库连接
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from .config import DatabaseConfig
+from .connectDB import batch_update_practice_sessions
+
+logger = logging.getLogger(__name__)
+
+
+class PracticeSessionWriter:
+    """有界的练习会话写回队列"""
+
+    def __init__(self, workers: int = 2, max_pending: int = 2000, batch_size: int = 50,
+                 flush_interval: float = 0.5, enqueue_timeout: float = 0.2, max_attempts: int = 3):
+        self._workers_count = workers
+        self._max_pending = max_pending
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._enqueue_timeout = enqueue_timeout
+        self._max_attempts = max_attempts
+
+        # 待写入的会话：{session_id: {'fields': 字段字典, 'events': 答题事件列表, 'snapshot': 是否含完整快照,
+        #                             'attempts': 已失败的写入次数}}
+        # 同一会话的多次更新合并为最新字段，答题事件按顺序追加
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        # 正在写入中的会话，避免同一会话的新旧状态被不同线程并发写入导致乱序
+        self._in_flight: set = set()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._threads = []
+        self._pid = None
+
+        # 统计信息
+        self._stats = {
+            'enqueued': 0,
+            'coalesced': 0,
+            'events': 0,
+            'flushed_sessions': 0,
+            'flushed_batches': 0,
+            'failed_batches': 0,
+            'retried_sessions': 0,
+            'dropped_sessions': 0,
+            'sync_fallbacks': 0,
+            'max_pending_seen': 0,
+            'enqueue_wait_ms': 0.0,
+            'flush_time_ms': 0.0
+        }
+
+    def _ensure_started(self):
+        """按进程懒启动后台线程（Gunicorn preload_app 下fork后需在worker进程内重新启动）"""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+
+        with self._cond:
+            if self._pid == pid:
+                return
+            self._pid = pid
+            self._stopping = False
+            self._in_flight.clear()
+            self._threads = []
+            for i in range(self._workers_count):
+                thread = threading.Thread(target=self._worker_loop, name=f"practice_writer_{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            logger.info(f"练习会话写回队列已启动: {self._workers_count} 个写库线程 (pid={pid})")
+
+    @staticmethod
+    def _new_entry() -> Dict[str, Any]:
+        return {'fields': {}, 'events': [], 'snapshot': False, 'attempts': 0}
+
+    @staticmethod
+    def _merge_into(entry: Dict[str, Any], fields: Dict[str, Any],
+                    event: Optional[Dict[str, Any]], snapshot: bool) -> None:
+        """把一次更新合并到待写条目：字段取最新值，快照覆盖之前的事件，事件按顺序追加"""
+        entry['fields'].update(fields)
+        if snapshot:
+            entry['events'] = []
+            entry['snapshot'] = True
+        if event is not None:
+            entry['events'].append(event)
+
+    def submit(self, session_id: int, fields: Dict[str, Any],
+               event: Optional[Dict[str, Any]] = None, snapshot: bool = False) -> bool:
+        """
+        登记练习会话的最新状态，立即返回
+        :param fields: 需要更新的会话字段
+        :param event: 本次答题事件（追加到事件日志）
+        :param snapshot: fields是否包含完整状态快照，快照写入后删除之前的答题事件
+        队列已满时最多等待 enqueue_timeout 秒，仍无空位则在当前线程同步写入
+        """
+        if not session_id or (not fields and event is None):
+            return False
+
+        self._ensure_started()
+        start_time = time.time()
+
+        with self._cond:
+            if event is not None:
+                self._stats['events'] += 1
+
+            if session_id in self._pending:
+                self._merge_into(self._pending[session_id], fields, event, snapshot)
+                self._stats['coalesced'] += 1
+                return True
+
+            deadline = start_time + self._enqueue_timeout
+            while len(self._pending) >= self._max_pending and not self._stopping:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            self._stats['enqueue_wait_ms'] += (time.time() - start_time) * 1000
+
+            if session_id in self._pending:
+                # 等待期间同一会话已重新入队（其他请求登记或写入失败放回），合并到其后
+                self._merge_into(self._pending[session_id], fields, event, snapshot)
+                self._stats['coalesced'] += 1
+                return True
+
+            entry = self._new_entry()
+            self._merge_into(entry, fields, event, snapshot)
+
+            if len(self._pending) < self._max_pending and not self._stopping:
+                self._pending[session_id] = entry
+                self._stats['enqueued'] += 1
+                self._stats['max_pending_seen'] = max(self._stats['max_pending_seen'], len(self._pending))
+                self._cond.notify()
+                return True
+
+            self._stats['sync_fallbacks'] += 1
+
+            if session_id in self._in_flight:
+                # 同一会话正在写入：排在其后由后台线程写入，不与其并发写，避免旧状态覆盖新状态
+                # （超出上限的数量不超过正在写入的会话数）
+                self._pending[session_id] = entry
+                self._cond.notify()
+                return True
+            self._in_flight.add(session_id)
+
+        # 背压：队列持续已满（或正在关闭），在当前线程同步写入
+        logger.warning(f"练习会话写回队列已满，同步写入会话 {session_id}")
+        self._write_and_settle({session_id: entry})
+        # 写入失败时已放回队列等待重试，仍视为登记成功
+        return True
+
+    def _take_batch(self) -> Dict[int, Dict[str, Any]]:
+        """取出一批可写入的会话（调用方需持有锁）"""
+        batch = {}
+        for session_id in list(self._pending):
+            if session_id in self._in_flight:
+                continue
+            batch[session_id] = self._pending.pop(session_id)
+            self._in_flight.add(session_id)
+            if len(batch) >= self._batch_size:
+                break
+        return batch
+
+    def _worker_loop(self):
+        """后台写库线程：攒批 flush_interval 秒后批量写入"""
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopping:
+                    self._cond.wait()
+                if self._stopping and not self._pending:
+                    return
+
+            # 攒批：给同一会话的后续提交留出合并时间
+            if not self._stopping:
+                time.sleep(self._flush_interval)
+
+            with self._cond:
+                batch = self._take_batch()
+                if not batch:
+                    # 剩余的会话都在其他线程写入中，等待其完成
+                    self._cond.wait(self._flush_interval)
+                    continue
+
+            self._write_and_settle(batch)
+
+    def _write_and_settle(self, batch: Dict[int, Dict[str, Any]]) -> None:
+        """
+        写入一批已标记为写入中的会话，完成后移出写入中集合
+        整批失败时逐个重试，只有自身写入失败的会话计入失败次数：未超过 max_attempts 的放回队列，
+        超过的记录日志后丢弃，避免一个无法写入的会话拖累同批的其他会话；数据库不可用时整批放回，不计入失败次数
+        """
+        pending = dict(batch)  # 尚未写入成功、也不计入失败次数的会话，结束时放回队列
+        failed: Dict[int, Dict[str, Any]] = {}
+        try:
+            result = self._write_batch(batch)
+            if result['success']:
+                pending.clear()
+            elif not result.get('unavailable'):
+                if len(batch) == 1:
+                    failed, pending = pending, {}
+                else:
+                    for session_id, entry in batch.items():
+                        with self._cond:
+                            self._stats['retried_sessions'] += 1
+                        result = self._write_batch({session_id: entry})
+                        if result['success']:
+                            del pending[session_id]
+                        elif not result.get('unavailable'):
+                            failed[session_id] = pending.pop(session_id)
+        finally:
+            with self._cond:
+                self._in_flight.difference_update(batch)
+                self._requeue(pending)
+                for session_id, entry in failed.items():
+                    entry['attempts'] += 1
+                    if entry['attempts'] < self._max_attempts:
+                        self._requeue({session_id: entry})
+                        continue
+                    self._stats['dropped_sessions'] += 1
+                    logger.error(f"练习会话 {session_id} 连续 {entry['attempts']} 次写入失败，丢弃待写状态: "
+                                 f"字段 {sorted(entry['fields'])}，答题事件 {len(entry['events'])} 条")
+                self._cond.notify_all()
+
+    def _requeue(self, batch: Dict[int, Dict[str, Any]]):
+        """写入失败的会话放回队列等待重试，排在其后登记的更新合并在后面（调用方需持有锁）"""
+        for session_id, entry in batch.items():
+            newer = self._pending.get(session_id)
+            if newer is not None:
+                self._merge_into(entry, newer['fields'], None, newer['snapshot'])
+                entry['events'].extend(newer['events'])
+            self._pending[session_id] = entry
+
+    def _write_batch(self, batch: Dict[int, Dict[str, Any]]) -> Dict[str, Any]:
+        """批量写入数据库，返回写入结果（无法取得数据库连接时 unavailable 为True）"""
+        start_time = time.time()
+        try:
+            result = batch_update_practice_sessions(
+                {sid: entry['fields'] for sid, entry in batch.items() if entry['fields']},
+                events={sid: entry['events'] for sid, entry in batch.items() if entry['events']},
+                compact_session_ids=[sid for sid, entry in batch.items() if entry['snapshot']]
+            )
+        except ConnectionError as e:
+            # 连接池无法取得连接：与会话数据无关
+            result = {'success': False, 'error': str(e), 'unavailable': True}
+        except Exception as e:
+            result = {'success': False, 'error': str(e)}
+
+        with self._cond:
+            self._stats['flush_time_ms'] += (time.time() - start_time) * 1000
+            if result['success']:
+                self._stats['flushed_batches'] += 1
+                self._stats['flushed_sessions'] += len(batch)
+            else:
+                self._stats['failed_batches'] += 1
+
+        if result['success']:
+            logger.debug(f"批量写入 {len(batch)} 个练习会话成功")
+        else:
+            logger.error(f"批量写入 {len(batch)} 个练习会话失败: {result.get('error', 'Unknown error')}")
+        return result
+
+    def flush_session(self, session_id: int) -> None:
+        """立即写入指定会话的待写状态（读库前调用，保证读到最新数据）"""
+        with self._cond:
+            # 等待正在写入的同一会话完成
+            while session_id in self._in_flight:
+                self._cond.wait(1.0)
+            entry = self._pending.pop(session_id, None)
+            if entry is None:
+                return
+            self._in_flight.add(session_id)
+
+        self._write_and_settle({session_id: entry})
+
+    def shutdown(self, timeout: float = 10.0) -> None:
+        """停止后台线程并写入所有待写状态（进程退出前调用）"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+
+        deadline = time.time() + timeout
+        for thread in self._threads:
+            if thread.is_alive():
+                thread.join(timeout=max(0.0, deadline - time.time()))
+
+        # 后台线程未能写完的（或从未启动过线程的进程）在当前线程写入
+        with self._cond:
+            remaining = dict(self._pending)
+            self._pending.clear()
+
+        for i in range(0, len(remaining), self._batch_size):
+            session_ids = list(remaining)[i:i + self._batch_size]
+            self._write_batch({sid: remaining[sid] for sid in session_ids})
+
+        if remaining:
+            logger.info(f"练习会话写回队列关闭，写入剩余 {len(remaining)} 个会话")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取队列统计信息（含背压指标）"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'pending': len(self._pending),
+                'in_flight': len(self._in_flight),
+                'max_pending': self._max_pending,
+                'workers': self._workers_count
+            })
+
+        total_batches = stats['flushed_batches'] + stats['failed_batches']
+        stats['avg_flush_time_ms'] = stats['flush_time_ms'] / total_batches if total_batches else 0.0
+        stats['avg_enqueue_wait_ms'] = stats['enqueue_wait_ms'] / stats['enqueued'] if stats['enqueued'] else 0.0
+        return stats
+
+
+# 全局写回队列实例
+practice_writer = PracticeSessionWriter(**DatabaseConfig.PRACTICE_WRITE_BEHIND_CONFIG)
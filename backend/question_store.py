@@ -0,0 +1,174 @@
+"""
+进程内题库存储 - 每个worker进程独立持有一份按题库分组的题目数据
+以 tiku_id + 题库版本号 作为缓存键，整套题库一次性批量加载，
+版本号变化时才重新加载，练习热路径直接读本地内存，无需网络往返
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _BankEntry:
+    """单个题库在本地内存中的快照"""
+
+    __slots__ = ('tiku_id', 'version', 'questions', 'question_ids', 'type_partitions', 'loaded_at', 'checked_at')
+
+    def __init__(self, tiku_id: int, version: Optional[Hashable], questions: List[Dict[str, Any]],
+                 type_partitions: Optional[Dict[str, List[Any]]] = None):
+        self.tiku_id = tiku_id
+        self.version = version
+        self.questions = {q['id']: q for q in questions}
+        self.question_ids = [q['id'] for q in questions]
+        self.type_partitions = type_partitions
+        self.loaded_at = time.time()
+        self.checked_at = self.loaded_at
+
+
+class QuestionStore:
+    """进程内的版本化题库存储"""
+
+    def __init__(self, loader: Callable[[int], List[Dict[str, Any]]],
+                 version_source: Callable[[int], Optional[Hashable]],
+                 check_interval: float = 5.0, max_stale: float = 60.0,
+                 partitioner: Optional[Callable[[List[Dict[str, Any]]], Dict[str, List[Any]]]] = None):
+        """
+        :param loader: 按题库ID批量加载整套题目的函数（一次MGET或一次SQL）
+        :param version_source: 获取题库当前版本号的函数，不可用时返回None
+        :param partitioner: 加载时把题目按题型划分为ID列表的函数，结果随题库快照一起保存
+        :param check_interval: 两次版本校验之间的最小间隔（秒），间隔内直接使用本地数据
+        :param max_stale: 版本号不可获取时本地数据的最长可用时间（秒）
+        """
+        self._loader = loader
+        self._version_source = version_source
+        self._check_interval = check_interval
+        self._max_stale = max_stale
+        self._partitioner = partitioner
+
+        self._banks: Dict[int, _BankEntry] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[int, threading.Lock] = {}
+
+        # 统计信息
+        self._hits = 0
+        self._loads = 0
+        self._version_checks = 0
+
+    def _get_load_lock(self, tiku_id: int) -> threading.Lock:
+        """获取题库级别的加载锁，避免同一进程内并发重复加载"""
+        with self._lock:
+            lock = self._load_locks.get(tiku_id)
+            if lock is None:
+                lock = threading.Lock()
+                self._load_locks[tiku_id] = lock
+            return lock
+
+    def _is_fresh(self, entry: _BankEntry, now: float) -> bool:
+        """检查本地题库是否仍与最新版本一致"""
+        if now - entry.checked_at < self._check_interval:
+            return True
+
+        self._version_checks += 1
+        current_version = self._version_source(entry.tiku_id)
+        if current_version is None:
+            # 无法获取版本号（如Redis不可用），在容忍时间内继续使用本地数据
+            return now - entry.loaded_at < self._max_stale
+
+        if current_version == entry.version:
+            entry.checked_at = now
+            return True
+
+        logger.info(f"题库 {entry.tiku_id} 版本变化 {entry.version} -> {current_version}，重新加载")
+        return False
+
+    def get_bank(self, tiku_id: int) -> Optional[_BankEntry]:
+        """获取题库的本地快照，必要时批量加载"""
+        if not tiku_id:
+            return None
+
+        now = time.time()
+        entry = self._banks.get(tiku_id)
+        if entry is not None and self._is_fresh(entry, now):
+            self._hits += 1
+            return entry
+
+        with self._get_load_lock(tiku_id):
+            # 双重检查：等待锁期间可能已被其他线程加载
+            current = self._banks.get(tiku_id)
+            if current is not None and current is not entry and current.loaded_at >= now:
+                return current
+
+            version = self._version_source(tiku_id)
+            questions = self._loader(tiku_id)
+            if not questions:
+                logger.warning(f"题库 {tiku_id} 为空或加载失败，不写入本地存储")
+                self._banks.pop(tiku_id, None)
+                return None
+
+            type_partitions = self._partitioner(questions) if self._partitioner else None
+            new_entry = _BankEntry(tiku_id, version, questions, type_partitions)
+            self._banks[tiku_id] = new_entry
+            self._loads += 1
+            logger.info(f"题库 {tiku_id} 已加载到进程内存储: {len(new_entry.question_ids)} 道题目, 版本 {version}")
+            return new_entry
+
+    def get_questions(self, tiku_id: int) -> List[Dict[str, Any]]:
+        """按原始顺序返回题库的全部题目"""
+        entry = self.get_bank(tiku_id)
+        if entry is None:
+            return []
+        return [entry.questions[qid] for qid in entry.question_ids]
+
+    def get_question(self, question_id: Any, tiku_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """从本地存储获取单个题目，未命中返回None由调用方回退"""
+        if tiku_id:
+            entry = self.get_bank(tiku_id)
+            if entry is not None:
+                question = entry.questions.get(question_id)
+                if question is not None:
+                    return question
+
+        # 未指定题库或不在当前题库中：在已加载的题库里查找
+        for entry in list(self._banks.values()):
+            question = entry.questions.get(question_id)
+            if question is not None:
+                return question
+        return None
+
+    def get_type_partitions(self, tiku_id: int) -> Optional[Dict[str, List[Any]]]:
+        """题库已在本地加载且未过期时返回按题型划分的题目ID，否则返回None（不触发加载）"""
+        entry = self._banks.get(tiku_id)
+        if entry is None or not self._is_fresh(entry, time.time()):
+            return None
+        return entry.type_partitions
+
+    def seed(self, tiku_id: int, questions: List[Dict[str, Any]], version: Optional[Hashable],
+             type_partitions: Optional[Dict[str, List[Any]]] = None) -> None:
+        """直接写入已加载的题库（启动预热时使用；在fork前写入，worker进程共享这份数据）"""
+        if not questions:
+            return
+        if type_partitions is None and self._partitioner:
+            type_partitions = self._partitioner(questions)
+        with self._lock:
+            self._banks[tiku_id] = _BankEntry(tiku_id, version, questions, type_partitions)
+
+    def invalidate(self, tiku_id: Optional[int] = None) -> None:
+        """使本地题库失效，不指定题库ID时清空全部"""
+        with self._lock:
+            if tiku_id is None:
+                self._banks.clear()
+            else:
+                self._banks.pop(tiku_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取本地存储统计信息"""
+        banks = list(self._banks.values())
+        return {
+            'banks_loaded': len(banks),
+            'questions_loaded': sum(len(entry.question_ids) for entry in banks),
+            'hits': self._hits,
+            'loads': self._loads,
+            'version_checks': self._version_checks
+        }
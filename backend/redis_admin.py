@@ -4,6 +4,7 @@ Redis Session 管理工具
 用于监控、管理和维护Redis中的session数据
 """
 import argparse
+import itertools
 import json
 import sys
 from datetime import datetime
@@ -29,19 +30,20 @@ class RedisSessionAdmin:
             # 获取Redis信息
             info = self.redis_manager._redis_client.info()
             
-            # 获取session统计
+            # 获取session统计（SCAN增量遍历，分批获取TTL）
             pattern = f"{RedisConfig.REDIS_SESSION_PREFIX}*"
-            keys = self.redis_manager._redis_client.keys(pattern)
             
+            total_keys = 0
             active_sessions = 0
             expired_sessions = 0
             
-            for key in keys:
-                ttl = self.redis_manager._redis_client.ttl(key)
-                if ttl > 0:
-                    active_sessions += 1
-                elif ttl == -2:
-                    expired_sessions += 1
+            for ttls in self.redis_manager._batched_ttls(self.redis_manager.scan_keys(pattern)):
+                total_keys += len(ttls)
+                for ttl in ttls.values():
+                    if ttl > 0:
+                        active_sessions += 1
+                    elif ttl == -2:
+                        expired_sessions += 1
             
             return {
                 'status': 'available',
@@ -51,7 +53,7 @@ class RedisSessionAdmin:
                 'total_commands_processed': info.get('total_commands_processed'),
                 'active_sessions': active_sessions,
                 'expired_sessions': expired_sessions,
-                'total_keys': len(keys)
+                'total_keys': total_keys
             }
             
         except Exception as e:
@@ -67,10 +69,10 @@ class RedisSessionAdmin:
         
         try:
             pattern = f"{RedisConfig.REDIS_SESSION_PREFIX}*"
-            keys = self.redis_manager._redis_client.keys(pattern)
+            keys = itertools.islice(self.redis_manager.scan_keys(pattern), limit)
             
             sessions = []
-            for key in keys[:limit]:
+            for key in keys:
                 session_id = key.replace(RedisConfig.REDIS_SESSION_PREFIX, '')
                 ttl = self.redis_manager._redis_client.ttl(key)
                 
@@ -2,7 +2,6 @@
 管理员相关的路由模块
 """
 import logging
-import os
 import random
 import string
 
@@ -10,27 +9,34 @@ from flask import Blueprint, request, session
 from werkzeug.exceptions import BadRequest, NotFound
 
 from backend.routes.practice import cache_manager as practice_cache_manager
-from ..config import SHEET_NAME, SESSION_KEYS
+from ..config import SESSION_KEYS
 from ..connectDB import (
     get_all_subjects, create_subject, update_subject, delete_subject,
-    get_tiku_by_subject, create_or_update_tiku, delete_tiku, toggle_tiku_status,
+    get_tiku_by_subject, delete_tiku, toggle_tiku_status,
     create_invitation_code, delete_questions_by_tiku,
-    parse_excel_to_questions, insert_questions_batch, toggle_user_status, update_user_model,
-    delete_invitation_code, get_system_stats, get_users_paginated,
-    get_all_invitations_detailed, get_detailed_question_stats,
+    toggle_user_status, update_user_model,
+    delete_invitation_code, get_users_paginated,
+    get_all_invitations_detailed,
     get_question_details_by_id, create_question_and_update_tiku_count,
     update_question_details, delete_question_and_update_tiku_count,
     toggle_question_status_and_update_tiku_count, get_questions_paginated,
-    reset_user_password
+    reset_user_password, count_users, count_active_questions
 )
+from ..dashboard_stats import dashboard_stats
+from ..db_manager import connection_manager
 from ..decorators import handle_api_error, login_required, admin_required
+from ..import_jobs import import_job_manager
+from ..listing_counts import listing_counts
+from ..practice_writer import practice_writer
+from ..session_lifecycle import session_compactor
+from ..tiku_index import tiku_index
+from ..usage_counter import usage_counter
+from ..user_stats import user_stats_store
 from ..utils import (
     create_response,
     ensure_subject_directory,
     remove_file_safely,
-    save_uploaded_file,
-    get_file_hash,
-    load_questions_from_excel
+    stream_uploaded_file
 )
 
 logger = logging.getLogger(__name__)
@@ -39,14 +45,34 @@ logger = logging.getLogger(__name__)
 admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
 
 
+def _parse_after_id():
+    """解析游标分页参数 after_id（上一页最后一条记录的ID），未指定返回None"""
+    after_id = request.args.get('after_id')
+    if not after_id:
+        return None
+    try:
+        return int(after_id)
+    except ValueError:
+        raise BadRequest('无效的after_id')
+
+
 @admin_bp.route('/stats', methods=['GET'])
 @login_required
 @admin_required
 @handle_api_error
 def api_admin_get_stats():
     """获取系统统计信息"""
-    stats = get_system_stats()
-    return create_response(True, data={'stats': stats})
+    # 统计数据来自共享的统计面板缓存，过期时在后台刷新
+    dashboard = dashboard_stats.get()
+    return create_response(True, data={'stats': dashboard['system'], 'stats_generated_at': dashboard['generated_at'],
+                                       'practice_writer': practice_writer.get_stats(),
+                                       'tiku_index': tiku_index.get_stats(),
+                                       'db_pool': connection_manager.get_stats(),
+                                       'session_compactor': session_compactor.get_stats(),
+                                       'usage_counter': usage_counter.get_stats(),
+                                       'user_stats': user_stats_store.get_stats(),
+                                       'listing_counts': listing_counts.get_stats(),
+                                       'dashboard_stats': dashboard_stats.get_stats()})
 
 
 @admin_bp.route('/users', methods=['GET'])
@@ -61,9 +87,12 @@ def api_admin_get_users():
     order_dir = request.args.get('order_dir', 'desc')
     page = max(1, int(request.args.get('page', 1)))
     per_page = min(100, max(10, int(request.args.get('per_page', 20))))
+    after_id = _parse_after_id()
 
-    # Database logic is now in connectDB.get_users_paginated
-    result = get_users_paginated(search, order_by, order_dir, page, per_page)
+    # 总数来自缓存（近似值），按id排序时支持 after_id 游标分页
+    total_count = listing_counts.get(listing_counts.users_key(search), lambda: count_users(search))
+    result = get_users_paginated(search, order_by, order_dir, page, per_page,
+                                 after_id=after_id, total_count=total_count)
 
     return create_response(True, data={
         'users': result['users'],
@@ -190,7 +219,7 @@ def api_admin_create_subject():
         try:
             ensure_subject_directory(subject_name)
             logger.info(f"管理员创建科目: {subject_name}")
-            practice_cache_manager.refresh_all_cache()
+            practice_cache_manager.invalidate_catalog()
             return create_response(True, result['message'], data={'subject_id': result['subject_id']})
         except Exception as e:
             # 如果目录创建失败，尝试删除数据库记录
@@ -223,7 +252,7 @@ def api_admin_update_subject(subject_id):
 
     result = update_subject(subject_id, subject_name, exam_time)
     if result['success']:
-        practice_cache_manager.refresh_all_cache()
+        practice_cache_manager.invalidate_catalog()
         logger.info(f"管理员更新科目: {subject_id} -> {subject_name}")
         return create_response(True, result['message'])
     else:
@@ -242,7 +271,7 @@ def api_admin_delete_subject(subject_id):
         for file_path in result.get('deleted_files', []):
             remove_file_safely(file_path)
 
-        practice_cache_manager.refresh_all_cache()
+        practice_cache_manager.invalidate_catalog()
         logger.info(f"管理员删除科目: {subject_id}")
         return create_response(True, result['message'])
     else:
@@ -308,79 +337,48 @@ def api_admin_upload_tiku():
 
     subject_name = subject_map[subject_id]
 
-    try:
-        # 保存临时文件用于解析
-        temp_filepath = save_uploaded_file(file, subject_name, tiku_name)
-
-        # 解析Excel文件
-        questions = load_questions_from_excel(temp_filepath, SHEET_NAME)
-        if questions is None:
-            remove_file_safely(temp_filepath)
-            raise BadRequest('文件格式错误或无法解析')
-
-        if not questions:
-            remove_file_safely(temp_filepath)
-            raise BadRequest('文件中没有有效的题目数据')
-
-        # 计算文件信息
-        file_size = os.path.getsize(temp_filepath)
-        file_hash = get_file_hash(temp_filepath)
-
-        # 创建题库记录
-        result = create_or_update_tiku(
-            subject_id=subject_id,
-            tiku_name=tiku_name,
-            tiku_position=temp_filepath,
-            tiku_nums=len(questions),
-            file_size=file_size,
-            file_hash=file_hash
-        )
-
-        if not result['success']:
-            remove_file_safely(temp_filepath)
-            raise BadRequest(result['error'])
-
-        tiku_id = result['tiku_id']
-
-        # 删除该题库的旧题目（如果存在）
-        delete_questions_by_tiku(tiku_id)
-
-        # 将解析的题目转换为数据库格式
-        db_questions = parse_excel_to_questions(subject_id, tiku_id, questions)
-
-        # 批量插入题目到数据库
-        insert_result = insert_questions_batch(db_questions)
-        if not insert_result['success']:
-            # 如果插入失败，删除题库记录和文件
-            delete_tiku(tiku_id)
-            remove_file_safely(temp_filepath)
-            raise BadRequest(f"插入题目失败: {insert_result['error']}")
-
-        # 更新题库记录中的题目数量（以数据库中实际插入的为准）
-        actual_count = insert_result['inserted_count']
-        if actual_count != len(questions):
-            logger.warning(f"题库 {tiku_name}: 解析{len(questions)}题，实际插入{actual_count}题")
-            # 更新题库记录
-            create_or_update_tiku(
-                subject_id=subject_id,
-                tiku_name=tiku_name,
-                tiku_position=temp_filepath,
-                tiku_nums=actual_count,
-                file_size=file_size,
-                file_hash=file_hash
-            )
-
-        logger.info(f"管理员上传题库: {tiku_name} (解析{len(questions)}题，插入{actual_count}题)")
-        practice_cache_manager.refresh_all_cache()
-        return create_response(True, f"题库上传成功，共{actual_count}道题目", data={
-            'tiku_id': tiku_id,
-            'question_count': actual_count,
-            'file_path': temp_filepath
-        })
+    # 保存文件后登记后台导入任务，立即返回任务ID，由客户端轮询进度
+    # 分块写入磁盘并在同一遍中计算哈希和大小，内存占用与文件大小无关
+    saved_file = stream_uploaded_file(file, subject_name, tiku_name)
+    temp_filepath = saved_file['file_path']
 
-    except Exception as e:
-        logger.error(f"上传题库失败: {e}")
-        raise
+    def on_import_complete(tiku_id: int, changed_question_ids):
+        # 新建题库使整个题库缓存失效；增量导入只删除变化题目的缓存，未变化的题目缓存保留
+        if changed_question_ids is None:
+            practice_cache_manager.invalidate_tiku(tiku_id)
+        else:
+            practice_cache_manager.invalidate_questions(tiku_id, changed_question_ids)
+        practice_cache_manager.invalidate_catalog()
+        listing_counts.invalidate_questions(tiku_id)
+
+    job = import_job_manager.submit(
+        subject_id=subject_id,
+        tiku_name=tiku_name,
+        filepath=temp_filepath,
+        created_by=session.get(SESSION_KEYS['USER_ID']),
+        file_size=saved_file['file_size'],
+        file_hash=saved_file['file_hash'],
+        on_complete=on_import_complete
+    )
+
+    logger.info(f"管理员上传题库: {tiku_name}，导入任务 {job['job_id']}")
+    return create_response(True, '题库已上传，正在后台导入', data={
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'file_path': temp_filepath
+    }, status_code=202)
+
+
+@admin_bp.route('/import-jobs/<job_id>', methods=['GET'])
+@login_required
+@admin_required
+@handle_api_error
+def api_admin_get_import_job(job_id):
+    """查询题库导入任务进度"""
+    job = import_job_manager.get(job_id)
+    if not job:
+        raise NotFound('导入任务不存在或已过期')
+    return create_response(True, data={'job': job})
 
 
 @admin_bp.route('/tiku/<int:tiku_id>', methods=['DELETE'])
@@ -401,7 +399,9 @@ def api_admin_delete_tiku(tiku_id):
         file_path = result.get('file_path')
         if file_path:
             remove_file_safely(file_path)
-        practice_cache_manager.refresh_all_cache()
+        practice_cache_manager.invalidate_tiku(tiku_id)
+        practice_cache_manager.invalidate_catalog()
+        listing_counts.invalidate_questions(tiku_id)
         logger.info(f"管理员删除题库: {tiku_id}")
         return create_response(True, result['message'])
     else:
@@ -416,7 +416,8 @@ def api_admin_toggle_tiku(tiku_id):
     """切换题库启用状态"""
     result = toggle_tiku_status(tiku_id)
 
-    practice_cache_manager.refresh_all_cache()
+    practice_cache_manager.invalidate_tiku(tiku_id)
+    practice_cache_manager.invalidate_catalog()
     if result['success']:
         logger.info(f"管理员切换题库状态: {tiku_id} -> {'启用' if result['is_active'] else '禁用'}")
         return create_response(True, result['message'], data={'is_active': result['is_active']})
@@ -440,57 +441,14 @@ def api_admin_get_questions():
 
     page = max(1, int(request.args.get('page', 1)))
     per_page = min(100, max(10, int(request.args.get('per_page', 20))))
+    after_id = _parse_after_id()
 
-    # Call the new function in connectDB.py
-    result = get_questions_paginated(tiku_id, page, per_page)
-
-    # The data from get_questions_paginated is already in the desired format for the response
-    # (a dict with 'questions' list and 'pagination' info).
-    # However, the original `get_questions_by_tiku` in connectDB.py (which this route used to call indirectly)
-    # had specific formatting for question objects (e.g., 'type' name, 'options_for_practice', 'id' with 'db_' prefix).
-    # The new `get_questions_paginated` returns raw DB rows. We need to re-apply that formatting here.
-
-    formatted_questions = []
-    for q_row in result['questions']:
-        # This formatting logic is adapted from connectDB.get_questions_by_tiku
-        options_for_practice = {}
-        if q_row.get('option_a'): options_for_practice['A'] = q_row['option_a']
-        if q_row.get('option_b'): options_for_practice['B'] = q_row['option_b']
-        if q_row.get('option_c'): options_for_practice['C'] = q_row['option_c']
-        if q_row.get('option_d'): options_for_practice['D'] = q_row['option_d']
-
-        question_type_code = q_row['question_type']
-        type_name = '未知题型'
-        is_multiple_choice = False
-        if question_type_code == 0:  # Assuming 0: Single
-            type_name = '单选题'
-        elif question_type_code == 5:  # Assuming 5: Multiple
-            type_name = '多选题'
-            is_multiple_choice = True
-        elif question_type_code == 10:  # Assuming 10: True/False
-            type_name = '判断题'
-            options_for_practice = None  # Judgment questions don't need options A, B, C, D
-
-        formatted_questions.append({
-            'id': f"db_{q_row['id']}",  # Add 'db_' prefix as in original function
-            'db_id': q_row['id'],
-            'subject_id': q_row['subject_id'],
-            'tiku_id': q_row['tiku_id'],
-            'type': type_name,
-            'question': q_row['stem'],
-            'options_for_practice': options_for_practice,
-            'answer': q_row['answer'],
-            'is_multiple_choice': is_multiple_choice,
-            'explanation': q_row['explanation'],
-            'difficulty': q_row['difficulty'],
-            'status': q_row['status'],
-            # This field was not in the original get_questions_by_tiku output structure directly in questions list
-            'subject_name': q_row['subject_name'],
-            'tiku_name': q_row['tiku_name']
-        })
+    # 总数来自缓存（近似值），传入 after_id 时按 (tiku_id, id) 游标分页；题目格式与练习题目一致
+    total_count = listing_counts.get(listing_counts.questions_key(tiku_id), lambda: count_active_questions(tiku_id))
+    result = get_questions_paginated(tiku_id, page, per_page, after_id=after_id, total_count=total_count)
 
     return create_response(True, data={
-        'questions': formatted_questions,
+        'questions': result['questions'],
         'pagination': result['pagination']
     })
 
@@ -501,8 +459,8 @@ def api_admin_get_questions():
 @handle_api_error
 def api_admin_get_questions_stats():
     """获取题目统计信息"""
-    # Database logic is now in connectDB.get_detailed_question_stats
-    stats = get_detailed_question_stats()
+    # 与系统统计共用统计面板缓存
+    stats = dashboard_stats.get()['questions']
     return create_response(True, data=stats)
 
 
@@ -717,10 +675,12 @@ def api_admin_create_question():
 
     if result['success']:
         logger.info(f"管理员新增题目: question_id={result['question_id']}, tiku_id={data['tiku_id']}")
-        # 刷新缓存
+        listing_counts.invalidate_questions(data['tiku_id'])
+        # 所在题库和题库列表（题目数量）在后台重新预热
         try:
-            practice_cache_manager.refresh_all_cache()
-            logger.info(f"管理员新增题目: question_id={result['question_id']}, 缓存已刷新")
+            practice_cache_manager.invalidate_tiku(data['tiku_id'])
+            practice_cache_manager.invalidate_catalog()
+            logger.info(f"管理员新增题目: question_id={result['question_id']}, 已提交缓存重新预热")
         except Exception as e:
             logger.warning(f"刷新缓存失败: {e}")
 
@@ -820,6 +780,8 @@ def api_admin_update_question(question_id):
     result = update_question_details(question_id, update_data)
 
     if result['success']:
+        # 状态可能变化，题目总数缓存失效
+        listing_counts.invalidate_questions()
         # 刷新相关缓存
         try:
             # 刷新题目缓存
@@ -848,7 +810,9 @@ def api_admin_delete_question(question_id):
 
     if result['success']:
         logger.info(f"管理员删除题目: question_id={question_id}, tiku_id_affected={result.get('tiku_id_affected')}")
-        practice_cache_manager.refresh_all_cache()
+        practice_cache_manager.invalidate_question(question_id, result.get('tiku_id_affected'))
+        practice_cache_manager.invalidate_catalog()
+        listing_counts.invalidate_questions(result.get('tiku_id_affected'))
         return create_response(True, result['message'])
     else:
         error_message = result.get('error', "删除题目失败")
@@ -869,7 +833,9 @@ def api_admin_toggle_question_status(question_id):
     if result['success']:
         action = "启用" if result['status'] == 'active' else "禁用"
         logger.info(f"管理员{action}题目: question_id={question_id}, tiku_id_affected={result.get('tiku_id_affected')}")
-        practice_cache_manager.refresh_all_cache()
+        practice_cache_manager.invalidate_question(question_id, result.get('tiku_id_affected'))
+        practice_cache_manager.invalidate_catalog()
+        listing_counts.invalidate_questions(result.get('tiku_id_affected'))
         return create_response(True, result['message'], data={'status': result['status']})
     else:
         error_message = result.get('error', "切换题目状态失败")
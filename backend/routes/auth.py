@@ -12,6 +12,7 @@ from ..connectDB import (
     get_user_info
 )
 from ..decorators import handle_api_error, login_required
+from ..listing_counts import listing_counts
 from ..session_manager import (
     clear_all_session, check_and_resume_practice_session
 )
@@ -52,6 +53,7 @@ def api_register():
     result = create_user(username, password, invitation_code_id)
     if result['success']:
         logger.info(f"User registered: {username}")
+        listing_counts.invalidate_users()
         return create_response(True, '注册成功！请登录。')
     else:
         raise BadRequest(result['error'])
@@ -3,10 +3,11 @@
 """
 import json
 import logging
+import os
 import random
 import threading
 import time
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from functools import lru_cache, wraps
 from typing import Dict, List, Optional, Any
 
@@ -14,17 +15,22 @@ from flask import Blueprint, request, jsonify, session
 from werkzeug.exceptions import BadRequest, NotFound
 
 from ..RedisManager import redis_manager
-from ..config import SESSION_KEYS, QUESTION_STATUS
+from ..cache_snapshot import load_snapshot, save_snapshot
+from ..config import SESSION_KEYS, QUESTION_STATUS, ANSWER_MAX_LENGTH
 from ..connectDB import (
     get_questions_by_tiku, get_user_practice_history, get_tiku_by_subject, get_all_subjects,
-    get_question_by_db_id
+    get_question_by_db_id, get_tiku_fingerprints
 )
 from ..decorators import handle_api_error, login_required
+from ..question_store import QuestionStore
+from ..tiku_index import tiku_index
+from ..usage_counter import usage_counter
+from ..user_stats import user_stats_store
 from ..session_manager import (
-    get_session_value, set_session_value, clear_practice_session,
-    get_current_tiku_info,
+    get_session_value, set_session_value, set_session_values, clear_practice_session,
+    get_current_tiku_info, get_practice_question_count, record_answer_state,
     create_and_store_practice_session, complete_current_practice_session, check_and_resume_practice_session,
-    get_user_session_info
+    get_user_session_info, record_practice_answer, submit_practice_snapshot
 )
 from ..utils import create_response, format_answer_display, validate_answer
 
@@ -33,10 +39,6 @@ logger = logging.getLogger(__name__)
 # 创建蓝图
 practice_bp = Blueprint('practice', __name__, url_prefix='/api')
 
-# 题库使用统计 - 使用defaultdict优化
-tiku_usage_stats = defaultdict(int)
-usage_stats_lock = threading.Lock()
-
 # 题型常量定义
 QUESTION_TYPE_SINGLE = 'single_choice'
 QUESTION_TYPE_MULTIPLE = 'multiple_choice'
@@ -61,6 +63,11 @@ class RedisCacheManager:
         self._cache_ttl = 3600  # 1小时TTL
         self._cache_prefix = 'cache:'
 
+        # 后台重新预热队列：{('catalog',) | ('tiku', tiku_id): None}，同一任务排队期间只保留一份
+        self._rewarm_tasks = OrderedDict()
+        self._rewarm_cond = threading.Condition()
+        self._rewarm_pid = None
+
     def _get_cache_key(self, key: str) -> str:
         """生成缓存键"""
         return f"{self._cache_prefix}{key}"
@@ -70,48 +77,16 @@ class RedisCacheManager:
         return self.redis_manager.is_available
 
     def _get_from_redis(self, key: str, default=None):
-        """从Redis获取数据"""
-        if not self._is_redis_available():
-            return default
-
-        try:
-            redis_key = self._get_cache_key(key)
-            data = self.redis_manager._redis_client.get(redis_key)
-            if data is None:
-                return default
-            return json.loads(data)
-        except Exception as e:
-            logger.error(f"从Redis获取缓存失败 {key}: {e}")
-            return default
+        """从Redis获取数据（可用性由熔断器判断，不额外PING）"""
+        return self.redis_manager.cache_get(key, default)
 
     def _set_to_redis(self, key: str, value, ttl: int = None):
         """存储数据到Redis"""
-        if not self._is_redis_available():
-            return False
-
-        try:
-            redis_key = self._get_cache_key(key)
-            data = json.dumps(value, ensure_ascii=False)
-            if ttl is None:
-                ttl = self._cache_ttl
-            self.redis_manager._redis_client.setex(redis_key, ttl, data)
-            return True
-        except Exception as e:
-            logger.error(f"存储缓存到Redis失败 {key}: {e}")
-            return False
+        return self.redis_manager.cache_set(key, value, ttl if ttl is not None else self._cache_ttl)
 
     def _delete_from_redis(self, key: str):
         """从Redis删除数据"""
-        if not self._is_redis_available():
-            return False
-
-        try:
-            redis_key = self._get_cache_key(key)
-            self.redis_manager._redis_client.delete(redis_key)
-            return True
-        except Exception as e:
-            logger.error(f"从Redis删除缓存失败 {key}: {e}")
-            return False
+        return self.redis_manager.cache_delete(key)
 
     def get_tiku_list(self):
         """获取缓存的题库列表"""
@@ -124,31 +99,37 @@ class RedisCacheManager:
 
         logger.info("从数据库重新加载题库列表")
         try:
-            # 并行获取数据
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-                future_tiku = executor.submit(get_tiku_by_subject)
-                future_subjects = executor.submit(get_all_subjects)
-
-                db_tiku_list = future_tiku.result()
-                all_subjects = future_subjects.result()
+            cache_data = self._build_tiku_list()
 
-            subjects_exam_time = {s['subject_name']: s['exam_time'] for s in all_subjects}
-
-            cache_data = {
-                'tiku_list': db_tiku_list,
-                'subjects_exam_time': subjects_exam_time
-            }
-
-            # 存储到Redis
+            # 存储到Redis，同时刷新题库元数据索引
             self._set_to_redis(cache_key, cache_data)
-            logger.info(f"成功加载并缓存了 {len(db_tiku_list)} 个题库到Redis")
+            tiku_index.rebuild(cache_data['tiku_list'])
+            logger.info(f"成功加载并缓存了 {len(cache_data['tiku_list'])} 个题库到Redis")
             return cache_data
 
         except Exception as e:
             logger.error(f"从数据库加载题库列表失败: {e}")
             raise
 
+    @staticmethod
+    def _build_tiku_list() -> Dict[str, Any]:
+        """从数据库构建题库列表数据"""
+        # 并行获取数据
+        import concurrent.futures
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            future_tiku = executor.submit(get_tiku_by_subject)
+            future_subjects = executor.submit(get_all_subjects)
+
+            db_tiku_list = future_tiku.result()
+            all_subjects = future_subjects.result()
+
+        subjects_exam_time = {s['subject_name']: s['exam_time'] for s in all_subjects}
+
+        return {
+            'tiku_list': db_tiku_list,
+            'subjects_exam_time': subjects_exam_time
+        }
+
     def get_file_options(self):
         """获取缓存的文件选项数据"""
         cache_key = 'file_options'
@@ -160,38 +141,7 @@ class RedisCacheManager:
 
         logger.info("重新构建文件选项缓存")
         try:
-            cached_tiku_data = self.get_tiku_list()
-            db_tiku_list = cached_tiku_data['tiku_list']
-            subjects_exam_time = cached_tiku_data['subjects_exam_time']
-
-            # 使用defaultdict优化数据处理
-            db_tiku_map = defaultdict(lambda: {'files': [], 'exam_time': None})
-
-            for tiku in db_tiku_list:
-                if not tiku['is_active']:
-                    continue
-
-                subject_name = tiku['subject_name']
-                if db_tiku_map[subject_name]['exam_time'] is None:
-                    db_tiku_map[subject_name]['exam_time'] = subjects_exam_time.get(subject_name)
-
-                db_tiku_map[subject_name]['files'].append({
-                    'key': tiku['tiku_position'],
-                    'display': tiku['tiku_name'],
-                    'count': tiku['tiku_nums'],
-                    'file_size': tiku['file_size'],
-                    'updated_at': tiku['updated_at'],
-                    'tiku_id': tiku['tiku_id']
-                })
-
-            # 批量排序优化
-            sorted_subjects = {
-                subject: {
-                    'files': sorted(data['files'], key=lambda x: x['display']),
-                    'exam_time': data['exam_time']
-                }
-                for subject, data in sorted(db_tiku_map.items())
-            }
+            sorted_subjects = self._build_file_options(self.get_tiku_list())
 
             # 存储到Redis
             self._set_to_redis(cache_key, sorted_subjects)
@@ -202,60 +152,68 @@ class RedisCacheManager:
             logger.error(f"处理文件选项缓存失败: {e}")
             raise
 
-    def get_question_bank(self, tiku_id: int) -> List[Dict[str, Any]]:
-        """获取指定题库的题目列表，使用Redis缓存"""
-        cache_key = f'question_bank_{tiku_id}'
-        cached_data = self._get_from_redis(cache_key)
-
-        if cached_data is not None:
-            logger.debug(f"使用Redis缓存的题库ID列表，题库ID: {tiku_id}")
-            # 从缓存的ID列表获取完整题目数据
-            question_ids = cached_data.get('question_ids', [])
-            questions_data = []
-
-            for question_id in question_ids:
-                question_data = self.get_question_by_id(question_id)
-                if question_data:
-                    questions_data.append(question_data)
-                else:
-                    logger.warning(f"题目 {question_id} 在缓存中不存在，将从数据库重新加载")
+    @staticmethod
+    def _build_file_options(cached_tiku_data: Dict[str, Any]) -> Dict[str, Any]:
+        """由题库列表数据构建按科目分组的文件选项"""
+        db_tiku_list = cached_tiku_data['tiku_list']
+        subjects_exam_time = cached_tiku_data['subjects_exam_time']
+
+        # 使用defaultdict优化数据处理
+        db_tiku_map = defaultdict(lambda: {'files': [], 'exam_time': None})
+
+        for tiku in db_tiku_list:
+            if not tiku['is_active']:
+                continue
+
+            subject_name = tiku['subject_name']
+            if db_tiku_map[subject_name]['exam_time'] is None:
+                db_tiku_map[subject_name]['exam_time'] = subjects_exam_time.get(subject_name)
+
+            db_tiku_map[subject_name]['files'].append({
+                'key': tiku['tiku_position'],
+                'display': tiku['tiku_name'],
+                'count': tiku['tiku_nums'],
+                'file_size': tiku['file_size'],
+                'updated_at': tiku['updated_at'],
+                'tiku_id': tiku['tiku_id']
+            })
+
+        # 批量排序优化
+        return {
+            subject: {
+                'files': sorted(data['files'], key=lambda x: x['display']),
+                'exam_time': data['exam_time']
+            }
+            for subject, data in sorted(db_tiku_map.items())
+        }
 
-            if len(questions_data) == len(question_ids):
-                return questions_data
-            else:
-                logger.warning(f"题库 {tiku_id} 缓存不完整，重新从数据库加载")
+    def get_question_bank(self, tiku_id: int) -> List[Dict[str, Any]]:
+        """获取指定题库的题目列表，题库以一个Redis hash存储（一次HGETALL取回）"""
+        cached_questions = self.redis_manager.get_question_bank(tiku_id)
+        if cached_questions is not None:
+            logger.debug(f"使用Redis缓存的题库hash，题库ID: {tiku_id}")
+            return cached_questions
 
         logger.info(f"从数据库获取题库 {tiku_id} 的题目数据")
         try:
             # 从数据库获取题目列表
             question_bank_list = get_questions_by_tiku(tiku_id)
 
+            if question_bank_list is None:
+                # 读取失败：不缓存不完整的题库，下次请求重新读取
+                return []
             if not question_bank_list:
                 logger.warning(f"题库 {tiku_id} 为空或不存在")
                 return []
 
-            # 提取题目ID列表用于题库缓存
-            question_ids = []
+            # 整套题库（含按题型划分的题目ID）写入一个hash，2小时
+            self.redis_manager.store_question_bank(tiku_id, question_bank_list, ttl=7200,
+                                                   type_partitions=build_type_partitions(question_bank_list))
 
-            # 缓存每道题的完整数据
-            for question in question_bank_list:
-                question_id = question['id']
-                question_ids.append(question_id)
+            # 单题目缓存供按ID查询使用，pipeline一次写入并登记到题库索引，3小时
+            self.redis_manager.store_bank_questions(tiku_id, question_bank_list, ttl=10800)
 
-                # 缓存单个题目数据
-                question_cache_key = f'question_{question_id}'
-                self._set_to_redis(question_cache_key, question, ttl=10800)  # 3小时
-
-            # 缓存题库的ID列表（而不是完整数据）
-            tiku_cache_data = {
-                'question_ids': question_ids,
-                'total_count': len(question_ids),
-                'cached_at': time.time()
-            }
-            self._set_to_redis(cache_key, tiku_cache_data, ttl=7200)  # 2小时
-
-            logger.info(f"成功缓存题库 {tiku_id} 的 {len(question_ids)} 道题目ID列表到Redis")
-            logger.info(f"同时缓存了 {len(question_bank_list)} 道题目的完整数据")
+            logger.info(f"成功缓存题库 {tiku_id} 的 {len(question_bank_list)} 道题目到Redis")
 
             return question_bank_list
 
@@ -263,6 +221,49 @@ class RedisCacheManager:
             logger.error(f"获取题库 {tiku_id} 的题目数据失败: {e}")
             return []
 
+    def get_type_partitions(self, tiku_id: int) -> Dict[str, List[int]]:
+        """获取题库按题型划分的题目ID，Redis中只取一个hash字段，不加载题目内容"""
+        type_partitions = self.redis_manager.get_bank_type_partitions(tiku_id)
+        if type_partitions is not None:
+            return type_partitions
+
+        # 未缓存（或旧格式hash）：加载题库并划分
+        return build_type_partitions(self.get_question_bank(tiku_id))
+
+    def get_bank_version(self, tiku_id: int) -> Optional[tuple]:
+        """获取题库版本号 (全局纪元, 题库版本)，Redis不可用时返回None"""
+        if not self._is_redis_available():
+            return None
+
+        try:
+            epoch, version = self.redis_manager._redis_client.mget(
+                self._get_cache_key('bank_epoch'),
+                self._get_cache_key(f'bank_version:{tiku_id}')
+            )
+            return int(epoch or 0), int(version or 0)
+        except Exception as e:
+            self.redis_manager.record_failure(e)
+            logger.error(f"获取题库 {tiku_id} 版本号失败: {e}")
+            return None
+
+    def bump_bank_version(self, tiku_id: Optional[int] = None) -> None:
+        """
+        递增题库版本号，不指定题库ID时递增全局纪元使所有题库失效
+        同时广播失效通知，其他worker立即清理进程内存储；版本号校验作为通知丢失时的兜底
+        """
+        question_store.invalidate(tiku_id)
+        if not self._is_redis_available():
+            return
+
+        try:
+            key = 'bank_epoch' if tiku_id is None else f'bank_version:{tiku_id}'
+            self.redis_manager._redis_client.incr(self._get_cache_key(key))
+        except Exception as e:
+            self.redis_manager.record_failure(e)
+            logger.error(f"递增题库版本号失败 {tiku_id}: {e}")
+
+        self.redis_manager.publish_invalidation('all' if tiku_id is None else 'tiku', tiku_id)
+
     def get_question_by_id(self, question_id: int) -> Optional[Dict[str, Any]]:
         """根据题目ID获取单个题目，使用Redis缓存"""
         cache_key = f'question_{question_id}'
@@ -280,8 +281,8 @@ class RedisCacheManager:
                 logger.warning(f"题目 {question_id} 不存在或已禁用")
                 return None
 
-            # 存储到Redis，单个题目缓存时间更长
-            self._set_to_redis(cache_key, question_data, ttl=10800)  # 3小时
+            # 存储到Redis并登记到题库索引，单个题目缓存时间更长
+            self.redis_manager.store_bank_questions(question_data.get('tiku_id'), [question_data], ttl=10800)  # 3小时
             logger.debug(f"成功缓存题目 {question_id} 到Redis")
             return question_data
 
@@ -291,36 +292,36 @@ class RedisCacheManager:
 
     def get_question_ids_by_tiku(self, tiku_id: int) -> List[int]:
         """获取题库的题目ID列表（仅ID，用于轻量级操作）"""
-        cache_key = f'question_bank_{tiku_id}'
-        cached_data = self._get_from_redis(cache_key)
-
-        if cached_data is not None:
-            return cached_data.get('question_ids', [])
+        question_ids = self.redis_manager.get_bank_question_ids(tiku_id)
+        if question_ids is not None:
+            return question_ids
 
         # 如果缓存中没有，从数据库获取并建立缓存
         question_bank = self.get_question_bank(tiku_id)
         return [q['id'] for q in question_bank]
 
     def refresh_one_question(self, question_id: int) -> bool:
-        """刷新单道题目的缓存"""
+        """刷新单道题目的缓存，并在后台重新预热其所在题库"""
 
         if not isinstance(question_id, int) or question_id <= 0:
             logger.error(f"无效的题目ID: {question_id}")
             return False
 
-        cache_key = f'question_{question_id}'
         try:
             # 从数据库获取题目数据
             question_data = get_question_by_db_id(question_id)
 
             if not question_data:
                 logger.warning(f"题目 {question_id} 不存在或已禁用，删除其缓存")
-                # 如果题目不存在，删除可能存在的缓存
-                self._delete_from_redis(cache_key)
+                # 如果题目不存在，删除可能存在的缓存并重新预热所在题库
+                self.invalidate_question(question_id)
                 return False
 
             # 设置缓存，使用与其他单题目缓存相同的TTL
-            success = self._set_to_redis(cache_key, question_data, ttl=10800)  # 3小时
+            success = self.redis_manager.store_bank_questions(
+                question_data.get('tiku_id'), [question_data], ttl=10800)  # 3小时
+            # 题目内容变化，所在题库的hash和进程内存储在后台重新预热
+            self.invalidate_tiku(question_data.get('tiku_id'))
 
             if success:
                 logger.debug(f"成功刷新题目 {question_id} 的缓存")
@@ -333,6 +334,181 @@ class RedisCacheManager:
             logger.error(f"刷新题目 {question_id} 缓存时发生异常: {e}")
             return False
 
+    # =========================
+    # 定向失效与后台重新预热
+    # =========================
+
+    def invalidate_tiku(self, tiku_id: Optional[int]) -> None:
+        """
+        题库内容变化（题目增删改、启用/禁用、重新上传）后调用
+        旧的题库hash保留到后台重新加载完成后被覆盖，期间练习请求不会同时回源数据库
+        """
+        if not tiku_id:
+            return
+        self._schedule_rewarm(('tiku', int(tiku_id)))
+
+    def invalidate_question(self, question_id: int, tiku_id: Optional[int] = None) -> None:
+        """单道题目变化后调用：删除该题缓存并重新预热其所在题库"""
+        cache_key = f'question_{question_id}'
+        if tiku_id is None:
+            # 优先从旧缓存中取所在题库，避免已删除/禁用的题目查不到
+            cached_question = self._get_from_redis(cache_key)
+            if cached_question:
+                tiku_id = cached_question.get('tiku_id')
+            else:
+                question_data = get_question_by_db_id(question_id)
+                tiku_id = question_data.get('tiku_id') if question_data else None
+
+        self._delete_from_redis(cache_key)
+        self.invalidate_tiku(tiku_id)
+
+    def invalidate_questions(self, tiku_id: int, question_ids: List[int]) -> None:
+        """增量导入后调用：只删除内容或状态变化的题目缓存，未变化的题目缓存保留"""
+        for question_id in question_ids:
+            self._delete_from_redis(f'question_{question_id}')
+        self.invalidate_tiku(tiku_id)
+
+    def invalidate_catalog(self) -> None:
+        """科目/题库列表变化后调用：后台重建题库列表和文件选项缓存"""
+        self._schedule_rewarm(('catalog',))
+
+    def _ensure_rewarm_worker(self):
+        """按进程懒启动重新预热线程（Gunicorn preload_app 下fork后需在worker进程内重新启动）"""
+        pid = os.getpid()
+        if self._rewarm_pid == pid:
+            return
+
+        with self._rewarm_cond:
+            if self._rewarm_pid == pid:
+                return
+            self._rewarm_pid = pid
+            threading.Thread(target=self._rewarm_loop, name="cache_rewarm", daemon=True).start()
+
+    def _schedule_rewarm(self, task: tuple) -> None:
+        """登记重新预热任务后立即返回，同一任务排队期间重复登记会被合并"""
+        self._ensure_rewarm_worker()
+        with self._rewarm_cond:
+            self._rewarm_tasks[task] = None
+            self._rewarm_cond.notify()
+
+    def _rewarm_loop(self):
+        """后台线程：依次执行排队的重新预热任务"""
+        while True:
+            with self._rewarm_cond:
+                while not self._rewarm_tasks:
+                    self._rewarm_cond.wait()
+                task, _ = self._rewarm_tasks.popitem(last=False)
+
+            try:
+                if task[0] == 'catalog':
+                    self._rewarm_catalog()
+                else:
+                    self._rewarm_tiku(task[1])
+            except Exception as e:
+                logger.error(f"后台重新预热缓存失败 {task}: {e}")
+
+    def _rewarm_catalog(self):
+        """重建题库列表和文件选项缓存，直接覆盖旧值"""
+        tiku_data = self._build_tiku_list()
+        self._set_to_redis('tiku_list', tiku_data)
+        tiku_index.rebuild(tiku_data['tiku_list'])
+        self._set_to_redis('file_options', self._build_file_options(tiku_data))
+        self.redis_manager.publish_invalidation('catalog')
+        logger.info(f"已重新预热题库列表缓存: {len(tiku_data['tiku_list'])} 个题库")
+
+    def _rewarm_tiku(self, tiku_id: int):
+        """从数据库重新加载题库，覆盖题库hash和单题缓存后递增题库版本"""
+        question_bank_list = get_questions_by_tiku(tiku_id)
+
+        if question_bank_list is None:
+            # 读取失败：删除已过期的题库hash并递增版本，之后的请求按需从数据库重新加载，
+            # 不用读到一半的结果覆盖缓存或清理单题缓存
+            self.redis_manager.delete_question_bank(tiku_id)
+            self.bump_bank_version(tiku_id)
+            raise RuntimeError(f"读取题库 {tiku_id} 的题目失败，已删除旧的题库缓存")
+
+        if question_bank_list:
+            self.redis_manager.store_question_bank(tiku_id, question_bank_list, ttl=7200,
+                                                   type_partitions=build_type_partitions(question_bank_list))
+            self.redis_manager.store_bank_questions(tiku_id, question_bank_list, ttl=10800)
+        else:
+            self.redis_manager.delete_question_bank(tiku_id)
+
+        # 按索引清理已删除/禁用题目残留的单题缓存
+        self.redis_manager.delete_bank_questions(tiku_id, keep_ids=[q['id'] for q in question_bank_list])
+
+        # 各worker的进程内存储在下次访问时按新版本重新加载
+        self.bump_bank_version(tiku_id)
+        logger.info(f"已重新预热题库 {tiku_id} 的缓存: {len(question_bank_list)} 道题目")
+
+    def warm_start(self, snapshot_path: str) -> Dict[str, Any]:
+        """
+        启动预热：读取本地题库快照，用数据库中每个题库的指纹校验，只重新查询变化的题库，
+        不删除Redis中仍然有效的缓存；题库写入进程内存储后由fork出的worker共享
+        无法获取指纹时回退到 refresh_all_cache
+        """
+        start_time = time.time()
+        fingerprints = get_tiku_fingerprints()
+        if fingerprints is None:
+            logger.warning("无法获取题库指纹，回退到完整刷新缓存")
+            return self.refresh_all_cache()
+
+        snapshot = load_snapshot(snapshot_path)
+        cached_bank_ids = set(self.redis_manager.get_cached_bank_ids())
+        banks = {}
+        reused = refetched = 0
+
+        for tiku_id, tiku_info in fingerprints.items():
+            if not tiku_info['is_active']:
+                continue
+
+            entry = snapshot.get(tiku_id)
+            changed = entry is None or entry['fingerprint'] != tiku_info['fingerprint']
+            if changed:
+                questions = get_questions_by_tiku(tiku_id)
+                if questions is None or len(questions) != tiku_info['question_count']:
+                    # 读取失败或题目数与指纹不一致（读取期间题库被修改）：不写入缓存和快照，下次启动重新查询
+                    logger.warning(f"启动预热: 读取题库 {tiku_id} 失败或题目数与指纹不一致，已跳过")
+                    continue
+                entry = {
+                    'fingerprint': tiku_info['fingerprint'],
+                    'questions': questions,
+                    'type_partitions': build_type_partitions(questions)
+                }
+                refetched += 1
+            else:
+                reused += 1
+
+            questions = entry['questions']
+            if not questions:
+                continue
+            banks[tiku_id] = entry
+
+            if changed or tiku_id not in cached_bank_ids:
+                self.redis_manager.store_question_bank(tiku_id, questions, ttl=7200,
+                                                       type_partitions=entry['type_partitions'])
+                self.redis_manager.store_bank_questions(tiku_id, questions, ttl=10800)
+            if changed:
+                self.redis_manager.delete_bank_questions(tiku_id, keep_ids=[q['id'] for q in questions])
+                self.bump_bank_version(tiku_id)
+
+            question_store.seed(tiku_id, questions, self.get_bank_version(tiku_id), entry['type_partitions'])
+
+        self._rewarm_catalog()
+        snapshot_size = save_snapshot(snapshot_path, banks)
+
+        message = (f"启动预热完成: {len(banks)} 个题库，快照复用 {reused} 个，重新查询 {refetched} 个，"
+                   f"耗时 {time.time() - start_time:.2f}s")
+        logger.info(message)
+        return {
+            'tiku_count': len(banks),
+            'reused_banks': reused,
+            'refetched_banks': refetched,
+            'prewarmed_questions': sum(len(entry['questions']) for entry in banks.values()),
+            'snapshot_bytes': snapshot_size,
+            'message': message
+        }
+
     def refresh_all_cache(self):
         """刷新所有缓存"""
         logger.info("开始刷新所有Redis缓存")
@@ -353,25 +529,15 @@ class RedisCacheManager:
             for key in cache_keys:
                 self._delete_from_redis(key)
 
-            # 删除所有题库缓存（使用模式匹配）
+            # 按索引集合删除所有题库hash和单题目缓存，不遍历整个键空间
             try:
-                pattern = self._get_cache_key('question_bank_*')
-                keys = self.redis_manager._redis_client.keys(pattern)
-                if keys:
-                    self.redis_manager._redis_client.delete(*keys)
-                    logger.info(f"删除了 {len(keys)} 个题库缓存")
+                cleared_count = self.redis_manager.clear_all_question_bank_cache()
+                logger.info(f"删除了 {cleared_count} 个题库/单题目缓存")
             except Exception as e:
                 logger.error(f"删除题库缓存失败: {e}")
 
-            # 删除所有单个题目缓存（使用模式匹配）
-            try:
-                pattern = self._get_cache_key('question_*')
-                keys = self.redis_manager._redis_client.keys(pattern)
-                if keys:
-                    self.redis_manager._redis_client.delete(*keys)
-                    logger.info(f"删除了 {len(keys)} 个单题目缓存")
-            except Exception as e:
-                logger.error(f"删除单题目缓存失败: {e}")
+            # 所有题库版本失效，各worker的进程内存储将在下次访问时重新加载
+            self.bump_bank_version()
 
             # 预热基础缓存
             logger.info("开始预热基础缓存...")
@@ -384,9 +550,9 @@ class RedisCacheManager:
                 logger.info("开始预热题目缓存...")
                 active_tiku_list = [tiku for tiku in tiku_data['tiku_list'] if tiku.get('is_active', False)]
 
-                # 根据题库使用统计排序，优先预热常用题库
-                with usage_stats_lock:
-                    active_tiku_list.sort(key=lambda x: tiku_usage_stats.get(x['tiku_id'], 0), reverse=True)
+                # 根据尚未写库的题库使用次数排序，优先预热近期常用题库
+                pending_usage = usage_counter.get_pending_counts()
+                active_tiku_list.sort(key=lambda x: pending_usage.get(x['tiku_id'], 0), reverse=True)
 
                 # 限制预热的题库数量，避免一次加载过多数据
                 max_prewarm_tiku = 10  # 最多预热10个题库
@@ -434,6 +600,39 @@ class RedisCacheManager:
 # 单例缓存管理器
 cache_manager = RedisCacheManager()
 
+# 进程内题库存储 - 练习热路径直接读取本地内存
+question_store = QuestionStore(loader=cache_manager.get_question_bank,
+                               version_source=cache_manager.get_bank_version,
+                               partitioner=lambda questions: build_type_partitions(questions))
+
+
+def _handle_cache_invalidation(scope: str, target_id: Optional[int]) -> None:
+    """处理其他worker广播的失效通知，清理本进程的缓存"""
+    if scope == 'tiku' and target_id:
+        question_store.invalidate(int(target_id))
+    elif scope == 'all':
+        question_store.invalidate()
+        _classify_question_type.cache_clear()
+
+
+redis_manager.register_invalidation_handler(_handle_cache_invalidation)
+
+
+def get_type_partitions(tiku_id: int) -> Dict[str, List[int]]:
+    """获取题库按题型划分的题目ID：优先读取进程内存储，未加载时从Redis取划分结果"""
+    type_partitions = question_store.get_type_partitions(tiku_id)
+    if type_partitions is not None:
+        return type_partitions
+    return cache_manager.get_type_partitions(tiku_id)
+
+
+def get_practice_question(question_id: Any, tiku_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """获取练习题目：优先读取进程内存储，未命中时回退到Redis/数据库"""
+    question = question_store.get_question(question_id, tiku_id)
+    if question is not None:
+        return question
+    return cache_manager.get_question_by_id(question_id)
+
 
 # 性能监控装饰器
 def performance_monitor(func):
@@ -474,10 +673,8 @@ def _classify_question_type(question_type_str: str, is_multiple: bool) -> str:
 
 
 def increment_tiku_usage(tiku_id: int):
-    """增加题库使用次数（优化版本）"""
-    with usage_stats_lock:
-        tiku_usage_stats[tiku_id] += 1
-        logger.debug(f"题库 {tiku_id} 使用次数: {tiku_usage_stats[tiku_id]}")
+    """增加题库使用次数（累加到Redis共享计数，由后台线程批量写库）"""
+    usage_counter.increment(tiku_id)
 
 
 def inject_user_progress(subjects_data: dict, current_tiku_id: int, current_progress: dict) -> dict:
@@ -530,16 +727,8 @@ def inject_user_progress(subjects_data: dict, current_tiku_id: int, current_prog
     return result
 
 
-@performance_monitor
-def generate_questions(question_bank: List[dict], selected_types: Optional[List[str]] = None,
-                       shuffle_enabled: bool = True) -> List[int]:
-    """
-    优化的题目生成函数 - 返回题目ID列表
-    """
-    if not question_bank:
-        return []
-
-    # 预分配列表避免动态扩容
+def build_type_partitions(question_bank: List[dict]) -> Dict[str, List[int]]:
+    """将题库按题型划分为题目ID列表（保持题库原始顺序），在题库加载/缓存时预先计算"""
     ids_by_type = {
         QUESTION_TYPE_SINGLE: [],
         QUESTION_TYPE_MULTIPLE: [],
@@ -547,19 +736,25 @@ def generate_questions(question_bank: List[dict], selected_types: Optional[List[
         QUESTION_TYPE_OTHER: []
     }
 
-    # 单次遍历分类，直接使用题目ID而不是索引
     for question in question_bank:
         question_type = _classify_question_type(
             question.get('type', ''),
             question.get('is_multiple_choice', False)
         )
-        question_id = question['id']
-        ids_by_type[question_type].append(question_id)
+        ids_by_type[question_type].append(question['id'])
+
+    return ids_by_type
 
-    # 批量打乱（如果需要）
-    if shuffle_enabled:
-        for ids_list in ids_by_type.values():
-            random.shuffle(ids_list)
+
+@performance_monitor
+def generate_questions(type_partitions: Dict[str, List[int]], selected_types: Optional[List[str]] = None,
+                       shuffle_enabled: bool = True) -> List[int]:
+    """
+    优化的题目生成函数 - 返回题目ID列表
+    直接拼接预先按题型划分好的题目ID，不需要加载和分类题目内容
+    """
+    if not type_partitions:
+        return []
 
     # 确定要包含的题型
     if selected_types is None:
@@ -588,7 +783,10 @@ def generate_questions(question_bank: List[dict], selected_types: Optional[List[
 
     summary_parts = []
     for q_type in types_to_include:
-        ids = ids_by_type[q_type]
+        # 复制后再打乱，划分结果是缓存共享的
+        ids = list(type_partitions.get(q_type, []))
+        if shuffle_enabled:
+            random.shuffle(ids)
         result_ids.extend(ids)
         if ids:
             summary_parts.append(f"{type_names[q_type]} {len(ids)} 道")
@@ -611,18 +809,18 @@ def api_file_options():
     current_progress = None
 
     if current_tiku_id:
-        current_indices = get_session_value(SESSION_KEYS['QUESTION_INDICES'], [])
+        total_questions = get_practice_question_count()
         current_index = get_session_value(SESSION_KEYS['CURRENT_INDEX'], 0)
         initial_total = get_session_value(SESSION_KEYS['INITIAL_TOTAL'], 0)
 
-        if current_indices and initial_total > 0:
+        if total_questions and initial_total > 0:
             current_progress = {
                 'current_question': current_index + 1,
-                'total_questions': len(current_indices),
+                'total_questions': total_questions,
                 'initial_total': initial_total,
                 'correct_first_try': get_session_value(SESSION_KEYS['CORRECT_FIRST_TRY'], 0),
                 'round_number': get_session_value(SESSION_KEYS['ROUND_NUMBER'], 1),
-                'progress_percent': min(100, (current_index / len(current_indices)) * 100) if current_indices else 0
+                'progress_percent': min(100, (current_index / total_questions) * 100)
             }
 
     try:
@@ -661,14 +859,7 @@ def api_start_practice():
 
     # 首先验证题库是否存在和可用
     try:
-        cached_tiku_data = cache_manager.get_tiku_list()
-        tiku_list = cached_tiku_data['tiku_list']
-        tiku_info = None
-
-        for tiku in tiku_list:
-            if tiku['tiku_id'] == tiku_id:
-                tiku_info = tiku
-                break
+        tiku_info = tiku_index.get(tiku_id)
 
         if not tiku_info:
             raise BadRequest(f"题库ID {tiku_id} 不存在")
@@ -683,9 +874,9 @@ def api_start_practice():
         logger.error(f"验证题库失败: {e}")
         raise BadRequest(f"题库 {tiku_id} 不可用")
 
-    # 获取题库的题目数据
-    question_bank = cache_manager.get_question_bank(tiku_id)
-    if not question_bank:
+    # 获取题库按题型划分的题目ID（不加载题目内容）
+    type_partitions = get_type_partitions(tiku_id)
+    if not any(type_partitions.values()):
         raise BadRequest(f"题库 {tiku_id} 为空或加载失败")
 
     user_info = get_user_session_info()
@@ -707,7 +898,7 @@ def api_start_practice():
     increment_tiku_usage(tiku_id)
 
     # 生成题目索引
-    question_indices = generate_questions(question_bank, selected_types, shuffle_questions)
+    question_indices = generate_questions(type_partitions, selected_types, shuffle_questions)
 
     if not question_indices:
         raise BadRequest("没有符合条件的题目")
@@ -739,8 +930,7 @@ def api_start_practice():
         'shuffle_enabled': shuffle_questions
     }
 
-    for key, value in session_data.items():
-        set_session_value(key, value)
+    set_session_values(session_data)
 
     practice_mode = "乱序练习" if shuffle_questions else "顺序练习"
     type_info = f"选择题型: {len(selected_types)} 种" if selected_types else "所有题型"
@@ -786,8 +976,10 @@ def api_practice_question():
             SESSION_KEYS['ANSWER_HISTORY']: {}
         }
 
-        for key, value in session_updates.items():
-            set_session_value(key, value)
+        set_session_values(session_updates)
+
+        # 新轮次重置了全部状态，写入完整快照
+        submit_practice_snapshot()
 
         flash_messages.append({
             'category': 'info',
@@ -801,7 +993,7 @@ def api_practice_question():
     question_id = q_indices[current_idx]
 
     try:
-        question_obj = cache_manager.get_question_by_id(question_id)
+        question_obj = get_practice_question(question_id, get_session_value(SESSION_KEYS['CURRENT_TIKU_ID']))
         if not question_obj:
             logger.error(f"题目 {question_id} 不存在或已禁用")
             raise BadRequest("当前题目不可用，请重新开始练习")
@@ -846,17 +1038,20 @@ def api_submit_answer():
     if not data:
         raise BadRequest("缺少请求数据")
 
-    user_answer = data.get('answer', '').upper()
+    user_answer = data.get('answer') or ''
     question_id = data.get('question_id')
     peeked = data.get('peeked', False)
 
     if not question_id:
         raise BadRequest("缺少题目ID")
+    if not isinstance(user_answer, str) or len(user_answer) > ANSWER_MAX_LENGTH:
+        raise BadRequest(f"答案格式无效（最多{ANSWER_MAX_LENGTH}个字符）")
+    user_answer = user_answer.upper()
 
     current_idx = get_session_value(SESSION_KEYS['CURRENT_INDEX'], 0)
 
     try:
-        question_data = cache_manager.get_question_by_id(question_id)
+        question_data = get_practice_question(question_id, get_session_value(SESSION_KEYS['CURRENT_TIKU_ID']))
         if not question_data:
             raise BadRequest(f"题目 {question_id} 不存在或已禁用")
 
@@ -880,7 +1075,8 @@ def api_submit_answer():
                                                                                       is_multiple_choice)
     correct_answer_display = format_answer_display(correct_answer, options, is_multiple_choice)
 
-    update_practice_record(question_id, is_correct, peeked, current_idx, user_answer)
+    # 答题事件记录服务端加载的题目ID，不使用未经校验的前端参数
+    update_practice_record(question_data['id'], is_correct, peeked, current_idx, user_answer)
 
     return create_response(True, data={
         "is_correct": is_correct,
@@ -892,92 +1088,31 @@ def api_submit_answer():
 
 
 def update_practice_record(question_id: int, is_correct: bool, peeked: bool, current_idx: int, user_answer: str):
-    """更新练习记录 - 优化版本（处理题目ID）"""
-
-    # 批量获取session值避免多次调用
-    question_statuses = get_session_value(SESSION_KEYS['QUESTION_STATUSES'], [])
-    answer_history = get_session_value(SESSION_KEYS['ANSWER_HISTORY'], {})
-    wrong_indices = get_session_value(SESSION_KEYS['WRONG_INDICES'], [])
+    """更新练习记录 - 练习状态按字段更新，数据库只追加一条答题事件"""
 
-    # 更新题目状态
-    if current_idx < len(question_statuses):
-        question_statuses[current_idx] = QUESTION_STATUS['CORRECT'] if (is_correct and not peeked) else QUESTION_STATUS[
-            'WRONG']
-
-    # 保存答题历史 - 存储题目ID
-    answer_history[str(current_idx)] = {
-        'user_answer': user_answer,
+    # 答题事件 - 现在q_indices和wrong_indices存储的都是题目ID
+    answer_event = {
+        'question_index': current_idx,
+        'question_id': question_id,
         'is_correct': is_correct,
-        'question_id': question_id  # 直接存储题目ID，因为q_indices现在存储的就是ID
+        'peeked': peeked,
+        'user_answer': user_answer
     }
 
-    # 处理错题和正确题 - 现在wrong_indices存储的是题目ID
-    if not is_correct or peeked:
-        if question_id not in wrong_indices:
-            wrong_indices.append(question_id)
-    else:
-        if get_session_value(SESSION_KEYS['ROUND_NUMBER'], 1) == 1:
-            correct_count = get_session_value(SESSION_KEYS['CORRECT_FIRST_TRY'], 0) + 1
-            set_session_value(SESSION_KEYS['CORRECT_FIRST_TRY'], correct_count)
-
-    next_index = current_idx + 1
-
-    # 批量更新session值
-    session_updates = {
-        SESSION_KEYS['QUESTION_STATUSES']: question_statuses,
-        SESSION_KEYS['ANSWER_HISTORY']: answer_history,
-        SESSION_KEYS['WRONG_INDICES']: wrong_indices,
-        SESSION_KEYS['CURRENT_INDEX']: next_index
-    }
-
-    for key, value in session_updates.items():
-        set_session_value(key, value)
-
-    # 异步更新数据库记录 - 修复版本
-    try:
-        # 在主线程中获取所有需要的数据，避免在异步线程中访问Flask session
-        practice_session_id = get_session_value('practice_session_id')
-        if not practice_session_id:
-            # 尝试从session_manager获取
-            from ..session_manager import get_current_practice_session_id
-            practice_session_id = get_current_practice_session_id()
-
-        if not practice_session_id:
-            logger.warning("没有找到练习会话ID，跳过数据库更新")
-            return
-
-        update_data = {
-            'current_question_index': next_index,
-            'correct_first_try': get_session_value(SESSION_KEYS['CORRECT_FIRST_TRY'], 0),
-            'round_number': get_session_value(SESSION_KEYS['ROUND_NUMBER'], 1),
-            'wrong_indices': wrong_indices,
-            'question_statuses': question_statuses,
-            'answer_history': answer_history
-        }
+    # 按字段更新该题状态、答题历史和错题（与从事件日志恢复时使用同一逻辑），不重写整个列表
+    record_answer_state(answer_event)
 
-        # 异步执行数据库更新，避免阻塞主线程
-        def async_update_session(session_id: int, data: dict):
-            try:
-                # 直接调用connectDB中的函数，不依赖Flask上下文
-                from ..connectDB import update_practice_session
-                result = update_practice_session(session_id, **data)
-                if result['success']:
-                    logger.debug("练习会话数据库记录更新成功")
-                else:
-                    logger.warning(f"练习会话数据库记录更新失败: {result.get('error', 'Unknown error')}")
-            except Exception as e:
-                logger.error(f"异步更新练习会话数据库记录时发生错误: {e}")
+    if is_correct and not peeked and get_session_value(SESSION_KEYS['ROUND_NUMBER'], 1) == 1:
+        correct_count = get_session_value(SESSION_KEYS['CORRECT_FIRST_TRY'], 0) + 1
+        set_session_value(SESSION_KEYS['CORRECT_FIRST_TRY'], correct_count)
 
-        # 在后台线程中执行数据库更新，传递所有必要的数据
-        update_thread = threading.Thread(
-            target=async_update_session,
-            args=(practice_session_id, update_data),
-            daemon=True
-        )
-        update_thread.start()
+    set_session_value(SESSION_KEYS['CURRENT_INDEX'], current_idx + 1)
 
+    # 登记到写回队列：只追加答题事件，定期写完整快照，由后台线程批量写库
+    try:
+        record_practice_answer(answer_event)
     except Exception as e:
-        logger.error(f"启动异步更新练习会话数据库记录失败: {e}")
+        logger.error(f"登记练习会话数据库更新失败: {e}")
 
 
 @practice_bp.route('/completed_summary', methods=['GET'])
@@ -1078,9 +1213,9 @@ def api_session_status():
     step3_end_time = time.time()
     print(f"处理 display_name 耗时: {step3_end_time - step2_end_time:.4f} 秒")
 
-    current_indices = get_session_value(SESSION_KEYS['QUESTION_INDICES'], [])
+    total_questions = get_practice_question_count()
     step4_end_time = time.time()
-    print(f"获取 current_indices 耗时: {step4_end_time - step3_end_time:.4f} 秒")
+    print(f"获取 total_questions 耗时: {step4_end_time - step3_end_time:.4f} 秒")
 
     current_index = get_session_value(SESSION_KEYS['CURRENT_INDEX'], 0)
     step5_end_time = time.time()
@@ -1105,7 +1240,7 @@ def api_session_status():
         'file_info': {
             'display': display_name,
             'current_question': current_index + 1,
-            'total_questions': len(current_indices),
+            'total_questions': total_questions,
             'round_number': round_number
         },
         'session_config': {
@@ -1192,44 +1327,10 @@ def api_practice_statistics():
         raise BadRequest("用户未登录")
 
     try:
-        # 获取基本历史数据
-        history = get_user_practice_history(user_id, 100)
-
-        # 计算统计信息
-        total_sessions = len(history)
-        completed_sessions = len([h for h in history if h['status'] == 'completed'])
-        total_questions = sum(h['total_questions'] for h in history)
-        total_correct = sum(h['correct_first_try'] for h in history)
-
-        # 按科目统计
-        subject_stats = defaultdict(lambda: {
-            'sessions': 0, 'total_questions': 0, 'correct_answers': 0, 'avg_score': 0
-        })
-
-        for session in history:
-            subject = session['subject_name']
-            subject_stats[subject]['sessions'] += 1
-            subject_stats[subject]['total_questions'] += session['total_questions']
-            subject_stats[subject]['correct_answers'] += session['correct_first_try']
-
-        # 计算平均分
-        for subject, stats in subject_stats.items():
-            if stats['total_questions'] > 0:
-                stats['avg_score'] = round(stats['correct_answers'] / stats['total_questions'] * 100, 2)
-
-        overall_avg_score = round(total_correct / total_questions * 100, 2) if total_questions > 0 else 0
-
-        statistics = {
-            'overall': {
-                'total_sessions': total_sessions,
-                'completed_sessions': completed_sessions,
-                'total_questions': total_questions,
-                'total_correct': total_correct,
-                'avg_score': overall_avg_score
-            },
-            'by_subject': dict(subject_stats),
-            'recent_activity': history[:10]
-        }
+        # 全部历史的汇总来自用户统计读模型（Redis汇总hash，缺失时按练习统计表重建）
+        statistics = user_stats_store.get_statistics(user_id)
+        if statistics is None:
+            return create_response(False, '获取练习统计失败', status_code=500)
 
         return create_response(True, '获取统计信息成功', {
             'statistics': statistics
@@ -1266,7 +1367,7 @@ def api_get_question_history(question_index: int):
     actual_question_id = history_data['question_id']
 
     try:
-        question_data = cache_manager.get_question_by_id(actual_question_id)
+        question_data = get_practice_question(actual_question_id, get_session_value(SESSION_KEYS['CURRENT_TIKU_ID']))
         if not question_data:
             raise NotFound(f'题目 {actual_question_id} 不存在或已禁用')
 
@@ -1398,16 +1499,9 @@ def api_practice_url_params():
 
     logger.info(f"URL practice access: tikuid={tiku_id}, order={order}, types={selected_types}")
 
-    # 从缓存获取题库信息
+    # 从题库元数据索引获取题库信息
     try:
-        cached_tiku_data = cache_manager.get_tiku_list()
-        tiku_list = cached_tiku_data['tiku_list']
-        tiku_info = None
-
-        for tiku in tiku_list:
-            if tiku['tiku_id'] == tiku_id:
-                tiku_info = tiku
-                break
+        tiku_info = tiku_index.get(tiku_id)
 
         if not tiku_info:
             raise NotFound(f"未找到题库ID: {tiku_id}")
@@ -1419,9 +1513,9 @@ def api_practice_url_params():
         logger.warning(f"查找题库失败: {e}")
         raise NotFound(f"查找题库失败: {tiku_id}")
 
-    # 使用缓存管理器获取题库题目
-    question_bank = cache_manager.get_question_bank(tiku_id)
-    if not question_bank:
+    # 获取题库按题型划分的题目ID（不加载题目内容）
+    type_partitions = get_type_partitions(tiku_id)
+    if not any(type_partitions.values()):
         raise NotFound("选择的题库为空或不存在")
 
     # 检查是否有现有会话
@@ -1433,15 +1527,12 @@ def api_practice_url_params():
 
     if existing_tiku_id != tiku_id or not existing_indices:
         # 开始新的练习会话
-        if not isinstance(question_bank, list) or not question_bank:
-            raise BadRequest('选择的题库为空或无效')
-
         # 增加题库使用次数统计
         increment_tiku_usage(tiku_id)
 
         # 根据参数生成题目索引
         question_indices = generate_questions(
-            question_bank,
+            type_partitions,
             selected_types=selected_types,
             shuffle_enabled=shuffle_questions
         )
@@ -1489,8 +1580,7 @@ def api_practice_url_params():
             'shuffle_enabled': shuffle_questions
         }
 
-        for key, value in session_data.items():
-            set_session_value(key, value)
+        set_session_values(session_data)
 
         # 验证关键的 session 值是否正确设置
         current_tiku_id_check = get_session_value(SESSION_KEYS['CURRENT_TIKU_ID'])
@@ -1,42 +1,89 @@
 """
 使用统计相关的路由模块
+统计数据来自后台定期生成的汇总文档（usage_analytics），接口不再查询数据库；
+支持 days / hours 参数查询最近一段时间的排行
 """
 import logging
+from typing import Optional, Tuple
+
 from flask import Blueprint, jsonify, request
+from werkzeug.exceptions import BadRequest
 
 from ..decorators import handle_api_error, login_required
+from ..usage_analytics import usage_analytics
 from ..utils import create_response
-from ..connectDB import get_usage_statistics
-from ..routes.practice import tiku_usage_stats, usage_stats_lock
 
 logger = logging.getLogger(__name__)
 
 # 创建蓝图
 usage_bp = Blueprint('usage', __name__, url_prefix='/api')
 
+# 不带时间窗口参数时返回的排行数量（与原接口一致）
+DEFAULT_SUBJECT_STATS_LIMIT = 10
+DEFAULT_TIKU_STATS_LIMIT = 20
+
+
+def _parse_limit(default: int, maximum: int) -> int:
+    """解析数量参数并限制在 1-maximum 之间"""
+    try:
+        limit = int(request.args.get('limit', str(default)))
+        return max(1, min(limit, maximum))
+    except ValueError:
+        return default
+
+
+def _parse_window() -> Optional[Tuple[str, int]]:
+    """解析时间窗口参数：days=N 为最近N天，hours=N 为最近N小时；未指定返回None"""
+    for param, granularity in (('days', 'day'), ('hours', 'hour')):
+        value = request.args.get(param)
+        if value is None:
+            continue
+        maximum = usage_analytics.max_window(granularity)
+        try:
+            span = int(value)
+        except ValueError:
+            span = 0
+        if not 1 <= span <= maximum:
+            raise BadRequest(f"{param} 必须在 1-{maximum} 之间")
+        return granularity, span
+    return None
+
+
+def _load_stats(window: Optional[Tuple[str, int]], subject_limit: int, tiku_limit: int) -> Optional[dict]:
+    """读取统计数据：指定时间窗口时返回窗口排行，否则返回汇总文档"""
+    if window:
+        return usage_analytics.get_window_stats(*window, subject_limit=subject_limit, tiku_limit=tiku_limit)
+    return usage_analytics.get_summary()
+
+
+def _with_rank(items: list, limit: int, total_usage: int) -> list:
+    """取前N项并计算排名和百分比（不修改汇总文档中的数据）"""
+    total_usage = total_usage or 1
+    return [dict(item, rank=i + 1, usage_percentage=round((item['used_count'] / total_usage) * 100, 2))
+            for i, item in enumerate(items[:limit])]
+
 
 @usage_bp.route('/usage-stats', methods=['GET'])
 @login_required
 @handle_api_error
 def api_usage_stats():
     """获取使用统计信息"""
+    window = _parse_window()
     try:
-        stats_result = get_usage_statistics()
-        
-        if not stats_result:
+        stats = _load_stats(window, DEFAULT_SUBJECT_STATS_LIMIT, DEFAULT_TIKU_STATS_LIMIT)
+        if not stats:
             return create_response(False, "获取统计数据失败", status_code=500)
-        
-        if not stats_result.get('success'):
-            return create_response(False, stats_result.get('error', '未知错误'), status_code=500)
-        
+
         # 构造返回数据
         response_data = {
-            'subject_stats': stats_result.get('subject_stats', []),
-            'tiku_stats': stats_result.get('tiku_stats', [])
+            'subject_stats': stats['subject_stats'][:DEFAULT_SUBJECT_STATS_LIMIT],
+            'tiku_stats': stats['tiku_stats'][:DEFAULT_TIKU_STATS_LIMIT]
         }
+        if window:
+            response_data['window'] = {'granularity': stats['granularity'], 'span': stats['span']}
 
         return create_response(True, "获取统计数据成功", data=response_data)
-        
+
     except Exception as e:
         logger.error(f"获取使用统计失败: {str(e)}")
         return create_response(False, f"获取统计数据失败: {str(e)}", status_code=500)
@@ -48,37 +95,29 @@ def api_usage_stats():
 def api_usage_stats_summary():
     """获取使用统计摘要信息"""
     try:
-        stats_result = get_usage_statistics()
-        
-        if not stats_result or not stats_result.get('success'):
+        summary = usage_analytics.get_summary()
+
+        if not summary:
             return create_response(False, "获取统计数据失败", status_code=500)
-        
-        subject_stats = stats_result.get('subject_stats', [])
-        tiku_stats = stats_result.get('tiku_stats', [])
-        
-        # 计算摘要信息
-        total_subject_usage = sum(item['used_count'] for item in subject_stats)
-        total_tiku_usage = sum(item['used_count'] for item in tiku_stats)
-        active_subjects = len([item for item in subject_stats if item['used_count'] > 0])
-        active_tikues = len([item for item in tiku_stats if item['used_count'] > 0])
-        
-        # 获取最受欢迎的科目和题库
-        most_popular_subject = subject_stats[0] if subject_stats else None
-        most_popular_tiku = tiku_stats[0] if tiku_stats else None
-        
+
+        subject_stats = summary['subject_stats']
+        tiku_stats = summary['tiku_stats']
+
+        # 摘要基于全部科目和题库的累计次数，不受排行截断影响
         summary_data = {
-            'total_subject_usage': total_subject_usage,
-            'total_tiku_usage': total_tiku_usage,
-            'active_subjects_count': active_subjects,
-            'active_tikues_count': active_tikues,
-            'most_popular_subject': most_popular_subject,
-            'most_popular_tiku': most_popular_tiku,
-            'total_subjects': len(subject_stats),
-            'total_tikues': len(tiku_stats)
+            'total_subject_usage': summary['total_subject_usage'],
+            'total_tiku_usage': summary['total_tiku_usage'],
+            'active_subjects_count': summary['active_subjects_count'],
+            'active_tikues_count': summary['active_tikues_count'],
+            'most_popular_subject': subject_stats[0] if subject_stats else None,
+            'most_popular_tiku': tiku_stats[0] if tiku_stats else None,
+            'total_subjects': summary['total_subjects'],
+            'total_tikues': summary['total_tikues'],
+            'generated_at': summary['generated_at']
         }
 
         return create_response(True, "获取统计摘要成功", data=summary_data)
-        
+
     except Exception as e:
         logger.error(f"获取使用统计摘要失败: {str(e)}")
         return create_response(False, f"获取统计摘要失败: {str(e)}", status_code=500)
@@ -90,40 +129,24 @@ def api_usage_stats_summary():
 @handle_api_error
 def api_top_subjects():
     """获取热门科目排行榜"""
+    window = _parse_window()
     try:
-        # 获取数量参数，默认10个
-        limit = request.args.get('limit', '10')
-        try:
-            limit = int(limit)
-            limit = max(1, min(limit, 50))  # 限制在1-50之间
-        except ValueError:
-            limit = 10
-        
-        stats_result = get_usage_statistics()
-        
-        if not stats_result or not stats_result.get('success'):
+        # 获取数量参数，默认10个，限制在1-50之间
+        limit = _parse_limit(10, 50)
+
+        stats = _load_stats(window, limit, 1)
+        if not stats:
             return create_response(False, "获取统计数据失败", status_code=500)
-        
-        subject_stats = stats_result.get('subject_stats', [])
-        
-        # 取前N个科目
-        top_subjects = subject_stats[:limit]
-        
-        # 计算排名和百分比
-        total_usage = sum(item['used_count'] for item in subject_stats) if subject_stats else 1
-        
-        for i, subject in enumerate(top_subjects):
-            subject['rank'] = i + 1
-            subject['usage_percentage'] = round((subject['used_count'] / total_usage) * 100, 2)
-        
+
+        subject_stats = stats['subject_stats']
         response_data = {
-            'top_subjects': top_subjects,
-            'total_subjects': len(subject_stats),
+            'top_subjects': _with_rank(subject_stats, limit, stats['total_subject_usage']),
+            'total_subjects': stats['total_subjects'],
             'limit': limit
         }
 
         return create_response(True, "获取热门科目排行榜成功", data=response_data)
-        
+
     except Exception as e:
         logger.error(f"获取热门科目排行榜失败: {str(e)}")
         return create_response(False, f"获取热门科目排行榜失败: {str(e)}", status_code=500)
@@ -134,40 +157,24 @@ def api_top_subjects():
 @handle_api_error
 def api_top_tikues():
     """获取热门题库排行榜"""
+    window = _parse_window()
     try:
-        # 获取数量参数，默认20个
-        limit = request.args.get('limit', '20')
-        try:
-            limit = int(limit)
-            limit = max(1, min(limit, 100))  # 限制在1-100之间
-        except ValueError:
-            limit = 20
-        
-        stats_result = get_usage_statistics()
-        
-        if not stats_result or not stats_result.get('success'):
+        # 获取数量参数，默认20个，限制在1-100之间
+        limit = _parse_limit(20, 100)
+
+        stats = _load_stats(window, 1, limit)
+        if not stats:
             return create_response(False, "获取统计数据失败", status_code=500)
-        
-        tiku_stats = stats_result.get('tiku_stats', [])
-        
-        # 取前N个题库
-        top_tikues = tiku_stats[:limit]
-        
-        # 计算排名和百分比
-        total_usage = sum(item['used_count'] for item in tiku_stats) if tiku_stats else 1
-        
-        for i, tiku in enumerate(top_tikues):
-            tiku['rank'] = i + 1
-            tiku['usage_percentage'] = round((tiku['used_count'] / total_usage) * 100, 2)
-        
+
+        tiku_stats = stats['tiku_stats']
         response_data = {
-            'top_tikues': top_tikues,
-            'total_tikues': len(tiku_stats),
+            'top_tikues': _with_rank(tiku_stats, limit, stats['total_tiku_usage']),
+            'total_tikues': stats['total_tikues'],
             'limit': limit
         }
 
         return create_response(True, "获取热门题库排行榜成功", data=response_data)
-        
+
     except Exception as e:
         logger.error(f"获取热门题库排行榜失败: {str(e)}")
         return create_response(False, f"获取热门题库排行榜失败: {str(e)}", status_code=500)
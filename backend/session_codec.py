@@ -0,0 +1,172 @@
+"""
+练习会话状态的紧凑二进制编码
+- 题目ID列表：array('I')，每个ID固定4字节
+- 答题状态列表：每个状态2位，4个状态打包为1字节
+- 错题集合：以最小ID为基准的位图
+编码结果以固定魔数开头，解码时自动识别，未编码的旧数据（list）原样返回
+"""
+import base64
+import json
+import struct
+import sys
+from array import array
+from typing import Any, Iterable, List
+
+# 编码数据的魔数和类型标记
+MAGIC = b'\x00SC'
+TAG_IDS = b'I'  # 整数ID列表
+TAG_DB_IDS = b'D'  # 'db_'前缀的字符串ID列表
+TAG_STATUSES = b'S'  # 2位打包的状态列表
+TAG_BITMAP = b'B'  # ID集合位图
+TAG_JSON = b'J'  # 无法紧凑编码时的回退
+
+# 存入数据库文本/JSON列时使用的前缀
+TEXT_PREFIX = 'sc1:'
+
+_DB_ID_PREFIX = 'db_'
+_UINT32_MAX = 0xFFFFFFFF
+_HEADER = struct.Struct('<I')
+
+
+def _to_uint_bytes(values: Iterable[int]) -> bytes:
+    """整数列表编码为小端uint32，保证不同机器上编码一致"""
+    arr = array('I', values)
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _from_uint_bytes(data: bytes) -> List[int]:
+    arr = array('I')
+    arr.frombytes(data)
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr.tolist()
+
+
+# 解码查表：每个字节对应的4个2位状态 / 置位的位偏移
+_STATUS_TABLE = [bytes((byte >> shift) & 3 for shift in (0, 2, 4, 6)) for byte in range(256)]
+_BIT_OFFSETS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+
+def _has_bool(values: list) -> bool:
+    """bool是int的子类，可以写入array/bytes，但解码后变为0/1，需走JSON回退保留类型"""
+    return bool in set(map(type, values))
+
+
+def _try_uint_bytes(values: list):
+    """整数列表可无损编码为uint32时返回编码结果，否则返回None"""
+    if _has_bool(values):
+        return None
+    try:
+        return _to_uint_bytes(values)
+    except (TypeError, OverflowError):
+        return None
+
+
+def _json_fallback(values: Any) -> bytes:
+    return MAGIC + TAG_JSON + json.dumps(values, ensure_ascii=False).encode('utf-8')
+
+
+def pack_ids(ids: list) -> bytes:
+    """编码题目ID列表（保持顺序）"""
+    encoded = _try_uint_bytes(ids)
+    if encoded is not None:
+        return MAGIC + TAG_IDS + encoded
+
+    if all(isinstance(v, str) and v.startswith(_DB_ID_PREFIX) and v[3:].isdigit() for v in ids):
+        encoded = _try_uint_bytes([int(v[3:]) for v in ids])
+        if encoded is not None:
+            return MAGIC + TAG_DB_IDS + encoded
+
+    return _json_fallback(ids)
+
+
+def _small_int_bytes(values: list):
+    """0-3的整数列表返回其字节形式，否则返回None"""
+    if _has_bool(values):
+        return None
+    try:
+        raw = bytes(values)
+    except (TypeError, ValueError):
+        return None
+    return raw if not raw or max(raw) <= 3 else None
+
+
+def pack_statuses(statuses: list) -> bytes:
+    """编码答题状态列表，每个状态占2位"""
+    raw = _small_int_bytes(statuses)
+    if raw is None:
+        return _json_fallback(statuses)
+
+    # 用大整数按位运算合并：每字节低2位 -> 每2字节4位 -> 每4字节8位，再取每4字节的首字节
+    raw += bytes(-len(raw) % 4)
+    value = int.from_bytes(raw, 'little')
+    value = (value | value >> 6) & int.from_bytes(b'\x0f\x00' * (len(raw) // 2), 'little')
+    value = (value | value >> 12) & int.from_bytes(b'\xff\x00\x00\x00' * (len(raw) // 4), 'little')
+    packed = value.to_bytes(len(raw), 'little')[0::4]
+    return MAGIC + TAG_STATUSES + _HEADER.pack(len(statuses)) + packed
+
+
+def pack_id_set(ids: list) -> bytes:
+    """
+    编码ID集合（不保留顺序，解码后升序）
+    位图比ID数组更大时（ID分布稀疏）改用ID数组
+    """
+    unique_ids = sorted(set(ids))
+    if not unique_ids or _try_uint_bytes(unique_ids) is None:
+        return pack_ids(unique_ids)
+
+    base = unique_ids[0]
+    span = unique_ids[-1] - base + 1
+    if (span + 7) // 8 + _HEADER.size * 2 >= len(unique_ids) * 4:
+        return pack_ids(unique_ids)
+
+    bitmap = bytearray((span + 7) // 8)
+    for question_id in unique_ids:
+        offset = question_id - base
+        bitmap[offset >> 3] |= 1 << (offset & 7)
+    return MAGIC + TAG_BITMAP + _HEADER.pack(base) + _HEADER.pack(span) + bytes(bitmap)
+
+
+def is_packed(value: Any) -> bool:
+    """判断是否为本模块编码的数据"""
+    return isinstance(value, (bytes, bytearray)) and value[:len(MAGIC)] == MAGIC
+
+
+def unpack(data: Any) -> Any:
+    """解码，非编码数据原样返回"""
+    if isinstance(data, str) and data.startswith(TEXT_PREFIX):
+        data = base64.b64decode(data[len(TEXT_PREFIX):])
+    if not is_packed(data):
+        return data
+
+    data = bytes(data)
+    tag = data[3:4]
+    body = data[4:]
+
+    if tag == TAG_IDS:
+        return _from_uint_bytes(body)
+
+    if tag == TAG_DB_IDS:
+        return [f'{_DB_ID_PREFIX}{n}' for n in _from_uint_bytes(body)]
+
+    if tag == TAG_STATUSES:
+        (count,) = _HEADER.unpack_from(body)
+        return list(b''.join(map(_STATUS_TABLE.__getitem__, body[_HEADER.size:]))[:count])
+
+    if tag == TAG_BITMAP:
+        (base,) = _HEADER.unpack_from(body)
+        bitmap = body[_HEADER.size * 2:]
+        return [base + (index << 3) + bit
+                for index, byte in enumerate(bitmap) if byte for bit in _BIT_OFFSETS[byte]]
+
+    if tag == TAG_JSON:
+        return json.loads(body.decode('utf-8'))
+
+    raise ValueError(f"未知的会话编码类型: {tag!r}")
+
+
+def to_text(data: bytes) -> str:
+    """编码数据转为文本（用于数据库文本/JSON列）"""
+    return TEXT_PREFIX + base64.b64encode(data).decode('ascii')
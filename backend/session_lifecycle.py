@@ -0,0 +1,252 @@
+"""
+Session 生命周期管理
+- 服务重启不再清空session库，已登录用户无需重新登录（避免重启后集中登录、集中恢复练习会话查询MySQL）
+- session数据带结构版本号：请求时懒迁移，无法迁移（来自更新版本等）的session直接丢弃
+- 后台定期压缩过大的session：旧格式列表重新紧凑编码、清理已结束练习残留的大数据
+- v3起练习大数据存于按练习会话ID的Redis结构，旧session中的大数据迁移时移出
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import redis
+from flask import session
+
+from .RedisManager import redis_manager
+from .config import RedisConfig, SESSION_KEYS
+from .session_manager import PACKED_SESSION_KEYS, PRACTICE_SESSION_ID_KEY, PRACTICE_STATE_KEYS
+
+logger = logging.getLogger(__name__)
+
+SESSION_SCHEMA_KEY = '_schema'
+SESSION_SCHEMA_VERSION = RedisConfig.SESSION_LIFECYCLE_CONFIG['schema_version']
+
+# 练习进行中才需要的大数据，练习结束（无练习会话ID和当前题库）后可以清理
+PRACTICE_PAYLOAD_KEYS = (
+    SESSION_KEYS['QUESTION_INDICES'],
+    SESSION_KEYS['WRONG_INDICES'],
+    SESSION_KEYS['QUESTION_STATUSES'],
+    SESSION_KEYS['ANSWER_HISTORY']
+)
+
+
+def _migrate_v1(data: Dict[str, Any]) -> Dict[str, Any]:
+    """v1 -> v2：题目列表/状态/错题改为紧凑编码"""
+    for key, packer in PACKED_SESSION_KEYS.items():
+        value = data.get(key)
+        if isinstance(value, list):
+            data[key] = packer(value)
+    return data
+
+
+def _migrate_v2(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    v2 -> v3：有练习会话ID时，练习大数据移到Redis练习状态（已存在则不覆盖）
+    写入失败时直接丢弃，读取时从数据库恢复
+    """
+    practice_session_id = data.get(PRACTICE_SESSION_ID_KEY)
+    if not practice_session_id:
+        return data
+
+    state = {part: data.pop(key) for key, part in PRACTICE_STATE_KEYS.items() if key in data}
+    if state and redis_manager.get_practice_state(practice_session_id, ()) is None:
+        redis_manager.store_practice_state(practice_session_id, state)
+    return data
+
+
+# 版本号 -> 迁移到下一版本的函数
+SESSION_MIGRATIONS: Dict[int, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    1: _migrate_v1,
+    2: _migrate_v2
+}
+
+
+def migrate_session_data(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    把session数据迁移到当前结构版本并清理练习残留数据
+    没有版本号的视为v1；版本高于当前版本或迁移失败时返回None，调用方应丢弃该session
+    """
+    version = data.get(SESSION_SCHEMA_KEY, 1)
+    if not isinstance(version, int) or version > SESSION_SCHEMA_VERSION:
+        return None
+
+    data = dict(data)
+    try:
+        while version < SESSION_SCHEMA_VERSION:
+            data = SESSION_MIGRATIONS[version](data)
+            version += 1
+    except Exception as e:
+        logger.warning(f"session从版本 {version} 迁移失败: {e}")
+        return None
+
+    if not data.get(PRACTICE_SESSION_ID_KEY) and not data.get(SESSION_KEYS['CURRENT_TIKU_ID']):
+        for key in PRACTICE_PAYLOAD_KEYS:
+            data.pop(key, None)
+
+    data[SESSION_SCHEMA_KEY] = SESSION_SCHEMA_VERSION
+    return data
+
+
+def ensure_session_schema() -> None:
+    """请求开始时调用：当前session不是最新结构版本时懒迁移，无法迁移则清空"""
+    if not session or session.get(SESSION_SCHEMA_KEY) == SESSION_SCHEMA_VERSION:
+        return
+
+    migrated = migrate_session_data(dict(session))
+    session.clear()
+    if migrated is None:
+        logger.info("丢弃结构版本不兼容的session")
+    else:
+        session.update(migrated)
+    session.modified = True
+
+
+class SessionCompactor:
+    """后台session压缩任务：每个worker一个线程，通过Redis锁保证同一时间只有一个worker在扫描"""
+
+    _LOCK_KEY = 'compaction_lock:session'
+
+    def __init__(self, compact_interval: float = 600, compact_threshold_bytes: int = 8192,
+                 scan_count: int = 500):
+        self._interval = compact_interval
+        self._threshold = compact_threshold_bytes
+        self._scan_count = scan_count
+
+        self._client: Optional[redis.Redis] = None
+        self._serializer = None
+        self._key_prefix = ''
+        self._pid = None
+        self._lock = threading.Lock()
+
+        # 统计信息（本进程执行的压缩）
+        self._stats = {
+            'runs': 0,
+            'scanned': 0,
+            'oversized': 0,
+            'compacted': 0,
+            'dropped': 0,
+            'conflicts': 0,
+            'bytes_saved': 0,
+            'last_run_at': None,
+            'last_run_ms': 0.0
+        }
+
+    def configure(self, client: redis.Redis, serializer, key_prefix: str) -> None:
+        """设置session库连接、Flask-Session的序列化器和键前缀（Session(app)初始化之后调用）"""
+        self._client = client
+        self._serializer = serializer
+        self._key_prefix = key_prefix
+
+    def ensure_started(self) -> None:
+        """按进程懒启动压缩线程（Gunicorn preload_app 下fork后需在worker进程内重新启动）"""
+        pid = os.getpid()
+        if self._pid == pid or self._client is None:
+            return
+
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._pid = pid
+            threading.Thread(target=self._loop, name="session_compactor", daemon=True).start()
+
+    def _loop(self) -> None:
+        while True:
+            time.sleep(self._interval)
+            try:
+                # 锁的有效期与间隔相同：本轮由一个worker执行，其他worker跳过
+                if self._client.set(self._LOCK_KEY, os.getpid(), nx=True, ex=int(self._interval)):
+                    self.compact_once()
+            except Exception as e:
+                logger.error(f"session压缩任务出错: {e}")
+
+    def compact_once(self) -> Dict[str, int]:
+        """扫描一遍session库，压缩超过阈值的session"""
+        start_time = time.perf_counter()
+        result = {'scanned': 0, 'oversized': 0, 'compacted': 0, 'dropped': 0, 'conflicts': 0, 'bytes_saved': 0}
+
+        batch = []
+        for key in self._client.scan_iter(match=f'{self._key_prefix}*', count=self._scan_count):
+            batch.append(key)
+            if len(batch) >= self._scan_count:
+                self._compact_batch(batch, result)
+                batch = []
+        if batch:
+            self._compact_batch(batch, result)
+
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        with self._lock:
+            self._stats['runs'] += 1
+            for name, value in result.items():
+                self._stats[name] += value
+            self._stats['last_run_at'] = time.time()
+            self._stats['last_run_ms'] = elapsed_ms
+
+        logger.info(f"session压缩完成: 扫描 {result['scanned']} 个，压缩 {result['compacted']} 个，"
+                    f"丢弃 {result['dropped']} 个，节省 {result['bytes_saved']} 字节，耗时 {elapsed_ms:.0f}ms")
+        return result
+
+    def _compact_batch(self, keys: list, result: Dict[str, int]) -> None:
+        """pipeline取一批session的大小，只处理超过阈值的"""
+        pipe = self._client.pipeline(transaction=False)
+        for key in keys:
+            pipe.strlen(key)
+        sizes = pipe.execute()
+        result['scanned'] += len(keys)
+
+        for key, size in zip(keys, sizes):
+            if size and size > self._threshold:
+                result['oversized'] += 1
+                self._compact_key(key, result)
+
+    def _compact_key(self, key, result: Dict[str, int]) -> None:
+        """WATCH后读取、迁移并写回，期间session被请求修改则放弃本次压缩"""
+        with self._client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                raw = pipe.get(key)
+                ttl_ms = pipe.pttl(key)
+                if not raw or ttl_ms is None or ttl_ms <= 0:
+                    pipe.unwatch()
+                    return
+
+                migrated = migrate_session_data(self._serializer.decode(raw))
+                pipe.multi()
+                if migrated is None:
+                    pipe.delete(key)
+                    pipe.execute()
+                    result['dropped'] += 1
+                    return
+
+                encoded = self._serializer.encode(migrated)
+                if len(encoded) >= len(raw):
+                    pipe.reset()
+                    return
+                pipe.set(key, encoded, px=ttl_ms)
+                pipe.execute()
+                result['compacted'] += 1
+                result['bytes_saved'] += len(raw) - len(encoded)
+            except redis.WatchError:
+                result['conflicts'] += 1
+            except Exception as e:
+                logger.warning(f"压缩session {key!r} 失败: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取压缩任务统计信息"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({
+            'schema_version': SESSION_SCHEMA_VERSION,
+            'compact_interval': self._interval,
+            'compact_threshold_bytes': self._threshold
+        })
+        return stats
+
+
+# 全局session压缩任务
+session_compactor = SessionCompactor(
+    compact_interval=RedisConfig.SESSION_LIFECYCLE_CONFIG['compact_interval'],
+    compact_threshold_bytes=RedisConfig.SESSION_LIFECYCLE_CONFIG['compact_threshold_bytes'],
+    scan_count=RedisConfig.SESSION_LIFECYCLE_CONFIG['scan_count']
+)
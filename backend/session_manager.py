@@ -4,24 +4,47 @@
 """
 import logging
 from datetime import datetime, timedelta
-from typing import Any, Optional, Dict
+from typing import Any, Optional, Dict, Iterable
 
 import redis
 from flask import session, g
 
-from backend.config import RedisConfig
+from backend.config import RedisConfig, DatabaseConfig
+from . import session_codec
 from .RedisManager import redis_manager
-from .config import SESSION_KEYS, Config
+from .config import SESSION_KEYS, Config, QUESTION_STATUS
 from .connectDB import (
-    create_practice_session, update_practice_session,
+    create_practice_session, update_practice_session, get_practice_session,
     complete_practice_session, get_user_active_practice_session,
-    get_tiku_by_subject
+    answer_event_result, apply_answer_event
 )
+from .practice_writer import practice_writer
+from .tiku_index import tiku_index
+from .user_stats import user_stats_store
 
 logger = logging.getLogger(__name__)
 
 # 添加练习会话ID的session key
 PRACTICE_SESSION_ID_KEY = 'practice_session_id'
+# 上次写入完整快照后追加的答题事件数
+ANSWER_EVENTS_SINCE_SNAPSHOT_KEY = 'answer_events_since_snapshot'
+
+# 以紧凑二进制编码存储的session keys及其编码函数（错题按集合存储，不保留顺序）
+PACKED_SESSION_KEYS = {
+    SESSION_KEYS['QUESTION_INDICES']: session_codec.pack_ids,
+    SESSION_KEYS['WRONG_INDICES']: session_codec.pack_id_set,
+    SESSION_KEYS['QUESTION_STATUSES']: session_codec.pack_statuses
+}
+
+# 练习进行中的大数据 session key -> 练习状态部分（同时也是数据库字段名）
+# 有练习会话ID时存于按练习会话ID的Redis结构（RedisManager.store_practice_state），Flask session只保留少量标量；
+# 没有练习会话ID（未登录用户通过URL练习）时仍以紧凑编码存于Flask session
+PRACTICE_STATE_KEYS = {
+    SESSION_KEYS['QUESTION_INDICES']: 'question_indices',
+    SESSION_KEYS['WRONG_INDICES']: 'wrong_indices',
+    SESSION_KEYS['QUESTION_STATUSES']: 'question_statuses',
+    SESSION_KEYS['ANSWER_HISTORY']: 'answer_history'
+}
 
 
 class SessionManager:
@@ -45,9 +68,9 @@ class SessionManager:
                 retry_on_timeout=True
             )
 
-            # 测试Redis连接
+            # 测试Redis连接（不清空session库，重启后已登录用户的session继续有效，
+            # 旧结构的session由 session_lifecycle 在请求时懒迁移）
             redis_client.ping()
-            redis_client.flushdb()
 
             logger.info("Flask-Session Redis连接成功")
             return redis_client
@@ -98,56 +121,156 @@ class SessionManager:
 session_manager = SessionManager()
 
 
+def _practice_state_id() -> Optional[int]:
+    """练习大数据存于Redis练习状态时返回练习会话ID，否则返回None（存于Flask session）"""
+    if not RedisConfig.PRACTICE_STATE_CONFIG['enabled']:
+        return None
+    return session.get(PRACTICE_SESSION_ID_KEY)
+
+
+def _read_practice_state_from_db(practice_session_id: int) -> Dict[str, Any]:
+    """从数据库读取练习会话的完整练习状态（先写入写回队列中尚未落库的最新状态）"""
+    try:
+        practice_writer.flush_session(practice_session_id)
+        session_data = get_practice_session(practice_session_id)
+    except Exception as e:
+        logger.error(f"从数据库获取练习状态失败: {e}")
+        return {}
+
+    return _practice_state_from_record(session_data) if session_data else {}
+
+
+def _practice_state_from_record(session_data: Dict[str, Any]) -> Dict[str, Any]:
+    """从数据库练习会话记录中取出练习状态各部分"""
+    state = {part: session_data[part] for part in PRACTICE_STATE_KEYS.values() if session_data.get(part) is not None}
+    # 会话创建后尚未写过快照时没有状态列表，按题目列表初始化为未作答
+    if 'question_statuses' not in state and 'question_indices' in state:
+        state['question_statuses'] = [QUESTION_STATUS['UNANSWERED']] * len(state['question_indices'])
+    return state
+
+
+def _load_practice_state(practice_session_id: int, parts: Iterable[str]) -> Dict[str, Any]:
+    """
+    读取练习状态的指定部分：优先Redis；Redis中没有（过期、尚未写入）时从数据库读取完整状态并回填Redis，
+    Redis不可用时直接返回数据库中的状态
+    """
+    parts = list(parts)
+    state = redis_manager.get_practice_state(practice_session_id, parts)
+    if state is not None:
+        return state
+
+    state = _read_practice_state_from_db(practice_session_id)
+    if state:
+        redis_manager.store_practice_state(practice_session_id, state)
+    return state
+
+
 def get_session_value(key: str, default: Any = None) -> Any:
     """
     获取session值 - 适配Flask-Session
-    Flask-Session统一管理所有session数据，无需区分大小数据
+    练习大数据有练习会话ID时从Redis练习状态读取，其余从Flask session读取
+    题目列表/状态/错题以紧凑编码存储，在此透明解码
     """
-    result = session.get(key, default)
+    practice_session_id = _practice_state_id() if key in PRACTICE_STATE_KEYS else None
+    if practice_session_id:
+        part = PRACTICE_STATE_KEYS[key]
+        result = _load_practice_state(practice_session_id, (part,)).get(part, default)
+    else:
+        result = session.get(key, default)
+        if key in PACKED_SESSION_KEYS:
+            result = session_codec.unpack(result)
     logger.debug(f"获取session key {key}: {'有值' if result is not None else '无值/默认值'}")
     return result
 
 
+def set_session_values(values: Dict[str, Any]) -> None:
+    """
+    批量设置session值 - 练习大数据有练习会话ID时一次写入Redis练习状态，
+    不写入Flask session，读取进度的请求不必重写大的session数据
+    """
+    practice_session_id = _practice_state_id()
+    state = {}
+    for key, value in values.items():
+        if practice_session_id and key in PRACTICE_STATE_KEYS:
+            state[PRACTICE_STATE_KEYS[key]] = value
+            # 清除旧版本存在Flask session中的副本
+            session.pop(key, None)
+            continue
+
+        logger.debug(f"设置session key {key}: 长度 {len(value) if hasattr(value, '__len__') else 'N/A'}")
+        packer = PACKED_SESSION_KEYS.get(key)
+        if packer is not None and isinstance(value, list):
+            value = packer(value)
+        session[key] = value
+
+    if not state:
+        return
+
+    # 只替换部分数据时先确保其余部分已在Redis中，避免之后从数据库回填时覆盖本次写入
+    if len(state) < len(PRACTICE_STATE_KEYS):
+        _load_practice_state(practice_session_id, ())
+    if not redis_manager.store_practice_state(practice_session_id, state):
+        # Redis不可用时作为完整快照登记到写回队列：与答题事件保持同一会话的写入顺序，
+        # 快照写入时删除之前的答题事件，旧轮次的事件不会被重放到新状态上
+        logger.debug(f"练习状态写入Redis失败，回退到数据库: {list(state)}")
+        if len(state) < len(PRACTICE_STATE_KEYS):
+            state = dict(_read_practice_state_from_db(practice_session_id), **state)
+        practice_writer.submit(practice_session_id, state, snapshot=True)
+
+
 def set_session_value(key: str, value: Any) -> None:
     """
     设置session值 - 适配Flask-Session
-    Flask-Session统一管理所有session数据，无需区分大小数据
+    Flask-Session会自动处理session.modified
     """
-    logger.debug(f"设置session key {key}: 长度 {len(value) if hasattr(value, '__len__') else 'N/A'}")
-    session[key] = value
-    # Flask-Session会自动处理session.modified
+    set_session_values({key: value})
+
+
+def record_answer_state(event: Dict[str, Any]) -> None:
+    """
+    把一次答题应用到练习状态：存于Redis时只按字段更新该题的状态、答题历史和错题，
+    否则读出完整状态、应用后整体写回
+    """
+    practice_session_id = _practice_state_id()
+    if practice_session_id:
+        status, history_entry = answer_event_result(event)
+        wrong_question_id = event['question_id'] if status == QUESTION_STATUS['WRONG'] else None
+        args = (practice_session_id, event['question_index'], status, history_entry, wrong_question_id)
+        if redis_manager.apply_practice_answer(*args):
+            return
+        # 练习状态不在Redis中（已过期等）：从数据库回填后重试
+        _load_practice_state(practice_session_id, ())
+        if redis_manager.apply_practice_answer(*args):
+            return
+
+    question_statuses = get_session_value(SESSION_KEYS['QUESTION_STATUSES'], [])
+    answer_history = get_session_value(SESSION_KEYS['ANSWER_HISTORY'], {})
+    wrong_indices = get_session_value(SESSION_KEYS['WRONG_INDICES'], [])
+    apply_answer_event(question_statuses, answer_history, wrong_indices, event)
+    set_session_values({
+        SESSION_KEYS['QUESTION_STATUSES']: question_statuses,
+        SESSION_KEYS['ANSWER_HISTORY']: answer_history,
+        SESSION_KEYS['WRONG_INDICES']: wrong_indices
+    })
+
+
+def get_practice_question_count() -> int:
+    """当前练习的题目数量，练习状态在Redis中时只读取状态串长度，不读取题目列表"""
+    practice_session_id = _practice_state_id()
+    if practice_session_id:
+        count = redis_manager.get_practice_question_count(practice_session_id)
+        if count is not None:
+            return count
+    return len(get_session_value(SESSION_KEYS['QUESTION_INDICES'], []) or [])
 
 
 def get_database_session_value(key: str, default: Any = None) -> Any:
     """从数据库获取session数据"""
     session_id = session.get(PRACTICE_SESSION_ID_KEY)
-    if not session_id:
+    if not session_id or key not in PRACTICE_STATE_KEYS:
         return default
 
-    try:
-        from .connectDB import get_practice_session
-        session_data = get_practice_session(session_id)
-
-        if not session_data:
-            return default
-
-        # 映射session key到数据库字段
-        key_mapping = {
-            SESSION_KEYS['QUESTION_INDICES']: 'question_indices',
-            SESSION_KEYS['WRONG_INDICES']: 'wrong_indices',
-            SESSION_KEYS['QUESTION_STATUSES']: 'question_statuses',
-            SESSION_KEYS['ANSWER_HISTORY']: 'answer_history'
-        }
-
-        db_field = key_mapping.get(key)
-        if db_field and db_field in session_data:
-            return session_data[db_field]
-
-        return default
-
-    except Exception as e:
-        logger.error(f"从数据库获取session数据失败: {e}")
-        return default
+    return _read_practice_state_from_db(session_id).get(PRACTICE_STATE_KEYS[key], default)
 
 
 def set_database_session_value(key: str, value: Any) -> None:
@@ -158,18 +281,9 @@ def set_database_session_value(key: str, value: Any) -> None:
         return
 
     try:
-        # 映射session key到数据库字段
-        key_mapping = {
-            SESSION_KEYS['QUESTION_INDICES']: 'question_indices',
-            SESSION_KEYS['WRONG_INDICES']: 'wrong_indices',
-            SESSION_KEYS['QUESTION_STATUSES']: 'question_statuses',
-            SESSION_KEYS['ANSWER_HISTORY']: 'answer_history'
-        }
-
-        db_field = key_mapping.get(key)
+        db_field = PRACTICE_STATE_KEYS.get(key)
         if db_field:
-            update_data = {db_field: value}
-            update_current_practice_session(**update_data)
+            update_current_practice_session(**{db_field: value})
 
     except Exception as e:
         logger.error(f"设置数据库session数据失败: {e}")
@@ -217,6 +331,9 @@ def create_and_store_practice_session(user_id: int, tiku_id: int, session_type:
 
         if result['success']:
             session_id = result['session_id']
+            previous_session_id = session.get(PRACTICE_SESSION_ID_KEY)
+            if previous_session_id and previous_session_id != session_id:
+                redis_manager.delete_practice_state(previous_session_id)
             # 只将会话ID和基本信息存储到Flask session cookie中
             session[PRACTICE_SESSION_ID_KEY] = session_id
             session[SESSION_KEYS['CURRENT_TIKU_ID']] = tiku_id
@@ -224,7 +341,9 @@ def create_and_store_practice_session(user_id: int, tiku_id: int, session_type:
             session[SESSION_KEYS['ROUND_NUMBER']] = 1
             session[SESSION_KEYS['INITIAL_TOTAL']] = total_questions
             session[SESSION_KEYS['CORRECT_FIRST_TRY']] = 0
+            session[ANSWER_EVENTS_SINCE_SNAPSHOT_KEY] = 0
             session.modified = True
+            user_stats_store.record_session_started(user_id)
 
             logger.info(f"创建练习会话成功: session_id={session_id} (大数据存储在数据库中)")
             return session_id
@@ -258,6 +377,48 @@ def update_current_practice_session(**kwargs) -> bool:
         return False
 
 
+def submit_practice_snapshot(session_id: Optional[int] = None) -> bool:
+    """将当前练习的完整状态作为快照登记到写回队列，快照写入后之前的答题事件被删除"""
+    session_id = session_id or session.get(PRACTICE_SESSION_ID_KEY)
+    if not session_id:
+        return False
+
+    snapshot = {
+        'current_question_index': get_session_value(SESSION_KEYS['CURRENT_INDEX'], 0),
+        'correct_first_try': get_session_value(SESSION_KEYS['CORRECT_FIRST_TRY'], 0),
+        'round_number': get_session_value(SESSION_KEYS['ROUND_NUMBER'], 1),
+        'question_indices': get_session_value(SESSION_KEYS['QUESTION_INDICES'], []),
+        'wrong_indices': get_session_value(SESSION_KEYS['WRONG_INDICES'], []),
+        'question_statuses': get_session_value(SESSION_KEYS['QUESTION_STATUSES'], []),
+        'answer_history': get_session_value(SESSION_KEYS['ANSWER_HISTORY'], {})
+    }
+    session[ANSWER_EVENTS_SINCE_SNAPSHOT_KEY] = 0
+    return practice_writer.submit(session_id, snapshot, snapshot=True)
+
+
+def record_practice_answer(event: Dict[str, Any]) -> bool:
+    """
+    登记一次答题：只追加一条答题事件和少量计数字段，
+    每 PRACTICE_SNAPSHOT_INTERVAL 次答题写一次完整快照
+    """
+    session_id = session.get(PRACTICE_SESSION_ID_KEY)
+    if not session_id:
+        logger.warning("没有找到练习会话ID，跳过数据库更新")
+        return False
+
+    events_since_snapshot = session.get(ANSWER_EVENTS_SINCE_SNAPSHOT_KEY, 0) + 1
+    if events_since_snapshot >= DatabaseConfig.PRACTICE_SNAPSHOT_INTERVAL:
+        return submit_practice_snapshot(session_id)
+
+    session[ANSWER_EVENTS_SINCE_SNAPSHOT_KEY] = events_since_snapshot
+    fields = {
+        'current_question_index': get_session_value(SESSION_KEYS['CURRENT_INDEX'], 0),
+        'correct_first_try': get_session_value(SESSION_KEYS['CORRECT_FIRST_TRY'], 0),
+        'round_number': get_session_value(SESSION_KEYS['ROUND_NUMBER'], 1)
+    }
+    return practice_writer.submit(session_id, fields, event=event)
+
+
 def complete_current_practice_session(final_stats: dict = None) -> bool:
     """完成当前的练习会话 - 优化版本"""
     session_id = session.get(PRACTICE_SESSION_ID_KEY)
@@ -266,16 +427,29 @@ def complete_current_practice_session(final_stats: dict = None) -> bool:
         return False
 
     try:
+        # 完成时写入最终快照，答题事件合并进会话记录
+        submit_practice_snapshot(session_id)
+        practice_writer.flush_session(session_id)
         result = complete_practice_session(session_id, final_stats)
         if result['success']:
+            if final_stats:
+                tiku = tiku_index.get(session.get(SESSION_KEYS['CURRENT_TIKU_ID']))
+                user_stats_store.record_session_completed(
+                    session.get(SESSION_KEYS['USER_ID']),
+                    tiku['subject_name'] if tiku else None,
+                    final_stats.get('total_questions', 0),
+                    final_stats.get('correct_answers', 0)
+                )
             # 清除Flask session中的会话ID和所有练习相关数据
             session.pop(PRACTICE_SESSION_ID_KEY, None)
+            session.pop(ANSWER_EVENTS_SINCE_SNAPSHOT_KEY, None)
             session.pop(SESSION_KEYS['CURRENT_TIKU_ID'], None)
             session.pop(SESSION_KEYS['CURRENT_INDEX'], None)
             session.pop(SESSION_KEYS['ROUND_NUMBER'], None)
             session.pop(SESSION_KEYS['INITIAL_TOTAL'], None)
             session.pop(SESSION_KEYS['CORRECT_FIRST_TRY'], None)
             session.modified = True
+            redis_manager.delete_practice_state(session_id)
 
             logger.info(f"完成练习会话成功: session_id={session_id}")
             return True
@@ -298,6 +472,10 @@ def check_and_resume_practice_session(user_id: int, tiku_id: int = None) -> Opti
     logger.debug(f"开始检查用户 {user_id} 的活跃练习会话")
 
     try:
+        current_session_id = session.get(PRACTICE_SESSION_ID_KEY)
+        if current_session_id:
+            practice_writer.flush_session(current_session_id)
+
         active_session = get_user_active_practice_session(user_id, tiku_id)
         logger.debug(f"查询活跃会话结果: {active_session is not None}")
 
@@ -313,6 +491,7 @@ def check_and_resume_practice_session(user_id: int, tiku_id: int = None) -> Opti
                 SESSION_KEYS['INITIAL_TOTAL']: active_session.get('total_questions', 0),
                 SESSION_KEYS['CORRECT_FIRST_TRY']: active_session.get('correct_first_try', 0),
                 SESSION_KEYS['SELECT_TYPES']: active_session.get('selected_types', []),
+                ANSWER_EVENTS_SINCE_SNAPSHOT_KEY: 0,
             }
 
             logger.debug(f"准备设置的 session 数据: {session_data_to_set}")
@@ -330,11 +509,9 @@ def check_and_resume_practice_session(user_id: int, tiku_id: int = None) -> Opti
                 logger.error(f"Session 设置验证失败！期望: {active_session['tiku_id']}, 实际: {verification_tiku_id}")
                 return None
 
-            # 大数据（question_indices, wrong_indices, question_statuses, answer_history）
-            set_session_value(SESSION_KEYS['QUESTION_INDICES'], active_session['question_indices'])
-            set_session_value(SESSION_KEYS['WRONG_INDICES'], active_session['wrong_indices'])
-            set_session_value(SESSION_KEYS['QUESTION_STATUSES'], active_session['question_statuses'])
-            set_session_value(SESSION_KEYS['ANSWER_HISTORY'], active_session['answer_history'])
+            # 大数据（question_indices, wrong_indices, question_statuses, answer_history）一次写入Redis练习状态
+            state = _practice_state_from_record(active_session)
+            set_session_values({key: state.get(part) for key, part in PRACTICE_STATE_KEYS.items()})
 
             logger.info(f"恢复活跃练习会话成功: session_id={active_session['id']}, tiku_id={active_session['tiku_id']}")
             return active_session
@@ -351,24 +528,26 @@ def check_and_resume_practice_session(user_id: int, tiku_id: int = None) -> Opti
 
 
 def clear_practice_session() -> None:
-    """清除练习相关的session数据 - 优化版本：只清除cookie中的数据"""
-    # 只清除cookie中的练习相关键（大数据在数据库中会通过会话管理自动清理）
+    """清除练习相关的session数据和Redis中的练习状态（数据库中的会话记录保留）"""
+    practice_session_id = session.get(PRACTICE_SESSION_ID_KEY)
+    if practice_session_id:
+        redis_manager.delete_practice_state(practice_session_id)
+
     practice_keys = [
         SESSION_KEYS['CURRENT_TIKU_ID'],
         SESSION_KEYS['CURRENT_INDEX'],
-        SESSION_KEYS['WRONG_INDICES'],
         SESSION_KEYS['ROUND_NUMBER'],
         SESSION_KEYS['INITIAL_TOTAL'],
         SESSION_KEYS['CORRECT_FIRST_TRY'],
-        PRACTICE_SESSION_ID_KEY  # 清除会话ID以断开与数据库的连接
+        ANSWER_EVENTS_SINCE_SNAPSHOT_KEY,
+        PRACTICE_SESSION_ID_KEY,  # 清除会话ID以断开与数据库的连接
+        *PRACTICE_STATE_KEYS  # 没有练习会话ID时存于Flask session的大数据
     ]
 
     for key in practice_keys:
         session.pop(key, None)
     session.modified = True
 
-    # 大数据在数据库中，会话结束时会自动标记为完成状态
-
 
 def clear_all_session() -> None:
     """清除所有session数据"""
@@ -379,7 +558,7 @@ def get_practice_session_summary() -> dict:
     """获取练习session的摘要信息"""
     return {
         'current_tiku_id': get_session_value(SESSION_KEYS['CURRENT_TIKU_ID']),
-        'total_questions': len(get_session_value(SESSION_KEYS['QUESTION_INDICES'], [])),
+        'total_questions': get_practice_question_count(),
         'current_index': get_session_value(SESSION_KEYS['CURRENT_INDEX'], 0),
         'round_number': get_session_value(SESSION_KEYS['ROUND_NUMBER'], 1),
         'correct_first_try': get_session_value(SESSION_KEYS['CORRECT_FIRST_TRY'], 0),
@@ -403,18 +582,16 @@ def load_session_from_db() -> None:
 
 
 def get_tiku_position_by_id(tiku_id: int) -> Optional[str]:
-    """根据题库ID获取题库位置标识符 (直接从数据库查询)"""
+    """根据题库ID获取题库位置标识符 (题库元数据索引O(1)查找)"""
     if not tiku_id:
         return None
 
     try:
-        # 直接从数据库获取题库列表，避免循环依赖
-        tiku_list = get_tiku_by_subject()
-        for tiku in tiku_list:
-            if tiku['tiku_id'] == tiku_id:
-                return tiku['tiku_position']
+        tiku = tiku_index.get(tiku_id)
+        if tiku:
+            return tiku['tiku_position']
 
-        logger.warning(f"在数据库中未找到 tiku_id: {tiku_id}")
+        logger.warning(f"在题库索引中未找到 tiku_id: {tiku_id}")
         return None
     except Exception as e:
         logger.error(f"获取题库位置失败: {e}")
@@ -422,7 +599,7 @@ def get_tiku_position_by_id(tiku_id: int) -> Optional[str]:
 
 
 def get_current_tiku_info() -> Optional[dict]:
-    """获取当前练习题库的详细信息 (直接从数据库查询)"""
+    """获取当前练习题库的详细信息 (题库元数据索引O(1)查找)"""
     tiku_id = get_session_value(SESSION_KEYS['CURRENT_TIKU_ID'])
     if not tiku_id:
         return None
@@ -435,13 +612,11 @@ def get_current_tiku_info() -> Optional[dict]:
         return None
 
     try:
-        # 直接从数据库获取题库列表，避免循环依赖
-        tiku_list = get_tiku_by_subject()
-        for tiku in tiku_list:
-            if tiku['tiku_id'] == tiku_id:
-                return tiku  # Return the whole tiku dict
+        tiku = tiku_index.get(tiku_id)
+        if tiku:
+            return tiku  # Return the whole tiku dict
 
-        logger.warning(f"在数据库中未找到当前 tiku_id: {tiku_id}")
+        logger.warning(f"在题库索引中未找到当前 tiku_id: {tiku_id}")
         return None
     except Exception as e:
         logger.error(f"获取当前题库信息失败: {e}")
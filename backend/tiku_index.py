@@ -0,0 +1,133 @@
+"""
+题库元数据索引 - tiku_id -> 题库信息 的O(1)查找
+Redis中以一个hash保存（附带版本号），每个worker进程持有一份本地副本，
+版本号变化或收到失效通知时才重新加载，热路径上不查询MySQL
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from .RedisManager import redis_manager
+from .connectDB import get_tiku_by_subject
+
+logger = logging.getLogger(__name__)
+
+
+class TikuIndex:
+    """进程内的版本化题库元数据索引"""
+
+    def __init__(self, loader: Callable[[], List[Dict[str, Any]]],
+                 check_interval: float = 5.0, max_stale: float = 60.0):
+        """
+        :param loader: 从数据库一次查询全部题库信息的函数
+        :param check_interval: 两次版本校验之间的最小间隔（秒）
+        :param max_stale: 版本号不可获取时本地副本的最长可用时间（秒）
+        """
+        self.redis_manager = redis_manager
+        self._loader = loader
+        self._check_interval = check_interval
+        self._max_stale = max_stale
+
+        self._entries: Optional[Dict[int, Dict[str, Any]]] = None
+        self._version = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self._hits = 0
+        self._loads = 0
+        self._db_loads = 0
+
+    def _is_fresh(self, now: float) -> bool:
+        """检查本地副本是否仍与Redis中的版本一致"""
+        if self._entries is None:
+            return False
+        if now - self._checked_at < self._check_interval:
+            return True
+
+        current_version = self.redis_manager.get_tiku_index_version()
+        if current_version is None:
+            # Redis不可用时在容忍时间内继续使用本地副本
+            return now - self._loaded_at < self._max_stale
+
+        if current_version == self._version:
+            self._checked_at = now
+            return True
+        return False
+
+    def _reload(self) -> None:
+        """从Redis加载索引，Redis中没有时查询一次数据库并写回Redis"""
+        version = self.redis_manager.get_tiku_index_version()
+        entries = self.redis_manager.get_tiku_index()
+
+        if entries is None:
+            tikus = self._loader()
+            entries = {tiku['tiku_id']: tiku for tiku in tikus}
+            stored_version = self.redis_manager.store_tiku_index(tikus)
+            if stored_version is not None:
+                version = stored_version
+            self._db_loads += 1
+            logger.info(f"从数据库加载题库元数据索引: {len(entries)} 个题库")
+
+        now = time.time()
+        self._entries = entries
+        self._version = version
+        self._loaded_at = now
+        self._checked_at = now
+        self._loads += 1
+
+    def get(self, tiku_id: Any) -> Optional[Dict[str, Any]]:
+        """按题库ID获取题库信息（副本），不存在返回None"""
+        try:
+            tiku_id = int(tiku_id)
+        except (TypeError, ValueError):
+            return None
+
+        if not self._is_fresh(time.time()):
+            with self._lock:
+                # 双重检查：等待锁期间可能已被其他线程重新加载
+                if not self._is_fresh(time.time()):
+                    self._reload()
+        else:
+            self._hits += 1
+
+        tiku = (self._entries or {}).get(tiku_id)
+        return dict(tiku) if tiku is not None else None
+
+    def rebuild(self, tikus: List[Dict[str, Any]]) -> None:
+        """用最新的题库列表覆盖Redis中的索引（版本号递增，其他进程随之重新加载）"""
+        version = self.redis_manager.store_tiku_index(tikus)
+        with self._lock:
+            self._entries = {tiku['tiku_id']: tiku for tiku in tikus}
+            self._version = version
+            self._loaded_at = self._checked_at = time.time()
+
+    def invalidate(self) -> None:
+        """丢弃本地副本，下次访问时重新加载"""
+        with self._lock:
+            self._entries = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取索引统计信息"""
+        return {
+            'tiku_count': len(self._entries or {}),
+            'version': self._version,
+            'hits': self._hits,
+            'loads': self._loads,
+            'db_loads': self._db_loads
+        }
+
+
+# 全局题库元数据索引实例
+tiku_index = TikuIndex(loader=get_tiku_by_subject)
+
+
+def _handle_cache_invalidation(scope: str, target_id: Optional[int]) -> None:
+    """科目/题库列表变化时丢弃本进程的索引副本"""
+    if scope in ('catalog', 'all'):
+        tiku_index.invalidate()
+
+
+redis_manager.register_invalidation_handler(_handle_cache_invalidation)
@@ -0,0 +1,254 @@
+"""
+使用统计分析
+- 每次使用题库时，在累加使用次数的同一个pipeline中按小时/按天分桶累加题库和科目的有序集合，
+  同时累加总排行有序集合，排行随使用增量更新
+- 后台监控线程定期用数据库中的累计次数加上尚未写库的次数重建总排行，并生成汇总文档缓存到Redis，
+  统计接口只读取汇总文档；最近N天/N小时的排行由对应时间桶合并得到，
+  合并结果连同总次数和成员数一起缓存，重复查询只读取排行前N项
+"""
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from .RedisManager import redis_manager
+from .config import RedisConfig
+from .connectDB import get_usage_totals
+from .tiku_index import tiku_index
+from .usage_counter import usage_counter
+
+logger = logging.getLogger(__name__)
+
+# 合并时间窗口：合并结果（KEYS[1]）和其总次数/成员数（KEYS[2]）不存在时，由 KEYS[3..] 的时间桶合并生成，
+# 两者有效期相同（ARGV[1]秒）。脚本在Redis中原子执行，并发请求不会重复合并同一窗口
+_BUILD_WINDOW_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return 0
+end
+local buckets = {}
+for i = 3, #KEYS do
+    buckets[#buckets + 1] = KEYS[i]
+end
+local count = redis.call('ZUNIONSTORE', KEYS[1], #buckets, unpack(buckets))
+local total = 0
+local members = redis.call('ZRANGE', KEYS[1], 0, -1, 'WITHSCORES')
+for i = 2, #members, 2 do
+    total = total + tonumber(members[i])
+end
+redis.call('HSET', KEYS[2], 'total', total, 'count', count)
+redis.call('EXPIRE', KEYS[2], ARGV[1])
+if count > 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return 1
+"""
+
+# 时间桶粒度 -> (键中的时间格式, 每个桶的秒数)
+BUCKET_FORMATS = {
+    'hour': ('%Y%m%d%H', 3600),
+    'day': ('%Y%m%d', 86400)
+}
+
+
+class UsageAnalytics:
+    """基于Redis有序集合的使用统计：分桶计数 + 总排行 + 汇总文档"""
+
+    _SUMMARY_CACHE_KEY = 'usage_summary'
+
+    def __init__(self, key_prefix: str = 'usage:', hour_retention: int = 48, day_retention: int = 90,
+                 summary_ttl: int = 300, window_cache_ttl: int = 60,
+                 top_subjects: int = 50, top_tikus: int = 100):
+        self._prefix = key_prefix
+        self._retention = {'hour': hour_retention, 'day': day_retention}
+        self._summary_ttl = summary_ttl
+        self._window_cache_ttl = window_cache_ttl
+        self._top_subjects = top_subjects
+        self._top_tikus = top_tikus
+
+        # Redis不可用时使用的本进程汇总文档
+        self._local_summary: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    # =========================
+    # 写入：分桶计数和总排行
+    # =========================
+
+    def _top_key(self, dimension: str) -> str:
+        return f'{self._prefix}top:{dimension}'
+
+    def _bucket_key(self, dimension: str, granularity: str, timestamp: float) -> str:
+        time_format = BUCKET_FORMATS[granularity][0]
+        return f'{self._prefix}{dimension}:{granularity}:{time.strftime(time_format, time.localtime(timestamp))}'
+
+    def record(self, pipe, tiku_id: int, amount: int) -> None:
+        """在使用次数计数的pipeline中追加分桶计数和总排行的增量"""
+        tiku = tiku_index.get(tiku_id)
+        members = {'tiku': tiku_id}
+        if tiku:
+            members['subject'] = tiku['subject_id']
+
+        now = time.time()
+        for dimension, member in members.items():
+            pipe.zincrby(self._top_key(dimension), amount, member)
+            for granularity, (_, bucket_seconds) in BUCKET_FORMATS.items():
+                bucket_key = self._bucket_key(dimension, granularity, now)
+                pipe.zincrby(bucket_key, amount, member)
+                # 保留期再加一个桶，保证最早的完整窗口仍可查询
+                pipe.expire(bucket_key, (self._retention[granularity] + 1) * bucket_seconds)
+
+    # =========================
+    # 汇总文档
+    # =========================
+
+    def refresh_summary(self) -> Optional[Dict[str, Any]]:
+        """用数据库累计次数 + 尚未写库的次数重建总排行，并生成汇总文档（由后台监控线程定期调用）"""
+        totals = get_usage_totals()
+        if not totals['success']:
+            logger.error(f"重建使用统计失败: {totals['error']}")
+            return None
+
+        pending = usage_counter.get_pending_counts()
+        tiku_counts = {}
+        subject_counts = {subject['subject_id']: subject['used_count'] for subject in totals['subjects']}
+        for tiku in totals['tikus']:
+            pending_count = pending.get(tiku['tiku_id'], 0)
+            tiku_counts[tiku['tiku_id']] = tiku['used_count'] + pending_count
+            if tiku['subject_id'] in subject_counts:
+                subject_counts[tiku['subject_id']] += pending_count
+
+        summary = self._build_summary(totals, tiku_counts, subject_counts)
+        self._store_rankings(tiku_counts, subject_counts)
+        redis_manager.cache_set(self._SUMMARY_CACHE_KEY, summary, self._summary_ttl)
+        with self._lock:
+            self._local_summary = summary
+        return summary
+
+    def _build_summary(self, totals: Dict[str, Any], tiku_counts: Dict[int, int],
+                       subject_counts: Dict[int, int]) -> Dict[str, Any]:
+        subjects = {subject['subject_id']: subject for subject in totals['subjects']}
+        tikus = {tiku['tiku_id']: tiku for tiku in totals['tikus']}
+
+        top_subjects = sorted(subject_counts.items(), key=lambda item: item[1], reverse=True)
+        top_tikus = sorted(tiku_counts.items(), key=lambda item: item[1], reverse=True)
+
+        return {
+            'generated_at': time.time(),
+            'subject_stats': [{'subject_name': subjects[subject_id]['subject_name'], 'used_count': count}
+                              for subject_id, count in top_subjects[:self._top_subjects]],
+            'tiku_stats': [self._tiku_entry(tikus[tiku_id], count) for tiku_id, count in top_tikus[:self._top_tikus]],
+            'total_subject_usage': sum(subject_counts.values()),
+            'total_tiku_usage': sum(tiku_counts.values()),
+            'active_subjects_count': sum(1 for count in subject_counts.values() if count > 0),
+            'active_tikues_count': sum(1 for count in tiku_counts.values() if count > 0),
+            'total_subjects': len(subject_counts),
+            'total_tikues': len(tiku_counts),
+            # 时间窗口排行只有ID，用这里的名称信息补全（JSON键为字符串）
+            'subject_names': {str(subject_id): subject['subject_name'] for subject_id, subject in subjects.items()},
+            'tiku_names': {str(tiku_id): {key: tiku[key] for key in ('tiku_name', 'subject_name', 'tiku_position')}
+                           for tiku_id, tiku in tikus.items()}
+        }
+
+    @staticmethod
+    def _tiku_entry(tiku: Dict[str, Any], count: int) -> Dict[str, Any]:
+        return {
+            'tiku_name': tiku['tiku_name'],
+            'subject_name': tiku['subject_name'],
+            'used_count': count,
+            'tiku_position': tiku['tiku_position']
+        }
+
+    def _store_rankings(self, tiku_counts: Dict[int, int], subject_counts: Dict[int, int]) -> None:
+        """在一个事务中整体替换总排行有序集合，纠正增量累加的偏差（如题库被删除）"""
+        if not redis_manager.is_available:
+            return
+
+        try:
+            with redis_manager.client.pipeline() as pipe:
+                for dimension, counts in (('tiku', tiku_counts), ('subject', subject_counts)):
+                    pipe.delete(self._top_key(dimension))
+                    if counts:
+                        pipe.zadd(self._top_key(dimension), counts)
+                pipe.execute()
+        except Exception as e:
+            redis_manager.record_failure(e)
+            logger.error(f"重建使用排行失败: {e}")
+
+    def get_summary(self) -> Optional[Dict[str, Any]]:
+        """读取汇总文档：优先Redis，其次本进程副本，都没有时立即生成"""
+        summary = redis_manager.cache_get(self._SUMMARY_CACHE_KEY)
+        if summary is not None:
+            return summary
+
+        with self._lock:
+            summary = self._local_summary
+        if summary is not None and time.time() - summary['generated_at'] < self._summary_ttl:
+            return summary
+        return self.refresh_summary()
+
+    # =========================
+    # 时间窗口排行
+    # =========================
+
+    def max_window(self, granularity: str) -> int:
+        """按该粒度可查询的最大窗口（桶数）"""
+        return self._retention[granularity]
+
+    def get_window_stats(self, granularity: str, span: int, subject_limit: int,
+                         tiku_limit: int) -> Optional[Dict[str, Any]]:
+        """
+        最近 span 个小时/天（含当前桶）的科目和题库排行，Redis不可用时返回None
+        合并结果缓存 window_cache_ttl 秒，同一窗口的重复查询只读取合并后的有序集合
+        """
+        summary = self.get_summary()
+        if summary is None or not redis_manager.is_available:
+            return None
+
+        span = max(1, min(span, self._retention[granularity]))
+        bucket_seconds = BUCKET_FORMATS[granularity][1]
+        now = time.time()
+
+        try:
+            result = {}
+            client = redis_manager.client
+            with client.pipeline(transaction=False) as pipe:
+                for dimension, limit in (('subject', subject_limit), ('tiku', tiku_limit)):
+                    bucket_keys = [self._bucket_key(dimension, granularity, now - offset * bucket_seconds)
+                                   for offset in range(span)]
+                    window_key = f'{bucket_keys[0]}:last{span}'
+                    # 窗口未缓存时先合并（同一pipeline中按顺序执行），之后只读取前N项和缓存的总数
+                    pipe.eval(_BUILD_WINDOW_SCRIPT, len(bucket_keys) + 2, window_key, f'{window_key}:meta',
+                              *bucket_keys, self._window_cache_ttl)
+                    pipe.zrevrange(window_key, 0, limit - 1, withscores=True)
+                    pipe.hmget(f'{window_key}:meta', 'total', 'count')
+                replies = pipe.execute()
+
+            for i, dimension in enumerate(('subject', 'tiku')):
+                _, top, (total, count) = replies[i * 3:i * 3 + 3]
+                result[dimension] = [(int(member), int(score)) for member, score in top]
+                result[f'{dimension}_total'] = int(float(total or 0))
+                result[f'{dimension}_count'] = int(count or 0)
+        except Exception as e:
+            redis_manager.record_failure(e)
+            logger.error(f"读取时间窗口使用排行失败: {e}")
+            return None
+
+        subject_names = summary['subject_names']
+        tiku_names = summary['tiku_names']
+        return {
+            'granularity': granularity,
+            'span': span,
+            'subject_stats': [{'subject_name': subject_names.get(str(subject_id), str(subject_id)),
+                               'used_count': count} for subject_id, count in result['subject']],
+            'tiku_stats': [dict(tiku_names.get(str(tiku_id), {'tiku_name': str(tiku_id), 'subject_name': None,
+                                                              'tiku_position': None}), used_count=count)
+                           for tiku_id, count in result['tiku']],
+            'total_subject_usage': result['subject_total'],
+            'total_tiku_usage': result['tiku_total'],
+            'total_subjects': result['subject_count'],
+            'total_tikues': result['tiku_count']
+        }
+
+
+# 全局使用统计实例，注册到使用次数计数器：每次计数时同一pipeline内更新分桶和排行
+usage_analytics = UsageAnalytics(**RedisConfig.USAGE_ANALYTICS_CONFIG)
+usage_counter.register_increment_handler(usage_analytics.record)
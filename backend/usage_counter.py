@@ -0,0 +1,272 @@
+"""
+题库使用次数计数
+- 各worker进程通过 HINCRBY 原子累加到Redis共享hash，worker回收或重启不丢计数
+- 每个worker一个后台线程，通过Redis锁选出一个worker定期把计数批量写入MySQL
+- 写库前先把待写hash改名为写库中hash，写库失败时保留下来下次重试；Redis不可用时暂存在进程内
+- 写库锁带持有者令牌：写库前确认仍持有并续期，只有仍持有锁时才删除写库中hash，避免锁过期后被其他worker重复写库
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+import redis
+
+from .RedisManager import redis_manager
+from .config import RedisConfig
+from .connectDB import batch_update_tiku_usage
+
+logger = logging.getLogger(__name__)
+
+# 仍持有锁（值等于令牌）时续期
+_EXTEND_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# 仍持有锁时删除 KEYS[2]（未指定则只释放锁）；ARGV[2] 为 1 时同时释放锁
+_DELETE_IF_OWNER_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+if KEYS[2] then
+    redis.call('DEL', KEYS[2])
+end
+if ARGV[2] == '1' then
+    redis.call('DEL', KEYS[1])
+end
+return 1
+"""
+
+
+class UsageCounter:
+    """题库使用次数计数器：Redis共享计数 + 选主批量写库"""
+
+    def __init__(self, key_prefix: str = 'usage:tiku:', flush_interval: float = 30, lock_ttl: int = 300):
+        self._pending_key = f'{key_prefix}pending'
+        self._flushing_key = f'{key_prefix}flushing'
+        self._lock_key = f'{key_prefix}flush_lock'
+        self._round_key = f'{key_prefix}flush_round'
+        self._interval = flush_interval
+        self._lock_ttl = lock_ttl
+
+        # Redis不可用时的进程内暂存计数
+        self._local_counts: Dict[int, int] = defaultdict(int)
+        # 计数时在同一pipeline中追加命令的处理函数 (pipe, tiku_id, amount)，如使用统计分桶
+        self._increment_handlers: List[Callable[[Any, int, int], None]] = []
+        self._pid = None
+        self._lock = threading.Lock()
+
+        # 统计信息（本进程）
+        self._stats = {
+            'increments': 0,
+            'local_fallbacks': 0,
+            'flushes': 0,
+            'flushed_tikus': 0,
+            'flushed_usages': 0,
+            'flush_failures': 0,
+            'lock_lost': 0,
+            'last_flush_at': None,
+            'last_flush_ms': 0.0
+        }
+
+    def register_increment_handler(self, handler: Callable[[Any, int, int], None]) -> None:
+        """注册计数处理函数，每次计数时以 (pipeline, tiku_id, amount) 调用，与计数一起发送"""
+        self._increment_handlers.append(handler)
+
+    def _add_increment(self, pipe, tiku_id: int, amount: int) -> None:
+        pipe.hincrby(self._pending_key, tiku_id, amount)
+        for handler in self._increment_handlers:
+            try:
+                handler(pipe, tiku_id, amount)
+            except Exception as e:
+                logger.error(f"题库使用次数处理函数出错: {e}")
+
+    def increment(self, tiku_id: int, amount: int = 1) -> None:
+        """增加题库使用次数"""
+        with self._lock:
+            self._stats['increments'] += 1
+
+        if redis_manager.is_available:
+            try:
+                with redis_manager.client.pipeline(transaction=False) as pipe:
+                    self._add_increment(pipe, tiku_id, amount)
+                    pipe.execute()
+                return
+            except Exception as e:
+                redis_manager.record_failure(e)
+                logger.warning(f"累加题库 {tiku_id} 使用次数到Redis失败，暂存在进程内: {e}")
+
+        with self._lock:
+            self._local_counts[tiku_id] += amount
+            self._stats['local_fallbacks'] += 1
+
+    def get_pending_counts(self) -> Dict[int, int]:
+        """尚未写入数据库的使用次数（Redis待写、写库中和进程内暂存之和）"""
+        with self._lock:
+            counts = defaultdict(int, self._local_counts)
+
+        if redis_manager.is_available:
+            try:
+                with redis_manager.client.pipeline(transaction=False) as pipe:
+                    pipe.hgetall(self._pending_key)
+                    pipe.hgetall(self._flushing_key)
+                    for raw in pipe.execute():
+                        for tiku_id, count in raw.items():
+                            counts[int(tiku_id)] += int(count)
+            except Exception as e:
+                redis_manager.record_failure(e)
+                logger.warning(f"读取待写入的题库使用次数失败: {e}")
+        return dict(counts)
+
+    def ensure_started(self) -> None:
+        """按进程懒启动写库线程（Gunicorn preload_app 下fork后需在worker进程内重新启动）"""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._pid = pid
+            # fork前父进程暂存的计数属于父进程
+            self._local_counts = defaultdict(int)
+            threading.Thread(target=self._loop, name="usage_counter", daemon=True).start()
+
+    def _loop(self) -> None:
+        while True:
+            time.sleep(self._interval)
+            try:
+                self.flush_local()
+                # 轮次标记的有效期与间隔相同：本轮由一个worker写库，其他worker跳过
+                if (redis_manager.is_available and
+                        redis_manager.client.set(self._round_key, os.getpid(), nx=True, ex=int(self._interval))):
+                    self._flush_with_lock()
+            except Exception as e:
+                redis_manager.record_failure(e)
+                logger.error(f"题库使用次数写库任务出错: {e}")
+
+    def flush_local(self) -> None:
+        """把进程内暂存的计数并入Redis；Redis仍不可用时直接写入数据库"""
+        with self._lock:
+            if not self._local_counts:
+                return
+            counts = dict(self._local_counts)
+            self._local_counts.clear()
+
+        if redis_manager.is_available:
+            try:
+                with redis_manager.client.pipeline(transaction=False) as pipe:
+                    for tiku_id, count in counts.items():
+                        self._add_increment(pipe, tiku_id, count)
+                    pipe.execute()
+                return
+            except Exception as e:
+                redis_manager.record_failure(e)
+                logger.warning(f"暂存的题库使用次数并入Redis失败，直接写库: {e}")
+
+        if not self._write(counts):
+            self._restore_local(counts)
+
+    def _flush_with_lock(self) -> Optional[Dict[str, Any]]:
+        """获取带令牌的写库锁后写库，完成后释放；锁被其他worker持有时跳过"""
+        client = redis_manager.client
+        token = uuid.uuid4().hex
+        if not client.set(self._lock_key, token, nx=True, ex=self._lock_ttl):
+            return None
+        try:
+            return self.flush_once(token)
+        finally:
+            client.eval(_DELETE_IF_OWNER_SCRIPT, 1, self._lock_key, token, 1)
+
+    def flush_once(self, token: str) -> Optional[Dict[str, Any]]:
+        """
+        把Redis中累计的使用次数写入数据库（只应由持有写库锁、令牌为 token 的worker调用）
+        待写hash先改名为写库中hash，之后的HINCRBY写入新的待写hash；写库成功后才删除写库中hash
+        写库前确认仍持有锁并续期，删除写库中hash时再次确认，锁已丢失则交给新的持有者处理
+        """
+        client = redis_manager.client
+        # 上次写库失败留下的写库中hash优先重试，不改名覆盖
+        if not client.exists(self._flushing_key):
+            try:
+                client.rename(self._pending_key, self._flushing_key)
+            except redis.ResponseError:
+                # 待写hash不存在：没有新的使用记录
+                return None
+
+        counts = {int(tiku_id): int(count) for tiku_id, count in client.hgetall(self._flushing_key).items()
+                  if int(count) > 0}
+        if counts:
+            if not client.eval(_EXTEND_LOCK_SCRIPT, 1, self._lock_key, token, self._lock_ttl):
+                self._lock_lost()
+                return None
+            if not self._write(counts):
+                return None
+
+        if not client.eval(_DELETE_IF_OWNER_SCRIPT, 2, self._lock_key, self._flushing_key, token, 0):
+            self._lock_lost()
+            return None
+        return counts
+
+    def _lock_lost(self) -> None:
+        with self._lock:
+            self._stats['lock_lost'] += 1
+        logger.error("题库使用次数写库锁已过期被其他worker获取，放弃本次写库（请调大 lock_ttl）")
+
+    def _write(self, counts: Dict[int, int]) -> bool:
+        """批量写入数据库并记录统计"""
+        if not counts:
+            return True
+
+        start_time = time.perf_counter()
+        try:
+            result = batch_update_tiku_usage(counts)
+        except Exception as e:
+            result = {'success': False, 'error': str(e)}
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+
+        with self._lock:
+            if not result['success']:
+                self._stats['flush_failures'] += 1
+            else:
+                self._stats['flushes'] += 1
+                self._stats['flushed_tikus'] += len(counts)
+                self._stats['flushed_usages'] += sum(counts.values())
+                self._stats['last_flush_at'] = time.time()
+                self._stats['last_flush_ms'] = elapsed_ms
+
+        if not result['success']:
+            logger.error(f"题库使用次数写库失败: {result['error']}")
+            return False
+
+        logger.info(f"题库使用次数写库完成: {len(counts)} 个题库，共 {sum(counts.values())} 次，耗时 {elapsed_ms:.0f}ms")
+        return True
+
+    def _restore_local(self, counts: Dict[int, int]) -> None:
+        with self._lock:
+            for tiku_id, count in counts.items():
+                self._local_counts[tiku_id] += count
+
+    def shutdown(self) -> None:
+        """进程退出前处理暂存在进程内的计数"""
+        try:
+            self.flush_local()
+        except Exception as e:
+            logger.error(f"退出前写入题库使用次数失败: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取计数器统计信息"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['local_pending_tikus'] = len(self._local_counts)
+        stats['flush_interval'] = self._interval
+        return stats
+
+
+# 全局题库使用次数计数器
+usage_counter = UsageCounter(**RedisConfig.USAGE_COUNTER_CONFIG)
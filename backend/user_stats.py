@@ -0,0 +1,258 @@
+"""
+用户练习统计读模型
+每个用户一个Redis汇总hash：会话数、题目数、答对数及按科目的分项，开始/完成练习时HINCRBY增量更新，
+统计页面只读一次hash；hash缺失或过期时从数据库（练习统计表 + 练习会话计数）重建，包含全部历史
+"""
+import json
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import redis
+
+from .RedisManager import redis_manager
+from .config import RedisConfig
+from .connectDB import get_user_practice_history, get_user_statistics_summary
+
+logger = logging.getLogger(__name__)
+
+# 汇总hash中的字段
+_BUILT_FIELD = '_built'  # 完整重建的标记：增量命令可能在hash过期后建出不完整的hash，没有该标记视为缺失
+_RECENT_FIELD = 'recent'  # 最近练习记录（JSON，时间为ISO字符串；开始/完成练习时删除，读取时重新查询）
+_OVERALL_FIELDS = ('total_sessions', 'completed_sessions', 'total_questions', 'total_correct')
+_SUBJECT_METRICS = ('sessions', 'total_questions', 'correct_answers')
+_SUBJECT_FIELD_PREFIX = 'subject:'
+
+
+def _subject_field(subject_name: str, metric: str) -> str:
+    return f'{_SUBJECT_FIELD_PREFIX}{subject_name}:{metric}'
+
+
+def _score(correct: int, total: int) -> float:
+    return round(correct / total * 100, 2) if total > 0 else 0
+
+
+def _recent_to_json(recent: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """最近练习记录中的时间转为ISO字符串，缓存和直接查询返回相同的格式"""
+    return [{field: value.isoformat() if isinstance(value, datetime) else value for field, value in entry.items()}
+            for entry in recent]
+
+
+class UserStatsStore:
+    """用户练习统计读模型"""
+
+    def __init__(self, key_prefix: str = 'user_stats:', ttl: int = 7 * 86400, recent_limit: int = 10):
+        self._key_prefix = key_prefix
+        self._ttl = ttl
+        self._recent_limit = recent_limit
+
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'rebuilds': 0, 'recent_loads': 0, 'increments': 0, 'rebuild_conflicts': 0,
+                       'errors': 0}
+
+    def _key(self, user_id: int) -> str:
+        return f'{self._key_prefix}{user_id}'
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    # =========================
+    # 增量更新
+    # =========================
+
+    def _increment(self, user_id: int, increments: Dict[str, int]) -> None:
+        """对汇总hash执行HINCRBY并删除最近练习记录；hash不存在时建出的不完整hash会在读取时重建"""
+        if not redis_manager.is_available:
+            return
+
+        try:
+            key = self._key(user_id)
+            with redis_manager.client.pipeline(transaction=False) as pipe:
+                for field, amount in increments.items():
+                    pipe.hincrby(key, field, amount)
+                pipe.hdel(key, _RECENT_FIELD)
+                pipe.expire(key, self._ttl)
+                pipe.execute()
+            self._count('increments')
+        except Exception as e:
+            redis_manager.record_failure(e)
+            self._count('errors')
+            logger.warning(f"增量更新用户 {user_id} 的练习统计失败: {e}")
+
+    def record_session_started(self, user_id: int) -> None:
+        """开始新练习会话"""
+        self._increment(user_id, {'total_sessions': 1})
+
+    def record_session_completed(self, user_id: int, subject_name: Optional[str], total_questions: int,
+                                 correct_answers: int) -> None:
+        """练习会话完成（与练习统计表的累加保持一致）"""
+        subject_name = subject_name or 'Unknown'
+        self._increment(user_id, {
+            'completed_sessions': 1,
+            'total_questions': total_questions,
+            'total_correct': correct_answers,
+            _subject_field(subject_name, 'sessions'): 1,
+            _subject_field(subject_name, 'total_questions'): total_questions,
+            _subject_field(subject_name, 'correct_answers'): correct_answers
+        })
+
+    # =========================
+    # 读取
+    # =========================
+
+    def get_statistics(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """获取用户练习统计（overall / by_subject / recent_activity），数据库不可用时返回None"""
+        raw = self._read(user_id)
+        if raw is None:
+            raw = self._rebuild(user_id)
+            if raw is None:
+                return None
+        else:
+            self._count('hits')
+
+        recent = raw.get(_RECENT_FIELD)
+        if recent is None:
+            recent = _recent_to_json(get_user_practice_history(user_id, self._recent_limit))
+            self._store_fields(user_id, {_RECENT_FIELD: json.dumps(recent, ensure_ascii=False)})
+            self._count('recent_loads')
+
+        return self._format(raw, recent)
+
+    def _read(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """读取完整的汇总hash，不存在或不完整时返回None"""
+        if not redis_manager.is_available:
+            return None
+
+        try:
+            raw = redis_manager.client.hgetall(self._key(user_id))
+        except Exception as e:
+            redis_manager.record_failure(e)
+            self._count('errors')
+            logger.warning(f"读取用户 {user_id} 的练习统计失败: {e}")
+            return None
+
+        fields = {field.decode('utf-8') if isinstance(field, bytes) else field: value for field, value in raw.items()}
+        if _BUILT_FIELD not in fields:
+            return None
+
+        result = {}
+        for field, value in fields.items():
+            if field == _RECENT_FIELD:
+                try:
+                    result[field] = json.loads(value)
+                except ValueError:
+                    pass  # 无法解析的旧格式记录视为缺失，读取时重新查询
+            elif field != _BUILT_FIELD:
+                result[field] = int(value)
+        return result
+
+    def _rebuild(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """
+        从数据库汇总全部历史并整体写入汇总hash
+        读取数据库前WATCH汇总hash：期间有增量更新（或其他请求已完成重建）时放弃写入，
+        避免用旧快照覆盖并发的HINCRBY；本次仍返回数据库汇总，下次读取时重新重建
+        """
+        pipe = self._watch(user_id)
+        try:
+            summary = get_user_statistics_summary(user_id)
+            if summary is None:
+                return None
+            self._count('rebuilds')
+
+            raw = {
+                'total_sessions': summary['total_sessions'],
+                'completed_sessions': summary['completed_sessions'],
+                'total_questions': sum(stats['total_questions'] for stats in summary['by_subject'].values()),
+                'total_correct': sum(stats['correct_answers'] for stats in summary['by_subject'].values())
+            }
+            for subject_name, stats in summary['by_subject'].items():
+                for metric in _SUBJECT_METRICS:
+                    raw[_subject_field(subject_name, metric)] = stats[metric]
+
+            if pipe is not None:
+                self._replace(pipe, user_id, dict(raw, **{_BUILT_FIELD: 1}))
+            return raw
+        finally:
+            if pipe is not None:
+                pipe.reset()
+
+    def _watch(self, user_id: int):
+        """WATCH汇总hash，返回用于之后替换的pipeline；Redis不可用时返回None"""
+        if not redis_manager.is_available:
+            return None
+
+        pipe = redis_manager.client.pipeline()
+        try:
+            pipe.watch(self._key(user_id))
+            return pipe
+        except Exception as e:
+            pipe.reset()
+            redis_manager.record_failure(e)
+            self._count('errors')
+            logger.warning(f"监视用户 {user_id} 的练习统计失败: {e}")
+            return None
+
+    def _replace(self, pipe, user_id: int, fields: Dict[str, Any]) -> None:
+        """在WATCH之后的事务中整体替换汇总hash，汇总hash被并发修改时放弃"""
+        try:
+            key = self._key(user_id)
+            pipe.multi()
+            pipe.delete(key)
+            pipe.hset(key, mapping=fields)
+            pipe.expire(key, self._ttl)
+            pipe.execute()
+        except redis.WatchError:
+            self._count('rebuild_conflicts')
+            logger.debug(f"用户 {user_id} 的练习统计在重建期间被修改，放弃写入")
+        except Exception as e:
+            redis_manager.record_failure(e)
+            self._count('errors')
+            logger.warning(f"写入用户 {user_id} 的练习统计失败: {e}")
+
+    def _store_fields(self, user_id: int, fields: Dict[str, Any]) -> None:
+        if not redis_manager.is_available:
+            return
+
+        try:
+            key = self._key(user_id)
+            with redis_manager.client.pipeline() as pipe:
+                pipe.hset(key, mapping=fields)
+                pipe.expire(key, self._ttl)
+                pipe.execute()
+        except Exception as e:
+            redis_manager.record_failure(e)
+            self._count('errors')
+            logger.warning(f"写入用户 {user_id} 的练习统计失败: {e}")
+
+    @staticmethod
+    def _format(raw: Dict[str, Any], recent: list) -> Dict[str, Any]:
+        """汇总hash转为接口返回格式"""
+        by_subject: Dict[str, Dict[str, Any]] = {}
+        for field, value in raw.items():
+            if not field.startswith(_SUBJECT_FIELD_PREFIX):
+                continue
+            subject_name, metric = field[len(_SUBJECT_FIELD_PREFIX):].rsplit(':', 1)
+            by_subject.setdefault(subject_name, dict.fromkeys(_SUBJECT_METRICS, 0))[metric] = value
+
+        for stats in by_subject.values():
+            stats['avg_score'] = _score(stats['correct_answers'], stats['total_questions'])
+
+        overall = {field: raw.get(field, 0) for field in _OVERALL_FIELDS}
+        overall['avg_score'] = _score(overall['total_correct'], overall['total_questions'])
+
+        return {
+            'overall': overall,
+            'by_subject': by_subject,
+            'recent_activity': recent
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取读模型统计信息"""
+        with self._lock:
+            return dict(self._stats)
+
+
+# 全局用户练习统计读模型
+user_stats_store = UserStatsStore(**RedisConfig.USER_STATS_CONFIG)
@@ -8,10 +8,9 @@ import math
 from datetime import datetime
 from typing import Optional, Any, Dict, List, Union
 from flask import Response, jsonify
-import pandas as pd
 from .config import (
     TRUE_ANSWER_STRINGS, FALSE_ANSWER_STRINGS, 
-    INTERNAL_TRUE, INTERNAL_FALSE, QUESTION_COLUMN, ANSWER_COLUMN
+    INTERNAL_TRUE, INTERNAL_FALSE
 )
 
 logger = logging.getLogger(__name__)
@@ -30,25 +29,27 @@ def create_response(success: bool = True, message: str = '', data: Any = None, s
     return jsonify(response_data), status_code
 
 
+# 判断题答案查找表：大写答案文本 -> 内部表示，预先构建以便一次字典查询完成标准化
+TF_ANSWER_MAP = {
+    **{false_str.upper(): INTERNAL_FALSE for false_str in FALSE_ANSWER_STRINGS},
+    **{true_str.upper(): INTERNAL_TRUE for true_str in TRUE_ANSWER_STRINGS},
+    INTERNAL_TRUE: INTERNAL_TRUE,
+    INTERNAL_FALSE: INTERNAL_FALSE
+}
+
+
 def standardize_tf_answer(answer_text: Optional[str]) -> Optional[str]:
     """标准化判断题答案"""
     if not isinstance(answer_text, str):
         return None
-    answer_upper = answer_text.strip().upper()
-    if answer_upper == INTERNAL_TRUE or any(true_str.upper() == answer_upper for true_str in TRUE_ANSWER_STRINGS):
-        return INTERNAL_TRUE
-    if answer_upper == INTERNAL_FALSE or any(false_str.upper() == answer_upper for false_str in FALSE_ANSWER_STRINGS):
-        return INTERNAL_FALSE
-    return None
+    return TF_ANSWER_MAP.get(answer_text.strip().upper())
 
 
 def is_tf_answer(answer_text: str) -> bool:
     """检查是否为判断题答案"""
     if not isinstance(answer_text, str):
         return False
-    answer_upper = answer_text.strip().upper()
-    return (any(true_str.upper() == answer_upper for true_str in TRUE_ANSWER_STRINGS) or
-            any(false_str.upper() == answer_upper for false_str in FALSE_ANSWER_STRINGS))
+    return answer_text.strip().upper() in TF_ANSWER_MAP
 
 
 def normalize_filepath(filepath: str) -> str:
@@ -86,11 +87,17 @@ def validate_answer(user_answer: str, correct_answer: str, is_multiple_choice: b
         return user_answer == correct_answer
 
 
+FILE_CHUNK_SIZE = 1024 * 1024  # 文件分块读写大小，上传/计算哈希时内存占用与文件大小无关
+
+
 def get_file_hash(filepath: str) -> str:
-    """计算文件MD5哈希"""
+    """计算文件MD5哈希（分块读取）"""
     try:
+        md5 = hashlib.md5()
         with open(filepath, 'rb') as f:
-            return hashlib.md5(f.read()).hexdigest()
+            for chunk in iter(lambda: f.read(FILE_CHUNK_SIZE), b''):
+                md5.update(chunk)
+        return md5.hexdigest()
     except Exception:
         return None
 
@@ -105,6 +112,15 @@ def ensure_subject_directory(subject_name: str, subject_directory: str = 'subjec
 
 def save_uploaded_file(file, subject_name: str, filename: str, subject_directory: str = 'subject') -> str:
     """保存上传的文件，返回文件路径"""
+    return stream_uploaded_file(file, subject_name, filename, subject_directory)['file_path']
+
+
+def stream_uploaded_file(file, subject_name: str, filename: str,
+                         subject_directory: str = 'subject') -> Dict[str, Any]:
+    """
+    分块把上传的文件写入磁盘，同一遍中计算MD5和文件大小，之后无需再读取文件
+    返回 {'file_path', 'file_size', 'file_hash'}
+    """
     subject_dir = ensure_subject_directory(subject_name, subject_directory)
 
     # 确保文件名有正确的扩展名
@@ -115,13 +131,28 @@ def save_uploaded_file(file, subject_name: str, filename: str, subject_directory
 
     # 如果文件已存在，添加时间戳
     if os.path.exists(filepath):
-        base_name = filename.replace('.xlsx', '').replace('.xls', '')
+        base_name, extension = os.path.splitext(filename)
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        new_filename = f"{base_name}_{timestamp}.xlsx"
+        new_filename = f"{base_name}_{timestamp}{extension}"
         filepath = os.path.join(subject_dir, new_filename)
 
-    file.save(filepath)
-    return normalize_filepath(filepath)
+    md5 = hashlib.md5()
+    file_size = 0
+    try:
+        with open(filepath, 'wb') as f:
+            for chunk in iter(lambda: file.stream.read(FILE_CHUNK_SIZE), b''):
+                md5.update(chunk)
+                f.write(chunk)
+                file_size += len(chunk)
+    except Exception:
+        remove_file_safely(filepath)
+        raise
+
+    return {
+        'file_path': normalize_filepath(filepath),
+        'file_size': file_size,
+        'file_hash': md5.hexdigest()
+    }
 
 
 def remove_file_safely(filepath: str) -> bool:
@@ -149,78 +180,15 @@ def format_file_size(size_bytes: int) -> str:
 
 
 def load_questions_from_excel(filepath: str, sheetname: Union[str, int]) -> List[Dict[str, Any]]:
-    """从Excel文件加载题目"""
+    """从Excel文件加载题目（流式解析，无效行跳过；需要逐行错误时使用 excel_ingest.ingest_excel）"""
+    from .excel_ingest import ingest_excel
+
     if not os.path.exists(filepath):
         logger.error(f"Question bank file '{filepath}' not found.")
         return None
 
-    try:
-        df = pd.read_excel(filepath, sheet_name=sheetname, dtype=str)
-        df.columns = [col.strip() for col in df.columns]
-
-        required_cols = [QUESTION_COLUMN, ANSWER_COLUMN]
-        missing_cols = [col for col in required_cols if col not in df.columns]
-        if missing_cols:
-            logger.error(f"Missing required columns in '{filepath}': {', '.join(missing_cols)}")
-            return []
-
-        questions_data = []
-        for index, row in df.iterrows():
-            try:
-                question_text = str(row.get(QUESTION_COLUMN, '')).strip()
-                raw_answer_text = str(row.get(ANSWER_COLUMN, '')).strip()
-
-                if not question_text or not raw_answer_text or question_text.lower() == 'nan' or raw_answer_text.lower() == 'nan':
-                    continue
-
-                # 处理判断题
-                if is_tf_answer(raw_answer_text):
-                    processed_answer = standardize_tf_answer(raw_answer_text)
-                    if not processed_answer:
-                        continue
-                    question_type = '判断题'
-                    options_for_practice = None
-                else:
-                    # 处理选择题
-                    options_for_practice = {}
-                    for option_key in ['A', 'B', 'C', 'D']:
-                        option_text = str(row.get(option_key, '')).strip()
-                        if option_text and option_text.lower() != 'nan':
-                            options_for_practice[option_key] = option_text
-
-                    if not options_for_practice:
-                        processed_answer = standardize_tf_answer(raw_answer_text)
-                        if processed_answer:
-                            question_type = '判断题'
-                            options_for_practice = None
-                        else:
-                            continue
-                    else:
-                        processed_answer = raw_answer_text.strip().upper()
-                        if processed_answer.endswith(".0"):
-                            processed_answer = processed_answer[:-2]
-
-                        # 验证答案
-                        if not all(char in options_for_practice for char in processed_answer):
-                            continue
-
-                        question_type = '多选题' if len(processed_answer) > 1 else '单选题'
-
-                questions_data.append({
-                    'id': f"{filepath}_{index}",
-                    'type': question_type,
-                    'question': question_text,
-                    'options_for_practice': options_for_practice,
-                    'answer': processed_answer,
-                    'is_multiple_choice': question_type == '多选题'
-                })
-            except Exception as e:
-                logger.warning(f"Error processing question at index {index} in '{filepath}': {e}")
-                continue
-
-        logger.info(f"从文件加载 {len(questions_data)} 道题目: '{filepath}'")
-        return questions_data
-
-    except Exception as e:
-        logger.error(f"Critical error loading questions from '{filepath}': {e}")
-        return None 
\ No newline at end of file
+    result = ingest_excel(filepath, sheetname)
+    if not result['success']:
+        logger.error(f"Critical error loading questions from '{filepath}': {result['error']}")
+        return [] if result['error'].startswith('缺少必需的列') else None
+    return result['questions']
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+题库Excel导入基准测试
+对比 旧实现（pandas整表读取 + iterrows逐行处理）和
+新的流式导入引擎（openpyxl只读模式 + 查找表）的每秒处理行数（1000、5000、20000行）
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+from openpyxl import Workbook
+
+from backend.config import (
+    TRUE_ANSWER_STRINGS, FALSE_ANSWER_STRINGS, INTERNAL_TRUE, INTERNAL_FALSE,
+    QUESTION_COLUMN, ANSWER_COLUMN, TYPE_COLUMN
+)
+from backend.excel_ingest import ingest_excel
+
+SIZES = [1000, 5000, 20000]
+
+
+def legacy_standardize_tf_answer(answer_text):
+    if not isinstance(answer_text, str):
+        return None
+    answer_upper = answer_text.strip().upper()
+    if answer_upper == INTERNAL_TRUE or any(true_str.upper() == answer_upper for true_str in TRUE_ANSWER_STRINGS):
+        return INTERNAL_TRUE
+    if answer_upper == INTERNAL_FALSE or any(false_str.upper() == answer_upper for false_str in FALSE_ANSWER_STRINGS):
+        return INTERNAL_FALSE
+    return None
+
+
+def legacy_is_tf_answer(answer_text):
+    if not isinstance(answer_text, str):
+        return False
+    answer_upper = answer_text.strip().upper()
+    return (any(true_str.upper() == answer_upper for true_str in TRUE_ANSWER_STRINGS) or
+            any(false_str.upper() == answer_upper for false_str in FALSE_ANSWER_STRINGS))
+
+
+def legacy_load_questions(filepath, sheetname=0):
+    """旧实现：pandas读取整个工作簿后 iterrows 逐行处理"""
+    df = pd.read_excel(filepath, sheet_name=sheetname, dtype=str)
+    df.columns = [col.strip() for col in df.columns]
+
+    questions_data = []
+    for index, row in df.iterrows():
+        question_text = str(row.get(QUESTION_COLUMN, '')).strip()
+        raw_answer_text = str(row.get(ANSWER_COLUMN, '')).strip()
+
+        if not question_text or not raw_answer_text or question_text.lower() == 'nan' or raw_answer_text.lower() == 'nan':
+            continue
+
+        if legacy_is_tf_answer(raw_answer_text):
+            processed_answer = legacy_standardize_tf_answer(raw_answer_text)
+            if not processed_answer:
+                continue
+            question_type = '判断题'
+            options_for_practice = None
+        else:
+            options_for_practice = {}
+            for option_key in ['A', 'B', 'C', 'D']:
+                option_text = str(row.get(option_key, '')).strip()
+                if option_text and option_text.lower() != 'nan':
+                    options_for_practice[option_key] = option_text
+
+            if not options_for_practice:
+                processed_answer = legacy_standardize_tf_answer(raw_answer_text)
+                if processed_answer:
+                    question_type = '判断题'
+                    options_for_practice = None
+                else:
+                    continue
+            else:
+                processed_answer = raw_answer_text.strip().upper()
+                if processed_answer.endswith(".0"):
+                    processed_answer = processed_answer[:-2]
+                if not all(char in options_for_practice for char in processed_answer):
+                    continue
+                question_type = '多选题' if len(processed_answer) > 1 else '单选题'
+
+        questions_data.append({
+            'id': f"{filepath}_{index}",
+            'type': question_type,
+            'question': question_text,
+            'options_for_practice': options_for_practice,
+            'answer': processed_answer,
+            'is_multiple_choice': question_type == '多选题'
+        })
+    return questions_data
+
+
+def build_workbook(filepath: str, row_count: int):
+    """生成混合题型的题库文件，约2%的行答案无效"""
+    random.seed(row_count)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append([QUESTION_COLUMN, 'A', 'B', 'C', 'D', ANSWER_COLUMN, TYPE_COLUMN])
+
+    for i in range(row_count):
+        stem = f"第{i}题 " + "题干内容" * random.randint(5, 30)
+        kind = random.random()
+        if kind < 0.3:
+            sheet.append([stem, None, None, None, None, random.choice(['正确', '错误', '对', '错', 'T', 'F']), '判断题'])
+        elif kind < 0.98:
+            answer = random.choice(['A', 'B', 'C', 'D', 'AB', 'ACD', 'BCD'])
+            sheet.append([stem] + [f"选项{c}" * random.randint(1, 5) for c in 'ABCD'] + [answer, '选择题'])
+        else:
+            sheet.append([stem, '选项A', '选项B', None, None, 'E', '单选题'])
+
+    workbook.save(filepath)
+
+
+def timed(func):
+    start_time = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start_time
+
+
+def main():
+    print("🚀 题库Excel导入基准测试")
+    print("=" * 50)
+
+    all_passed = True
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for row_count in SIZES:
+            filepath = os.path.join(temp_dir, f"bench_{row_count}.xlsx")
+            build_workbook(filepath, row_count)
+            print(f"\n📊 {row_count} 行题库")
+
+            legacy_questions, legacy_seconds = timed(lambda: legacy_load_questions(filepath))
+            result, new_seconds = timed(lambda: ingest_excel(filepath, 0))
+
+            if result['success'] and result['questions'] == legacy_questions:
+                print(f"   ✅ 解析结果一致: {len(legacy_questions)} 道题目, {result['error_count']} 行无效")
+            else:
+                print("   ❌ 解析结果不一致")
+                all_passed = False
+
+            print(f"   旧实现:   {legacy_seconds:.2f} s ({row_count / legacy_seconds:,.0f} 行/秒)")
+            print(f"   流式引擎: {new_seconds:.2f} s ({row_count / new_seconds:,.0f} 行/秒)")
+            print(f"   提升: {legacy_seconds / new_seconds:.1f}x")
+
+    print("\n" + "=" * 50)
+    return all_passed
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
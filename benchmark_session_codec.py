@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+练习会话状态编码基准测试
+对比 题目ID列表/答题状态/错题列表 在紧凑二进制编码前后的
+session载荷大小和序列化/反序列化耗时（100、1000、10000道题）
+"""
+import json
+import os
+import pickle
+import random
+import sys
+import time
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend import session_codec
+
+SIZES = [100, 1000, 10000]
+REPEAT = 200
+
+
+def build_state(question_count: int) -> dict:
+    """构造一个答到一半的练习会话状态"""
+    random.seed(question_count)
+    first_id = random.randint(1000, 50000)
+    question_indices = list(range(first_id, first_id + question_count))
+    random.shuffle(question_indices)
+
+    answered = question_count // 2
+    question_statuses = [random.choice((1, 1, 2)) for _ in range(answered)] + [0] * (question_count - answered)
+    wrong_indices = [qid for qid, status in zip(question_indices, question_statuses) if status == 2]
+
+    return {
+        'question_indices': question_indices,
+        'question_statuses': question_statuses,
+        'wrong_indices': wrong_indices
+    }
+
+
+def pack_state(state: dict) -> dict:
+    return {
+        'question_indices': session_codec.pack_ids(state['question_indices']),
+        'question_statuses': session_codec.pack_statuses(state['question_statuses']),
+        'wrong_indices': session_codec.pack_id_set(state['wrong_indices'])
+    }
+
+
+def unpack_state(packed: dict) -> dict:
+    return {key: session_codec.unpack(value) for key, value in packed.items()}
+
+
+def timed(func, repeat: int = REPEAT) -> float:
+    """返回单次调用的平均耗时（毫秒）"""
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start_time) / repeat * 1000
+
+
+def benchmark_session_payload(state: dict) -> dict:
+    """Flask-Session 以pickle保存整个session字典"""
+    raw_payload = pickle.dumps(state)
+    packed_payload = pickle.dumps(pack_state(state))
+
+    return {
+        'before_bytes': len(raw_payload),
+        'after_bytes': len(packed_payload),
+        'before_dump_ms': timed(lambda: pickle.dumps(state)),
+        'after_dump_ms': timed(lambda: pickle.dumps(pack_state(state))),
+        'before_load_ms': timed(lambda: pickle.loads(raw_payload)),
+        'after_load_ms': timed(lambda: unpack_state(pickle.loads(packed_payload)))
+    }
+
+
+def benchmark_db_columns(state: dict) -> dict:
+    """practice_sessions 表的JSON列"""
+    raw_columns = {key: json.dumps(value) for key, value in state.items()}
+    packed_columns = {key: json.dumps(session_codec.to_text(value)) for key, value in pack_state(state).items()}
+
+    return {
+        'before_bytes': sum(len(v) for v in raw_columns.values()),
+        'after_bytes': sum(len(v) for v in packed_columns.values()),
+        'before_dump_ms': timed(lambda: {k: json.dumps(v) for k, v in state.items()}),
+        'after_dump_ms': timed(lambda: {k: json.dumps(session_codec.to_text(v)) for k, v in pack_state(state).items()}),
+        'before_load_ms': timed(lambda: {k: json.loads(v) for k, v in raw_columns.items()}),
+        'after_load_ms': timed(lambda: {k: session_codec.unpack(json.loads(v)) for k, v in packed_columns.items()})
+    }
+
+
+def print_result(title: str, result: dict):
+    ratio = result['after_bytes'] / result['before_bytes'] * 100
+    print(f"   {title}:")
+    print(f"      大小: {result['before_bytes']:>8} B -> {result['after_bytes']:>8} B ({ratio:.1f}%)")
+    print(f"      序列化:   {result['before_dump_ms']:.3f} ms -> {result['after_dump_ms']:.3f} ms")
+    print(f"      反序列化: {result['before_load_ms']:.3f} ms -> {result['after_load_ms']:.3f} ms")
+
+
+def verify_roundtrip(state: dict) -> bool:
+    """验证编码无损（错题按集合比较）"""
+    decoded = unpack_state(pack_state(state))
+    return (decoded['question_indices'] == state['question_indices']
+            and decoded['question_statuses'] == state['question_statuses']
+            and decoded['wrong_indices'] == sorted(set(state['wrong_indices'])))
+
+
+def main():
+    print("🚀 练习会话状态编码基准测试")
+    print("=" * 50)
+
+    all_passed = True
+    for question_count in SIZES:
+        state = build_state(question_count)
+        print(f"\n📊 {question_count} 道题的练习会话")
+
+        if verify_roundtrip(state):
+            print("   ✅ 编码/解码结果一致")
+        else:
+            print("   ❌ 编码/解码结果不一致")
+            all_passed = False
+
+        print_result("Session载荷 (pickle)", benchmark_session_payload(state))
+        print_result("数据库列 (JSON)", benchmark_db_columns(state))
+
+    print("\n" + "=" * 50)
+    return all_passed
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -14,6 +14,8 @@ import type {
   AdminSubjectFile,
   AdminSubject,
   TikuItem,
+  TikuImportJob,
+  TikuUploadResult,
   AdminQuestionItem,
   QuestionCreateData,
   QuestionUpdateData,
@@ -32,6 +34,8 @@ import router from '@/router';
 export type {
   AdminInvitation,
   TikuItem,
+  TikuImportJob,
+  TikuUploadResult,
   QuestionCreateData,
   QuestionUpdateData,
   AdminSubject as Subject, // Alias for compatibility
@@ -126,7 +130,8 @@ export interface ApiService {
     updateSubject(subjectId: number, subjectName: string, examTime?: string): Promise<ServiceResponse<null>>;
     deleteSubject(subjectId: number): Promise<ServiceResponse<null>>;
     getTiku(subjectId?: number, params?: SearchParams): Promise<ServiceResponse<{ tiku_list: TikuItem[]; pagination?: Pagination }>>;
-    uploadTiku(file: File, subjectId: number, tikuName?: string): Promise<ServiceResponse<{ tiku_id?: number; question_count?: number }>>;
+    uploadTiku(file: File, subjectId: number, tikuName?: string): Promise<ServiceResponse<TikuUploadResult>>;
+    getImportJob(jobId: string): Promise<ServiceResponse<{ job: TikuImportJob }>>;
     deleteTiku(tikuId: number): Promise<ServiceResponse<null>>;
     toggleTiku(tikuId: number): Promise<ServiceResponse<{ is_active?: boolean }>>;
     getQuestions(tikuId?: number, params?: SearchParams): Promise<ServiceResponse<{ questions: AdminQuestionItem[]; pagination: Pagination }>>;
@@ -532,7 +537,7 @@ class ApiServiceImpl implements ApiService {
       const response = await (this as ApiServiceImpl).fetchWithCredentials(url);
       return (this as ApiServiceImpl).handleResponse<{ tiku_list: TikuItem[]; pagination?: Pagination }>(response);
     },
-    uploadTiku: async (file: File, subjectId: number, tikuName?: string): Promise<ServiceResponse<{ tiku_id?: number; question_count?: number }>> => {
+    uploadTiku: async (file: File, subjectId: number, tikuName?: string): Promise<ServiceResponse<TikuUploadResult>> => {
       const formData = new FormData();
       formData.append('file', file);
       formData.append('subject_id', subjectId.toString());
@@ -543,7 +548,11 @@ class ApiServiceImpl implements ApiService {
         method: 'POST',
         body: formData,
       });
-      return (this as ApiServiceImpl).handleResponse<{ tiku_id?: number; question_count?: number }>(response);
+      return (this as ApiServiceImpl).handleResponse<TikuUploadResult>(response);
+    },
+    getImportJob: async (jobId: string): Promise<ServiceResponse<{ job: TikuImportJob }>> => {
+      const response = await (this as ApiServiceImpl).fetchWithCredentials(`${API_BASE}/admin/import-jobs/${encodeURIComponent(jobId)}`);
+      return (this as ApiServiceImpl).handleResponse<{ job: TikuImportJob }>(response);
     },
     deleteTiku: async (tikuId: number): Promise<ServiceResponse<null>> => {
       const response = await (this as ApiServiceImpl).fetchWithCredentials(`${API_BASE}/admin/tiku/${tikuId}`, { method: 'DELETE' });
@@ -297,6 +297,38 @@ export interface TikuItem {
   updated_at?: string;
 }
 
+// 题库上传后的后台导入任务（GET /admin/import-jobs/<job_id>）
+export type TikuImportStatus = 'queued' | 'parsing' | 'staging' | 'swapping' | 'completed' | 'failed' | 'skipped';
+
+export interface TikuImportRowError {
+  row: number;   // Excel行号
+  error: string;
+}
+
+export interface TikuImportJob {
+  job_id: string;
+  status: TikuImportStatus;
+  progress: number; // 0-100
+  subject_id: number;
+  tiku_name: string;
+  file_path: string;
+  tiku_id: number | null;
+  total_rows: number;
+  parsed_count: number;
+  inserted_count: number;
+  question_count: number;
+  skipped_count: number;  // 校验失败被跳过的行数
+  row_errors: TikuImportRowError[];
+  error: string | null;
+  created_at: number;
+}
+
+export interface TikuUploadResult {
+  job_id: string;
+  status: TikuImportStatus;
+  file_path: string;
+}
+
 export interface AdminQuestionItem { // Was QuestionItem in api.ts
   id: string; // Question ID can be string (ObjectID from mongo) or number (if SQL)
               // Backend admin.py uses <int:question_id> in routes but create_question_and_update_tiku_count returns string id
@@ -12,17 +12,23 @@ from flask_cors import CORS
 from flask_session import Session
 
 # 导入backend模块
-from backend.config import Config, ServerConfig
+from backend.config import Config, ServerConfig, RedisConfig
 from backend.connectDB import (
-    init_connection_pool, cleanup_expired_practice_sessions, batch_update_tiku_usage
+    init_connection_pool, cleanup_expired_practice_sessions
 )
+from backend.RedisManager import redis_manager
+from backend.db_manager import connection_manager
+from backend.practice_writer import practice_writer
 from backend.routes.admin import admin_bp
 from backend.routes.auth import auth_bp
-from backend.routes.practice import practice_bp, usage_stats_lock,  tiku_usage_stats,cache_manager
+from backend.routes.practice import practice_bp, cache_manager
 from backend.routes.profile import profile_bp
 from backend.routes.usage import usage_bp
 
+from backend.session_lifecycle import session_compactor, ensure_session_schema
 from backend.session_manager import SessionManager
+from backend.usage_analytics import usage_analytics
+from backend.usage_counter import usage_counter
 from backend.utils import create_response
 
 # Configure logging
@@ -42,38 +48,6 @@ request_counter_lock = threading.Lock()
 stop_event = threading.Event()
 
 
-def sync_usage_stats_to_database():
-    """同步题库使用次数到数据库"""
-    global tiku_usage_stats
-
-    with usage_stats_lock:
-        if not tiku_usage_stats:
-            return
-
-        # 复制当前统计数据并清空
-        stats_to_sync = dict(tiku_usage_stats)
-        tiku_usage_stats.clear()
-
-    if stats_to_sync:
-        try:
-            result = batch_update_tiku_usage(stats_to_sync)
-            if result['success']:
-                total_updates = sum(stats_to_sync.values())
-                logger.info(f"Synced usage stats: {len(stats_to_sync)} files, {total_updates} total usages")
-            else:
-                logger.error(f"Failed to sync usage stats: {result['error']}")
-                # 如果同步失败，重新添加到统计中
-                with usage_stats_lock:
-                    for tiku_id, count in stats_to_sync.items():
-                        tiku_usage_stats[tiku_id] = tiku_usage_stats.get(tiku_id, 0) + count
-        except Exception as e:
-            logger.error(f"Error in batch_update_tiku_usage: {e}")
-            # 如果发生异常，重新添加到统计中
-            with usage_stats_lock:
-                for tiku_id, count in stats_to_sync.items():
-                    tiku_usage_stats[tiku_id] = tiku_usage_stats.get(tiku_id, 0) + count
-
-
 def monitor_activity():
     """后台活动监控 - 优化版本，包含session管理"""
     global request_counter
@@ -104,6 +78,12 @@ def monitor_activity():
                 logger.error(f"Error cleaning practice sessions: {e}")
             cleanup_counter = 0
 
+        # 重建使用统计排行和汇总文档，统计接口只读汇总文档
+        try:
+            usage_analytics.refresh_summary()
+        except Exception as e:
+            logger.error(f"Error refreshing usage analytics: {e}")
+
         # 每10分钟的统计信息记录
         if session_cleanup_counter >= 20:  # 每10分钟
             try:
@@ -112,12 +92,6 @@ def monitor_activity():
                 logger.error(f"Error in session status logging: {e}")
             session_cleanup_counter = 0
 
-        # 同步题库使用次数到数据库
-        try:
-            sync_usage_stats_to_database()
-        except Exception as e:
-            logger.error(f"Error syncing usage stats: {e}")
-
 
 # --- Flask App Initialization ---
 def create_app():
@@ -136,6 +110,10 @@ def create_app():
         # 如果初始化失败，使用默认的客户端session
         exit(-1)
 
+    # session跨重启保留，由后台任务压缩过大的session
+    session_compactor.configure(app.config['SESSION_REDIS'], app.session_interface.serializer,
+                                Config.SESSION_KEY_PREFIX)
+
     # 配置 CORS
     cors = CORS(app,
                 resources={
@@ -192,8 +170,17 @@ def create_app():
         with request_counter_lock:
             request_counter += 1
 
-        # 设置session为永久性
-        session.permanent = True
+        # 每个worker进程首次处理请求时启动缓存失效通知订阅线程、session压缩线程和使用次数写库线程
+        redis_manager.ensure_invalidation_listener()
+        session_compactor.ensure_started()
+        usage_counter.ensure_started()
+
+        # 重启前写入的旧结构session在此懒迁移
+        ensure_session_schema()
+
+        # 设置session为永久性（赋值会把session标记为已修改，已是永久session时不再赋值）
+        if not session.permanent:
+            session.permanent = True
 
     # 添加错误处理器来处理session相关错误
     @app.errorhandler(UnicodeDecodeError)
@@ -214,10 +201,13 @@ if __name__ == '__main__':
     # 初始化数据库连接池
     init_connection_pool()
 
-    # 预热缓存 - 从数据库加载数据到缓存中
+    # 预热缓存 - 优先使用本地题库快照，只从数据库重新加载有变化的题库
     logger.info("正在预热缓存...")
     try:
-        cache_manager.refresh_all_cache()
+        if RedisConfig.WARM_START_CONFIG['enabled']:
+            cache_manager.warm_start(RedisConfig.WARM_START_CONFIG['snapshot_path'])
+        else:
+            cache_manager.refresh_all_cache()
         logger.info("缓存预热完成")
     except Exception as e:
         logger.error(f"缓存预热失败: {e}")
@@ -258,6 +248,12 @@ if __name__ == '__main__':
 
             options = ServerConfig.GUNICORN_OPTIONS.copy()
             options['bind'] = f'{HOST}:{PORT}'
+            # 每个worker退出前写入其写回队列中的练习会话状态和暂存的使用次数
+            def worker_exit(server, worker):
+                practice_writer.shutdown()
+                usage_counter.shutdown()
+
+            options['worker_exit'] = worker_exit
 
             logger.info("Using Gunicorn server")
             StandaloneApplication(app, options).run()
@@ -267,6 +263,8 @@ if __name__ == '__main__':
                 from waitress import serve
 
                 logger.info("Using Waitress server")
+                # Waitress为单进程多线程，按其线程数重新计算连接池大小
+                connection_manager.configure(request_threads=ServerConfig.WAITRESS_OPTIONS['threads'], workers=1)
                 # Waitress配置，更适合后台运行
                 serve(app,
                       host=HOST,
@@ -274,6 +272,7 @@ if __name__ == '__main__':
                       **ServerConfig.WAITRESS_OPTIONS)
             except ImportError:
                 logger.warning("Using Flask dev server (not recommended for production)")
+                connection_manager.configure(workers=1)
                 # 对于开发服务器，禁用重载器以避免nohup问题
                 app.run(host=HOST, port=PORT, debug=False, use_reloader=False, threaded=True)
 
@@ -286,4 +285,7 @@ if __name__ == '__main__':
         stop_event.set()
         if activity_thread.is_alive():
             activity_thread.join(timeout=5)
+        # 写入写回队列中剩余的练习会话状态
+        practice_writer.shutdown()
+        usage_counter.shutdown()
         logger.info("Server shutdown complete")
@@ -24,4 +24,15 @@ CREATE TABLE `invitation_codes` (
     PRIMARY KEY (`id`),
     UNIQUE KEY `uk_code` (`code`), -- 确保邀请码字符串本身是唯一的
     KEY `idx_is_used_expires_at` (`is_used`, `expires_at`) -- 用于快速查找有效且未使用的邀请码
-) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='邀请码信息表';
\ No newline at end of file
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='邀请码信息表';
+CREATE TABLE `practice_answer_events` (
+    `id` BIGINT UNSIGNED AUTO_INCREMENT COMMENT '事件ID（自增，决定重放顺序）',
+    `session_id` BIGINT UNSIGNED NOT NULL COMMENT '练习会话ID (关联 practice_sessions.id)',
+    `question_index` SMALLINT UNSIGNED NOT NULL COMMENT '题目在本轮中的位置',
+    `question_id` INT UNSIGNED NOT NULL COMMENT '题目ID',
+    `is_correct` BOOLEAN NOT NULL COMMENT '是否答对',
+    `peeked` BOOLEAN NOT NULL DEFAULT FALSE COMMENT '是否查看了答案',
+    `user_answer` VARCHAR(64) NOT NULL DEFAULT '' COMMENT '用户答案',
+    PRIMARY KEY (`id`),
+    KEY `idx_session_id` (`session_id`, `id`) -- 按会话顺序重放快照之后的事件
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='练习答题事件日志（快照之后的增量）';
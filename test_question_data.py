@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+题目数据读写逻辑测试（无需MySQL服务，用记录SQL的游标代替数据库连接）
+包含题目流式读取的错误处理、启动预热的题库校验、Excel格式识别、后台列表的游标分页、
+导入任务暂存题目的ID区间
+"""
+import os
+import sys
+import tempfile
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mysql.connector import Error
+
+from backend import connectDB, excel_ingest
+from backend.routes import practice
+
+
+class FakeCursor:
+    """按顺序返回预置批次的游标（fetchone 依次返回 one_rows）；批次为异常实例时在该次 fetchmany 抛出"""
+
+    def __init__(self, batches=None, one_rows=None):
+        self.batches = list(batches or [])
+        self.one_rows = list(one_rows or [])
+        self.executed = []
+
+    def execute(self, query, params=()):
+        self.executed.append((' '.join(query.split()), params))
+
+    def fetchone(self):
+        return self.one_rows.pop(0) if self.one_rows else None
+
+    def fetchmany(self, size):
+        if not self.batches:
+            return []
+        batch = self.batches.pop(0)
+        if isinstance(batch, Exception):
+            raise batch
+        return batch
+
+    def fetchall(self):
+        rows = []
+        while self.batches:
+            rows.extend(self.fetchmany(None))
+        return rows
+
+    def close(self):
+        pass
+
+
+class StagingCursor(FakeCursor):
+    """模拟自增ID和影响行数：多行INSERT的 lastrowid 为第一行的ID，DELETE 依次返回 rowcounts"""
+
+    def __init__(self, next_id=101, rowcounts=None, fail_on_insert=None, one_rows=None):
+        super().__init__(one_rows=one_rows)
+        self.next_id = next_id
+        self.rowcounts = list(rowcounts or [])
+        self.fail_on_insert = fail_on_insert  # 第几条INSERT语句抛出异常（从1开始）
+        self.inserts = 0
+        self.lastrowid = None
+        self.rowcount = 0
+
+    def execute(self, query, params=()):
+        super().execute(query, params)
+        if query.startswith('INSERT'):
+            self.inserts += 1
+            if self.inserts == self.fail_on_insert:
+                raise Error('Data too long')
+            rows = query.count('), (') + 1
+            self.lastrowid, self.next_id = self.next_id, self.next_id + rows
+        elif 'DELETE' in query:
+            self.rowcount = self.rowcounts.pop(0) if self.rowcounts else 0
+
+    def executemany(self, query, seq_params):
+        self.executed.append((' '.join(query.split()), list(seq_params)))
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.transactions = []  # 'start' / 'commit' / 'rollback'
+
+    def cursor(self, **kwargs):
+        return self._cursor
+
+    def start_transaction(self):
+        self.transactions.append('start')
+
+    def commit(self):
+        self.transactions.append('commit')
+
+    def rollback(self):
+        self.transactions.append('rollback')
+
+    def close(self):
+        pass
+
+
+class patched_connection:
+    """把 connectDB 的数据库连接替换为给定游标（with 块结束后恢复）"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __enter__(self):
+        self._original = connectDB.get_db_connection
+        self.connection = FakeConnection(self._cursor)
+        connectDB.get_db_connection = lambda: self.connection
+        return self
+
+    def __exit__(self, *exc_info):
+        connectDB.get_db_connection = self._original
+
+
+def _question_row(question_id, tiku_id=1):
+    return (question_id, 1, tiku_id, 1, f'题干{question_id}', 'A项', 'B项', None, None, 'A', None, 1, '科目', '题库')
+
+
+def test_question_stream_errors():
+    """测试流式读取中途出错时不返回截断的题库"""
+    print("\n📥 测试题目流式读取...")
+    with patched_connection(FakeCursor([[_question_row(1), _question_row(2)], [_question_row(3)]])):
+        questions = connectDB.get_questions_by_tiku(1)
+    assert [q['id'] for q in questions] == [1, 2, 3], "完整读取"
+
+    with patched_connection(FakeCursor([])):
+        assert connectDB.get_questions_by_tiku(1) == [], "空题库返回空列表"
+
+    with patched_connection(FakeCursor([[_question_row(1), _question_row(2)], Error('Lost connection')])):
+        assert connectDB.get_questions_by_tiku(1) is None, "读到一半出错返回None，不返回截断的题库"
+
+    with patched_connection(FakeCursor([[_question_row(1)], Error('Lost connection')])):
+        try:
+            list(connectDB.iter_questions(1))
+        except Error:
+            pass
+        else:
+            raise AssertionError("iter_questions 出错时应抛出异常")
+
+
+class FakeRedisManager:
+    """只记录写入的题库，不连接Redis"""
+    is_available = False
+
+    def __init__(self):
+        self.stored_banks = []
+
+    def get_cached_bank_ids(self):
+        return []
+
+    def store_question_bank(self, tiku_id, questions, ttl=None, type_partitions=None):
+        self.stored_banks.append(tiku_id)
+
+    def store_bank_questions(self, tiku_id, questions, ttl=None):
+        pass
+
+    def delete_bank_questions(self, tiku_id, keep_ids=None):
+        pass
+
+
+def test_warm_start_rejects_incomplete_banks():
+    """测试启动预热只接受读取完整、题目数与指纹一致的题库"""
+    print("\n🔥 测试启动预热的题库校验...")
+    fingerprints = {
+        1: {'is_active': True, 'question_count': 2, 'fingerprint': 'f1'},
+        2: {'is_active': True, 'question_count': 3, 'fingerprint': 'f2'},  # 读取期间被删掉一题
+        3: {'is_active': True, 'question_count': 1, 'fingerprint': 'f3'},  # 读取失败
+    }
+    fetched = {
+        1: [connectDB._format_question_row(_question_row(i)) for i in (1, 2)],
+        2: [connectDB._format_question_row(_question_row(i, tiku_id=2)) for i in (3, 4)],
+        3: None,
+    }
+    saved = {}
+    fake_redis = FakeRedisManager()
+    originals = {name: getattr(practice, name) for name in
+                 ('get_tiku_fingerprints', 'get_questions_by_tiku', 'load_snapshot', 'save_snapshot')}
+    original_redis = practice.cache_manager.redis_manager
+    try:
+        practice.get_tiku_fingerprints = lambda: fingerprints
+        practice.get_questions_by_tiku = lambda tiku_id: fetched[tiku_id]
+        practice.load_snapshot = lambda path: {}
+        practice.save_snapshot = lambda path, banks: saved.update(banks) or 0
+        practice.cache_manager.redis_manager = fake_redis
+        practice.cache_manager._rewarm_catalog = lambda: None
+
+        result = practice.cache_manager.warm_start('unused.snapshot')
+    finally:
+        for name, value in originals.items():
+            setattr(practice, name, value)
+        practice.cache_manager.redis_manager = original_redis
+        del practice.cache_manager._rewarm_catalog
+        practice.question_store.invalidate()
+
+    assert set(saved) == {1}, "只有完整的题库写入快照"
+    assert fake_redis.stored_banks == [1], "只有完整的题库写入缓存"
+    assert result['refetched_banks'] == 1
+    assert result['prewarmed_questions'] == 2
+
+
+def test_excel_format_detection():
+    """测试按文件头识别Excel格式，不受扩展名影响"""
+    print("\n📄 测试Excel格式识别...")
+    with tempfile.TemporaryDirectory() as directory:
+        def write(name, content):
+            path = os.path.join(directory, name)
+            with open(path, 'wb') as f:
+                f.write(content)
+            return path
+
+        # 同名文件重命名后旧版 .xls 可能带 .xlsx 扩展名
+        assert excel_ingest._is_legacy_xls(write('old_20240101_000000.xlsx', excel_ingest.OLE2_MAGIC + b'\0' * 8))
+        assert not excel_ingest._is_legacy_xls(write('new.xls', excel_ingest.ZIP_MAGIC + b'\0' * 8))
+        assert excel_ingest._is_legacy_xls(write('unknown.xls', b'')), "无法识别时按扩展名判断"
+        assert not excel_ingest._is_legacy_xls(write('unknown.xlsx', b''))
+
+
+def _question_dict_row(question_id, tiku_id=1):
+    return dict(zip(connectDB._QUESTION_COLUMNS, _question_row(question_id, tiku_id)))
+
+
+def test_question_pagination():
+    """测试题目列表的OFFSET分页和游标分页条件"""
+    print("\n📑 测试题目列表分页...")
+    get_questions_paginated = connectDB.get_questions_paginated.__wrapped__
+
+    # 按页码翻页：先COUNT，多取一行判断下一页
+    cursor = FakeCursor([[_question_dict_row(i) for i in (3, 4, 5)]], one_rows=[{'total': 5}])
+    result = get_questions_paginated(cursor, 1, 2, 2)
+    assert cursor.executed[0][1] == [1] and 'COUNT(*)' in cursor.executed[0][0]
+    query, params = cursor.executed[1]
+    assert query.endswith("WHERE q.status = 'active' AND q.tiku_id = %s ORDER BY q.tiku_id, q.id LIMIT %s OFFSET %s")
+    assert params == [1, 3, 2], "多取一行，OFFSET=(page-1)*per_page"
+    assert [q['db_id'] for q in result['questions']] == [3, 4]
+    assert result['pagination'] == {'page': 2, 'per_page': 2, 'total': 5, 'total_pages': 3, 'has_prev': True,
+                                    'has_next': True, 'after_id': None, 'next_after_id': 4}
+
+    # 按题库过滤的游标分页：WHERE q.id > after_id，不再COUNT，不用OFFSET
+    cursor = FakeCursor([[_question_dict_row(5)]])
+    result = get_questions_paginated(cursor, 1, 3, 2, after_id=4, total_count=5)
+    assert len(cursor.executed) == 1, "传入缓存的总数时不执行COUNT"
+    query, params = cursor.executed[0]
+    assert "AND q.id > %s ORDER BY" in query and params == [1, 4, 3, 0]
+    assert (result['pagination']['has_next'], result['pagination']['next_after_id']) == (False, None)
+    assert result['pagination']['has_prev'] is True
+
+    # 不按题库过滤：游标为 (tiku_id, id)，先查出游标题目所在的题库
+    cursor = FakeCursor([[_question_dict_row(7, tiku_id=2), _question_dict_row(1, tiku_id=3),
+                          _question_dict_row(2, tiku_id=3)]], one_rows=[{'tiku_id': 2}])
+    result = get_questions_paginated(cursor, None, 2, 2, after_id=6, total_count=10)
+    assert cursor.executed[0] == ("SELECT tiku_id FROM questions WHERE id = %s", (6,))
+    query, params = cursor.executed[1]
+    assert "AND (q.tiku_id > %s OR (q.tiku_id = %s AND q.id > %s)) ORDER BY" in query
+    assert params == [2, 2, 6, 3, 0]
+    assert result['pagination']['next_after_id'] == 1
+
+    # 游标题目已被删除时退回按ID比较
+    cursor = FakeCursor([[]], one_rows=[None])
+    result = get_questions_paginated(cursor, None, 2, 2, after_id=6, total_count=10)
+    query, params = cursor.executed[1]
+    assert "AND q.id > %s ORDER BY" in query and params == [6, 3, 0]
+    assert (result['questions'], result['pagination']['has_next']) == ([], False)
+
+
+def test_user_pagination():
+    """测试用户列表的游标条件随排序方向变化，非ID排序时忽略游标"""
+    print("\n👥 测试用户列表分页...")
+    get_users_paginated = connectDB.get_users_paginated.__wrapped__
+
+    cursor = FakeCursor([[]])
+    get_users_paginated(cursor, 'bob', 'id', 'desc', 3, 20, after_id=100, total_count=50)
+    query, params = cursor.executed[0]
+    assert "WHERE u.username LIKE %s AND u.id < %s" in query and "ORDER BY u.id DESC" in query
+    assert params == ['%bob%', 100, 21, 0]
+
+    cursor = FakeCursor([[]])
+    get_users_paginated(cursor, '', 'id', 'asc', 3, 20, after_id=100, total_count=50)
+    query, params = cursor.executed[0]
+    assert "WHERE u.id > %s" in query and params == [100, 21, 0]
+
+    cursor = FakeCursor([[]])
+    result = get_users_paginated(cursor, '', 'username', 'asc', 3, 20, after_id=100, total_count=50)
+    query, params = cursor.executed[0]
+    assert "u.id >" not in query and params == [21, 40], "非ID排序时使用OFFSET分页"
+    assert result['pagination']['after_id'] is None
+
+
+def test_build_pagination():
+    """测试分页信息"""
+    print("\n🔢 测试分页信息...")
+    pagination = connectDB._build_pagination(1, 20, 0, False, None, None)
+    assert (pagination['total_pages'], pagination['has_prev'], pagination['has_next']) == (0, False, False)
+    pagination = connectDB._build_pagination(1, 20, 41, True, 7, 27)
+    assert pagination['total_pages'] == 3
+    assert pagination['has_prev'] is True, "游标分页时第1页之后也有上一页"
+    assert (pagination['after_id'], pagination['next_after_id']) == (7, 27)
+
+
+def _insert_question(stem):
+    return {'subject_id': 1, 'tiku_id': 9, 'question_type': '单选题', 'stem': stem, 'option_a': 'A项',
+            'option_b': 'B项', 'answer': 'A', 'status': 'inactive'}
+
+
+def test_staged_id_ranges():
+    """测试导入任务记录本次写入的ID区间，只启用/清理这些区间内的题目"""
+    print("\n🧱 测试暂存题目的ID区间...")
+    progress = []
+    with patched_connection(StagingCursor(next_id=101)) as patched:
+        result = connectDB.bulk_insert_questions((_insert_question(f'题目{i}') for i in range(5)), batch_size=2,
+                                                 chunk_rows=4, progress_callback=progress.append)
+    assert result['success'] and result['inserted_count'] == 5
+    assert result['inserted_id_ranges'] == [(101, 102), (103, 104), (105, 105)], "每条多行INSERT一个连续区间"
+    assert progress == [4, 5]
+    assert patched.connection.transactions == ['start', 'commit', 'start', 'commit']
+
+    # 写入失败：已提交的块不回滚，已回滚的区间也一并返回供清理
+    with patched_connection(StagingCursor(next_id=101, fail_on_insert=4)) as patched:
+        result = connectDB.bulk_insert_questions((_insert_question(f'题目{i}') for i in range(8)), batch_size=2,
+                                                 chunk_rows=4)
+    assert not result['success'] and result['inserted_count'] == 4
+    assert result['inserted_id_ranges'] == [(101, 102), (103, 104), (105, 106)]
+    assert patched.connection.transactions[-1] == 'rollback'
+
+    # 替换：删除水位以下的旧题目，只启用本次写入的区间
+    with patched_connection(StagingCursor(rowcounts=[7], one_rows=[(3,)])) as patched:
+        result = connectDB.swap_staged_questions(9, 100, [(101, 102), (105, 105)])
+    executed = patched._cursor.executed
+    assert executed[0] == ("DELETE FROM questions WHERE tiku_id = %s AND id <= %s", (9, 100))
+    assert executed[1][0] == "UPDATE questions SET status = 'active' WHERE tiku_id = %s AND id BETWEEN %s AND %s"
+    assert executed[1][1] == [(9, 101, 102), (9, 105, 105)]
+    assert (result['deleted_count'], result['question_count']) == (7, 3)
+    assert patched.connection.transactions == ['start', 'commit']
+
+    # 清理：只删除区间内未启用的题目，按块删除直到不足一块
+    with patched_connection(StagingCursor(rowcounts=[2, 1, 0])) as patched:
+        result = connectDB.delete_staged_questions(9, [(101, 104), (105, 105)], chunk_rows=2)
+    assert result == {'success': True, 'deleted_count': 3}
+    params = [params for query, params in patched._cursor.executed]
+    assert params == [(9, 101, 104, 2), (9, 101, 104, 2), (9, 105, 105, 2)]
+    assert all("AND status = 'inactive'" in query for query, _ in patched._cursor.executed)
+
+
+def main():
+    """主测试函数（也可以用 pytest 运行本文件）"""
+    print("🚀 开始题目数据读写逻辑测试")
+    print("=" * 50)
+
+    tests = [
+        ("题目流式读取", test_question_stream_errors),
+        ("启动预热题库校验", test_warm_start_rejects_incomplete_banks),
+        ("Excel格式识别", test_excel_format_detection),
+        ("题目列表分页", test_question_pagination),
+        ("用户列表分页", test_user_pagination),
+        ("分页信息", test_build_pagination),
+        ("暂存题目的ID区间", test_staged_id_ranges),
+    ]
+
+    test_results = []
+    for test_name, test in tests:
+        try:
+            test()
+            test_results.append((test_name, True))
+        except AssertionError as e:
+            print(f"   ❌ {e}")
+            test_results.append((test_name, False))
+
+    # 输出测试结果
+    print("\n" + "=" * 50)
+    print("📊 测试结果总结:")
+
+    all_passed = True
+    for test_name, result in test_results:
+        status = "✅ 通过" if result else "❌ 失败"
+        print(f"   {test_name}: {status}")
+        if not result:
+            all_passed = False
+
+    print("\n" + "=" * 50)
+    if all_passed:
+        print("🎉 所有测试都通过了！")
+    else:
+        print("⚠️  部分测试失败")
+
+    return all_passed
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
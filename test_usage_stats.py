@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+使用次数计数和用户练习统计测试（无需Redis/MySQL服务，用进程内的字典代替Redis）
+包含题库使用次数的选主写库、用户练习统计汇总hash的增量更新和重建
+"""
+import os
+import sys
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import copy
+
+import redis
+
+from backend import usage_counter as usage_counter_module
+from backend import user_stats as user_stats_module
+from backend.usage_counter import UsageCounter, _DELETE_IF_OWNER_SCRIPT, _EXTEND_LOCK_SCRIPT
+from backend.user_stats import UserStatsStore
+
+
+class DictRedis:
+    """用到的Redis命令的进程内实现；eval 按脚本对象模拟写库锁的两段Lua脚本"""
+
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return False
+        self.data[key] = value
+        return True
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def rename(self, src, dst):
+        if src not in self.data:
+            raise redis.ResponseError('no such key')
+        self.data[dst] = self.data.pop(src)
+
+    def hincrby(self, key, field, amount):
+        bucket = self.data.setdefault(key, {})
+        bucket[str(field)] = bucket.get(str(field), 0) + amount
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def hset(self, key, mapping):
+        self.data.setdefault(key, {}).update({str(field): value for field, value in mapping.items()})
+
+    def hdel(self, key, field):
+        self.data.get(key, {}).pop(field, None)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def expire(self, key, ttl):
+        pass
+
+    def pipeline(self, transaction=True):
+        return DictPipeline(self)
+
+    def eval(self, script, numkeys, *args):
+        keys, argv = args[:numkeys], args[numkeys:]
+        owned = self.data.get(keys[0]) == argv[0]
+        if script is _EXTEND_LOCK_SCRIPT:
+            return int(owned)
+        assert script is _DELETE_IF_OWNER_SCRIPT
+        if not owned:
+            return 0
+        if len(keys) > 1:
+            self.data.pop(keys[1], None)
+        if str(argv[1]) == '1':
+            self.data.pop(keys[0], None)
+        return 1
+
+
+class DictPipeline:
+    """排队执行的pipeline（单线程测试中无需隔离）；WATCH的key在执行前被修改时抛出 WatchError"""
+
+    def __init__(self, client):
+        self._client = client
+        self._commands = []
+        self._watched = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.reset()
+
+    def watch(self, key):
+        self._watched[key] = copy.deepcopy(self._client.data.get(key))
+
+    def multi(self):
+        pass
+
+    def reset(self):
+        self._commands = []
+        self._watched = {}
+
+    def __getattr__(self, name):
+        command = getattr(self._client, name)
+        return lambda *args, **kwargs: self._commands.append((command, args, kwargs))
+
+    def execute(self):
+        commands, self._commands = self._commands, []
+        watched, self._watched = self._watched, {}
+        if any(self._client.data.get(key) != value for key, value in watched.items()):
+            raise redis.WatchError('watched key changed')
+        return [command(*args, **kwargs) for command, args, kwargs in commands]
+
+
+class FakeRedisManager:
+    def __init__(self, available=True):
+        self.is_available = available
+        self.client = DictRedis()
+
+    def record_failure(self, error):
+        self.is_available = False
+
+
+class patched_usage_counter:
+    """替换 usage_counter 模块的 redis_manager 和写库函数（with 块结束后恢复）"""
+
+    def __init__(self, available=True):
+        self.redis_manager = FakeRedisManager(available)
+        self.written = []
+        self.fail_writes = 0
+
+    def _batch_update(self, counts):
+        if self.fail_writes:
+            self.fail_writes -= 1
+            return {'success': False, 'error': '模拟写库失败'}
+        self.written.append(dict(counts))
+        return {'success': True}
+
+    def __enter__(self):
+        self._originals = (usage_counter_module.redis_manager, usage_counter_module.batch_update_tiku_usage)
+        usage_counter_module.redis_manager = self.redis_manager
+        usage_counter_module.batch_update_tiku_usage = self._batch_update
+        return self
+
+    def __exit__(self, *exc_info):
+        usage_counter_module.redis_manager, usage_counter_module.batch_update_tiku_usage = self._originals
+
+
+def test_usage_counter_flush():
+    """测试使用次数写库：改名后写库，失败时保留写库中hash重试，锁丢失时不写库"""
+    print("\n📈 测试题库使用次数写库...")
+    with patched_usage_counter() as patched:
+        counter = UsageCounter(key_prefix='test:')
+        data = patched.redis_manager.client.data
+        counter.increment(1)
+        counter.increment(1)
+        counter.increment(2, 3)
+        assert counter.get_pending_counts() == {1: 2, 2: 3}
+
+        assert counter._flush_with_lock() == {1: 2, 2: 3}
+        assert patched.written == [{1: 2, 2: 3}]
+        assert 'test:flushing' not in data and 'test:flush_lock' not in data, "写库后删除写库中hash并释放锁"
+        assert counter._flush_with_lock() is None, "没有新的使用记录"
+
+        # 写库失败：写库中hash保留，之后的计数进入新的待写hash，下次先重试写库中hash
+        counter.increment(1)
+        patched.fail_writes = 1
+        assert counter._flush_with_lock() is None
+        assert data['test:flushing'] == {'1': 1}
+        counter.increment(1, 5)
+        assert counter.get_pending_counts() == {1: 6}
+        assert counter._flush_with_lock() == {1: 1}
+        assert counter._flush_with_lock() == {1: 5}
+        assert patched.written[1:] == [{1: 1}, {1: 5}]
+
+        # 锁已过期被其他worker获取：不写库，写库中hash留给新的持有者
+        counter.increment(3)
+        data['test:flush_lock'] = 'other-token'
+        assert counter.flush_once('my-token') is None
+        assert data['test:flushing'] == {'3': 1} and len(patched.written) == 3
+        assert counter.get_stats()['lock_lost'] == 1
+        assert counter._flush_with_lock() is None, "锁被其他worker持有时跳过"
+
+
+def test_usage_counter_local_fallback():
+    """测试Redis不可用时计数暂存在进程内，直接写库失败时保留"""
+    print("\n💾 测试题库使用次数进程内暂存...")
+    with patched_usage_counter(available=False) as patched:
+        counter = UsageCounter(key_prefix='test:')
+        counter.increment(1)
+        counter.increment(1, 2)
+        assert counter.get_pending_counts() == {1: 3}
+        assert counter.get_stats()['local_fallbacks'] == 2
+
+        patched.fail_writes = 1
+        counter.flush_local()
+        assert counter.get_pending_counts() == {1: 3}, "写库失败时计数放回进程内"
+        counter.flush_local()
+        assert patched.written == [{1: 3}] and counter.get_pending_counts() == {}
+
+        # Redis恢复后暂存的计数并入Redis，由选出的worker写库
+        counter.increment(2)
+        patched.redis_manager.is_available = True
+        counter.flush_local()
+        assert patched.redis_manager.client.data['test:pending'] == {'2': 1}
+        assert len(patched.written) == 1
+
+
+class patched_user_stats:
+    """替换 user_stats 模块的 redis_manager 和数据库查询（with 块结束后恢复）"""
+
+    def __init__(self, summary, available=True):
+        self.redis_manager = FakeRedisManager(available)
+        self.summary = summary
+        self.summary_queries = 0
+        self.history_queries = 0
+        self.during_summary = None  # 查询数据库汇总期间执行的操作（模拟并发请求）
+
+    def _summary(self, user_id):
+        self.summary_queries += 1
+        if self.during_summary:
+            self.during_summary()
+        return self.summary
+
+    def _history(self, user_id, limit):
+        self.history_queries += 1
+        return [{'session_id': 's1', 'subject_name': '数学', 'total_questions': 10}]
+
+    def __enter__(self):
+        self._originals = (user_stats_module.redis_manager, user_stats_module.get_user_statistics_summary,
+                           user_stats_module.get_user_practice_history)
+        user_stats_module.redis_manager = self.redis_manager
+        user_stats_module.get_user_statistics_summary = self._summary
+        user_stats_module.get_user_practice_history = self._history
+        return self
+
+    def __exit__(self, *exc_info):
+        (user_stats_module.redis_manager, user_stats_module.get_user_statistics_summary,
+         user_stats_module.get_user_practice_history) = self._originals
+
+
+def _summary(**by_subject):
+    return {
+        'total_sessions': 5,
+        'completed_sessions': len(by_subject),
+        'by_subject': {name: {'sessions': 1, 'total_questions': total, 'correct_answers': correct}
+                       for name, (total, correct) in by_subject.items()}
+    }
+
+
+def test_user_stats_rebuild_and_increment():
+    """测试统计汇总hash：缺失时从数据库重建，之后增量更新，读取时不再查询数据库"""
+    print("\n📊 测试用户练习统计...")
+    with patched_user_stats(_summary(数学=(10, 8))) as patched:
+        store = UserStatsStore(key_prefix='test:')
+        stats = store.get_statistics(1)
+        assert patched.summary_queries == 1 and patched.history_queries == 1
+        assert stats['overall'] == {'total_sessions': 5, 'completed_sessions': 1, 'total_questions': 10,
+                                    'total_correct': 8, 'avg_score': 80.0}
+        assert stats['by_subject'] == {'数学': {'sessions': 1, 'total_questions': 10, 'correct_answers': 8,
+                                               'avg_score': 80.0}}
+        assert stats['recent_activity'] == [{'session_id': 's1', 'subject_name': '数学', 'total_questions': 10}]
+
+        assert store.get_statistics(1) == stats, "第二次读取命中汇总hash"
+        assert (patched.summary_queries, patched.history_queries) == (1, 1)
+
+        # 增量更新后最近练习记录重新查询，汇总不再从数据库重建；科目名可以包含冒号
+        store.record_session_started(1)
+        store.record_session_completed(1, '语文:阅读', 4, 1)
+        stats = store.get_statistics(1)
+        assert (patched.summary_queries, patched.history_queries) == (1, 2)
+        assert stats['overall'] == {'total_sessions': 6, 'completed_sessions': 2, 'total_questions': 14,
+                                    'total_correct': 9, 'avg_score': 64.29}
+        assert stats['by_subject']['语文:阅读'] == {'sessions': 1, 'total_questions': 4, 'correct_answers': 1,
+                                                  'avg_score': 25.0}
+
+        # hash过期后的增量更新建出不完整的hash（没有重建标记），读取时视为缺失重新重建
+        patched.redis_manager.client.data.clear()
+        store.record_session_started(1)
+        store.get_statistics(1)
+        assert patched.summary_queries == 2
+
+
+def test_user_stats_rebuild_conflict():
+    """测试重建期间有并发的增量更新时放弃写入，不用旧快照覆盖"""
+    print("\n⚔️  测试用户练习统计重建冲突...")
+    with patched_user_stats(_summary(数学=(10, 8))) as patched:
+        store = UserStatsStore(key_prefix='test:')
+        patched.during_summary = lambda: store.record_session_started(1)
+        stats = store.get_statistics(1)
+        assert stats['overall']['total_sessions'] == 5, "本次返回数据库汇总"
+        assert store.get_stats()['rebuild_conflicts'] == 1
+        assert '_built' not in patched.redis_manager.client.data['test:1'], "放弃写入，下次读取时重新重建"
+
+        patched.during_summary = None
+        patched.summary['total_sessions'] = 6
+        assert store.get_statistics(1)['overall']['total_sessions'] == 6
+        assert patched.summary_queries == 2
+
+    # Redis不可用时直接返回数据库汇总
+    with patched_user_stats(_summary(), available=False) as patched:
+        stats = UserStatsStore(key_prefix='test:').get_statistics(1)
+        assert stats['overall']['avg_score'] == 0 and stats['by_subject'] == {}
+        assert patched.summary_queries == 1
+
+    with patched_user_stats(None, available=False):
+        assert UserStatsStore(key_prefix='test:').get_statistics(1) is None, "数据库不可用时返回None"
+
+
+def main():
+    """主测试函数（也可以用 pytest 运行本文件）"""
+    print("🚀 开始使用次数和练习统计测试")
+    print("=" * 50)
+
+    tests = [
+        ("题库使用次数写库", test_usage_counter_flush),
+        ("题库使用次数进程内暂存", test_usage_counter_local_fallback),
+        ("用户练习统计", test_user_stats_rebuild_and_increment),
+        ("用户练习统计重建冲突", test_user_stats_rebuild_conflict),
+    ]
+
+    test_results = []
+    for test_name, test in tests:
+        try:
+            test()
+            test_results.append((test_name, True))
+        except AssertionError as e:
+            print(f"   ❌ {e}")
+            test_results.append((test_name, False))
+
+    # 输出测试结果
+    print("\n" + "=" * 50)
+    print("📊 测试结果总结:")
+
+    all_passed = True
+    for test_name, result in test_results:
+        status = "✅ 通过" if result else "❌ 失败"
+        print(f"   {test_name}: {status}")
+        if not result:
+            all_passed = False
+
+    print("\n" + "=" * 50)
+    if all_passed:
+        print("🎉 所有测试都通过了！")
+    else:
+        print("⚠️  部分测试失败")
+
+    return all_passed
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)